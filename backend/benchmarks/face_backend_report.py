@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+CPU latency report for the face detector/embedder backends.
+
+Runs every image in ``backend/employee_image/`` through each backend that can
+be loaded here (dlib-hog, dlib-cnn, onnx) and prints median detection,
+embedding and end-to-end ``encode_frame`` times. Backends whose package or
+model files are missing are reported as skipped.
+
+    python benchmarks/face_backend_report.py [--backends dlib-hog onnx] [--repeats 5]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from tools.config import get_face_pipeline_settings
+from tools.face_backends import FACE_BACKENDS, get_face_backend
+from tools.face_pipeline import _downscale, decode_frame, encode_frame
+
+
+IMAGE_DIR = Path(__file__).resolve().parent.parent / "employee_image"
+
+
+def timed(function, repeats: int):
+    samples = []
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backends", nargs="+", default=list(FACE_BACKENDS))
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    settings = get_face_pipeline_settings()
+    images = sorted(path for path in IMAGE_DIR.iterdir() if path.suffix.lower() in {".jpg", ".jpeg", ".png"})
+    print(f"{'backend':>9} {'image':>9} {'faces':>5} {'detect_ms':>10} {'embed_ms':>9} {'total_ms':>9}")
+    for name in args.backends:
+        try:
+            backend = get_face_backend(name)
+            backend.warm_up()
+        except Exception as exc:
+            print(f"{name:>9} skipped: {exc}")
+            continue
+
+        totals = []
+        for path in images:
+            image_bytes = path.read_bytes()
+            frame = decode_frame(image_bytes, settings["decode_max_side"])
+            small, scale = _downscale(frame, settings["detect_max_side"])
+            boxes, detect_ms = timed(lambda: backend.detect(small, settings["upsample"]), args.repeats)
+            embed_ms = 0.0
+            if boxes:
+                top, right, bottom, left = max(boxes, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+                box = (int(top / scale), int(right / scale), int(bottom / scale), int(left / scale))
+                _, embed_ms = timed(lambda: backend.embed(frame, box), args.repeats)
+            _, total_ms = timed(
+                lambda: encode_frame(image_bytes, settings, quality={"enabled": False}, backend=backend), args.repeats
+            )
+            totals.append(total_ms)
+            print(f"{backend.name:>9} {path.name:>9} {len(boxes):>5} {detect_ms:10.1f} {embed_ms:9.1f} {total_ms:9.1f}")
+        print(f"{backend.name:>9} {'median':>9} {'':>5} {'':>10} {'':>9} {statistics.median(totals):9.1f}")
+
+
+if __name__ == "__main__":
+    main()
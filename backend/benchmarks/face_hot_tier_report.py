@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Hit-rate/latency report for the recently-matched face hot tier.
+
+Builds synthetic galleries and replays a morning of arrivals in which most
+verifications come from a set of regulars (Zipf-distributed) and the rest
+from the whole workforce. Every verification runs the hot tier first and
+falls through to the full search exactly as ``match_face_image`` does; the
+report compares the per-verification match time against always running the
+full search, and checks every hot acceptance against the exact answer.
+
+    python benchmarks/face_hot_tier_report.py [--sizes 1000 10000 50000] [--regulars 300]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import numpy as np
+
+from tools.face_gallery import FaceGallery
+from tools.face_hot_tier import FaceHotTier
+
+
+THRESHOLD, MIN_GAP, CONFIDENT = 0.55, 0.05, 0.03
+
+
+def synthetic_encodings(count: int, rng: np.random.Generator) -> np.ndarray:
+    # Same loosely face-like layout as face_index_report.py
+    modes = rng.normal(scale=0.06, size=(32, 128))
+    assignment = rng.integers(0, len(modes), size=count)
+    return (modes[assignment] + rng.normal(scale=0.05, size=(count, 128))).astype(np.float32)
+
+
+def replay(gallery: FaceGallery, encodings: np.ndarray, arrivals: np.ndarray, rng, tier_size: int) -> dict:
+    tier = FaceHotTier(max_entries=tier_size)
+    hot_ms, full_ms, baseline_ms = [], [], []
+    hits = wrong = 0
+    for index in arrivals:
+        probe = encodings[index] + rng.normal(scale=0.012, size=encodings.shape[1]).astype(np.float32)
+
+        started = time.perf_counter()
+        expected = gallery.nearest_employees(probe, k=2)
+        baseline_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        match, _ = tier.match(gallery, probe, THRESHOLD, MIN_GAP, CONFIDENT)
+        elapsed = (time.perf_counter() - started) * 1000
+        if match is not None:
+            hits += 1
+            wrong += match["employeeId"] != expected[0][0]
+            hot_ms.append(elapsed)
+            tier.record(match["employeeId"])
+            continue
+
+        started = time.perf_counter()
+        found = gallery.nearest_employees(probe, k=2)
+        full_ms.append(elapsed + (time.perf_counter() - started) * 1000)
+        if found and found[0][1] <= THRESHOLD:
+            tier.record(found[0][0])
+
+    total = sum(hot_ms) + sum(full_ms)
+    return {
+        "hit_rate": hits / len(arrivals),
+        "wrong": wrong,
+        "hot_ms": float(np.median(hot_ms)) if hot_ms else 0.0,
+        "full_ms": float(np.median(full_ms)) if full_ms else 0.0,
+        "baseline_ms": float(np.median(baseline_ms)),
+        "speedup": sum(baseline_ms) / total if total else 0.0,
+        "revalidations": tier.metrics()["revalidations"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--regulars", type=int, default=300)
+    parser.add_argument("--arrivals", type=int, default=2000)
+    parser.add_argument("--regular-share", type=float, default=0.85)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(3)
+    print(
+        f"{'size':>7} {'hit rate':>9} {'hot ms':>8} {'fall ms':>8} {'full ms':>8} "
+        f"{'speedup':>8} {'revalid':>8} {'wrong':>6}"
+    )
+    for size in args.sizes:
+        encodings = synthetic_encodings(size, rng)
+        gallery = FaceGallery(encodings, [f"E{index:06d}" for index in range(size)])
+        regulars = rng.choice(size, size=min(args.regulars, size), replace=False)
+        weights = 1.0 / np.arange(1, len(regulars) + 1)
+        weights /= weights.sum()
+        from_regulars = rng.random(args.arrivals) < args.regular_share
+        arrivals = np.where(
+            from_regulars,
+            rng.choice(regulars, size=args.arrivals, p=weights),
+            rng.integers(0, size, size=args.arrivals),
+        )
+        report = replay(gallery, encodings, arrivals, rng, tier_size=args.regulars)
+        print(
+            f"{size:>7} {report['hit_rate']:>9.1%} {report['hot_ms']:8.3f} {report['full_ms']:8.3f} "
+            f"{report['baseline_ms']:8.3f} {report['speedup']:7.2f}x {report['revalidations']:>8} {report['wrong']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
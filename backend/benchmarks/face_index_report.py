@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Recall/latency report for the face gallery index backends.
+
+Builds synthetic galleries of 1k, 10k and 100k encodings, queries them with
+perturbed copies of gallery rows, and compares each backend's top-2
+employees from ``nearest_employees`` (what the threshold and confidence-gap
+rule look at) with exact search. ``decision_diff`` counts the probes whose
+accept/reject decision under that rule differs from flat search.
+
+    python benchmarks/face_index_report.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import numpy as np
+
+from tools.face_gallery import FaceGallery, decide_match
+
+
+THRESHOLD, MIN_GAP, CONFIDENT = 0.55, 0.05, 0.03
+
+
+def synthetic_encodings(count: int, rng: np.random.Generator) -> np.ndarray:
+    # Loosely face-like: identities spread around a few "demographic" modes
+    modes = rng.normal(scale=0.06, size=(32, 128))
+    assignment = rng.integers(0, len(modes), size=count)
+    return (modes[assignment] + rng.normal(scale=0.05, size=(count, 128))).astype(np.float32)
+
+
+def run_backend(gallery: FaceGallery, probes: np.ndarray, exact: list) -> dict:
+    timings = []
+    top1_hits = 0
+    top2_hits = 0
+    decision_diff = 0
+    for probe, expected in zip(probes, exact):
+        start = time.perf_counter()
+        found = gallery.nearest_employees(probe, k=2)
+        timings.append(time.perf_counter() - start)
+        found = [(employee_id, distance) for employee_id, distance, _ in found]
+        top1_hits += found[0][0] == expected[0][0]
+        top2_hits += [employee_id for employee_id, _ in found] == [employee_id for employee_id, _ in expected]
+        decision_diff += decide_match(found, THRESHOLD, MIN_GAP, CONFIDENT) != decide_match(
+            expected, THRESHOLD, MIN_GAP, CONFIDENT
+        )
+    timings_ms = np.asarray(timings) * 1000
+    return {
+        "recall@1": top1_hits / len(probes),
+        "top2_agreement": top2_hits / len(probes),
+        "decision_diff": decision_diff,
+        "p50_ms": float(np.percentile(timings_ms, 50)),
+        "p95_ms": float(np.percentile(timings_ms, 95)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(2024)
+    print(
+        f"{'size':>7} {'backend':>8} {'build_s':>8} {'recall@1':>9} {'top2':>6} "
+        f"{'decision_diff':>13} {'p50_ms':>8} {'p95_ms':>8}"
+    )
+    for size in args.sizes:
+        encodings = synthetic_encodings(size, rng)
+        ids = [f"E{index:06d}" for index in range(size)]
+        targets = rng.integers(0, size, size=args.queries)
+        probes = encodings[targets] + rng.normal(scale=0.025, size=(args.queries, 128)).astype(np.float32)
+
+        flat = FaceGallery(encodings, ids, index_backend="flat")
+        exact = [
+            [(employee_id, distance) for employee_id, distance, _ in flat.nearest_employees(probe, k=2)]
+            for probe in probes
+        ]
+
+        for backend in ("flat", "ivf"):
+            start = time.perf_counter()
+            gallery = flat if backend == "flat" else FaceGallery(encodings, ids, index_backend=backend, nprobe=args.nprobe)
+            build_s = time.perf_counter() - start if backend != "flat" else 0.0
+            stats = run_backend(gallery, probes, exact)
+            print(
+                f"{size:>7} {backend:>8} {build_s:>8.2f} {stats['recall@1']:>9.3f} "
+                f"{stats['top2_agreement']:>6.3f} {stats['decision_diff']:>13d} "
+                f"{stats['p50_ms']:>8.3f} {stats['p95_ms']:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing report for the downscaled-detection face pipeline.
+
+Runs every image in ``backend/employee_image/`` through the original
+full-frame path (``load_image_file`` + ``face_encodings``) and through
+``encode_frame`` at each detection size, and prints decode/detect/encode
+medians, the speed-up, and how far the pipeline's encoding drifts from the
+full-frame one (the match threshold is 0.55, so drift should stay well
+below 0.05).
+
+    python benchmarks/face_pipeline_report.py [--detect-sides 320 480 640] [--repeats 5]
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import face_recognition
+import numpy as np
+
+from tools.config import get_face_pipeline_settings
+from tools.face_pipeline import encode_frame
+
+
+IMAGE_DIR = Path(__file__).resolve().parent.parent / "employee_image"
+
+
+def full_frame(image_bytes: bytes) -> tuple[np.ndarray | None, dict]:
+    import io
+
+    timings = {}
+    started = time.perf_counter()
+    image = face_recognition.load_image_file(io.BytesIO(image_bytes))
+    timings["decode_ms"] = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    boxes = face_recognition.face_locations(image)
+    timings["detect_ms"] = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    encodings = face_recognition.face_encodings(image, known_face_locations=boxes[:1]) if boxes else []
+    timings["encode_ms"] = (time.perf_counter() - started) * 1000
+    return (encodings[0] if encodings else None), timings
+
+
+def median_timings(samples: list[dict]) -> dict:
+    return {stage: statistics.median(sample[stage] for sample in samples) for stage in samples[0]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--detect-sides", type=int, nargs="+", default=[320, 480, 640])
+    parser.add_argument("--decode-side", type=int, default=get_face_pipeline_settings()["decode_max_side"])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    images = sorted(path for path in IMAGE_DIR.iterdir() if path.suffix.lower() in {".jpg", ".jpeg", ".png"})
+    print(f"{'image':>10} {'variant':>10} {'decode':>8} {'detect':>8} {'encode':>8} {'total':>8} {'speedup':>8} {'drift':>7}")
+    for path in images:
+        image_bytes = path.read_bytes()
+        baseline_samples = []
+        for _ in range(args.repeats):
+            baseline, timings = full_frame(image_bytes)
+            baseline_samples.append(timings)
+        baseline_timings = median_timings(baseline_samples)
+        baseline_total = sum(baseline_timings.values())
+        print(
+            f"{path.name:>10} {'full':>10} {baseline_timings['decode_ms']:8.1f} {baseline_timings['detect_ms']:8.1f} "
+            f"{baseline_timings['encode_ms']:8.1f} {baseline_total:8.1f} {'1.00x':>8} {'-':>7}"
+        )
+
+        for side in args.detect_sides:
+            settings = {
+                **get_face_pipeline_settings(),
+                "decode_max_side": args.decode_side,
+                "detect_max_side": side,
+                "fallback": False,
+            }
+            samples = []
+            for _ in range(args.repeats):
+                result = encode_frame(image_bytes, settings)
+                samples.append(result["timings"])
+            timings = median_timings(samples)
+            total = sum(timings.values())
+            if result["encoding"] is None or baseline is None:
+                drift = "miss" if baseline is not None else "-"
+            else:
+                drift = f"{float(np.linalg.norm(result['encoding'] - baseline)):.3f}"
+            print(
+                f"{'':>10} {f'det={side}':>10} {timings['decode_ms']:8.1f} {timings['detect_ms']:8.1f} "
+                f"{timings['encode_ms']:8.1f} {total:8.1f} {baseline_total / total:7.2f}x {drift:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Accuracy and size report for the compact gallery storage modes.
+
+Holds out a share of the encodings as probes and checks, for float32,
+float16 and int8 storage, how often the match decision, the top-1 employee
+and the top-k employee ranking agree with float64 search. Probes whose
+employee has no other template exercise rejection.
+
+By default it runs on the local face store snapshot (run it before
+switching ``FACE_GALLERY_DTYPE`` on a deployment); ``--synthetic`` uses
+generated encodings instead.
+
+    python benchmarks/face_quantization_report.py [--synthetic 50000] [--holdout 0.2] [--noise 0.02] [--max-probes 2000]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import numpy as np
+
+from tools.config import get_face_store_dir
+from tools.face_quantize import QUANT_DTYPES, validate_quantization
+from tools.face_store import load_snapshot
+
+
+# dlib-space accept rule, as match_face_image applies it (ONNX: scale by its threshold / 0.55)
+DLIB_MATCH_THRESHOLD = 0.55
+MIN_CONFIDENCE_GAP = 0.05
+CONFIDENT_MARGIN = 0.03
+
+
+def synthetic_encodings(count: int, rng: np.random.Generator) -> tuple[np.ndarray, list[str]]:
+    # Identities spread around a few "demographic" modes, 1-3 templates each
+    modes = rng.normal(scale=0.06, size=(32, 128))
+    identities = modes[rng.integers(0, len(modes), size=count)] + rng.normal(scale=0.05, size=(count, 128))
+    templates = rng.integers(1, 4, size=count)
+    owners = np.repeat(np.arange(count), templates)[:count]
+    encodings = identities[owners] + rng.normal(scale=0.02, size=(len(owners), 128))
+    return encodings, [f"E{owner:06d}" for owner in owners]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--synthetic", type=int, default=0, help="use N generated encodings instead of the store")
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--noise", type=float, default=0.02, help="probe perturbation (a fresh capture)")
+    parser.add_argument("--threshold", type=float, default=DLIB_MATCH_THRESHOLD)
+    parser.add_argument("--max-probes", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        encodings, ids = synthetic_encodings(args.synthetic, np.random.default_rng(args.seed))
+        source = f"synthetic ({args.synthetic} encodings)"
+    else:
+        snapshot = load_snapshot(get_face_store_dir())
+        if snapshot is None:
+            parser.error("no local face store snapshot; run encode_faces.py or pass --synthetic N")
+        encodings, ids = snapshot.float_encodings(), snapshot.employee_ids
+        source = f"store snapshot v{snapshot.version} ({snapshot.manifest.get('dtype', 'float32')})"
+        if snapshot.manifest.get("dtype", "float32") != "float32":
+            print("Note: the snapshot is already compact, so float64 here is its dequantised values")
+
+    scale = args.threshold / DLIB_MATCH_THRESHOLD
+    print(f"Source: {source}, holdout {args.holdout:.0%}, probe noise {args.noise}")
+    print(
+        f"{'dtype':>8} {'bytes':>6} {'vs f64':>7} {'decision':>9} {'flips':>6} {'top1':>7} "
+        f"{'top' + str(args.k):>7} {'order':>7} {'max_err':>9}"
+    )
+    for dtype in QUANT_DTYPES:
+        report = validate_quantization(
+            encodings,
+            ids,
+            dtype,
+            threshold=args.threshold,
+            min_gap=MIN_CONFIDENCE_GAP * scale,
+            confident_margin=CONFIDENT_MARGIN * scale,
+            k=args.k,
+            holdout=args.holdout,
+            seed=args.seed,
+            probe_noise=args.noise,
+            max_probes=args.max_probes,
+        )
+        print(
+            f"{dtype:>8} {report['bytes_per_encoding']:>6} {report['compression_vs_float64']:>6.0f}x "
+            f"{report['decision_agreement']:>9.4f} {report['accept_flips']:>6} {report['top1_agreement']:>7.4f} "
+            f"{report[f'top{args.k}_overlap']:>7.4f} {report[f'top{args.k}_exact_order']:>7.4f} "
+            f"{report['max_distance_error']:>9.5f}"
+        )
+    print(f"({report['probes']} probes, {report['reference_accepts']} accepted by float64)")
+
+
+if __name__ == "__main__":
+    main()
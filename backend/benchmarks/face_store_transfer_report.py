@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Cold-start load time of the face store: single GET vs chunked ranged GETs.
+
+Publishes one synthetic snapshot twice into a local S3 stand-in (an HTTP
+server speaking just enough of the S3 GET API for botocore), once as a plain
+``.npy`` object and once as zstd-compressed chunks. The stand-in caps each
+connection's throughput and adds a first-byte delay, as S3 does per
+request. Each mode then starts a node from an empty store directory and
+times sync (download + decompress), memory-mapping and the gallery build.
+
+    python benchmarks/face_store_transfer_report.py [--encodings 200000] [--dtype float32] [--mbps 50] [--workers 8]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import boto3
+import numpy as np
+from botocore.config import Config
+
+from tools.face_gallery import FaceGallery
+from tools.face_store import load_snapshot, publish_to_s3, sync_from_s3, write_snapshot
+
+
+BUCKET = "bench"
+WRITE_BLOCK = 64 * 1024
+
+
+class StandInStore:
+    """Object dict shared by the in-process publisher and the HTTP server."""
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.requests = 0
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = bytes(Body)
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None):
+        self.objects[Key] = Fileobj.read()
+
+
+def serve(store: StandInStore, bytes_per_second: float, first_byte_ms: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            store.requests += 1
+            key = self.path.split("?", 1)[0].lstrip("/").removeprefix(f"{BUCKET}/")
+            body = store.objects.get(key)
+            if body is None:
+                error = b"<Error><Code>NoSuchKey</Code><Message>missing</Message></Error>"
+                self.send_response(404)
+                self.send_header("Content-Type", "application/xml")
+                self.send_header("Content-Length", str(len(error)))
+                self.end_headers()
+                self.wfile.write(error)
+                return
+
+            status, total = 200, len(body)
+            byte_range = self.headers.get("Range")
+            if byte_range:
+                start, end = (int(value) for value in byte_range.removeprefix("bytes=").split("-"))
+                body, status = body[start : end + 1], 206
+            time.sleep(first_byte_ms / 1000)
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", '"bench"')
+            if byte_range:
+                self.send_header("Content-Range", f"bytes {start}-{start + len(body) - 1}/{total}")
+            self.end_headers()
+
+            # Per-connection throughput cap
+            started = time.perf_counter()
+            for offset in range(0, len(body), WRITE_BLOCK):
+                self.wfile.write(body[offset : offset + WRITE_BLOCK])
+                ahead = (offset + WRITE_BLOCK) / bytes_per_second - (time.perf_counter() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def cold_start(endpoint: str, prefix: str, workers: int, dtype: str) -> dict:
+    client = boto3.client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id="bench",
+        aws_secret_access_key="bench",
+        region_name="us-east-1",
+        config=Config(s3={"addressing_style": "path"}, max_pool_connections=max(10, workers)),
+    )
+    with tempfile.TemporaryDirectory() as node:
+        started = time.perf_counter()
+        assert sync_from_s3(Path(node), client, BUCKET, prefix, workers=workers)
+        synced = time.perf_counter()
+        snapshot = load_snapshot(Path(node))
+        data = snapshot.as_encoding_data()
+        gallery = FaceGallery.from_encoding_data(data, index_backend="flat", storage_dtype=dtype)
+        ready = time.perf_counter()
+        assert len(gallery) == len(snapshot.employee_ids)
+    return {"sync_s": synced - started, "gallery_s": ready - synced, "total_s": ready - started}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--encodings", type=int, default=200000)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--mbps", type=float, default=50, help="per-connection throughput cap, MB/s")
+    parser.add_argument("--first-byte-ms", type=float, default=30)
+    parser.add_argument("--chunk-mb", type=float, default=8)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    encodings = rng.normal(scale=0.09, size=(args.encodings, 128)).astype(np.float32)
+    ids = [f"E{index:07d}" for index in range(args.encodings)]
+
+    store = StandInStore()
+    sys.stdout = io.StringIO()
+    try:
+        with tempfile.TemporaryDirectory() as source:
+            write_snapshot(Path(source), encodings, ids, dtype=args.dtype)
+            publish_to_s3(Path(source), store, BUCKET, "plain")
+            chunk_bytes = int(args.chunk_mb * 1024 * 1024)
+            publish_to_s3(Path(source), store, BUCKET, "chunked", chunk_bytes=chunk_bytes, workers=os.cpu_count() or 1)
+    finally:
+        sys.stdout = sys.__stdout__
+
+    plain = len(store.objects["plain/encodings-v1.npy"])
+    compressed = len(store.objects["chunked/encodings-v1.npy.zst"])
+    print(
+        f"Snapshot: {args.encodings} x 128 {args.dtype}, {plain / 1e6:.1f} MB; "
+        f"zstd chunks {compressed / 1e6:.1f} MB ({compressed / plain:.0%})"
+    )
+    print(f"Stand-in S3: {args.mbps:.0f} MB/s per connection, {args.first_byte_ms:.0f} ms to first byte\n")
+
+    server = serve(store, args.mbps * 1e6, args.first_byte_ms)
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"{'mode':>22} {'sync_s':>8} {'gallery_s':>10} {'total_s':>8}")
+    results = {}
+    try:
+        for label, prefix, workers in (("single GET", "plain", 1), (f"chunked x{args.workers}", "chunked", args.workers)):
+            sys.stdout = io.StringIO()
+            try:
+                results[label] = cold_start(endpoint, prefix, workers, args.dtype)
+            finally:
+                sys.stdout = sys.__stdout__
+            timing = results[label]
+            print(f"{label:>22} {timing['sync_s']:>8.2f} {timing['gallery_s']:>10.2f} {timing['total_s']:>8.2f}")
+    finally:
+        server.shutdown()
+
+    before, after = results.values()
+    print(f"\nCold start is {before['total_s'] / after['total_s']:.1f}x faster with chunked transfer")
+
+
+if __name__ == "__main__":
+    main()
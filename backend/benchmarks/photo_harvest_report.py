@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Dry-run throughput report for the concurrent employee photo harvester.
+
+Starts a local HTTP stand-in for the photo hosts: a fast host, a slow host
+and a host that sends no validators (so unchanged photos are detected by
+content hash). Every tenth photo fails with 503 on its first request. The
+harvester then runs in dry-run mode (nothing is uploaded) three times:
+
+- serial: concurrency 1, the shape of the old one-photo-at-a-time job;
+- cold: the configured concurrency with an empty state;
+- warm: the same with the state from the cold run, so hosts with
+  validators answer 304 and only the delta is reported.
+
+    python benchmarks/photo_harvest_report.py [--employees 300] [--slow-ms 250] [--concurrency 32] [--per-host 4]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from aiohttp import web
+
+from tools.config import get_face_harvest_settings
+from tools.zenith_emp_img import format_harvest_report, harvest_photos
+
+
+PHOTO_BYTES = 48 * 1024
+FLAKY_SEEN = web.AppKey("flaky_seen", set)
+
+
+def build_stand_in(slow_ms: int, validators: bool) -> web.Application:
+    app = web.Application()
+    seen: set[str] = set()
+    app[FLAKY_SEEN] = seen
+
+    async def photo(request: web.Request) -> web.StreamResponse:
+        name = request.match_info["name"]
+        index = int(name.lstrip("E"))
+        if index % 10 == 0 and name not in seen:
+            seen.add(name)
+            return web.Response(status=503, headers={"Retry-After": "0"})
+        if slow_ms:
+            await asyncio.sleep(slow_ms / 1000)
+
+        body = hashlib.sha256(name.encode()).digest() * (PHOTO_BYTES // 32)
+        headers = {"Content-Type": "image/jpeg"}
+        if validators:
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            if request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304, headers={"ETag": etag})
+            headers["ETag"] = etag
+        return web.Response(body=body, headers=headers)
+
+    app.router.add_get("/photos/{name}.jpg", photo)
+    return app
+
+
+async def run(args) -> None:
+    hosts = [("fast", 0, True), ("slow", args.slow_ms, True), ("no-validators", 0, False)]
+    runners, ports = [], []
+    for _, slow_ms, validators in hosts:
+        runner = web.AppRunner(build_stand_in(slow_ms, validators), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        runners.append(runner)
+        ports.append(site._server.sockets[0].getsockname()[1])
+
+    employees = {}
+    for index in range(args.employees):
+        port = ports[index % len(ports)]
+        employees[f"E{index:05d}"] = {
+            "name": f"Employee {index}",
+            "photo_url": f"http://127.0.0.1:{port}/photos/E{index:05d}.jpg",
+        }
+    print("Stand-in hosts: " + ", ".join(f"{name}=:{port}" for (name, _, _), port in zip(hosts, ports)))
+
+    settings = {**get_face_harvest_settings(), "concurrency": args.concurrency, "per_host": args.per_host}
+    serial_settings = {**settings, "concurrency": 1, "per_host": 1}
+    try:
+        sys.stdout = open(os.devnull, "w")
+        results = []
+        for run_settings, state in ((serial_settings, {}), (settings, {}), (settings, None)):
+            # Every run sees the same first-request 503s
+            for runner in runners:
+                runner.app[FLAKY_SEEN].clear()
+            state = results[-1]["state"] if state is None else state
+            results.append(await harvest_photos(employees, state, None, run_settings))
+        serial, cold, warm = results
+    finally:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
+        for runner in runners:
+            await runner.cleanup()
+
+    for label, result in (("serial", serial), ("cold", cold), ("warm", warm)):
+        print(f"\n[{label}] delta: {len(result['delta'])} employee(s)")
+        print(format_harvest_report(result["stats"]))
+    speedup = serial["stats"]["elapsed_seconds"] / max(cold["stats"]["elapsed_seconds"], 1e-9)
+    print(f"\nCold concurrent run is {speedup:.1f}x faster than serial")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--employees", type=int, default=300)
+    parser.add_argument("--slow-ms", type=int, default=250)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--per-host", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Shared pytest setup: every test gets its own flow sessions file, agent state
+file, shared state database and flow signal files, so running the suite never
+rewrites the tracked files under data/
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent / "src"))
+
+import agent_state
+import flow_manager
+import flow_signal
+import shared_state
+from tools import config
+
+
+@pytest.fixture(autouse=True)
+def isolated_state_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(flow_manager, "FLOW_SESSIONS_FILE", tmp_path / "flow_sessions.json")
+    monkeypatch.setattr(agent_state, "STATE_FILE", tmp_path / "agent_state.json")
+    monkeypatch.setattr(config, "SHARED_STATE_PATH", str(tmp_path / "shared_state.db"))
+    monkeypatch.setattr(flow_signal, "SIGNAL_FILE", tmp_path / "flow_signal.json")
+    monkeypatch.setattr(flow_signal, "KIOSK_SIGNAL_DIR", tmp_path / "flow_signals")
+    # The global flow manager and shared state backend are reopened on the paths above
+    flow_manager.close_flow_manager()
+    previous = shared_state.set_shared_state(None)
+    yield tmp_path
+    flow_manager.close_flow_manager()
+    opened = shared_state.set_shared_state(previous)
+    if opened is not None:
+        opened.close()
@@ -82,6 +82,7 @@ def _get_state_fallback(session, lang: str, include_default: bool = True) -> str
     return text
 import os
 import time
+from contextvars import ContextVar
 from dotenv import load_dotenv
 import logging
 from livekit.plugins import noise_cancellation, google
@@ -110,6 +111,7 @@ from tools import (
 )
 from agent_state import verified_user_name, verified_user_id
 from flow_manager import flow_manager, FlowState, UserType
+from flow_signal import DEFAULT_KIOSK_ID, kiosk_key
 from prompts import AGENT_INSTRUCTION
 from language_utils import get_message
  
@@ -119,6 +121,14 @@ load_dotenv()
  
 # Set logging to INFO to reduce noise
 logging.basicConfig(level=logging.INFO)
+
+# Kiosk of the room this job serves: the room name is the kiosk id, so a
+# worker serving several rooms keeps a flow session per room
+_room_kiosk: ContextVar[str] = ContextVar("room_kiosk", default=DEFAULT_KIOSK_ID)
+
+
+def _kiosk() -> str:
+    return _room_kiosk.get()
  
 # -------------------------
 # Flow Management Tools
@@ -126,13 +136,13 @@ logging.basicConfig(level=logging.INFO)
 @function_tool
 async def start_reception_flow():
     """Start the reception flow - used when wake word is detected"""
-    success, message = flow_manager.process_wake_word_detected()
+    success, message = flow_manager.process_wake_word_detected(kiosk_id=_kiosk())
     return message
  
 @function_tool
 async def classify_user_type(user_input: str):
     """Classify user as employee or visitor based on their input"""
-    success, message, next_state = flow_manager.process_user_classification(user_input)
+    success, message, next_state = flow_manager.process_user_classification(user_input, kiosk_id=_kiosk())
    
     # If user classified as employee and moved to face recognition state, signal frontend
     if success and next_state and next_state.value == "face_recognition":
@@ -140,7 +150,7 @@ async def classify_user_type(user_input: str):
         post_signal("start_face_capture", {
             "message": "Please show your face to the camera for employee verification",
             "next_endpoint": "/flow/face_recognition"
-        })
+        }, kiosk_id=_kiosk())
    
     return message
  
@@ -154,7 +164,7 @@ async def process_face_recognition(face_result_status: str, employee_name: str =
        
         # If face recognition succeeded but no employee data provided, try to reuse active session (never cached state)
         if face_result_status == "success" and not employee_name and not employee_id:
-            session = flow_manager.get_current_session()
+            session = flow_manager.get_current_session(_kiosk())
             if session and session.user_data:
                 employee_name = session.user_data.get("employee_name")
                 employee_id = session.user_data.get("employee_id")
@@ -165,7 +175,7 @@ async def process_face_recognition(face_result_status: str, employee_name: str =
             "name": employee_name,
             "employeeId": employee_id
         }
-        success, message, next_state = flow_manager.process_face_recognition_result(face_result)
+        success, message, next_state = flow_manager.process_face_recognition_result(face_result, kiosk_id=_kiosk())
         return message
     except Exception as e:
         print(f"[ERROR] process_face_recognition: {e}")
@@ -175,10 +185,7 @@ async def process_face_recognition(face_result_status: str, employee_name: str =
 async def trigger_face_recognition():
     """Tell the user to use their camera for face recognition and trigger frontend capture"""
     try:
-        session = flow_manager.get_current_session()
-        if not session:
-            flow_manager.create_session()
-            session = flow_manager.get_current_session()
+        session = flow_manager.ensure_session(_kiosk())
 
         if session:
             if session.is_verified:
@@ -187,7 +194,9 @@ async def trigger_face_recognition():
                 session.user_type = UserType.EMPLOYEE
             session.current_state = FlowState.FACE_RECOGNITION
             session.last_activity = time.time()
-            flow_manager.save_sessions()
+            flow_manager.save_sessions(session)
+            # The kiosk acts on the signal below, so persist the state first
+            flow_manager.flush_sessions()
     except Exception as exc:
         print(f"[WARN] trigger_face_recognition could not sync flow state: {exc}")
 
@@ -197,7 +206,7 @@ async def trigger_face_recognition():
         post_signal("start_face_capture", {
             "message": "Please show your face to the camera for employee verification",
             "next_endpoint": "/flow/face_recognition",
-        })
+        }, kiosk_id=_kiosk())
     except Exception as exc:
         print(f"[WARN] trigger_face_recognition could not emit signal: {exc}")
 
@@ -216,19 +225,20 @@ async def verify_employee_credentials(
         otp=otp,
         name=name,
         employee_id=employee_id,
+        kiosk_id=_kiosk(),
     )
     return message
  
 @function_tool
 async def handle_face_registration_choice(register_face: bool):
     """Handle employee choice for face registration"""
-    success, message, next_state = flow_manager.process_face_registration_choice(register_face)
+    success, message, next_state = flow_manager.process_face_registration_choice(register_face, kiosk_id=_kiosk())
     return message
 
 @function_tool
 async def complete_face_registration(success: bool, message: str = None):
     """Complete face registration process after photo capture"""
-    success_result, response_message, next_state = flow_manager.process_face_registration_completion(success, message)
+    success_result, response_message, next_state = flow_manager.process_face_registration_completion(success, message, kiosk_id=_kiosk())
     return response_message
  
 @function_tool
@@ -238,20 +248,16 @@ async def collect_visitor_info(name: str, phone: str, purpose: str, host_employe
         print(f"[Tool] collect_visitor_info called with: name='{name}', phone='{phone}', purpose='{purpose}', host='{host_employee}'")
         
         # Ensure session is properly set up for visitor
-        session = flow_manager.get_current_session()
-        if not session:
-            print("[Tool] No session found, creating new session")
-            flow_manager.create_session()
-            session = flow_manager.get_current_session()
+        session = flow_manager.ensure_session(_kiosk())
         
         # Force set user type to VISITOR if not already set
         if session.user_type != UserType.VISITOR:
             print(f"[Tool] Fixing user type from {session.user_type} to VISITOR")
             session.user_type = UserType.VISITOR
             session.current_state = FlowState.VISITOR_INFO_COLLECTION
-            flow_manager.save_sessions()
+            flow_manager.save_sessions(session)
         
-        success, message, next_state = await flow_manager.process_visitor_info(name, phone, purpose, host_employee)
+        success, message, next_state = await flow_manager.process_visitor_info(name, phone, purpose, host_employee, kiosk_id=_kiosk())
         print(f"[Tool] collect_visitor_info result: success={success}, message='{message}', state={next_state}")
         return message
     except Exception as e:
@@ -264,19 +270,19 @@ async def collect_visitor_info(name: str, phone: str, purpose: str, host_employe
 @function_tool
 async def flow_capture_visitor_photo(captured: bool = True):
     """Process visitor photo capture within the flow manager"""
-    success, message, next_state = flow_manager.process_visitor_face_capture(captured)
+    success, message, next_state = flow_manager.process_visitor_face_capture(captured, kiosk_id=_kiosk())
     return message
  
 @function_tool
 async def check_flow_status():
     """Get current flow status for debugging"""
-    status = flow_manager.get_flow_status()
+    status = flow_manager.get_flow_status(_kiosk())
     return f"Flow Status: {status}"
  
 @function_tool
 async def end_current_session():
     """End the current session"""
-    message = flow_manager.end_session()
+    message = flow_manager.end_session(kiosk_id=_kiosk())
     return message
  
 # -------------------------
@@ -291,7 +297,7 @@ async def check_user_verification():
     load_state_from_file()
    
     # Also check flow manager session
-    session = flow_manager.get_current_session()
+    session = flow_manager.get_current_session(_kiosk())
    
     if is_verified or (session and session.is_verified):
         user_name = verified_user_name or (session.user_data.get('employee_name') if session else 'Unknown')
@@ -306,7 +312,7 @@ async def check_user_verification():
 @function_tool
 async def check_tool_access(tool_name: str):
     """Check if current user has access to a specific tool"""
-    has_access, message = flow_manager.check_tool_access(tool_name)
+    has_access, message = flow_manager.check_tool_access(tool_name, kiosk_id=_kiosk())
     return message if not has_access else f"Access granted for {tool_name}"
  
 @function_tool
@@ -318,7 +324,7 @@ async def cleanup_old_sessions():
 @function_tool  
 async def get_flow_help():
     """Get help about the current flow state and available actions"""
-    session = flow_manager.get_current_session()
+    session = flow_manager.get_current_session(_kiosk())
     if not session:
         return "No active session. Say 'Hey Clara' to start the verification process."
    
@@ -345,7 +351,7 @@ async def get_flow_help():
 @function_tool
 async def sync_verification_status():
     """Synchronize agent verification state with flow manager"""
-    session = flow_manager.get_current_session()
+    session = flow_manager.get_current_session(_kiosk())
    
     if session and session.is_verified:
         # Sync flow manager verified state to agent state
@@ -466,7 +472,7 @@ STATE MANAGEMENT:
             if _is_verified:
                 # Advance flow as if face recognition succeeded
                 face_result = {"status": "success", "name": _vun, "employeeId": _vuid}
-                _, message_out, _ = flow_manager.process_face_recognition_result(face_result)
+                _, message_out, _ = flow_manager.process_face_recognition_result(face_result, kiosk_id=_kiosk())
                 if message_out:
                     print("✅ Detected external verification; advancing flow")
                     return message_out
@@ -484,7 +490,7 @@ STATE MANAGEMENT:
             wake_ack = get_message("wake_ack", lang)
             if state_response == wake_ack or "I'm awake" in state_response or "awake" in state_response.lower():
                 print("🚀 Clara waking up - starting reception flow...")
-                flow_success, flow_message = flow_manager.process_wake_word_detected()
+                flow_success, flow_message = flow_manager.process_wake_word_detected(kiosk_id=_kiosk())
                 question = get_message("wake_prompt", lang)
                 combined_message = f"{flow_message}\n{question}" if flow_message else question
                 print(f"🔊 Combined wake message: '{combined_message}'")
@@ -497,17 +503,17 @@ STATE MANAGEMENT:
             return ""
         
         # Check current flow status for context
-        session = flow_manager.get_current_session()
+        session = flow_manager.get_current_session(_kiosk())
         if session:
             print(f"📊 Current session state: {session.current_state.value}")
             # Update session activity
             session.last_activity = time.time()
-            flow_manager.save_sessions()
+            flow_manager.save_sessions(session)
             
             # Provide context-aware responses based on current flow state
             if session.current_state == FlowState.USER_CLASSIFICATION:
                 print(f"🔍 In USER_CLASSIFICATION state, processing: '{text_content}'")
-                success, response, next_state = flow_manager.process_user_classification(text_content)
+                success, response, next_state = flow_manager.process_user_classification(text_content, kiosk_id=_kiosk())
                 if success:
                     print(f"✅ Classification successful: '{response}', next_state: {next_state.value}")
                     return response
@@ -531,14 +537,14 @@ STATE MANAGEMENT:
             llm_response = await super().handle_message(message)
         except RealtimeError as err:
             print(f"❗ Realtime generation error: {err}")
-            session = flow_manager.get_current_session()
+            session = flow_manager.get_current_session(_kiosk())
             lang = get_preferred_language()
             fb = _get_state_fallback(session, lang, include_default=True)
             print("🔄 Falling back after realtime error")
             return fb
         except Exception as err:
             print(f"❗ Unexpected LLM error: {err}")
-            session = flow_manager.get_current_session()
+            session = flow_manager.get_current_session(_kiosk())
             lang = get_preferred_language()
             fb = _get_state_fallback(session, lang, include_default=True)
             print("🔄 Falling back after unexpected LLM error")
@@ -547,7 +553,7 @@ STATE MANAGEMENT:
         # Safety guard: never emit None/empty; use context-aware fallback instead
         if not llm_response or str(llm_response).strip().lower() in {"none", "null"}:
             try:
-                session = flow_manager.get_current_session()
+                session = flow_manager.get_current_session(_kiosk())
                 lang = get_preferred_language()
                 fallback = _get_state_fallback(session, lang, include_default=False)
                 if fallback:
@@ -570,7 +576,8 @@ async def entrypoint(ctx: JobContext):
     from agent_state import load_state_from_file
     load_state_from_file()
    
-    print(f"🤖 Clara Agent starting in room: {ctx.room.name}")
+    _room_kiosk.set(kiosk_key(ctx.room.name))
+    print(f"🤖 Clara Agent starting in room: {ctx.room.name} (kiosk {_kiosk()})")
     print(f"🎯 Agent name: clara-receptionist")
     print(f"🔊 Listening for 'Hey Clara' to activate...")
    
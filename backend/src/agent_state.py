@@ -4,6 +4,7 @@ import os
 from datetime import datetime
 from pathlib import Path
 
+from shared_state import SharedMap
 from language_utils import (
     DEFAULT_LANGUAGE,
     SUPPORTED_LANGUAGES,
@@ -23,7 +24,12 @@ last_activity = time.time()  # Track last interaction
 preferred_language = DEFAULT_LANGUAGE
 AUTO_SLEEP_TIMEOUT = 180  # 3 minutes of inactivity = auto sleep
 
-# -------------------- Shared State File --------------------
+# -------------------- Shared State --------------------
+# One key per field in the shared state backend, so every process (agent,
+# uvicorn workers) sees the same values and a write only touches its fields
+shared_state = SharedMap("agent_state")
+STATE_FIELDS = ("is_awake", "is_verified", "verified_user_name", "verified_user_id", "last_activity", "preferred_language")
+# Written before the shared state backend; read when it holds no state yet
 STATE_FILE = Path(__file__).parent.parent / "data" / "agent_state.json"
 
 # -------------------- Verification State --------------------
@@ -36,42 +42,35 @@ def wake_up():
     global is_awake, last_activity
     is_awake = True
     last_activity = time.time()
+    save_state_to_file("is_awake", "last_activity")
     return get_message("wake_ack", get_preferred_language())
 
 def go_to_sleep():
     """Put Clara to sleep state"""
     global is_awake
     is_awake = False
+    save_state_to_file("is_awake")
     return get_message("sleep_ack", get_preferred_language())
 
-def save_state_to_file():
-    """Save current state to shared file"""
-    state = {
-        "is_awake": is_awake,
-        "is_verified": is_verified,
-        "verified_user_name": verified_user_name,
-        "verified_user_id": verified_user_id,
-        "last_activity": last_activity,
-        "preferred_language": preferred_language,
-        "timestamp": time.time()
-    }
-    
+def save_state_to_file(*fields: str):
+    """Save state fields (all when none are named) to the shared state"""
+    values = globals()
     try:
-        STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(STATE_FILE, 'w') as f:
-            json.dump(state, f)
+        for field in fields or STATE_FIELDS:
+            shared_state[field] = values[field]
     except Exception as e:
         print(f"Error saving state: {e}")
 
 def load_state_from_file():
-    """Load state from shared file"""
+    """Load state from the shared state"""
     global is_awake, is_verified, verified_user_name, verified_user_id, last_activity, preferred_language
     
     try:
-        if STATE_FILE.exists():
+        state = shared_state.to_dict()
+        if not state and STATE_FILE.exists():
             with open(STATE_FILE, 'r') as f:
                 state = json.load(f)
-            
+        if state:
             is_awake = state.get("is_awake", True)
             is_verified = state.get("is_verified", False)
             verified_user_name = state.get("verified_user_name")
@@ -85,13 +84,14 @@ def update_activity():
     """Update the last activity timestamp"""
     global last_activity
     last_activity = time.time()
-    save_state_to_file()
+    save_state_to_file("last_activity")
 
 def check_auto_sleep():
     """Check if Clara should auto-sleep due to inactivity"""
     global is_awake, last_activity
     if is_awake and (time.time() - last_activity) > AUTO_SLEEP_TIMEOUT:
         is_awake = False
+        save_state_to_file("is_awake")
         return get_message("auto_sleep_notice", get_preferred_language())
     return None
 
@@ -101,7 +101,8 @@ def set_user_verified(name: str, user_id: str = None):
     is_verified = True
     verified_user_name = name
     verified_user_id = user_id
-    update_activity()  # This now saves state to file
+    save_state_to_file("is_verified", "verified_user_name", "verified_user_id")
+    update_activity()
     print(f" User verified: {name} (ID: {user_id})")
     
 def clear_verification():
@@ -110,10 +111,11 @@ def clear_verification():
     is_verified = False
     verified_user_name = None
     verified_user_id = None
-    save_state_to_file()
+    save_state_to_file("is_verified", "verified_user_name", "verified_user_id")
 
 def get_state():
-    """Get current state information"""
+    """Get current state information (as last saved by any process)"""
+    load_state_from_file()
     return {
         "is_awake": is_awake,
         "is_verified": is_verified,
@@ -131,7 +133,7 @@ def get_preferred_language() -> str:
 def set_preferred_language(lang_label: str) -> None:
     global preferred_language
     preferred_language = resolve_language_code(lang_label)
-    save_state_to_file()
+    save_state_to_file("preferred_language")
 
 
 def _detect_language_by_script(text: str) -> str | None:
@@ -1,44 +1,134 @@
-import io
-import pickle
 from pathlib import Path
 
 import boto3
 from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
-import face_recognition
 
 from tools.config import (
     FACE_IMAGE_BUCKET,
     FACE_S3_BUCKET,
     FACE_IMAGE_PREFIX,
     FACE_IMAGE_EXTENSION,
-    FACE_ENCODING_S3_KEY,
+    FACE_STORE_S3_PREFIX,
+    get_face_encode_settings,
+    get_face_gallery_dtype,
+    get_face_pipeline_settings,
+    get_face_shard_settings,
+    get_face_store_dir,
+    get_face_store_transfer_settings,
+    get_face_template_options,
 )
+from tools.employee_repository import get_employee_offices
+from tools.face_backends import get_face_backend
+from tools.face_batch_encoder import (
+    ENCODER_DIR,
+    EncodeManifest,
+    run_batch_encode,
+    select_templates,
+    snapshot_fingerprint,
+)
+from tools.face_shards import shard_key, shard_location, update_shard_index
+from tools.face_store import next_snapshot_version, publish_to_s3, write_snapshot
 
 def _get_s3_client():
     return boto3.client("s3")
 
 
-def _list_employee_images(client, bucket: str, prefix: str | None) -> list[str]:
+def _list_employee_images(client, bucket: str, prefix: str | None) -> list[dict]:
     paginator = client.get_paginator("list_objects_v2")
     kwargs = {"Bucket": bucket}
     if prefix:
         kwargs["Prefix"] = prefix
 
-    keys: list[str] = []
+    entries: list[dict] = []
     for page in paginator.paginate(**kwargs):
         contents = page.get("Contents", [])
         for entry in contents:
             key = entry.get("Key")
             if not key or key.endswith("/"):
                 continue
-            keys.append(key)
-    return keys
+            entries.append(entry)
+    return entries
+
+
+def _employee_id_from_key(key: str, prefix: str) -> str:
+    """``<prefix>/E001.jpg`` and ``<prefix>/E001/<anything>.jpg`` both belong to E001."""
+    relative = key[len(prefix):].lstrip("/") if prefix and key.startswith(prefix) else key
+    parts = Path(relative).parts
+    return parts[0] if len(parts) > 1 else Path(relative).stem
+
 
+def _group_images_by_employee(entries: list[dict], prefix: str, allowed_exts: set[str], max_templates: int) -> dict[str, list[str]]:
+    """Newest ``max_templates`` image keys per employee, oldest first."""
+    grouped: dict[str, list[dict]] = {}
+    for entry in entries:
+        if allowed_exts and Path(entry["Key"]).suffix.lower() not in allowed_exts:
+            continue
+        grouped.setdefault(_employee_id_from_key(entry["Key"], prefix), []).append(entry)
+
+    return {
+        employee_id: [
+            entry["Key"]
+            for entry in sorted(images, key=lambda item: (item.get("LastModified") or 0, item["Key"]))[-max_templates:]
+        ]
+        for employee_id, images in grouped.items()
+    }
 
-def _load_image_from_s3(client, bucket: str, key: str):
+
+def _load_image_from_s3(client, bucket: str, key: str) -> bytes:
     response = client.get_object(Bucket=bucket, Key=key)
-    body = response["Body"].read()
-    return face_recognition.load_image_file(io.BytesIO(body))
+    return response["Body"].read()
+
+
+def _publish_shards(s3, bucket: str | None, manifest: EncodeManifest, jobs: list[dict], encodings: list, ids: list[str], embedder: str, failed: int) -> None:
+    """Write one snapshot per office; only shards whose images changed are rewritten and published."""
+    offices = get_employee_offices()
+    if offices is None:
+        print("❌ Could not read employee offices; shards not written")
+        return
+
+    rows_by_shard: dict[str, list[int]] = {}
+    for row, employee_id in enumerate(ids):
+        rows_by_shard.setdefault(shard_key(offices.get(employee_id)), []).append(row)
+    jobs_by_shard: dict[str, list[dict]] = {}
+    for job in jobs:
+        jobs_by_shard.setdefault(shard_key(offices.get(job["employee_id"])), []).append(job)
+    # Offices emptied since the last run get an empty snapshot, so employees who moved drop out
+    for shard in manifest.published_shards:
+        rows_by_shard.setdefault(shard, [])
+
+    dtype = get_face_gallery_dtype()
+    entries: dict[str, dict] = {}
+    for shard, rows in sorted(rows_by_shard.items()):
+        fingerprint = snapshot_fingerprint(jobs_by_shard.get(shard, []), embedder, dtype)
+        if manifest.published_shards.get(shard) == fingerprint and not failed:
+            continue
+
+        store_dir, prefix = shard_location(shard)
+        version = next_snapshot_version(store_dir, s3 if bucket else None, bucket, prefix)
+        snapshot = write_snapshot(
+            store_dir,
+            [encodings[row] for row in rows],
+            [ids[row] for row in rows],
+            version=version,
+            embedder=embedder,
+            dtype=dtype,
+        )
+        if bucket and not publish_to_s3(store_dir, s3, bucket, prefix, **get_face_store_transfer_settings()):
+            print(f"❌ Failed to upload shard {shard} to S3")
+            continue
+
+        employees = len({ids[row] for row in rows})
+        print(f"[INFO] Shard {shard}: snapshot v{snapshot.version}, {len(rows)} encoding(s) of {employees} employee(s)")
+        entries[shard] = {"employees": employees, "encodings": len(rows), "version": snapshot.version}
+        # Failed images are retried next run, so only a complete snapshot counts as published
+        if not failed:
+            manifest.published_shards[shard] = fingerprint
+
+    if not entries:
+        print("✔ No office's employee images changed since the last snapshots; nothing to upload.")
+        return
+    update_shard_index(entries, s3 if bucket else None, bucket)
+    print(f"[INFO] {len(entries)} of {len(rows_by_shard)} shard(s) rewritten")
 
 
 def main():
@@ -55,63 +145,103 @@ def main():
 
     print(f"[INFO] Listing employee images from s3://{image_bucket}/{image_prefix}")
     try:
-        image_keys = _list_employee_images(s3, image_bucket, image_prefix or None)
+        image_entries = _list_employee_images(s3, image_bucket, image_prefix or None)
     except (BotoCoreError, ClientError, NoCredentialsError) as exc:
         print(f"❌ Failed to list employee images from S3: {exc}")
         return
 
-    if not image_keys:
+    if not image_entries:
         print("⚠️ No employee images found in S3")
         return
 
-    known_encodings: list = []
-    known_ids: list[str] = []
-
-    for key in sorted(image_keys):
-        suffix = Path(key).suffix.lower()
-        if allowed_exts and suffix not in allowed_exts:
-            continue
-
-        try:
-            image = _load_image_from_s3(s3, image_bucket, key)
-        except Exception as exc:
-            print(f"  ⚠ Failed to load {key}: {exc}")
-            continue
-
-        encodings = face_recognition.face_encodings(image)
-        if not encodings:
-            print(f"  ⚠ No face found in {key}")
-            continue
-
-        encoding = encodings[0]
-        known_encodings.append(encoding)
-        employee_id = Path(key).stem
-        known_ids.append(employee_id)
-        print(f"  ✔ Encoded Employee ID: {employee_id}")
-
+    backend = get_face_backend()
+    print(f"[INFO] Encoding with the {backend.name} backend (embedder {backend.embedder_id})")
+    # Reference photos: full decoded resolution, no quality gate (a soft photo beats none)
+    pipeline = {**get_face_pipeline_settings(), "decode_max_side": 0}
+    max_templates = get_face_template_options()["max_templates"]
+    images_by_employee = _group_images_by_employee(image_entries, image_prefix, allowed_exts, max_templates)
+    etags = {entry["Key"]: entry.get("ETag") for entry in image_entries}
+    jobs = [
+        {"key": key, "etag": etags.get(key), "employee_id": employee_id}
+        for employee_id in sorted(images_by_employee)
+        for key in images_by_employee[employee_id]
+    ]
+
+    # Unchanged images (same ETag, same embedder) are reused from the manifest;
+    # a checkpoint left by an interrupted run is picked up here
+    store_dir = get_face_store_dir()
+    manifest = EncodeManifest(store_dir / ENCODER_DIR, backend.embedder_id)
+    resumed = manifest.load()
+    if resumed:
+        print(f"[INFO] Resuming an interrupted run ({resumed} image(s) already encoded)")
+
+    settings = get_face_encode_settings()
+    print(
+        f"[INFO] {len(jobs)} image(s) for {len(images_by_employee)} employee(s); "
+        f"{settings['download_workers']} download thread(s), {settings['encode_workers']} encoding process(es)"
+    )
+    counters = run_batch_encode(
+        jobs,
+        lambda key: _load_image_from_s3(s3, image_bucket, key),
+        manifest,
+        download_workers=settings["download_workers"],
+        encode_workers=settings["encode_workers"],
+        checkpoint_every=settings["checkpoint_every"],
+        backend_name=backend.name,
+        pipeline=pipeline,
+    )
+    print(
+        f"[INFO] Encoded {counters['encoded']}, unchanged {counters['skipped']}, "
+        f"no face {counters['no_face']}, failed {counters['failed']}"
+    )
+
+    known_encodings, known_ids = select_templates(manifest, images_by_employee)
+    fingerprint = snapshot_fingerprint(jobs, backend.embedder_id, get_face_gallery_dtype())
     if not known_encodings:
+        manifest.compact(etags)
         print("⚠️ No face encodings were generated. Nothing to upload.")
         return
 
-    data = {"encodings": known_encodings, "employee_ids": known_ids}
-    payload = pickle.dumps(data)
-
     encoding_bucket = FACE_S3_BUCKET or FACE_IMAGE_BUCKET
-    encoding_key = FACE_ENCODING_S3_KEY
-
-    if encoding_bucket and encoding_key:
-        try:
-            s3.put_object(
-                Bucket=encoding_bucket,
-                Key=encoding_key,
-                Body=payload,
-                ContentType="application/octet-stream",
-            )
-            print(f"[INFO] Face encodings saved to s3://{encoding_bucket}/{encoding_key}")
-        except (BotoCoreError, ClientError, NoCredentialsError) as exc:
-            print(f"❌ Failed to upload face encodings to S3: {exc}")
+    if get_face_shard_settings()["enabled"]:
+        _publish_shards(s3, encoding_bucket, manifest, jobs, known_encodings, known_ids, backend.embedder_id, counters["failed"])
+        manifest.compact(etags)
+        return
+
+    if manifest.published == fingerprint and not counters["failed"]:
+        manifest.compact(etags)
+        print("✔ No employee images changed since the last snapshot; nothing to upload.")
+        return
+
+    version = next_snapshot_version(
+        store_dir, s3 if encoding_bucket else None, encoding_bucket, FACE_STORE_S3_PREFIX
+    )
+    snapshot = write_snapshot(
+        store_dir,
+        known_encodings,
+        known_ids,
+        version=version,
+        embedder=backend.embedder_id,
+        dtype=get_face_gallery_dtype(),
+    )
+    print(f"[INFO] Face store snapshot v{snapshot.version} written to {store_dir}")
+
+    published = True
+    if encoding_bucket:
+        published = publish_to_s3(
+            store_dir, s3, encoding_bucket, FACE_STORE_S3_PREFIX, **get_face_store_transfer_settings()
+        )
+        if published:
+            print(f"[INFO] Face encodings saved to s3://{encoding_bucket}/{FACE_STORE_S3_PREFIX}")
+        else:
+            print("❌ Failed to upload face encodings to S3")
     else:
-        print("✔ FACE_S3_BUCKET/FACE_IMAGE_BUCKET or FACE_ENCODING_S3_KEY not configured; skipping S3 upload")
+        print("✔ FACE_S3_BUCKET/FACE_IMAGE_BUCKET not configured; skipping S3 upload")
+
+    # Failed images are retried next run, so only a complete snapshot counts as published
+    if published and not counters["failed"]:
+        manifest.published = fingerprint
+    manifest.compact(etags)
 
 
 if __name__ == "__main__":
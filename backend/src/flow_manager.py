@@ -6,13 +6,21 @@ This module implements the complete flow logic based on the provided flowchart:
 2. Employee Path: Face Recognition → Manual Verification → Face Registration
 3. Visitor Path: Information Collection → Host Notification → Face Capture
 4. Tool Access Control → Flow Completion
+
+One process serves many kiosks: every flow step takes the ``kiosk_id`` of
+the kiosk (LiveKit room) it acts on, each kiosk has its own active session,
+and steps for the same kiosk are serialized by a per-kiosk lock while
+different kiosks proceed in parallel.
 """
 
 import time
-import json
+import threading
+import uuid
 from datetime import datetime
 from enum import Enum
-from typing import Dict, Any, Optional, Tuple
+from functools import wraps
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
 
 from language_utils import (
@@ -21,8 +29,12 @@ from language_utils import (
     SUPPORTED_LANGUAGES,
     normalize_transcript,
 )
-from tools.config import is_face_recognition_enabled
+from tools.config import get_flow_persistence_settings, is_face_recognition_enabled
 from agent_state import get_preferred_language, set_preferred_language
+from flow_persistence import open_session_store
+from flow_signal import DEFAULT_KIOSK_ID, kiosk_key
+
+FLOW_SESSIONS_FILE = Path(__file__).parent.parent / "data" / "flow_sessions.json"
 
 
 class FlowState(Enum):
@@ -63,20 +75,96 @@ class FlowSession:
     user_data: Dict[str, Any]
     is_verified: bool
     verification_method: Optional[str] = None
+    kiosk_id: str = DEFAULT_KIOSK_ID
+
+
+def _session_record(session: FlowSession) -> Dict[str, Any]:
+    return {
+        "session_id": session.session_id,
+        "current_state": session.current_state.value,
+        "user_type": session.user_type.value,
+        "start_time": session.start_time,
+        "last_activity": session.last_activity,
+        "verification_attempts": session.verification_attempts,
+        "user_data": session.user_data,
+        "is_verified": session.is_verified,
+        "verification_method": session.verification_method,
+        "kiosk_id": session.kiosk_id
+    }
+
+
+def _session_from_record(record: Dict[str, Any]) -> FlowSession:
+    return FlowSession(
+        session_id=record["session_id"],
+        current_state=FlowState(record["current_state"]),
+        user_type=UserType(record["user_type"]),
+        start_time=record["start_time"],
+        last_activity=record["last_activity"],
+        verification_attempts=record["verification_attempts"],
+        user_data=record["user_data"],
+        is_verified=record["is_verified"],
+        verification_method=record.get("verification_method"),
+        kiosk_id=record.get("kiosk_id", DEFAULT_KIOSK_ID)
+    )
+
+
+def _kiosk_locked(method):
+    """Run a flow step under its kiosk's lock, with ``kiosk_id`` normalized.
+
+    The step's changes are on disk before it returns to the caller.
+    """
+    @wraps(method)
+    def wrapper(self, *args, kiosk_id: Optional[str] = None, **kwargs):
+        kiosk_id = kiosk_key(kiosk_id)
+        with self.kiosk_lock(kiosk_id):
+            result = method(self, *args, kiosk_id=kiosk_id, **kwargs)
+        with self._lock:
+            self._transitions += 1
+        self.flush_sessions()
+        return result
+    return wrapper
 
 
 class VirtualReceptionistFlow:
     """Main flow manager implementing the flowchart logic"""
     
-    def __init__(self):
+    def __init__(self, sessions_file: Optional[Path] = None):
+        self.sessions_file = Path(sessions_file) if sessions_file else FLOW_SESSIONS_FILE
         self.sessions: Dict[str, FlowSession] = {}
-        self.current_session_id: Optional[str] = None
+        # kiosk id -> session id of the kiosk's active session
+        self.active_sessions: Dict[str, str] = {}
+        # Guards the two maps above; each kiosk's steps hold that kiosk's lock
+        self._lock = threading.RLock()
+        self._kiosk_locks: Dict[str, threading.RLock] = {}
+        self._transitions = 0
+        self._writer = open_session_store(self.sessions_file, get_flow_persistence_settings())
         self.load_sessions()
-    
-    def create_session(self, session_id: str = None) -> str:
-        """Create a new flow session"""
+
+    @property
+    def current_session_id(self) -> Optional[str]:
+        """Active session of the default kiosk (single-kiosk deployments)"""
+        return self.active_sessions.get(DEFAULT_KIOSK_ID)
+
+    def kiosk_lock(self, kiosk_id: Optional[str] = None) -> threading.RLock:
+        """Lock serializing one kiosk's flow steps (re-entrant)"""
+        kiosk_id = kiosk_key(kiosk_id)
+        with self._lock:
+            lock = self._kiosk_locks.get(kiosk_id)
+            if lock is None:
+                lock = self._kiosk_locks[kiosk_id] = threading.RLock()
+            return lock
+
+    def _language(self, session: Optional[FlowSession]) -> str:
+        """Language chosen at the session's kiosk, else the process-wide preference"""
+        if session and session.user_data.get("language"):
+            return session.user_data["language"]
+        return get_preferred_language()
+
+    def create_session(self, session_id: str = None, kiosk_id: Optional[str] = None) -> str:
+        """Create a new flow session and make it the kiosk's active one"""
+        kiosk_id = kiosk_key(kiosk_id)
         if session_id is None:
-            session_id = f"session_{int(time.time() * 1000)}"
+            session_id = f"session_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}"
         
         session = FlowSession(
             session_id=session_id,
@@ -86,46 +174,103 @@ class VirtualReceptionistFlow:
             last_activity=time.time(),
             verification_attempts=0,
             user_data={},
-            is_verified=False
+            is_verified=False,
+            kiosk_id=kiosk_id,
         )
         
-        self.sessions[session_id] = session
-        self.current_session_id = session_id
-        self.save_sessions()
+        with self._lock:
+            self.sessions[session_id] = session
+            self.active_sessions[kiosk_id] = session_id
+        self.save_sessions(session)
         return session_id
     
-    def get_current_session(self) -> Optional[FlowSession]:
-        """Get the current active session"""
-        if self.current_session_id and self.current_session_id in self.sessions:
-            return self.sessions[self.current_session_id]
-        return None
-    def process_wake_word_detected(self) -> Tuple[bool, str]:
+    def get_session(self, session_id: str) -> Optional[FlowSession]:
+        """Look a session up by its id"""
+        with self._lock:
+            return self.sessions.get(session_id)
+
+    def get_current_session(self, kiosk_id: Optional[str] = None) -> Optional[FlowSession]:
+        """Get the kiosk's active session"""
+        kiosk_id = kiosk_key(kiosk_id)
+        if self._writer.shared:
+            self._refresh_kiosk(kiosk_id)
+        with self._lock:
+            session_id = self.active_sessions.get(kiosk_id)
+            return self.sessions.get(session_id) if session_id else None
+
+    def _refresh_kiosk(self, kiosk_id: str):
+        """Pick up the kiosk's active session as another process left it (shared stores)"""
+        try:
+            stored = self._writer.refresh_kiosk(kiosk_id)
+        except Exception as e:
+            print(f"Error refreshing flow session of {kiosk_id}: {e}")
+            return
+        if stored is None:
+            return
+        session_id, record = stored
+        with self._lock:
+            if session_id is None:
+                self.active_sessions.pop(kiosk_id, None)
+                return
+            if record is not None:
+                self.sessions[session_id] = _session_from_record(record)
+            if session_id in self.sessions:
+                self.active_sessions[kiosk_id] = session_id
+
+    def sessions_in_state(self, state: FlowState) -> List[FlowSession]:
+        """Sessions currently in ``state``, least recently active first"""
+        if self._writer.shared:
+            return [_session_from_record(record) for record in self._writer.records_in_state(state.value)]
+        with self._lock:
+            sessions = [session for session in self.sessions.values() if session.current_state == state]
+        return sorted(sessions, key=lambda session: session.last_activity)
+
+    def ensure_session(self, kiosk_id: Optional[str] = None) -> FlowSession:
+        """The kiosk's active session, created when there is none"""
+        with self.kiosk_lock(kiosk_id):
+            session = self.get_current_session(kiosk_id)
+            if session is None:
+                session = self.get_session(self.create_session(kiosk_id=kiosk_id))
+            return session
+
+    def list_kiosks(self) -> List[Dict[str, Any]]:
+        """Flow status of every kiosk with an active session"""
+        if self._writer.shared:
+            kiosks = self._writer.active_kiosks()
+        else:
+            with self._lock:
+                kiosks = sorted(self.active_sessions)
+        return [self.get_flow_status(kiosk_id=kiosk_id) for kiosk_id in kiosks]
+
+    @_kiosk_locked
+    def process_wake_word_detected(self, kiosk_id: str = DEFAULT_KIOSK_ID) -> Tuple[bool, str]:
         """Process wake word detection - start of flow"""
         # Create new session or reset existing one
-        session_id = self.create_session()
-        session = self.get_current_session()
+        self.create_session(kiosk_id=kiosk_id)
+        session = self.get_current_session(kiosk_id)
 
         if session:
             session.current_state = FlowState.LANGUAGE_SELECTION
             session.last_activity = time.time()
 
-        self.save_sessions()
+        self.save_sessions(session)
         # Return localized greeting. The caller (agent/frontend) will append the wake prompt.
-        lang = get_preferred_language()
+        lang = self._language(session)
         greeting = get_message("wake_intro", lang)
         language_prompt = get_message("language_selection_prompt", lang)
         combined = f"{greeting} {language_prompt}"
         print(f"[Flow] Wake message ({lang}): {combined}")
         return True, combined
     
-    def process_user_classification(self, user_input: str) -> Tuple[bool, str, FlowState]:
+    @_kiosk_locked
+    def process_user_classification(self, user_input: str, kiosk_id: str = DEFAULT_KIOSK_ID) -> Tuple[bool, str, FlowState]:
         """Process user type classification"""
-        session = self.get_current_session()
+        session = self.get_current_session(kiosk_id)
         if not session:
-            lang = get_preferred_language()
+            lang = self._language(session)
             return False, get_message("manual_no_session", lang), FlowState.IDLE
 
-        lang = get_preferred_language()
+        lang = self._language(session)
         user_input_clean = user_input.strip()
         user_input_normalized = normalize_transcript(user_input_clean, lang)
         user_input_lower = user_input_normalized.lower()
@@ -138,9 +283,10 @@ class VirtualReceptionistFlow:
                 return False, response, FlowState.LANGUAGE_SELECTION
 
             set_preferred_language(lang_choice)
+            session.user_data["language"] = lang_choice
             session.current_state = FlowState.USER_CLASSIFICATION
             session.last_activity = time.time()
-            self.save_sessions()
+            self.save_sessions(session)
 
             response = get_message("language_selection_confirmed", lang_choice)
             print(f"[Flow] Language selected ({lang_choice}): '{response}'")
@@ -162,11 +308,12 @@ class VirtualReceptionistFlow:
                 from flow_signal import post_signal
                 post_signal("start_face_capture", {
                     "message": response,
-                    "next_endpoint": "/flow/face_recognition"
-                })
+                    "next_endpoint": "/flow/face_recognition",
+                    "stream_endpoint": "/flow/face_recognition/ws"
+                }, kiosk_id=kiosk_id)
             except Exception as e:
                 print(f"Warning: could not post start_face_capture signal: {e}")
-            self.save_sessions()
+            self.save_sessions(session)
             print(f"[Flow] Classified as EMPLOYEE ({lang}): '{response}'")
             return True, response, FlowState.FACE_RECOGNITION
 
@@ -187,10 +334,10 @@ class VirtualReceptionistFlow:
                 post_signal("start_visitor_info", {
                     "message": response,
                     "next_endpoint": "/flow/visitor_info"
-                })
+                }, kiosk_id=kiosk_id)
             except Exception as e:
                 print(f"Warning: could not post start_visitor_info signal on classification: {e}")
-            self.save_sessions()
+            self.save_sessions(session)
             print(f"[Flow] Classified as VISITOR ({lang}): '{response}'")
             return True, response, FlowState.VISITOR_INFO_COLLECTION
 
@@ -199,14 +346,14 @@ class VirtualReceptionistFlow:
         print(f"[Flow] Unclear classification ({lang}): '{response}'")
         return False, response, FlowState.USER_CLASSIFICATION
     
-    def process_face_recognition_result(self, face_result: Dict[str, Any]) -> Tuple[bool, str, FlowState]:
+    @_kiosk_locked
+    def process_face_recognition_result(self, face_result: Dict[str, Any], kiosk_id: str = DEFAULT_KIOSK_ID) -> Tuple[bool, str, FlowState]:
         """Process face recognition results for employees"""
-        session = self.get_current_session()
+        session = self.get_current_session(kiosk_id)
 
         # Recover from stale session issues (e.g. session ended just before recognition finished)
         if not session:
-            self.create_session()
-            session = self.get_current_session()
+            session = self.ensure_session(kiosk_id)
 
         if session and session.user_type != UserType.EMPLOYEE:
             # A valid face recognition success should promote the user to EMPLOYEE
@@ -217,20 +364,20 @@ class VirtualReceptionistFlow:
                 # Gracefully fall back to manual verification instead of a hard error
                 session.user_type = UserType.EMPLOYEE
                 session.current_state = FlowState.MANUAL_VERIFICATION
-                self.save_sessions()
-                lang = get_preferred_language()
+                self.save_sessions(session)
+                lang = self._language(session)
                 return False, get_message("manual_face_not_recognized", lang), FlowState.MANUAL_VERIFICATION
 
         if not session:
-            lang = get_preferred_language()
+            lang = self._language(session)
             return False, get_message("manual_invalid_session", lang), FlowState.IDLE
 
         if face_result.get("status") == "success":
             if not is_face_recognition_enabled():
                 session.current_state = FlowState.MANUAL_VERIFICATION
                 session.verification_attempts += 1
-                self.save_sessions()
-                lang = get_preferred_language()
+                self.save_sessions(session)
+                lang = self._language(session)
                 return (
                     False,
                     get_message("manual_face_not_recognized", lang),
@@ -252,8 +399,8 @@ class VirtualReceptionistFlow:
                 # Missing identity details – fall back to manual verification flow
                 session.current_state = FlowState.MANUAL_VERIFICATION
                 session.verification_attempts += 1
-                self.save_sessions()
-                lang = get_preferred_language()
+                self.save_sessions(session)
+                lang = self._language(session)
                 return False, get_message("manual_face_not_recognized", lang), FlowState.MANUAL_VERIFICATION
 
             session.user_data.update({
@@ -274,34 +421,36 @@ class VirtualReceptionistFlow:
             from agent_state import set_user_verified
             set_user_verified(emp_name, emp_id)
 
-            self.save_sessions()
-            lang = get_preferred_language()
+            self.save_sessions(session)
+            lang = self._language(session)
             return True, get_message("face_recognition_success", lang, name=emp_name), FlowState.EMPLOYEE_VERIFIED
         else:
             # Face not matched - proceed to manual verification
             session.current_state = FlowState.MANUAL_VERIFICATION
             session.verification_attempts += 1
-            self.save_sessions()
-            lang = get_preferred_language()
+            self.save_sessions(session)
+            lang = self._language(session)
             return False, get_message("manual_face_not_recognized", lang), FlowState.MANUAL_VERIFICATION
     
+    @_kiosk_locked
     def process_manual_verification_step(
         self,
         email: str = None,
         otp: str = None,
         name: str = None,
         employee_id: str = None,
+        kiosk_id: str = DEFAULT_KIOSK_ID,
     ) -> Tuple[bool, str, FlowState]:
         """Process manual employee verification steps"""
-        session = self.get_current_session()
+        session = self.get_current_session(kiosk_id)
         if not session:
-            lang = get_preferred_language()
+            lang = self._language(session)
             return False, get_message("manual_no_session", lang), FlowState.IDLE
 
         resolved_email = email
 
         if not employee_id:
-            lang = get_preferred_language()
+            lang = self._language(session)
             return False, get_message("manual_missing_employee_id", lang), FlowState.MANUAL_VERIFICATION
 
         if not resolved_email and employee_id:
@@ -328,7 +477,7 @@ class VirtualReceptionistFlow:
             from tools.employee_verification import get_employee_details  # async function
             import asyncio
         except Exception as e:
-            lang = get_preferred_language()
+            lang = self._language(session)
             return False, get_message("manual_preparation_error", lang, error=e), FlowState.MANUAL_VERIFICATION
 
         if otp:
@@ -342,7 +491,7 @@ class VirtualReceptionistFlow:
                     msg = asyncio.run(get_employee_details(None, resolved_email, name, employee_id, otp))
                 except Exception as async_error:
                     print(f"[Flow] Async OTP verification error: {async_error}")
-                    lang = get_preferred_language()
+                    lang = self._language(session)
                     return False, get_message("manual_internal_error_retry", lang), FlowState.MANUAL_VERIFICATION
             except Exception as e:
                 print(f"[Flow] OTP verification error: {e}")
@@ -357,8 +506,8 @@ class VirtualReceptionistFlow:
                 verified_name = session.user_data.get("manual_name") or name
                 verified_id = session.user_data.get("manual_employee_id") or employee_id
                 set_user_verified(verified_name, verified_id)
-                self.save_sessions()
-                lang = get_preferred_language()
+                self.save_sessions(session)
+                lang = self._language(session)
                 credentials_prompt = get_message("manual_credentials_verified", lang, name=verified_name or "")
                 combined_message = msg.strip() if msg else ""
                 if combined_message:
@@ -367,7 +516,7 @@ class VirtualReceptionistFlow:
                     combined_message = credentials_prompt
                 return True, combined_message, FlowState.CREDENTIAL_CHECK
             else:
-                lang = get_preferred_language()
+                lang = self._language(session)
                 return False, (msg or get_message("manual_otp_failed", lang)), FlowState.MANUAL_VERIFICATION
 
         # No OTP yet; send one
@@ -381,11 +530,11 @@ class VirtualReceptionistFlow:
                 msg = asyncio.run(get_employee_details(None, resolved_email, name, employee_id, None))
             except Exception as async_error:
                 print(f"[Flow] Async OTP sending error: {async_error}")
-                lang = get_preferred_language()
+                lang = self._language(session)
                 return False, get_message("manual_otp_send_failed", lang, error=async_error), FlowState.MANUAL_VERIFICATION
         except Exception as e:
             print(f"[Flow] OTP sending error: {e}")
-            lang = get_preferred_language()
+            lang = self._language(session)
             return False, get_message("manual_otp_send_failed", lang, error=e), FlowState.MANUAL_VERIFICATION
 
         if record:
@@ -396,14 +545,15 @@ class VirtualReceptionistFlow:
             if record.get("email"):
                 session.user_data["manual_email"] = record.get("email")
 
-        lang = get_preferred_language()
+        lang = self._language(session)
         return False, (msg or get_message("manual_otp_sent", lang)), FlowState.MANUAL_VERIFICATION
     
-    def process_face_registration_choice(self, register_face: bool) -> Tuple[bool, str, FlowState]:
+    @_kiosk_locked
+    def process_face_registration_choice(self, register_face: bool, kiosk_id: str = DEFAULT_KIOSK_ID) -> Tuple[bool, str, FlowState]:
         """Process face registration after manual verification"""
-        session = self.get_current_session()
+        session = self.get_current_session(kiosk_id)
         if not session or not session.is_verified:
-            lang = get_preferred_language()
+            lang = self._language(session)
             return False, get_message("manual_not_verified", lang), FlowState.IDLE
         
         if register_face:
@@ -412,24 +562,25 @@ class VirtualReceptionistFlow:
             try:
                 from flow_signal import post_signal
                 post_signal("start_face_registration", {
-                    "message": get_message("face_registration_ready", get_preferred_language()),
+                    "message": get_message("face_registration_ready", self._language(session)),
                     "next_endpoint": "/flow/register_face"
-                })
+                }, kiosk_id=kiosk_id)
             except Exception as _e:
                 print(f"Warning: could not post start_face_registration signal: {_e}")
-            self.save_sessions()
-            lang = get_preferred_language()
+            self.save_sessions(session)
+            lang = self._language(session)
             return True, get_message("face_registration_ready", lang), FlowState.FACE_REGISTRATION
         else:
             # Skip face registration and go directly to conversation mode
             session.current_state = FlowState.EMPLOYEE_VERIFIED
-            self.save_sessions()
-            lang = get_preferred_language()
+            self.save_sessions(session)
+            lang = self._language(session)
             return True, get_message("face_registration_skip_ack", lang), FlowState.EMPLOYEE_VERIFIED
     
-    def process_face_registration_completion(self, success: bool, message: str = None) -> Tuple[bool, str, FlowState]:
+    @_kiosk_locked
+    def process_face_registration_completion(self, success: bool, message: str = None, kiosk_id: str = DEFAULT_KIOSK_ID) -> Tuple[bool, str, FlowState]:
         """Process face registration completion - matches flowchart"""
-        session = self.get_current_session()
+        session = self.get_current_session(kiosk_id)
         if not session or not session.is_verified:
             return False, "Invalid session or not verified", FlowState.IDLE
         
@@ -437,28 +588,36 @@ class VirtualReceptionistFlow:
             # Face registration successful - transition to final state
             session.current_state = FlowState.EMPLOYEE_VERIFIED
             session.user_data["face_registered"] = True
-            self.save_sessions()
-            lang = get_preferred_language()
+            self.save_sessions(session)
+            lang = self._language(session)
             return True, get_message("face_registration_success", lang), FlowState.EMPLOYEE_VERIFIED
         else:
             # Face registration failed - still give access but without face registration
             session.current_state = FlowState.EMPLOYEE_VERIFIED
-            self.save_sessions()
-            lang = get_preferred_language()
+            self.save_sessions(session)
+            lang = self._language(session)
             failure_detail = message or 'Unknown error'
             return True, f"{get_message('face_registration_skip_ack', lang)} ({failure_detail})", FlowState.EMPLOYEE_VERIFIED
     
-    async def process_visitor_info(self, name: str, phone: str, purpose: str, host_employee: str) -> Tuple[bool, str, FlowState]:
+    async def process_visitor_info(
+        self, name: str, phone: str, purpose: str, host_employee: str, kiosk_id: Optional[str] = None
+    ) -> Tuple[bool, str, FlowState]:
         """Process visitor information collection"""
+        return self._process_visitor_info(name, phone, purpose, host_employee, kiosk_id=kiosk_id)
+
+    @_kiosk_locked
+    def _process_visitor_info(
+        self, name: str, phone: str, purpose: str, host_employee: str, kiosk_id: str = DEFAULT_KIOSK_ID
+    ) -> Tuple[bool, str, FlowState]:
         try:
             print(f"[Flow] process_visitor_info starting with: name='{name}', phone='{phone}', purpose='{purpose}', host='{host_employee}'")
 
-            session = self.get_current_session()
+            session = self.get_current_session(kiosk_id)
             if not session or session.user_type != UserType.VISITOR:
                 print(f"[Flow] ERROR: Invalid session or user type. Session: {session}, UserType: {session.user_type if session else 'None'}")
                 return False, "Invalid session or user type", FlowState.IDLE
 
-            lang = get_preferred_language()
+            lang = self._language(session)
             updated = False
 
             name_candidate = (name or "").strip()
@@ -487,23 +646,23 @@ class VirtualReceptionistFlow:
 
             if not trimmed_name:
                 if updated:
-                    self.save_sessions()
+                    self.save_sessions(session)
                 return False, get_message("visitor_need_name", lang), FlowState.VISITOR_INFO_COLLECTION
             if not trimmed_phone:
                 if updated:
-                    self.save_sessions()
+                    self.save_sessions(session)
                 return False, get_message("visitor_need_phone", lang), FlowState.VISITOR_INFO_COLLECTION
             if not trimmed_purpose:
                 if updated:
-                    self.save_sessions()
+                    self.save_sessions(session)
                 return False, get_message("visitor_need_purpose", lang), FlowState.VISITOR_INFO_COLLECTION
             if not trimmed_host:
                 if updated:
-                    self.save_sessions()
+                    self.save_sessions(session)
                 return False, get_message("visitor_need_host", lang), FlowState.VISITOR_INFO_COLLECTION
 
             if updated:
-                self.save_sessions()
+                self.save_sessions(session)
 
             session.user_data.update({
                 "visitor_name": trimmed_name,
@@ -513,7 +672,7 @@ class VirtualReceptionistFlow:
             })
             session.current_state = FlowState.HOST_NOTIFICATION
             session.last_activity = time.time()
-            self.save_sessions()
+            self.save_sessions(session)
             print(f"[Flow] Visitor info received: name='{trimmed_name}', phone='{trimmed_phone}', purpose='{trimmed_purpose}', host='{trimmed_host}'")
 
             # Signal frontend to capture photo instead of creating placeholder
@@ -524,8 +683,8 @@ class VirtualReceptionistFlow:
                     "message": get_message("flow_visitor_face_capture_prompt", lang),
                     "next_endpoint": "/flow/visitor_photo",
                     "visitor_name": trimmed_name
-                })
-                self.save_sessions()
+                }, kiosk_id=kiosk_id)
+                self.save_sessions(session)
                 print(f"[Flow] Photo capture signal sent for visitor: {trimmed_name}")
                 prompt = get_message("visitor_photo_prompt", lang, host=trimmed_host)
                 return True, prompt, FlowState.HOST_NOTIFICATION
@@ -541,9 +700,10 @@ class VirtualReceptionistFlow:
             traceback.print_exc()
             return False, f"Error processing visitor information: {str(e)}", FlowState.IDLE
     
-    def process_visitor_face_capture(self, captured: bool = True) -> Tuple[bool, str, FlowState]:
+    @_kiosk_locked
+    def process_visitor_face_capture(self, captured: bool = True, kiosk_id: str = DEFAULT_KIOSK_ID) -> Tuple[bool, str, FlowState]:
         """Process visitor face capture"""
-        session = self.get_current_session()
+        session = self.get_current_session(kiosk_id)
         if not session or session.user_type != UserType.VISITOR:
             return False, "Invalid session or user type", FlowState.IDLE
 
@@ -551,14 +711,14 @@ class VirtualReceptionistFlow:
             session.user_data["face_captured"] = True
             session.user_data["face_capture_time"] = datetime.now().isoformat()
             session.current_state = FlowState.FLOW_END
-            self.save_sessions()
+            self.save_sessions(session)
 
             return True, "Visitor Photo captured!", FlowState.FLOW_END
         else:
             return False, "Photo capture failed. Please try again.", FlowState.HOST_NOTIFICATION
 
-    def check_tool_access(self, tool_name: str) -> Tuple[bool, str]:
-        session = self.get_current_session()
+    def check_tool_access(self, tool_name: str, kiosk_id: Optional[str] = None) -> Tuple[bool, str]:
+        session = self.get_current_session(kiosk_id)
         if not session or not session.is_verified:
             if session and session.user_type == UserType.VISITOR:
                 return False, "Visitors have limited access. Your host will assist you with any information needed."
@@ -571,11 +731,14 @@ class VirtualReceptionistFlow:
 
         return True, f"Access granted for {tool_name}. How can I help you?"
 
-    def end_session(self) -> str:
-        """End the current session"""
-        session = self.get_current_session()
+    @_kiosk_locked
+    def end_session(self, kiosk_id: str = DEFAULT_KIOSK_ID) -> str:
+        """End the kiosk's current session"""
+        session = self.get_current_session(kiosk_id)
         if session:
             session.current_state = FlowState.FLOW_END
+            session.last_activity = time.time()
+            self.save_sessions(session)
         
         return "Thank you! Session completed. Say 'Hey Clara' if you need more assistance."
     
@@ -584,90 +747,101 @@ class VirtualReceptionistFlow:
         current_time = time.time()
         max_age_seconds = max_age_hours * 3600
         
-        to_remove = []
-        for session_id, session in self.sessions.items():
-            if (current_time - session.last_activity) > max_age_seconds:
-                to_remove.append(session_id)
+        # Shared stores expire with an indexed delete that covers every process
+        expired = self._writer.expire(current_time - max_age_seconds) if self._writer.shared else []
+        with self._lock:
+            to_remove = set(expired)
+            for session_id, session in self.sessions.items():
+                if (current_time - session.last_activity) > max_age_seconds:
+                    to_remove.add(session_id)
+            
+            for session_id in to_remove:
+                self.sessions.pop(session_id, None)
+            
+            for kiosk_id, session_id in list(self.active_sessions.items()):
+                if session_id not in self.sessions:
+                    del self.active_sessions[kiosk_id]
         
         for session_id in to_remove:
-            del self.sessions[session_id]
-        
-        if self.current_session_id in to_remove:
-            self.current_session_id = None
-        
-        self.save_sessions()
+            self._writer.mark(session_id, None)
+        self._save_active_sessions()
     
-    def save_sessions(self):
-        """Save sessions to file"""
+    def save_sessions(self, session: Optional[FlowSession] = None):
+        """Mark a session (all sessions when none is given) as changed.
+
+        The write-behind writer persists it within ``FLOW_SAVE_INTERVAL_SECONDS``;
+        flow steps flush before returning, other callers use ``flush_sessions``.
+        """
         try:
-            sessions_data = {}
-            for session_id, session in self.sessions.items():
-                sessions_data[session_id] = {
-                    "session_id": session.session_id,
-                    "current_state": session.current_state.value,
-                    "user_type": session.user_type.value,
-                    "start_time": session.start_time,
-                    "last_activity": session.last_activity,
-                    "verification_attempts": session.verification_attempts,
-                    "user_data": session.user_data,
-                    "is_verified": session.is_verified,
-                    "verification_method": session.verification_method
-                }
-            
-            flow_data = {
-                "sessions": sessions_data,
-                "current_session_id": self.current_session_id,
-                "last_updated": time.time()
-            }
-            
-            from pathlib import Path
-            flow_file = Path(__file__).parent.parent / "data" / "flow_sessions.json"
-            flow_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            with open(flow_file, 'w') as f:
-                json.dump(flow_data, f, indent=2)
-                
+            with self._lock:
+                sessions = [session] if session is not None else list(self.sessions.values())
+            for changed in sessions:
+                self._writer.mark(changed.session_id, _session_record(changed))
+            self._save_active_sessions()
         except Exception as e:
             print(f"Error saving flow sessions: {e}")
+
+    def _active_sessions_meta(self) -> Dict[str, Any]:
+        with self._lock:
+            active_sessions = dict(self.active_sessions)
+        return {
+            "active_sessions": active_sessions,
+            "current_session_id": active_sessions.get(DEFAULT_KIOSK_ID),
+        }
+
+    def _save_active_sessions(self):
+        self._writer.set_meta(self._active_sessions_meta())
+
+    def flush_sessions(self) -> bool:
+        """Write pending session changes now (before a change becomes visible to a kiosk)"""
+        return self._writer.flush()
+
+    def close_sessions(self):
+        """Stop the write-behind writer after a final flush (shutdown)"""
+        self._writer.close()
+
+    def persistence_metrics(self) -> Dict[str, Any]:
+        """Write-behind writer metrics plus bytes written per flow step"""
+        metrics = self._writer.metrics()
+        with self._lock:
+            transitions = self._transitions
+        metrics["transitions"] = transitions
+        metrics["bytes_per_transition"] = round(metrics["bytes_written"] / transitions, 1) if transitions else None
+        return metrics
     
     def load_sessions(self):
-        """Load sessions from file"""
+        """Load sessions from the session store"""
         try:
-            from pathlib import Path
-            flow_file = Path(__file__).parent.parent / "data" / "flow_sessions.json"
+            flow_data = self._writer.load()
+            
+            sessions_data = flow_data.get("sessions", {})
+            for session_id, session_data in sessions_data.items():
+                self.sessions[session_id] = _session_from_record(session_data)
+            
+            active_sessions = flow_data.get("active_sessions")
+            if active_sessions is None:
+                # Files written before per-kiosk sessions track one current session
+                current = flow_data.get("current_session_id")
+                active_sessions = {DEFAULT_KIOSK_ID: current} if current else {}
+            self.active_sessions.update(active_sessions)
+            self._writer.reset(
+                {session_id: _session_record(session) for session_id, session in self.sessions.items()},
+                self._active_sessions_meta(),
+            )
+            self.cleanup_old_sessions()
             
-            if flow_file.exists():
-                with open(flow_file, 'r') as f:
-                    flow_data = json.load(f)
-                
-                sessions_data = flow_data.get("sessions", {})
-                for session_id, session_data in sessions_data.items():
-                    session = FlowSession(
-                        session_id=session_data["session_id"],
-                        current_state=FlowState(session_data["current_state"]),
-                        user_type=UserType(session_data["user_type"]),
-                        start_time=session_data["start_time"],
-                        last_activity=session_data["last_activity"],
-                        verification_attempts=session_data["verification_attempts"],
-                        user_data=session_data["user_data"],
-                        is_verified=session_data["is_verified"],
-                        verification_method=session_data.get("verification_method")
-                    )
-                    self.sessions[session_id] = session
-                
-                self.current_session_id = flow_data.get("current_session_id")
-                self.cleanup_old_sessions()
-                
         except Exception as e:
             print(f"Error loading flow sessions: {e}")
     
-    def get_flow_status(self) -> Dict[str, Any]:
-        """Get current flow status for debugging"""
-        session = self.get_current_session()
+    def get_flow_status(self, kiosk_id: Optional[str] = None) -> Dict[str, Any]:
+        """Get the kiosk's flow status for debugging"""
+        kiosk_id = kiosk_key(kiosk_id)
+        session = self.get_current_session(kiosk_id)
         if not session:
-            return {"status": "no_active_session"}
+            return {"status": "no_active_session", "kiosk_id": kiosk_id}
         
         return {
+            "kiosk_id": kiosk_id,
             "session_id": session.session_id,
             "current_state": session.current_state.value,
             "user_type": session.user_type.value,
@@ -678,5 +852,32 @@ class VirtualReceptionistFlow:
         }
 
 
-# Global flow manager instance
-flow_manager = VirtualReceptionistFlow()
\ No newline at end of file
+# Global flow manager instance, created on first use (``from flow_manager import
+# flow_manager`` goes through the module ``__getattr__`` below) so importing the
+# module doesn't open the sessions file
+_flow_manager: Optional[VirtualReceptionistFlow] = None
+_flow_manager_lock = threading.Lock()
+
+
+def get_flow_manager() -> VirtualReceptionistFlow:
+    global _flow_manager
+    if _flow_manager is None:
+        with _flow_manager_lock:
+            if _flow_manager is None:
+                _flow_manager = VirtualReceptionistFlow()
+    return _flow_manager
+
+
+def close_flow_manager() -> None:
+    """Flush and drop the global instance if it was created (the next use opens it again)."""
+    global _flow_manager
+    with _flow_manager_lock:
+        manager, _flow_manager = _flow_manager, None
+    if manager is not None:
+        manager.close_sessions()
+
+
+def __getattr__(name: str):
+    if name == "flow_manager":
+        return get_flow_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
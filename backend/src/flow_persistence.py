@@ -0,0 +1,829 @@
+"""
+Write-behind persistence of flow sessions.
+
+Flow steps mark the sessions they changed; each session is serialized once,
+when it is marked, under its kiosk's lock. A background flusher writes at
+most once per interval, so the two or three saves of one step and the saves
+of concurrent kiosks share a single write. ``flush()`` writes immediately
+when something is pending (the flow manager calls it before a step returns
+to its caller), and ``close()`` flushes on shutdown.
+
+The stores share that machinery (``FLOW_SESSION_STORE``):
+
+* ``json`` rewrites the whole sessions file on every flush. Every write goes
+  to a temporary file that is fsynced and renamed over the sessions file, so
+  readers never see a partial file.
+* ``journal`` (default) appends one line per changed session to a journal
+  next to the sessions file, so a flush costs the same however many sessions
+  are retained. The sessions file becomes a snapshot that the journal is
+  replayed onto when loading; once the journal outgrows its limits it is
+  compacted into a new snapshot, which bounds replay time.
+* ``sqlite`` keeps one row per session in a WAL-mode database with indexed
+  kiosk, state and last-activity columns, so uvicorn and agent processes can
+  share sessions and expiry is an indexed delete.
+* ``shared`` keeps sessions in the shared state backend (``shared_state``),
+  so processes on several hosts can share them through a Redis server.
+"""
+from __future__ import annotations
+
+import atexit
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from flow_signal import DEFAULT_KIOSK_ID
+
+
+def _fsync_dir(directory: Path) -> None:
+    """Make a rename in ``directory`` durable (no-op where directories can't be opened)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_name, path)
+    except Exception:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+    _fsync_dir(path.parent)
+
+
+def _dumps(value: Any) -> bytes:
+    return orjson.dumps(value)
+
+
+# Stores not yet closed; one exit hook per process flushes them
+_open_stores: "weakref.WeakSet[WriteBehindSessionFile]" = weakref.WeakSet()
+_exit_hook_registered = False
+_exit_hook_lock = threading.Lock()
+
+
+def _close_open_stores() -> None:
+    for store in list(_open_stores):
+        store.close()
+
+
+def _track_open_store(store: "WriteBehindSessionFile") -> None:
+    global _exit_hook_registered
+    with _exit_hook_lock:
+        _open_stores.add(store)
+        if not _exit_hook_registered:
+            atexit.register(_close_open_stores)
+            _exit_hook_registered = True
+
+
+class WriteBehindSessionFile:
+    """Coalesced, atomic writes of the flow sessions file."""
+
+    # Whether other processes write the same sessions (the flow manager then reads back)
+    shared = False
+
+    def __init__(self, path: Path, interval: float):
+        self.path = Path(path)
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # session id -> serialized session
+        self._records: Dict[str, bytes] = {}
+        self._meta: Dict[str, Any] = {}
+        self._dirty: set[str] = set()
+        self._meta_dirty = False
+        self._dirty_since: Optional[float] = None
+        # Bumped by every change; the file holds everything up to _written_seq
+        self._seq = 0
+        self._written_seq = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {
+            "changes": 0,
+            "flushes": 0,
+            "sessions_flushed": 0,
+            "bytes_written": 0,
+            "last_flush_bytes": 0,
+            "failures": 0,
+        }
+        self._write_ms = {"total": 0.0, "max": 0.0}
+        self._latency_ms = {"total": 0.0, "max": 0.0}
+        _track_open_store(self)
+
+    def _read_snapshot(self) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Sessions and file-level fields of the sessions file (empty when missing)."""
+        if not self.path.exists():
+            return {}, {}
+        data = orjson.loads(self.path.read_bytes())
+        sessions = data.pop("sessions", None) or {}
+        data.pop("last_updated", None)
+        return sessions, data
+
+    def load(self) -> Dict[str, Any]:
+        """Read what is on disk; returns ``{"sessions": {...}, <file-level fields>}``."""
+        sessions, meta = self._read_snapshot()
+        self.reset(sessions, meta)
+        return {"sessions": sessions, **meta}
+
+    def reset(self, records: Dict[str, Dict[str, Any]], meta: Dict[str, Any]) -> None:
+        """Start from what is already on disk (nothing pending)."""
+        with self._lock:
+            self._records = {session_id: _dumps(record) for session_id, record in records.items()}
+            self._meta = dict(meta)
+            self._dirty.clear()
+            self._meta_dirty = False
+            self._dirty_since = None
+            self._written_seq = self._seq
+
+    def mark(self, session_id: str, record: Optional[Dict[str, Any]]) -> None:
+        """Record a session's new state (None removes it) and schedule a write."""
+        data = _dumps(record) if record is not None else None
+        with self._lock:
+            if data is None:
+                if self._records.pop(session_id, None) is None:
+                    return
+            elif self._records.get(session_id) == data:
+                return
+            else:
+                self._records[session_id] = data
+            self._changed(session_id)
+        self._schedule()
+
+    def set_meta(self, meta: Dict[str, Any]) -> None:
+        """Replace the file-level fields (active sessions per kiosk)."""
+        with self._lock:
+            if meta == self._meta:
+                return
+            self._meta = dict(meta)
+            self._meta_dirty = True
+            self._changed(None)
+        self._schedule()
+
+    def _changed(self, session_id: Optional[str]) -> None:
+        self._seq += 1
+        self._counters["changes"] += 1
+        if session_id is not None:
+            self._dirty.add(session_id)
+        if self._dirty_since is None:
+            self._dirty_since = time.perf_counter()
+
+    def _schedule(self) -> None:
+        if self.interval <= 0:
+            self.flush()
+            self._maintain()
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="flow-session-writer", daemon=True)
+                    self._thread.start()
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait()
+            # Let the rest of the burst arrive before writing
+            if self._stop.wait(self.interval):
+                break
+            self._wake.clear()
+            self.flush()
+            self._maintain()
+
+    def _maintain(self) -> None:
+        """Housekeeping run by the flusher after a write (nothing for a plain file)."""
+
+    @property
+    def pending(self) -> bool:
+        with self._lock:
+            return self._written_seq < self._seq
+
+    def _snapshot_body(self, records: List[Tuple[str, bytes]], meta: Dict[str, Any]) -> bytes:
+        sessions = b",".join(_dumps(session_id) + b":" + data for session_id, data in records)
+        fields = b"".join(b"," + _dumps(key) + b":" + _dumps(value) for key, value in meta.items())
+        return b'{"sessions":{' + sessions + b"}" + fields + b',"last_updated":' + _dumps(time.time()) + b"}"
+
+    def _prepare(self, dirty: set[str], meta_dirty: bool, full: bool) -> Any:
+        """Capture what the next write needs; called with the state lock held."""
+        return list(self._records.items()), dict(self._meta)
+
+    def _write(self, payload: Any) -> int:
+        """Persist a prepared payload; returns the number of bytes written."""
+        body = self._snapshot_body(*payload)
+        _atomic_write(self.path, body)
+        return len(body)
+
+    def flush(self) -> bool:
+        """Write pending changes now; False when the file was already current."""
+        return self._flush(full=False)
+
+    def _flush(self, full: bool) -> bool:
+        with self._lock:
+            target = self._seq
+            if self._written_seq >= target and not full:
+                return False
+
+        with self._write_lock:
+            with self._lock:
+                # A write that finished while we waited may already cover our changes
+                if self._written_seq >= target and not full:
+                    return False
+                seq = self._seq
+                dirty, self._dirty = self._dirty, set()
+                meta_dirty, self._meta_dirty = self._meta_dirty, False
+                dirty_since, self._dirty_since = self._dirty_since, None
+                payload = self._prepare(dirty, meta_dirty, full)
+
+            started = time.perf_counter()
+            try:
+                written = self._write(payload)
+            except Exception as exc:
+                print(f"[FlowSessions] Failed to write {self.path}: {exc}")
+                with self._lock:
+                    self._counters["failures"] += 1
+                    self._dirty |= dirty
+                    self._meta_dirty = self._meta_dirty or meta_dirty
+                    if self._dirty_since is None:
+                        self._dirty_since = dirty_since
+                return False
+            finished = time.perf_counter()
+
+            with self._lock:
+                self._written_seq = max(self._written_seq, seq)
+                self._counters["flushes"] += 1
+                self._counters["sessions_flushed"] += len(dirty)
+                self._counters["bytes_written"] += written
+                self._counters["last_flush_bytes"] = written
+                write_ms = (finished - started) * 1000
+                self._write_ms["total"] += write_ms
+                self._write_ms["max"] = max(self._write_ms["max"], write_ms)
+                if dirty_since is not None:
+                    latency_ms = (finished - dirty_since) * 1000
+                    self._latency_ms["total"] += latency_ms
+                    self._latency_ms["max"] = max(self._latency_ms["max"], latency_ms)
+            return True
+
+    def close(self) -> None:
+        """Stop the flusher and write anything still pending; later changes are written at once."""
+        _open_stores.discard(self)
+        self.interval = 0
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+        self._maintain()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            flushes = self._counters["flushes"]
+            return {
+                "path": str(self.path),
+                "interval": self.interval,
+                "sessions": len(self._records),
+                "pending": self._written_seq < self._seq,
+                **self._counters,
+                "changes_per_flush": round(self._counters["changes"] / flushes, 2) if flushes else None,
+                "write_ms_avg": round(self._write_ms["total"] / flushes, 3) if flushes else None,
+                "write_ms_max": round(self._write_ms["max"], 3),
+                # From the first unwritten change to the write that persisted it
+                "flush_latency_ms_avg": round(self._latency_ms["total"] / flushes, 3) if flushes else None,
+                "flush_latency_ms_max": round(self._latency_ms["max"], 3),
+            }
+
+
+class JournaledSessionFile(WriteBehindSessionFile):
+    """Snapshot plus append-only journal of session changes.
+
+    The journal's first line names the snapshot it extends; a journal whose
+    header doesn't match the snapshot (a compaction interrupted between its
+    two renames) is already contained in the snapshot and is ignored. Replay
+    stops at the first incomplete or unreadable line, so a write torn by a
+    crash loses only the flush it belonged to.
+    """
+
+    def __init__(self, path: Path, interval: float, compact_records: int = 2000, compact_bytes: int = 4 * 1024 * 1024):
+        super().__init__(path, interval)
+        self.journal_path = self.path.with_suffix(".journal")
+        self.compact_records = compact_records
+        self.compact_bytes = compact_bytes
+        # Id of the snapshot the journal on disk extends; None until both exist
+        self._journal_id: Optional[str] = None
+        self._journal_records = 0
+        self._journal_bytes = 0
+        self._compact_due = False
+        self._journal_counters = {
+            "compactions": 0,
+            "replayed_records": 0,
+            "truncated_tail": False,
+            "load_ms": 0.0,
+            "last_compaction_ms": None,
+        }
+
+    def load(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        sessions, meta = self._read_snapshot()
+        snapshot_id = meta.pop("journal", None)
+        replayed, truncated, journal_id = self._replay(sessions, meta, snapshot_id)
+        self.reset(sessions, meta)
+        with self._lock:
+            self._journal_counters["replayed_records"] = replayed
+            self._journal_counters["truncated_tail"] = truncated
+        if snapshot_id is not None and journal_id == snapshot_id and not replayed and not truncated:
+            self._journal_id = snapshot_id
+        elif sessions or meta or self.path.exists():
+            # Fold the replayed journal into a fresh snapshot so the next start replays nothing
+            self._flush(full=True)
+        with self._lock:
+            self._journal_counters["load_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return {"sessions": sessions, **meta}
+
+    def _replay(self, sessions: Dict[str, Any], meta: Dict[str, Any], snapshot_id: Optional[str]) -> Tuple[int, bool, Optional[str]]:
+        """Apply the journal to the snapshot read in ``load``; returns (records, torn tail, journal id)."""
+        if not self.journal_path.exists():
+            return 0, False, None
+        lines = self.journal_path.read_bytes().split(b"\n")
+        try:
+            journal_id = orjson.loads(lines[0]).get("journal")
+        except (orjson.JSONDecodeError, AttributeError):
+            print(f"[FlowSessions] Ignoring journal without a header: {self.journal_path}")
+            return 0, False, None
+        if journal_id != snapshot_id:
+            return 0, False, journal_id
+
+        replayed = 0
+        # Every complete line ends with a newline, so the last piece is b"" unless torn
+        entries, tail = lines[1:-1], lines[-1]
+        for line in entries:
+            try:
+                entry = orjson.loads(line)
+            except orjson.JSONDecodeError:
+                print(f"[FlowSessions] Journal ends in an unreadable record after {replayed} records")
+                return replayed, True, journal_id
+            if "m" in entry:
+                meta.clear()
+                meta.update(entry["m"])
+            elif entry.get("r") is None:
+                sessions.pop(entry["s"], None)
+            else:
+                sessions[entry["s"]] = entry["r"]
+            replayed += 1
+        if tail:
+            print(f"[FlowSessions] Journal ends in a partial record after {replayed} records")
+        return replayed, bool(tail), journal_id
+
+    def _prepare(self, dirty: set[str], meta_dirty: bool, full: bool) -> Any:
+        if full or self._journal_id is None:
+            # Compaction: the snapshot will hold everything, the journal nothing
+            journal_id = uuid.uuid4().hex
+            meta = {**self._meta, "journal": journal_id}
+            return "snapshot", journal_id, (list(self._records.items()), meta)
+        lines = []
+        for session_id in dirty:
+            lines.append(b'{"s":' + _dumps(session_id) + b',"r":' + self._records.get(session_id, b"null") + b"}\n")
+        if meta_dirty:
+            lines.append(b'{"m":' + _dumps(self._meta) + b"}\n")
+        return "append", None, b"".join(lines)
+
+    def _write(self, payload: Any) -> int:
+        kind, journal_id, data = payload
+        if kind == "snapshot":
+            started = time.perf_counter()
+            data = self._snapshot_body(*data)
+            header = _dumps({"journal": journal_id}) + b"\n"
+            # Snapshot first: until the new journal replaces the old one, the old journal's
+            # header no longer matches and it is ignored, which is right since the snapshot holds it all
+            _atomic_write(self.path, data)
+            _atomic_write(self.journal_path, header)
+            with self._lock:
+                self._journal_id = journal_id
+                self._journal_records = 0
+                self._journal_bytes = len(header)
+                self._compact_due = False
+                self._journal_counters["compactions"] += 1
+                self._journal_counters["last_compaction_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            return len(data) + len(header)
+
+        if not data:
+            return 0
+        with open(self.journal_path, "ab") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        with self._lock:
+            self._journal_records += data.count(b"\n")
+            self._journal_bytes += len(data)
+            if self._journal_records >= self.compact_records or self._journal_bytes >= self.compact_bytes:
+                self._compact_due = True
+                # Compaction runs on the flusher thread, off the flow step's path
+                self._wake.set()
+        return len(data)
+
+    def _maintain(self) -> None:
+        if self._compact_due:
+            self.compact()
+
+    def compact(self) -> bool:
+        """Write a snapshot of every session and start an empty journal."""
+        return self._flush(full=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        metrics = super().metrics()
+        with self._lock:
+            metrics.update(self._journal_counters)
+            metrics.update({
+                "journal_path": str(self.journal_path),
+                "journal_records": self._journal_records,
+                "journal_bytes": self._journal_bytes,
+            })
+        return metrics
+
+
+class SharedSessionStore(WriteBehindSessionFile):
+    """Flow sessions in storage that several processes read and write.
+
+    Writes are coalesced like the file stores and touch only the sessions and
+    kiosks this process changed, so processes sharing the storage don't
+    overwrite each other's kiosks. ``refresh_kiosk`` reads a kiosk's active
+    session back so a process sees another one's steps. Subclasses provide
+    the storage operations (the ``_fetch_*``/``_store``/``_delete_*`` methods).
+    """
+
+    shared = True
+
+    def __init__(self, path: Path, interval: float, legacy_path: Optional[Path] = None):
+        super().__init__(path, interval)
+        # Sessions file of the file stores, imported into empty storage
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        # session id -> (kiosk id, state, last activity) of marked sessions
+        self._columns: Dict[str, Tuple[str, str, float]] = {}
+        # kiosk id -> active session id (None: no longer active) not yet written
+        self._kiosks_dirty: Dict[str, Optional[str]] = {}
+        self._db_counters = {"refreshes": 0, "refreshed_sessions": 0, "expired": 0}
+
+    # -- storage operations --------------------------------------------------
+
+    def _fetch_all(self) -> Tuple[List[Tuple[str, bytes]], Dict[str, str]]:
+        """Every stored ``(session id, data)`` and the active session of every kiosk."""
+        raise NotImplementedError
+
+    def _fetch_active(self, kiosk_id: str) -> Tuple[Optional[str], Optional[bytes]]:
+        raise NotImplementedError
+
+    def _fetch_in_state(self, state: str) -> List[bytes]:
+        raise NotImplementedError
+
+    def _fetch_kiosks(self) -> List[str]:
+        raise NotImplementedError
+
+    def _store(self, upserts: List[Tuple], deletes: List[str], kiosks: Dict[str, Optional[str]]) -> None:
+        """Write ``(session id, kiosk id, state, last activity, data)`` rows, delete
+        sessions and point kiosks at their active session (None: no longer active)."""
+        raise NotImplementedError
+
+    def _delete_inactive(self, cutoff: float) -> List[str]:
+        """Delete sessions inactive since ``cutoff`` and their kiosks' entries."""
+        raise NotImplementedError
+
+    # -----------------------------------------------------------------------
+
+    def load(self) -> Dict[str, Any]:
+        rows, active_sessions = self._fetch_all()
+        if not rows and self.legacy_path is not None and self.legacy_path.exists():
+            legacy = JournaledSessionFile(self.legacy_path, interval=0)
+            data = legacy.load()
+            legacy.close()
+            print(f"[FlowSessions] Importing {len(data['sessions'])} sessions from {self.legacy_path}")
+            active = data.get("active_sessions")
+            if active is None:
+                # Files written before per-kiosk sessions track one current session
+                current = data.get("current_session_id")
+                active = {DEFAULT_KIOSK_ID: current} if current else {}
+            for record in data["sessions"].values():
+                record.setdefault("kiosk_id", DEFAULT_KIOSK_ID)
+            self._store(
+                [(session_id, *self._row_columns(record), _dumps(record)) for session_id, record in data["sessions"].items()],
+                [],
+                active,
+            )
+            rows, active_sessions = self._fetch_all()
+        sessions = {session_id: orjson.loads(data) for session_id, data in rows}
+        meta = {"active_sessions": active_sessions}
+        self.reset(sessions, meta)
+        return {"sessions": sessions, **meta}
+
+    @staticmethod
+    def _row_columns(record: Dict[str, Any]) -> Tuple[str, str, float]:
+        return record.get("kiosk_id") or "", record.get("current_state") or "", float(record.get("last_activity") or 0)
+
+    def reset(self, records: Dict[str, Dict[str, Any]], meta: Dict[str, Any]) -> None:
+        super().reset(records, meta)
+        with self._lock:
+            self._columns = {session_id: self._row_columns(record) for session_id, record in records.items()}
+            self._kiosks_dirty.clear()
+
+    def mark(self, session_id: str, record: Optional[Dict[str, Any]]) -> None:
+        with self._lock:
+            if record is not None:
+                self._columns[session_id] = self._row_columns(record)
+        super().mark(session_id, record)
+
+    def set_meta(self, meta: Dict[str, Any]) -> None:
+        """Record which kiosks' active sessions changed (only those are written)."""
+        with self._lock:
+            before = self._meta.get("active_sessions") or {}
+            after = meta.get("active_sessions") or {}
+            changed = {kiosk: after.get(kiosk) for kiosk in before.keys() | after.keys() if before.get(kiosk) != after.get(kiosk)}
+            self._meta = {**meta, "active_sessions": dict(after)}
+            if not changed:
+                return
+            self._kiosks_dirty.update(changed)
+            self._meta_dirty = True
+            self._changed(None)
+        self._schedule()
+
+    def _prepare(self, dirty: set[str], meta_dirty: bool, full: bool) -> Any:
+        upserts, deletes = [], []
+        for session_id in dirty:
+            data = self._records.get(session_id)
+            if data is None:
+                self._columns.pop(session_id, None)
+                deletes.append(session_id)
+            else:
+                upserts.append((session_id, *self._columns[session_id], data))
+        return upserts, deletes, dict(self._kiosks_dirty)
+
+    def _write(self, payload: Any) -> int:
+        upserts, deletes, kiosks = payload
+        self._store(upserts, deletes, kiosks)
+        with self._lock:
+            for kiosk, session_id in kiosks.items():
+                # Unless the kiosk changed again while this write ran
+                if self._kiosks_dirty.get(kiosk, session_id) == session_id:
+                    self._kiosks_dirty.pop(kiosk, None)
+        return sum(len(row[-1]) for row in upserts)
+
+    def refresh_kiosk(self, kiosk_id: str) -> Optional[Tuple[Optional[str], Optional[Dict[str, Any]]]]:
+        """The kiosk's active session as stored: ``(session id, record)``.
+
+        The record is None when it matches what this process last wrote or
+        read; the whole result is None while this process has unwritten
+        changes to the kiosk, which take precedence.
+        """
+        with self._lock:
+            local_id = (self._meta.get("active_sessions") or {}).get(kiosk_id)
+            if kiosk_id in self._kiosks_dirty or local_id in self._dirty:
+                return None
+        session_id, data = self._fetch_active(kiosk_id)
+        with self._lock:
+            if kiosk_id in self._kiosks_dirty or (session_id is not None and session_id in self._dirty):
+                return None
+            self._db_counters["refreshes"] += 1
+            active = dict(self._meta.get("active_sessions") or {})
+            if session_id is None:
+                active.pop(kiosk_id, None)
+            else:
+                active[kiosk_id] = session_id
+            self._meta["active_sessions"] = active
+            if session_id is None or self._records.get(session_id) == data:
+                return session_id, None
+            self._records[session_id] = data
+            record = orjson.loads(data)
+            self._columns[session_id] = self._row_columns(record)
+            self._db_counters["refreshed_sessions"] += 1
+            return session_id, record
+
+    def records_in_state(self, state: str) -> List[Dict[str, Any]]:
+        """Sessions currently in ``state``, least recently active first."""
+        self.flush()
+        records = [orjson.loads(data) for data in self._fetch_in_state(state)]
+        return sorted(records, key=lambda record: record.get("last_activity") or 0)
+
+    def active_kiosks(self) -> List[str]:
+        """Kiosks with an active session, across every process."""
+        self.flush()
+        return sorted(self._fetch_kiosks())
+
+    def expire(self, cutoff: float) -> List[str]:
+        """Delete sessions inactive since ``cutoff``; returns their ids."""
+        self.flush()
+        with self._write_lock:
+            expired = self._delete_inactive(cutoff)
+        with self._lock:
+            gone = set(expired)
+            for session_id in expired:
+                self._records.pop(session_id, None)
+                self._columns.pop(session_id, None)
+            active = self._meta.get("active_sessions") or {}
+            self._meta["active_sessions"] = {kiosk: sid for kiosk, sid in active.items() if sid not in gone}
+            self._db_counters["expired"] += len(expired)
+        return expired
+
+    def metrics(self) -> Dict[str, Any]:
+        metrics = super().metrics()
+        with self._lock:
+            metrics.update(self._db_counters)
+        return metrics
+
+
+class SqliteSessionStore(SharedSessionStore):
+    """Flow sessions in a SQLite database (WAL mode) shared by processes.
+
+    Each session is a row keyed by its id, with the kiosk, state and last
+    activity in indexed columns; ``flow_kiosks`` maps each kiosk to its active
+    session. Lookups by state and expiry use the indexes.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS flow_sessions (
+            session_id TEXT PRIMARY KEY,
+            kiosk_id TEXT NOT NULL,
+            current_state TEXT NOT NULL,
+            last_activity REAL NOT NULL,
+            data BLOB NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_flow_sessions_last_activity ON flow_sessions (last_activity);
+        CREATE INDEX IF NOT EXISTS idx_flow_sessions_state ON flow_sessions (current_state);
+        CREATE INDEX IF NOT EXISTS idx_flow_sessions_kiosk ON flow_sessions (kiosk_id);
+        CREATE TABLE IF NOT EXISTS flow_kiosks (
+            kiosk_id TEXT PRIMARY KEY,
+            session_id TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path: Path, interval: float, legacy_path: Optional[Path] = None):
+        super().__init__(path, interval, legacy_path=legacy_path)
+        self._db_lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _transaction(self, statements: List[Tuple[str, Any]]) -> None:
+        """Run ``(sql, rows)`` pairs in one write transaction."""
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, rows in statements:
+                    if rows:
+                        self._db.executemany(sql, rows)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _fetch_all(self) -> Tuple[List[Tuple[str, bytes]], Dict[str, str]]:
+        rows = self._query("SELECT session_id, data FROM flow_sessions")
+        return rows, dict(self._query("SELECT kiosk_id, session_id FROM flow_kiosks"))
+
+    def _fetch_active(self, kiosk_id: str) -> Tuple[Optional[str], Optional[bytes]]:
+        rows = self._query(
+            "SELECT k.session_id, s.data FROM flow_kiosks k JOIN flow_sessions s ON s.session_id = k.session_id WHERE k.kiosk_id = ?",
+            (kiosk_id,),
+        )
+        return rows[0] if rows else (None, None)
+
+    def _fetch_in_state(self, state: str) -> List[bytes]:
+        rows = self._query("SELECT data FROM flow_sessions WHERE current_state = ?", (state,))
+        return [data for (data,) in rows]
+
+    def _fetch_kiosks(self) -> List[str]:
+        return [kiosk for (kiosk,) in self._query("SELECT kiosk_id FROM flow_kiosks")]
+
+    def _store(self, upserts: List[Tuple], deletes: List[str], kiosks: Dict[str, Optional[str]]) -> None:
+        self._transaction([
+            ("INSERT OR REPLACE INTO flow_sessions VALUES (?, ?, ?, ?, ?)", upserts),
+            ("DELETE FROM flow_sessions WHERE session_id = ?", [(session_id,) for session_id in deletes]),
+            ("INSERT OR REPLACE INTO flow_kiosks VALUES (?, ?)", [(kiosk, sid) for kiosk, sid in kiosks.items() if sid]),
+            ("DELETE FROM flow_kiosks WHERE kiosk_id = ?", [(kiosk,) for kiosk, sid in kiosks.items() if not sid]),
+        ])
+
+    def _delete_inactive(self, cutoff: float) -> List[str]:
+        # Indexed delete on last_activity
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                expired = [sid for (sid,) in self._db.execute(
+                    "SELECT session_id FROM flow_sessions WHERE last_activity < ?", (cutoff,)
+                )]
+                self._db.execute("DELETE FROM flow_sessions WHERE last_activity < ?", (cutoff,))
+                self._db.executemany("DELETE FROM flow_kiosks WHERE session_id = ?", [(sid,) for sid in expired])
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return expired
+
+
+class StateBackendSessionStore(SharedSessionStore):
+    """Flow sessions in the shared state backend (``shared_state``).
+
+    Sessions are stored under ``flow:session:<id>`` and each kiosk's active
+    session id under ``flow:kiosk:<kiosk>``. The backend has no secondary
+    indexes, so lookups by state and expiry read the sessions of the cleanup
+    window; a kiosk's active session is two key reads.
+    """
+
+    SESSION_PREFIX = "flow:session:"
+    KIOSK_PREFIX = "flow:kiosk:"
+
+    def __init__(self, backend: Any, interval: float, legacy_path: Optional[Path] = None):
+        super().__init__(Path(f"{backend.name}-shared-state"), interval, legacy_path=legacy_path)
+        self.backend = backend
+
+    def _fetch_prefix(self, prefix: str) -> List[Tuple[str, bytes]]:
+        keys = self.backend.keys(prefix)
+        values = self.backend.get_many(keys)
+        return [(key[len(prefix):], value) for key, value in zip(keys, values) if value is not None]
+
+    def _fetch_all(self) -> Tuple[List[Tuple[str, bytes]], Dict[str, str]]:
+        rows = self._fetch_prefix(self.SESSION_PREFIX)
+        kiosks = {kiosk: session_id.decode("utf-8") for kiosk, session_id in self._fetch_prefix(self.KIOSK_PREFIX)}
+        return rows, kiosks
+
+    def _fetch_active(self, kiosk_id: str) -> Tuple[Optional[str], Optional[bytes]]:
+        session_id = self.backend.get(self.KIOSK_PREFIX + kiosk_id)
+        if session_id is None:
+            return None, None
+        session_id = session_id.decode("utf-8")
+        data = self.backend.get(self.SESSION_PREFIX + session_id)
+        return (session_id, data) if data is not None else (None, None)
+
+    def _fetch_in_state(self, state: str) -> List[bytes]:
+        return [data for _, data in self._fetch_prefix(self.SESSION_PREFIX) if orjson.loads(data).get("current_state") == state]
+
+    def _fetch_kiosks(self) -> List[str]:
+        return [key[len(self.KIOSK_PREFIX):] for key in self.backend.keys(self.KIOSK_PREFIX)]
+
+    def _store(self, upserts: List[Tuple], deletes: List[str], kiosks: Dict[str, Optional[str]]) -> None:
+        for session_id, _kiosk, _state, _last_activity, data in upserts:
+            self.backend.set(self.SESSION_PREFIX + session_id, data)
+        for kiosk, session_id in kiosks.items():
+            if session_id:
+                self.backend.set(self.KIOSK_PREFIX + kiosk, session_id.encode("utf-8"))
+        removed = [self.SESSION_PREFIX + session_id for session_id in deletes]
+        removed += [self.KIOSK_PREFIX + kiosk for kiosk, session_id in kiosks.items() if not session_id]
+        if removed:
+            self.backend.delete(*removed)
+
+    def _delete_inactive(self, cutoff: float) -> List[str]:
+        expired = [
+            session_id for session_id, data in self._fetch_prefix(self.SESSION_PREFIX)
+            if float(orjson.loads(data).get("last_activity") or 0) < cutoff
+        ]
+        if not expired:
+            return []
+        gone = set(expired)
+        stale_kiosks = [
+            self.KIOSK_PREFIX + kiosk for kiosk, session_id in self._fetch_prefix(self.KIOSK_PREFIX)
+            if session_id.decode("utf-8") in gone
+        ]
+        self.backend.delete(*[self.SESSION_PREFIX + session_id for session_id in expired], *stale_kiosks)
+        return expired
+
+
+def open_session_store(path: Path, settings: Dict[str, Any]) -> WriteBehindSessionFile:
+    """Session store selected by ``get_flow_persistence_settings()``."""
+    if settings.get("store") == "json":
+        return WriteBehindSessionFile(path, settings["interval"])
+    if settings.get("store") == "sqlite":
+        db_path = Path(settings.get("db_path") or Path(path).with_suffix(".db"))
+        return SqliteSessionStore(db_path, settings["interval"], legacy_path=path)
+    if settings.get("store") == "shared":
+        from shared_state import get_shared_state
+
+        return StateBackendSessionStore(get_shared_state(), settings["interval"], legacy_path=path)
+    return JournaledSessionFile(
+        path,
+        settings["interval"],
+        compact_records=settings.get("compact_records", 2000),
+        compact_bytes=settings.get("compact_bytes", 4 * 1024 * 1024),
+    )
@@ -1,40 +1,80 @@
 """
 Simple file-based signaling between the agent and the frontend.
 Used to request client-side actions like starting/stopping face capture.
+
+Each kiosk has its own pending signal, so kiosks served by the same backend
+never consume each other's signals. The default kiosk keeps the original
+``flow_signal.json`` file.
+
+A kiosk's flow signal is a single slot: posting replaces the pending one.
+Notifications that must not replace a pending flow step (such as the outcome
+of a background OTP dispatch) go to a named channel, which has its own slot.
 """
 from __future__ import annotations
 import json
+import os
+import re
 from pathlib import Path
 from typing import Any, Dict, Optional
 
 # Location to store signals
 SIGNAL_FILE = Path(__file__).parent.parent / "data" / "flow_signal.json"
 SIGNAL_FILE.parent.mkdir(parents=True, exist_ok=True)
+KIOSK_SIGNAL_DIR = SIGNAL_FILE.parent / "flow_signals"
+
+# Kiosk of requests that name none (single-kiosk deployments)
+DEFAULT_KIOSK_ID = os.getenv("KIOSK_ID", "default").strip().lower() or "default"
+
+# Channel of face-match OTP outcomes (``face_otp_status`` signals)
+FACE_OTP_CHANNEL = "face_otp"
+
+
+def kiosk_key(kiosk_id: Optional[str]) -> str:
+    """Normalized, path-safe kiosk key; empty means the default kiosk."""
+    key = re.sub(r"[^a-z0-9_-]+", "-", str(kiosk_id or "").strip().lower()).strip("-")[:64]
+    return key or DEFAULT_KIOSK_ID
+
+
+def _signal_file(kiosk_id: Optional[str], channel: Optional[str] = None) -> Path:
+    kiosk_id = kiosk_key(kiosk_id)
+    if kiosk_id == DEFAULT_KIOSK_ID:
+        signal_file = SIGNAL_FILE
+    else:
+        KIOSK_SIGNAL_DIR.mkdir(parents=True, exist_ok=True)
+        signal_file = KIOSK_SIGNAL_DIR / f"{kiosk_id}.json"
+    if channel:
+        # Same path rules as kiosk ids
+        channel = re.sub(r"[^a-z0-9_-]+", "-", channel.strip().lower()).strip("-")[:32]
+        signal_file = signal_file.with_name(f"{signal_file.stem}.{channel}.json")
+    return signal_file
 
 
-def post_signal(name: str, payload: Optional[Dict[str, Any]] = None) -> None:
-    """Post a single signal. Overwrites any existing pending signal."""
+def post_signal(
+    name: str, payload: Optional[Dict[str, Any]] = None, kiosk_id: Optional[str] = None, channel: Optional[str] = None
+) -> None:
+    """Post a single signal to a kiosk. Overwrites its pending signal on that channel."""
     data = {
         "name": name,
         "payload": payload or {},
     }
-    with open(SIGNAL_FILE, "w", encoding="utf-8") as f:
+    with open(_signal_file(kiosk_id, channel), "w", encoding="utf-8") as f:
         json.dump(data, f)
 
 
-def get_signal(clear: bool = True) -> Optional[Dict[str, Any]]:
-    """Get the current signal. Optionally clear it afterwards."""
-    if not SIGNAL_FILE.exists():
+def get_signal(clear: bool = True, kiosk_id: Optional[str] = None, channel: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Get a kiosk's current signal (on ``channel``). Optionally clear it afterwards."""
+    signal_file = _signal_file(kiosk_id, channel)
+    if not signal_file.exists():
         return None
     try:
-        with open(SIGNAL_FILE, "r", encoding="utf-8") as f:
+        with open(signal_file, "r", encoding="utf-8") as f:
             data = json.load(f)
     except Exception:
         return None
 
     if clear:
         try:
-            SIGNAL_FILE.unlink(missing_ok=True)
+            signal_file.unlink(missing_ok=True)
         except Exception:
             pass
     return data
@@ -0,0 +1,34 @@
+"""
+Quantise an ONNX face model to int8 weights for the ``onnx`` face backend.
+
+    python quantize_face_model.py models/face_embedder.onnx models/face_embedder.int8.onnx
+
+Dynamic quantisation needs no calibration images. The quantised embedder is a
+different embedding space from the float one (its ``embedder_id`` changes with
+the file), so re-run ``encode_faces.py`` after switching models.
+"""
+import argparse
+from pathlib import Path
+
+from onnxruntime.quantization import QuantType, quantize_dynamic
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantise an ONNX face model to int8 weights")
+    parser.add_argument("source", type=Path)
+    parser.add_argument("target", type=Path)
+    args = parser.parse_args()
+
+    if not args.source.exists():
+        print(f"❌ Model not found: {args.source}")
+        return
+
+    args.target.parent.mkdir(parents=True, exist_ok=True)
+    quantize_dynamic(str(args.source), str(args.target), weight_type=QuantType.QInt8)
+    before = args.source.stat().st_size / 1e6
+    after = args.target.stat().st_size / 1e6
+    print(f"✔ Wrote {args.target} ({before:.1f} MB -> {after:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
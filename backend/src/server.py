@@ -1,11 +1,12 @@
 import os
+import asyncio
 import uvicorn
 import time
 import random
 import json
 import warnings
 from datetime import datetime
-from fastapi import FastAPI, Query, File, UploadFile, Request
+from fastapi import Depends, FastAPI, Header, Query, File, Form, UploadFile, Request, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -18,7 +19,23 @@ import sys
 from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from tools import run_face_verify
+from flow_signal import kiosk_key
+from tools.face_recognition import complete_face_match, get_gallery_generation
+from tools.face_hot_tier import get_face_hot_tier_stats
+from tools.face_pipeline import get_face_hint_stats, parse_face_hint
+from tools.face_post_match import get_face_post_match_queue, shutdown_face_post_match_queue
+from tools.face_result_cache import get_face_result_cache
+from tools.face_gallery_refresher import (
+    get_face_gallery_refresher,
+    start_face_gallery_refresher,
+    stop_face_gallery_refresher,
+)
+from tools.face_worker_pool import (
+    FacePoolBusy,
+    FacePoolTimeout,
+    get_face_worker_pool,
+    shutdown_face_worker_pool,
+)
 from livekit import api  # Correct LiveKit import
 from fastapi.responses import JSONResponse
 from livekit.protocol.agent_dispatch import CreateAgentDispatchRequest
@@ -29,9 +46,83 @@ load_dotenv()
 API_KEY = os.getenv("LIVEKIT_API_KEY", "devkey")
 API_SECRET = os.getenv("LIVEKIT_API_SECRET", "secret")
 LIVEKIT_URL = os.getenv("LIVEKIT_URL", "ws://127.0.0.1:7880")
+# Worker processes share flow sessions, agent state and OTPs through the shared state backend
+UVICORN_WORKERS = max(1, int(os.getenv("UVICORN_WORKERS", "1")))
 
 app = FastAPI()
 
+
+@app.on_event("startup")
+async def _start_face_refresher():
+    start_face_gallery_refresher()
+
+
+@app.on_event("shutdown")
+async def _flush_flow_sessions():
+    flow_module = sys.modules.get("flow_manager")
+    if flow_module is not None:
+        flow_module.close_flow_manager()
+
+
+@app.on_event("shutdown")
+async def _shutdown_face_pool():
+    stop_face_gallery_refresher()
+    shutdown_face_worker_pool()
+    shutdown_face_post_match_queue()
+
+
+def _face_hint(raw) -> tuple | None:
+    """Parse an optional client ROI hint; a malformed one is counted and ignored."""
+    if raw in (None, ""):
+        return None
+    hint = parse_face_hint(raw)
+    if hint is None:
+        get_face_hint_stats().record_invalid()
+    return hint
+
+
+async def _match_face_cached(image_bytes: bytes, hint: tuple | None = None) -> dict:
+    """Answer repeated frames from the result cache; everything else goes to the worker pool."""
+    cache = get_face_result_cache()
+    generation = get_gallery_generation()
+    match = await asyncio.to_thread(cache.get, image_bytes, generation)
+    if match is None:
+        match = await get_face_worker_pool().match(image_bytes, hint)
+        get_face_hot_tier_stats().record(match)
+        get_face_hint_stats().record(match)
+        await asyncio.to_thread(cache.put, image_bytes, generation, match)
+    return match
+
+
+async def _verify_face_off_loop(image_bytes: bytes, hint: tuple | None = None, kiosk_id: str | None = None) -> dict:
+    """Match in the worker pool, then resolve the name and queue the OTP without blocking the loop."""
+    match = await _match_face_cached(image_bytes, hint)
+    return await asyncio.to_thread(complete_face_match, match, kiosk_id)
+
+
+def _kiosk(kiosk_id: str | None = Query(None), x_kiosk_id: str | None = Header(None)) -> str:
+    """Kiosk a request acts on: ``X-Kiosk-Id`` header or ``kiosk_id`` query parameter.
+
+    Requests naming neither act on the default kiosk (``KIOSK_ID``).
+    """
+    return kiosk_key(x_kiosk_id or kiosk_id)
+
+
+def _face_pool_unavailable(exc: Exception) -> JSONResponse:
+    status = "timeout" if isinstance(exc, FacePoolTimeout) else "busy"
+    return JSONResponse(
+        status_code=503,
+        headers={"Retry-After": "1"},
+        content={
+            "success": False,
+            "verified": False,
+            "message": f"Face verification is busy, please retry ({exc})",
+            "access_granted": False,
+            "status": status,
+        },
+    )
+
+
 @app.get("/token")
 async def create_token(room: str, identity: str):
     try:
@@ -69,13 +160,19 @@ app.add_middleware(
 )
 
 @app.post("/face_verify")
-async def face_verify_endpoint(image: UploadFile = File(...)):
+async def face_verify_endpoint(
+    image: UploadFile = File(...), face_hint: str | None = Form(None), kiosk: str = Depends(_kiosk)
+):
     """Face verify and also notify the agent/flow on success.
     This mirrors the behavior of /face_login so the assistant recognizes the employee.
+
+    ``face_hint`` (optional) is a JSON ``{"x", "y", "w", "h"}`` box, as fractions
+    of the frame, where the client expects the face; ``faceBox`` in a response
+    is the box to send with the next frame.
     """
     try:
         image_bytes = await image.read()
-        result = run_face_verify(image_bytes)  # ✅ direct call
+        result = await _verify_face_off_loop(image_bytes, _face_hint(face_hint), kiosk)
 
         if result.get("status") == "success":
             # Extract details
@@ -93,7 +190,7 @@ async def face_verify_endpoint(image: UploadFile = File(...)):
             try:
                 from flow_manager import flow_manager
                 # Feed the same result dict to the flow manager
-                flow_manager.process_face_recognition_result(result)
+                flow_manager.process_face_recognition_result(result, kiosk_id=kiosk)
             except Exception as e:
                 print(f"Warning: could not advance flow manager: {e}")
 
@@ -104,17 +201,26 @@ async def face_verify_endpoint(image: UploadFile = File(...)):
                 "employeeName": emp_name,
                 "employeeId": emp_id,
                 "access_granted": True,
-                "status": "employee_verified"
+                "status": "employee_verified",
+                # The OTP outcome follows as a face_otp_status signal on the face_otp channel
+                "otpTaskId": (result.get("otp") or {}).get("taskId"),
             }
         else:
-            return {
+            response = {
                 "success": False,
                 "verified": False,
                 "message": result.get("message", "Face not recognized"),
                 "access_granted": False,
-                "status": "face_not_recognized"
+                "status": "face_not_recognized",
+                "faceBox": result.get("faceBox"),
             }
+            if result.get("hint"):
+                # Quality gate rejection: tell the kiosk how to fix the frame
+                response.update(status="face_quality_rejected", reason=result.get("reason"), hint=result.get("hint"))
+            return response
 
+    except (FacePoolBusy, FacePoolTimeout) as e:
+        return _face_pool_unavailable(e)
     except Exception as e:
         return {
             "success": False,
@@ -124,24 +230,59 @@ async def face_verify_endpoint(image: UploadFile = File(...)):
             "status": "error"
         }
 
+@app.get("/face_pool/metrics")
+async def face_pool_metrics():
+    """Utilisation, queue depth and wait-time metrics of the face worker pool"""
+    return get_face_worker_pool().metrics()
+
+@app.get("/face_cache/metrics")
+async def face_cache_metrics():
+    """Hit/miss counters of the repeated-frame result cache"""
+    return get_face_result_cache().metrics()
+
+@app.get("/face_gallery/metrics")
+async def face_gallery_metrics():
+    """Background refresh state and size of the in-memory face gallery"""
+    return get_face_gallery_refresher().metrics()
+
+@app.get("/face_hot_tier/metrics")
+async def face_hot_tier_metrics():
+    """Hit rate, fall-through reasons and estimated latency savings of the recently-matched hot tier"""
+    return get_face_hot_tier_stats().metrics()
+
+@app.get("/face_hint/metrics")
+async def face_hint_metrics():
+    """How often client ROI hints skip the full-frame face search, and the detect time saved"""
+    return get_face_hint_stats().metrics()
+
+@app.get("/face_post_match/metrics")
+async def face_post_match_metrics():
+    """Queue depth, retries and run times of the background OTP/visitor-log tasks"""
+    return get_face_post_match_queue().metrics()
+
+@app.get("/face_otp/status/{task_id}")
+async def face_otp_status(task_id: str):
+    """Outcome of a queued face-match OTP dispatch (also posted as a face_otp_status signal on the face_otp channel)"""
+    status = get_face_post_match_queue().status(task_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"success": False, "message": "Unknown OTP task"})
+    return {"success": True, **status}
+
 @app.post("/face_login")
-async def face_login_endpoint(image: UploadFile = File(...)):
+async def face_login_endpoint(image: UploadFile = File(...), kiosk: str = Depends(_kiosk)):
     """Enhanced face login endpoint with full access grant"""
     try:
         image_bytes = await image.read()
-        from tools.face_recognition import face_login
-        result = await face_login(None, image_bytes)
-        
+        face_result = await _verify_face_off_loop(image_bytes, kiosk_id=kiosk)
+
         # Check if verification was successful
-        if "✅" in result and ("Welcome" in result or "honored" in result):
-            # Extract employee name from the result message
-            import re
-            name_match = re.search(r'Welcome ([^!,]+)', result)
-            employee_name = name_match.group(1) if name_match else "Employee"
+        if face_result.get("status") == "success":
+            employee_name = face_result.get("name") or "Employee"
+            result = f"✅ Face recognized. Welcome {employee_name}!"
             
             # Notify the agent of successful verification
             from agent_state import set_user_verified
-            set_user_verified(employee_name)
+            set_user_verified(employee_name, face_result.get("employeeId"))
             
             return {
                 "success": True,
@@ -159,6 +300,8 @@ async def face_login_endpoint(image: UploadFile = File(...)):
                 "access_granted": False,
                 "status": "face_not_recognized"
             }
+    except (FacePoolBusy, FacePoolTimeout) as e:
+        return _face_pool_unavailable(e)
     except Exception as e:
         return {
             "success": False,
@@ -184,7 +327,7 @@ async def otp_send(request: EmployeeVerificationRequest):
 
 
 @app.post("/otp/verify")
-async def otp_verify(request: EmployeeVerificationRequest):
+async def otp_verify(request: EmployeeVerificationRequest, kiosk: str = Depends(_kiosk)):
     """Verify OTP and advance flow when successful."""
     try:
         from tools.employee_verification import get_employee_details
@@ -200,13 +343,13 @@ async def otp_verify(request: EmployeeVerificationRequest):
         success = ("✅" in msg) and ("OTP verified" in msg or "Welcome" in msg)
         if success:
             set_user_verified(request.name, request.employee_id)
-            session = flow_manager.get_current_session() or flow_manager.create_session()
-            session = flow_manager.get_current_session()
-            if session:
+            with flow_manager.kiosk_lock(kiosk):
+                session = flow_manager.ensure_session(kiosk)
                 session.user_data.update({"employee_name": request.name, "employee_id": request.employee_id})
                 session.is_verified = True
                 session.current_state = FlowState.EMPLOYEE_VERIFIED
-                flow_manager.save_sessions()
+                flow_manager.save_sessions(session)
+            flow_manager.flush_sessions()
         return {"success": success, "message": msg}
     except Exception as e:
         return {"success": False, "message": f"otp_verify failed: {str(e)}"}
@@ -290,15 +433,15 @@ async def notify_agent_verification(request: dict):
 
 
 @app.post("/flow/start")
-async def start_flow():
+async def start_flow(kiosk: str = Depends(_kiosk)):
     """Start the reception flow"""
     try:
         from flow_manager import flow_manager
-        success, message = flow_manager.process_wake_word_detected()
+        success, message = flow_manager.process_wake_word_detected(kiosk_id=kiosk)
         return {
             "success": success,
             "message": message,
-            "flow_status": flow_manager.get_flow_status()
+            "flow_status": flow_manager.get_flow_status(kiosk)
         }
     except Exception as e:
         return {
@@ -308,17 +451,17 @@ async def start_flow():
 
 
 @app.post("/flow/classify_user")
-async def classify_user(request: dict):
+async def classify_user(request: dict, kiosk: str = Depends(_kiosk)):
     """Classify user as employee or visitor"""
     try:
         from flow_manager import flow_manager
         user_input = request.get('user_input', '')
-        success, message, next_state = flow_manager.process_user_classification(user_input)
+        success, message, next_state = flow_manager.process_user_classification(user_input, kiosk_id=kiosk)
         return {
             "success": success,
             "message": message,
             "next_state": next_state.value if next_state else None,
-            "flow_status": flow_manager.get_flow_status()
+            "flow_status": flow_manager.get_flow_status(kiosk)
         }
     except Exception as e:
         return {
@@ -327,34 +470,57 @@ async def classify_user(request: dict):
         }
 
 
-@app.post("/flow/face_recognition")
-async def process_face_recognition_flow(image: UploadFile = File(...)):
-    """Process face recognition for employees in the flow"""
-    try:
-        from flow_manager import flow_manager
-        from tools import run_face_verify
-        
-        image_bytes = await image.read()
-        face_result = run_face_verify(image_bytes)
-\
-        if face_result.get("status") == "success":
-            try:
-                from agent_state import set_user_verified
-                emp_name = face_result.get("name")
-                emp_id = face_result.get("employeeId")
-                set_user_verified(emp_name, emp_id)
-            except Exception as _e:
-                print(f"Warning: could not sync agent state in /flow/face_recognition: {_e}")
+def _advance_flow_with_face_result(face_result: dict, kiosk: str, allow_retry: bool = True) -> dict:
+    """Sync agent state and advance the kiosk's flow session with a face verification result.
 
-        success, message, next_state = flow_manager.process_face_recognition_result(face_result)
-        
+    A quality-gate rejection (``hint`` set) does not count as a failed attempt
+    while ``allow_retry`` is on; the kiosk shows the hint and sends a new frame.
+    """
+    from flow_manager import flow_manager
+
+    if allow_retry and face_result.get("hint"):
         return {
-            "success": success,
-            "message": message,
-            "next_state": next_state.value if next_state else None,
+            "success": False,
+            "retry": True,
+            "message": face_result["hint"],
+            "reason": face_result.get("reason"),
+            "hint": face_result["hint"],
+            "next_state": None,
             "face_result": face_result,
-            "flow_status": flow_manager.get_flow_status()
+            "flow_status": flow_manager.get_flow_status(kiosk)
         }
+
+    if face_result.get("status") == "success":
+        try:
+            from agent_state import set_user_verified
+            emp_name = face_result.get("name")
+            emp_id = face_result.get("employeeId")
+            set_user_verified(emp_name, emp_id)
+        except Exception as _e:
+            print(f"Warning: could not sync agent state in /flow/face_recognition: {_e}")
+
+    success, message, next_state = flow_manager.process_face_recognition_result(face_result, kiosk_id=kiosk)
+    
+    return {
+        "success": success,
+        "message": message,
+        "next_state": next_state.value if next_state else None,
+        "face_result": face_result,
+        "flow_status": flow_manager.get_flow_status(kiosk)
+    }
+
+
+@app.post("/flow/face_recognition")
+async def process_face_recognition_flow(
+    image: UploadFile = File(...), face_hint: str | None = Form(None), kiosk: str = Depends(_kiosk)
+):
+    """Process face recognition for employees in the flow (optional ``face_hint`` as in /face_verify)"""
+    try:
+        image_bytes = await image.read()
+        face_result = await _verify_face_off_loop(image_bytes, _face_hint(face_hint), kiosk)
+        return _advance_flow_with_face_result(face_result, kiosk)
+    except (FacePoolBusy, FacePoolTimeout) as e:
+        return _face_pool_unavailable(e)
     except Exception as e:
         return {
             "success": False,
@@ -362,8 +528,127 @@ async def process_face_recognition_flow(image: UploadFile = File(...)):
         }
 
 
+@app.websocket("/flow/face_recognition/ws")
+async def stream_face_recognition_flow(websocket: WebSocket):
+    """Streamed face recognition: the kiosk sends JPEG frames as binary messages.
+
+    Only the newest frame is evaluated whenever the worker pool is free, and the
+    stream stops at the first frame that clears the run_face_verify threshold and
+    gap. The flow then advances exactly as with POST /flow/face_recognition; if
+    no frame matches within the frame/time budget the last failure is applied.
+    Each frame's face box is the ROI hint for the next one. The kiosk is named
+    by the ``kiosk_id`` query parameter (browsers cannot set WebSocket headers).
+    """
+    from tools.config import get_face_stream_settings
+
+    settings = get_face_stream_settings()
+    kiosk = kiosk_key(websocket.query_params.get("kiosk_id"))
+    await websocket.accept()
+
+    latest: dict = {"frame": None, "received": 0, "closed": False}
+    frame_ready = asyncio.Event()
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message.get("type") == "websocket.disconnect":
+                    break
+                if message.get("bytes"):
+                    latest["frame"] = message["bytes"]
+                    latest["received"] += 1
+                    frame_ready.set()
+                elif message.get("text"):
+                    try:
+                        control = json.loads(message["text"])
+                    except ValueError:
+                        continue
+                    if isinstance(control, dict) and control.get("type") == "end":
+                        break
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            latest["closed"] = True
+            frame_ready.set()
+
+    receiver = asyncio.create_task(receive_frames())
+    deadline = time.monotonic() + settings["timeout"]
+    evaluated = 0
+    last_match: dict = {"status": "error", "message": "No face frames received"}
+    hint = None
+
+    try:
+        while evaluated < settings["max_frames"]:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(frame_ready.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            frame_ready.clear()
+
+            frame, latest["frame"] = latest["frame"], None
+            if frame is None:
+                if latest["closed"]:
+                    break
+                continue
+
+            try:
+                match = await _match_face_cached(frame, hint)
+            except FacePoolBusy:
+                # Drop this frame; a newer one will be evaluated when capacity frees up
+                await asyncio.sleep(0.05)
+                continue
+            except FacePoolTimeout as e:
+                match = {"status": "error", "message": f"Verification timed out ({e})"}
+
+            evaluated += 1
+            last_match = match
+            # Consecutive frames barely move, so search around the last face first
+            hint = parse_face_hint(match.get("faceBox")) or hint
+            await websocket.send_json({
+                "type": "progress",
+                "frame": evaluated,
+                "frames_received": latest["received"],
+                "status": match.get("status"),
+                "message": match.get("message"),
+                "hint": match.get("hint"),
+            })
+            if match.get("status") == "success":
+                break
+
+        if evaluated == 0:
+            # Nothing was evaluated (no frames or client left); leave the flow untouched
+            await websocket.send_json({"type": "result", "success": False, **last_match})
+            return
+
+        face_result = await asyncio.to_thread(complete_face_match, last_match, kiosk)
+        # The frame budget is spent, so a final quality rejection counts as a failure
+        payload = _advance_flow_with_face_result(face_result, kiosk, allow_retry=False)
+        payload.update({"type": "result", "frames_evaluated": evaluated, "frames_received": latest["received"]})
+        await websocket.send_json(payload)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        try:
+            await websocket.send_json({
+                "type": "result",
+                "success": False,
+                "message": f"Error in face recognition stream: {str(e)}"
+            })
+        except Exception:
+            pass
+    finally:
+        receiver.cancel()
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+
 @app.post("/flow/manual_verification")
-async def manual_verification_flow(request: dict):
+async def manual_verification_flow(request: dict, kiosk: str = Depends(_kiosk)):
     """Process manual employee verification using the async tool directly.
     This avoids running event loops inside flow_manager and ensures OTP is strictly checked.
     """
@@ -380,13 +665,10 @@ async def manual_verification_flow(request: dict):
             return {"success": False, "message": "Please provide both your name and employee ID.", "next_state": FlowState.MANUAL_VERIFICATION.value}
 
         # Ensure session exists and store provided credentials
-        session = flow_manager.get_current_session()
-        if not session:
-            flow_manager.create_session()
-            session = flow_manager.get_current_session()
-        if session:
+        with flow_manager.kiosk_lock(kiosk):
+            session = flow_manager.ensure_session(kiosk)
             session.user_data.update({"manual_name": name, "manual_employee_id": employee_id})
-            flow_manager.save_sessions()
+            flow_manager.save_sessions(session)
 
         if not otp:
             # Send/resend OTP (or show it in DEV mode)
@@ -395,7 +677,7 @@ async def manual_verification_flow(request: dict):
                 "success": False,
                 "message": msg or "OTP has been sent to your registered email. Please provide the OTP to complete verification.",
                 "next_state": FlowState.MANUAL_VERIFICATION.value,
-                "flow_status": flow_manager.get_flow_status()
+                "flow_status": flow_manager.get_flow_status(kiosk)
             }
 
         # Verify OTP
@@ -403,11 +685,12 @@ async def manual_verification_flow(request: dict):
         success = ("✅" in msg) and ("OTP verified" in msg or "Welcome" in msg)
         if success:
             # Mark verified and move to credential check (offer face registration)
-            if session:
+            with flow_manager.kiosk_lock(kiosk):
                 session.user_data["verification_method"] = "manual_with_otp"
                 session.is_verified = True
                 session.current_state = FlowState.CREDENTIAL_CHECK
-                flow_manager.save_sessions()
+                flow_manager.save_sessions(session)
+            flow_manager.flush_sessions()
             try:
                 set_user_verified(name, employee_id)
             except Exception as _e:
@@ -417,14 +700,14 @@ async def manual_verification_flow(request: dict):
                 "success": True,
                 "message": f"Credentials verified! Welcome {name}. Would you like to register your face for faster access next time? (Yes/No)",
                 "next_state": FlowState.CREDENTIAL_CHECK.value,
-                "flow_status": flow_manager.get_flow_status()
+                "flow_status": flow_manager.get_flow_status(kiosk)
             }
         else:
             return {
                 "success": False,
                 "message": msg or "OTP verification failed.",
                 "next_state": FlowState.MANUAL_VERIFICATION.value,
-                "flow_status": flow_manager.get_flow_status()
+                "flow_status": flow_manager.get_flow_status(kiosk)
             }
     except Exception as e:
         return {
@@ -434,19 +717,19 @@ async def manual_verification_flow(request: dict):
 
 
 @app.post("/flow/face_registration_choice")
-async def face_registration_choice(request: dict):
+async def face_registration_choice(request: dict, kiosk: str = Depends(_kiosk)):
     """Handle face registration choice after manual verification"""
     try:
         from flow_manager import flow_manager
         
         register_face = request.get('register_face', False)
-        success, message, next_state = flow_manager.process_face_registration_choice(register_face)
+        success, message, next_state = flow_manager.process_face_registration_choice(register_face, kiosk_id=kiosk)
         
         return {
             "success": success,
             "message": message,
             "next_state": next_state.value if next_state else None,
-            "flow_status": flow_manager.get_flow_status()
+            "flow_status": flow_manager.get_flow_status(kiosk)
         }
     except Exception as e:
         return {
@@ -456,9 +739,11 @@ async def face_registration_choice(request: dict):
 
 
 @app.post("/flow/register_face")
-async def register_employee_face_endpoint(image: UploadFile = File(...), employee_id: str | None = None):
+async def register_employee_face_endpoint(
+    image: UploadFile = File(...), employee_id: str | None = None, kiosk: str = Depends(_kiosk)
+):
     """Register employee face after manual verification.
-    If employee_id is omitted, try to read it from the current flow session.
+    If employee_id is omitted, try to read it from the kiosk's flow session.
     """
     try:
         from tools.face_registration import register_employee_face as register_face_tool
@@ -467,7 +752,7 @@ async def register_employee_face_endpoint(image: UploadFile = File(...), employe
         
         # Fallback to current session's employee id
         if not employee_id:
-            session = flow_manager.get_current_session()
+            session = flow_manager.get_current_session(kiosk)
             if session:
                 employee_id = (
                     session.user_data.get("manual_employee_id")
@@ -487,15 +772,19 @@ async def register_employee_face_endpoint(image: UploadFile = File(...), employe
         if success:
             # Use the proper flow completion handler
             try:
-                success_result, completion_message, next_state = flow_manager.process_face_registration_completion(True, result)
+                success_result, completion_message, next_state = flow_manager.process_face_registration_completion(
+                    True, result, kiosk_id=kiosk
+                )
                 from flow_signal import post_signal
-                post_signal("registration_complete", {"message": completion_message})
+                post_signal("registration_complete", {"message": completion_message}, kiosk_id=kiosk)
             except Exception as _e:
                 print(f"Warning: could not advance flow after registration: {_e}")
         else:
             # Handle registration failure
             try:
-                success_result, completion_message, next_state = flow_manager.process_face_registration_completion(False, result)
+                success_result, completion_message, next_state = flow_manager.process_face_registration_completion(
+                    False, result, kiosk_id=kiosk
+                )
             except Exception as _e:
                 print(f"Warning: could not handle registration failure: {_e}")
         
@@ -511,7 +800,7 @@ async def register_employee_face_endpoint(image: UploadFile = File(...), employe
 
 
 @app.post("/flow/visitor_info")
-async def collect_visitor_info(request: dict):
+async def collect_visitor_info(request: dict, kiosk: str = Depends(_kiosk)):
     """Collect visitor information"""
     try:
         from flow_manager import flow_manager
@@ -521,13 +810,15 @@ async def collect_visitor_info(request: dict):
         purpose = request.get('purpose')
         host_employee = request.get('host_employee')
         
-        success, message, next_state = await flow_manager.process_visitor_info(name, phone, purpose, host_employee)
+        success, message, next_state = await flow_manager.process_visitor_info(
+            name, phone, purpose, host_employee, kiosk_id=kiosk
+        )
         
         return {
             "success": success,
             "message": message,
             "next_state": next_state.value if next_state else None,
-            "flow_status": flow_manager.get_flow_status()
+            "flow_status": flow_manager.get_flow_status(kiosk)
         }
     except Exception as e:
         return {
@@ -540,7 +831,8 @@ async def collect_visitor_info(request: dict):
 async def capture_visitor_photo_flow(
     request: Request,
     image: UploadFile = File(None),
-    file: UploadFile = File(None)
+    file: UploadFile = File(None),
+    kiosk: str = Depends(_kiosk)
 ):
     """Capture visitor photo and complete visitor flow"""
     try:
@@ -563,7 +855,7 @@ async def capture_visitor_photo_flow(
             return {"success": False, "message": "No image file uploaded (try field name 'image' or 'file')"}
 
         # Get visitor name from session
-        session = flow_manager.get_current_session()
+        session = flow_manager.get_current_session(kiosk)
         visitor_name = session.user_data.get('visitor_name') if session else None
         if not visitor_name:
             try:
@@ -582,11 +874,12 @@ async def capture_visitor_photo_flow(
         except Exception:
             photo_result = {"success": True, "message": photo_result_raw, "storage_location": None}
 
-        if photo_result and isinstance(photo_result, dict):
-            session.user_data["photo_location"] = photo_result.get("storage_location")
-            session.user_data["photo_storage_type"] = photo_result.get("storage_type")
-            session.user_data["photo_filename"] = photo_result.get("filename")
-            flow_manager.save_sessions()
+        if session and photo_result and isinstance(photo_result, dict):
+            with flow_manager.kiosk_lock(kiosk):
+                session.user_data["photo_location"] = photo_result.get("storage_location")
+                session.user_data["photo_storage_type"] = photo_result.get("storage_type")
+                session.user_data["photo_filename"] = photo_result.get("filename")
+                flow_manager.save_sessions(session)
 
         visitor_phone = session.user_data.get('visitor_phone') if session else ""
         visitor_purpose = session.user_data.get('visitor_purpose') if session else ""
@@ -618,7 +911,7 @@ async def capture_visitor_photo_flow(
             print(f"Warning: could not update visitor log photo flag: {_e}")
 
         # Advance flow to completion
-        success, message, next_state = flow_manager.process_visitor_face_capture(True)
+        success, message, next_state = flow_manager.process_visitor_face_capture(True, kiosk_id=kiosk)
 
         return {
             "success": success,
@@ -626,17 +919,17 @@ async def capture_visitor_photo_flow(
             "next_state": next_state.value if next_state else None,
             "photo_result": photo_result,
             "filename": f"{visitor_name}{datetime.now().strftime('%Y%m%d_%H%M%S')}.png",
-            "flow_status": flow_manager.get_flow_status()
+            "flow_status": flow_manager.get_flow_status(kiosk)
         }
     except Exception as e:
         return {"success": False, "message": f"Error capturing visitor photo: {str(e)}"}
 
 @app.get("/flow/status")
-async def get_flow_status():
-    """Get current flow status"""
+async def get_flow_status(kiosk: str = Depends(_kiosk)):
+    """Get the kiosk's flow status"""
     try:
         from flow_manager import flow_manager
-        status = flow_manager.get_flow_status()
+        status = flow_manager.get_flow_status(kiosk)
         return {
             "success": True,
             "flow_status": status
@@ -648,8 +941,28 @@ async def get_flow_status():
         }
 
 
+@app.get("/flow/kiosks")
+async def list_flow_kiosks():
+    """Flow status of every kiosk with an active session"""
+    try:
+        from flow_manager import flow_manager
+        return {"success": True, "kiosks": flow_manager.list_kiosks()}
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error listing kiosks: {str(e)}"
+        }
+
+
+@app.get("/flow/persistence/metrics")
+async def flow_persistence_metrics():
+    """Write-behind flow session persistence: flushes, coalescing, flush latency and bytes per transition"""
+    from flow_manager import flow_manager
+    return flow_manager.persistence_metrics()
+
+
 @app.post("/post_signal")
-async def post_signal_endpoint(request: Request):
+async def post_signal_endpoint(request: Request, kiosk: str = Depends(_kiosk)):
     try:
         body = await request.json()
     except Exception as e:
@@ -665,17 +978,17 @@ async def post_signal_endpoint(request: Request):
 
     try:
         from flow_signal import post_signal
-        post_signal(name, payload)
+        post_signal(name, payload, kiosk_id=kiosk)
         return {"success": True, "name": name, "payload": payload or {}}
     except Exception as e:
         return {"success": False, "error": f"Error posting signal: {str(e)}"}
 
 @app.get("/get_signal")
-async def get_signal():
-    """Get signals from the flow manager for frontend communication"""
+async def get_signal(kiosk: str = Depends(_kiosk), channel: str | None = None):
+    """Get the kiosk's signal (on ``channel``, e.g. face_otp) for frontend communication"""
     try:
         from flow_signal import get_signal
-        signal = get_signal(clear=False)  # Get but don't clear the signal immediately
+        signal = get_signal(clear=False, kiosk_id=kiosk, channel=channel)  # Get but don't clear the signal immediately
         return signal if signal else {}
     except Exception as e:
         return {
@@ -683,11 +996,11 @@ async def get_signal():
         }
 
 @app.post("/clear_signal")
-async def clear_signal():
-    """Clear the current signal after frontend has processed it"""
+async def clear_signal(kiosk: str = Depends(_kiosk), channel: str | None = None):
+    """Clear the kiosk's current signal (on ``channel``) after frontend has processed it"""
     try:
         from flow_signal import get_signal
-        signal = get_signal(clear=True)  # Clear the signal
+        signal = get_signal(clear=True, kiosk_id=kiosk, channel=channel)  # Clear the signal
         return {"success": True, "cleared": signal is not None}
     except Exception as e:
         return {
@@ -697,11 +1010,11 @@ async def clear_signal():
 
 
 @app.post("/flow/end")
-async def end_flow_session():
-    """End the current flow session"""
+async def end_flow_session(kiosk: str = Depends(_kiosk)):
+    """End the kiosk's flow session"""
     try:
         from flow_manager import flow_manager
-        message = flow_manager.end_session()
+        message = flow_manager.end_session(kiosk_id=kiosk)
         return {
             "success": True,
             "message": message
@@ -745,5 +1058,25 @@ def get_token(identity: str = Query(...), room: str = "Clara-room"):
         return {"error": str(e)}
 
 
+def _require_shared_flow_store(workers: int) -> None:
+    """Refuse to run several workers on a flow session store only one process can use.
+
+    The file stores are per process: workers would keep diverging sessions and
+    overwrite each other's journal and snapshot.
+    """
+    from tools.config import get_flow_persistence_settings
+
+    store = get_flow_persistence_settings()["store"]
+    if workers > 1 and store not in {"sqlite", "shared"}:
+        raise SystemExit(
+            f"UVICORN_WORKERS={workers} needs FLOW_SESSION_STORE=sqlite or shared "
+            f"(the {store} store is not shared between worker processes)"
+        )
+
+
 if __name__ == "__main__":
-    uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
+    if UVICORN_WORKERS > 1:
+        _require_shared_flow_store(UVICORN_WORKERS)
+        uvicorn.run("server:app", host="0.0.0.0", port=8000, workers=UVICORN_WORKERS)
+    else:
+        uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
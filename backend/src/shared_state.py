@@ -0,0 +1,376 @@
+"""
+Shared state for the processes serving the same kiosks.
+
+Flow sessions, the agent's wake/verification state and OTP sessions live
+here instead of in process memory, so the agent and any number of uvicorn
+workers see the same values. ``SHARED_STATE_BACKEND`` selects the backend:
+
+* ``embedded`` (default): a SQLite database (WAL mode) under ``data/``,
+  shared by the processes of one host and needing no server.
+* ``redis``: any server speaking the Redis protocol at ``SHARED_STATE_URL``,
+  shared across hosts. The client speaks RESP over a socket, so no extra
+  package is needed.
+
+Values are bytes with an optional expiry; ``get_json``/``set_json`` and
+``SharedMap`` (a dict over one key prefix) store JSON.
+"""
+from __future__ import annotations
+
+import socket
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from pathlib import Path
+from typing import Any, Iterator, List, Optional
+from urllib.parse import unquote, urlparse
+
+import orjson
+
+
+class SharedStateError(RuntimeError):
+    """The shared state backend rejected a command or could not be reached."""
+
+
+class SharedStateBackend:
+    """Key/value operations every backend provides."""
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        """Store ``value``; it expires after ``ttl`` seconds when given."""
+        raise NotImplementedError
+
+    def delete(self, *keys: str) -> int:
+        raise NotImplementedError
+
+    def keys(self, prefix: str) -> List[str]:
+        """Keys starting with ``prefix`` (not expired)."""
+        raise NotImplementedError
+
+    def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        """Atomically add one to the counter at ``key`` (missing counts as 0) and
+        return the new value; a new counter expires after ``ttl`` seconds."""
+        raise NotImplementedError
+
+    def get_json(self, key: str) -> Any:
+        value = self.get(key)
+        return orjson.loads(value) if value is not None else None
+
+    def set_json(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set(key, orjson.dumps(value), ttl)
+
+    def close(self) -> None:
+        pass
+
+
+class EmbeddedStateBackend(SharedStateBackend):
+    """SQLite key/value table shared by the processes of one host."""
+
+    name = "embedded"
+
+    # Expired rows are skipped by reads and purged at most this often
+    PURGE_INTERVAL_SECONDS = 60
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS shared_state (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_shared_state_expires_at ON shared_state (expires_at);
+        """)
+        self._purged_at = 0.0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO shared_state VALUES (?, ?, ?)", (key, value, expires_at))
+            if now - self._purged_at > self.PURGE_INTERVAL_SECONDS:
+                self._purged_at = now
+                self._db.execute("DELETE FROM shared_state WHERE expires_at <= ?", (now,))
+
+    def delete(self, *keys: str) -> int:
+        if not keys:
+            return 0
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany("DELETE FROM shared_state WHERE key = ?", [(key,) for key in keys])
+            return self._db.total_changes - before
+
+    def keys(self, prefix: str) -> List[str]:
+        # Range scan on the primary key; U+FFFF sorts after any character in a key
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key FROM shared_state WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+                (prefix, prefix + "\uffff", time.time()),
+            ).fetchall()
+        return [key for (key,) in rows]
+
+    def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        # One statement, so processes sharing the database serialize on its write lock;
+        # an expired counter that hasn't been purged yet starts again at 1
+        with self._lock:
+            (value,) = self._db.execute(
+                """
+                INSERT INTO shared_state (key, value, expires_at) VALUES (?, CAST(1 AS BLOB), ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    value = CASE WHEN expires_at IS NOT NULL AND expires_at <= ? THEN excluded.value
+                                 ELSE CAST(CAST(value AS INTEGER) + 1 AS BLOB) END,
+                    expires_at = CASE WHEN expires_at IS NOT NULL AND expires_at <= ? THEN excluded.expires_at
+                                      ELSE expires_at END
+                RETURNING value
+                """,
+                (key, expires_at, now, now),
+            ).fetchone()
+        return int(value)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+# INCR, and PEXPIRE on the first increment, run atomically on the server
+INCR_SCRIPT = (
+    "local value = redis.call('INCR', KEYS[1]) "
+    "if value == 1 and tonumber(ARGV[1]) > 0 then redis.call('PEXPIRE', KEYS[1], ARGV[1]) end "
+    "return value"
+)
+
+
+class RedisStateBackend(SharedStateBackend):
+    """Client for a server speaking the Redis protocol (RESP2).
+
+    One connection, serialized by a lock; a command that fails on a broken
+    connection is retried once on a new one.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        parsed = urlparse(url)
+        if parsed.scheme not in {"redis", ""}:
+            raise SharedStateError(f"Unsupported shared state URL scheme: {parsed.scheme}")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int((parsed.path or "/0").strip("/") or 0)
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile("rb")
+        if self.password:
+            auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+            self._roundtrip(auth)
+        if self.db:
+            self._roundtrip(("SELECT", str(self.db)))
+
+    def _disconnect(self) -> None:
+        for closable in (self._reader, self._sock):
+            try:
+                if closable is not None:
+                    closable.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    def _read_reply(self) -> Any:
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by the shared state server")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            raise SharedStateError(body.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("connection closed by the shared state server")
+            return data[:-2]
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise SharedStateError(f"Unexpected reply from the shared state server: {line!r}")
+
+    def _roundtrip(self, args) -> Any:
+        self._sock.sendall(self._encode(args))
+        return self._read_reply()
+
+    def command(self, *args) -> Any:
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._roundtrip(args)
+                except (OSError, ConnectionError) as exc:
+                    self._disconnect()
+                    if attempt:
+                        raise SharedStateError(f"Shared state server {self.host}:{self.port} unavailable: {exc}") from exc
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.command("GET", key)
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return self.command("MGET", *keys) if keys else []
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        if ttl:
+            self.command("SET", key, value, "PX", max(1, int(ttl * 1000)))
+        else:
+            self.command("SET", key, value)
+
+    def delete(self, *keys: str) -> int:
+        return self.command("DEL", *keys) if keys else 0
+
+    def incr(self, key: str, ttl: Optional[float] = None) -> int:
+        # One script, so a counter can never be left behind without its TTL
+        return self.command("EVAL", INCR_SCRIPT, 1, key, max(1, int(ttl * 1000)) if ttl else 0)
+
+    def keys(self, prefix: str) -> List[str]:
+        pattern = "".join("\\" + char if char in "*?[]\\" else char for char in prefix) + "*"
+        found, cursor = [], "0"
+        while True:
+            cursor, batch = self.command("SCAN", cursor, "MATCH", pattern, "COUNT", 500)
+            cursor = cursor.decode("utf-8") if isinstance(cursor, bytes) else str(cursor)
+            found.extend(key.decode("utf-8") for key in batch)
+            if cursor == "0":
+                return found
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
+
+
+class SharedMap(MutableMapping):
+    """Dict of JSON values stored under ``<namespace>:<key>`` in the shared state.
+
+    Values are copies: write a changed value back with ``mapping[key] = value``.
+    """
+
+    def __init__(self, namespace: str, ttl: Optional[float] = None, backend: Optional[SharedStateBackend] = None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._backend = backend
+
+    @property
+    def backend(self) -> SharedStateBackend:
+        return self._backend or get_shared_state()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.backend.get(self._key(key))
+        if value is None:
+            raise KeyError(key)
+        return orjson.loads(value)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.backend.set_json(self._key(key), value, self.ttl)
+
+    def __delitem__(self, key: str) -> None:
+        if not self.backend.delete(self._key(key)):
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        offset = len(self.namespace) + 1
+        return iter([key[offset:] for key in self.backend.keys(self._key(""))])
+
+    def __len__(self) -> int:
+        return len(self.backend.keys(self._key("")))
+
+    def __contains__(self, key: object) -> bool:
+        return self.backend.get(self._key(str(key))) is not None
+
+    def increment(self, key: str) -> int:
+        """Atomically count one more for ``key``; returns the new count (a JSON int)."""
+        return self.backend.incr(self._key(key), self.ttl)
+
+    def to_dict(self) -> dict:
+        """Every entry, read in one round trip after listing the keys."""
+        backend = self.backend
+        keys = backend.keys(self._key(""))
+        offset = len(self.namespace) + 1
+        return {
+            key[offset:]: orjson.loads(value)
+            for key, value in zip(keys, backend.get_many(keys))
+            if value is not None
+        }
+
+
+_backend: Optional[SharedStateBackend] = None
+_backend_lock = threading.Lock()
+
+
+def open_shared_state(settings: dict) -> SharedStateBackend:
+    """Backend described by ``get_shared_state_settings()``."""
+    if settings.get("backend") == "redis":
+        return RedisStateBackend(settings["url"], timeout=settings.get("timeout", 5.0))
+    return EmbeddedStateBackend(settings["path"])
+
+
+def get_shared_state() -> SharedStateBackend:
+    """The process-wide backend, opened on first use."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                # Settings are read on first use: tools.config doesn't import this
+                # module, so neither import order depends on the other
+                from tools.config import get_shared_state_settings
+
+                _backend = open_shared_state(get_shared_state_settings())
+    return _backend
+
+
+def set_shared_state(backend: Optional[SharedStateBackend]) -> Optional[SharedStateBackend]:
+    """Replace the process-wide backend (None reopens from settings); returns the previous one."""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
@@ -1,5 +1,4 @@
 import os
-from collections import defaultdict
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -50,9 +49,76 @@ FACE_IMAGE_BUCKET = os.getenv("FACE_IMAGE_BUCKET") or FACE_S3_BUCKET
 FACE_ENCODING_S3_KEY = os.getenv("FACE_ENCODING_S3_KEY", "Pickle_file/encoding.pkl")
 FACE_IMAGE_PREFIX = os.getenv("FACE_IMAGE_PREFIX", "Employee_Images")
 FACE_IMAGE_EXTENSION = os.getenv("FACE_IMAGE_EXTENSION", "jpg")
+FACE_HARVEST_CONCURRENCY = int(os.getenv("FACE_HARVEST_CONCURRENCY", "32"))
+FACE_HARVEST_PER_HOST = int(os.getenv("FACE_HARVEST_PER_HOST", "4"))
+FACE_HARVEST_TIMEOUT_SECONDS = float(os.getenv("FACE_HARVEST_TIMEOUT_SECONDS", "15"))
+FACE_HARVEST_MAX_ATTEMPTS = int(os.getenv("FACE_HARVEST_MAX_ATTEMPTS", "3"))
+FACE_HARVEST_MAX_BYTES = int(os.getenv("FACE_HARVEST_MAX_BYTES", str(10 * 1024 * 1024)))
+FACE_HARVEST_STATE_KEY = os.getenv("FACE_HARVEST_STATE_KEY", "")
+FACE_STORE_DIR = os.getenv("FACE_STORE_DIR") or str(PROJECT_ROOT / "data" / "face_store")
+FACE_STORE_S3_PREFIX = os.getenv("FACE_STORE_S3_PREFIX", "face_store")
+FACE_DELTA_COMPACT_EVERY = int(os.getenv("FACE_DELTA_COMPACT_EVERY", "50"))
+FACE_REFRESH_INTERVAL_SECONDS = float(os.getenv("FACE_REFRESH_INTERVAL_SECONDS", "30"))
+FACE_STORE_CHUNK_BYTES = int(os.getenv("FACE_STORE_CHUNK_BYTES", str(8 * 1024 * 1024)))
+FACE_STORE_ZSTD_LEVEL = int(os.getenv("FACE_STORE_ZSTD_LEVEL", "3"))
+FACE_STORE_TRANSFER_WORKERS = int(os.getenv("FACE_STORE_TRANSFER_WORKERS", "8"))
+FACE_SHARDING = os.getenv("FACE_SHARDING", "false").strip().lower() in {"1", "true", "yes", "on"}
+FACE_SITE = os.getenv("FACE_SITE", "")
+FACE_SHARD_FALLBACK = os.getenv("FACE_SHARD_FALLBACK", "true").strip().lower() in {"1", "true", "yes", "on"}
+FACE_SHARD_MAX_RESIDENT = int(os.getenv("FACE_SHARD_MAX_RESIDENT", "4"))
 FACE_ENCODING_TABLE_NAME = os.getenv("FACE_ENCODING_TABLE_NAME", "clara_face_encodings")
 FACE_ENCODING_TABLE_KEY = os.getenv("FACE_ENCODING_TABLE_KEY", "FACE_ENCODINGS")
+FACE_INDEX_BACKEND = os.getenv("FACE_INDEX_BACKEND", "auto")
+FACE_INDEX_IVF_MIN_SIZE = int(os.getenv("FACE_INDEX_IVF_MIN_SIZE", "20000"))
+FACE_INDEX_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", "8"))
+FACE_MAX_TEMPLATES = int(os.getenv("FACE_MAX_TEMPLATES", "5"))
+FACE_CENTROID_SHORTLIST = int(os.getenv("FACE_CENTROID_SHORTLIST", "32"))
+FACE_GALLERY_DTYPE = os.getenv("FACE_GALLERY_DTYPE", "float32")
+FACE_POOL_WORKERS = int(os.getenv("FACE_POOL_WORKERS", str(min(2, os.cpu_count() or 1))))
+FACE_POOL_MAX_QUEUE = int(os.getenv("FACE_POOL_MAX_QUEUE", "8"))
+FACE_POOL_TIMEOUT_SECONDS = float(os.getenv("FACE_POOL_TIMEOUT_SECONDS", "10"))
+FACE_POST_MATCH_WORKERS = int(os.getenv("FACE_POST_MATCH_WORKERS", "1"))
+FACE_POST_MATCH_MAX_QUEUE = int(os.getenv("FACE_POST_MATCH_MAX_QUEUE", "64"))
+FACE_POST_MATCH_MAX_ATTEMPTS = int(os.getenv("FACE_POST_MATCH_MAX_ATTEMPTS", "3"))
+FACE_POST_MATCH_BACKOFF_SECONDS = float(os.getenv("FACE_POST_MATCH_BACKOFF_SECONDS", "0.5"))
+FACE_POST_MATCH_STATUS_TTL_SECONDS = float(os.getenv("FACE_POST_MATCH_STATUS_TTL_SECONDS", "900"))
+FACE_ENCODE_DOWNLOAD_WORKERS = int(os.getenv("FACE_ENCODE_DOWNLOAD_WORKERS", "16"))
+FACE_ENCODE_WORKERS = int(os.getenv("FACE_ENCODE_WORKERS", str(os.cpu_count() or 1)))
+FACE_ENCODE_CHECKPOINT_EVERY = int(os.getenv("FACE_ENCODE_CHECKPOINT_EVERY", "25"))
+FACE_BACKEND = os.getenv("FACE_BACKEND", "dlib-hog")
+FACE_ONNX_DETECTOR_PATH = os.getenv("FACE_ONNX_DETECTOR_PATH") or str(PROJECT_ROOT / "models" / "face_detector.onnx")
+FACE_ONNX_EMBEDDER_PATH = os.getenv("FACE_ONNX_EMBEDDER_PATH") or str(PROJECT_ROOT / "models" / "face_embedder.int8.onnx")
+FACE_ONNX_MATCH_THRESHOLD = float(os.getenv("FACE_ONNX_MATCH_THRESHOLD", "1.05"))
+FACE_ONNX_THREADS = int(os.getenv("FACE_ONNX_THREADS", "1"))
+FACE_DECODE_MAX_SIDE = int(os.getenv("FACE_DECODE_MAX_SIDE", "800"))
+FACE_DETECT_MAX_SIDE = int(os.getenv("FACE_DETECT_MAX_SIDE", "480"))
+FACE_DETECT_UPSAMPLE = int(os.getenv("FACE_DETECT_UPSAMPLE", "1"))
+FACE_DETECT_FALLBACK = os.getenv("FACE_DETECT_FALLBACK", "true").strip().lower() in {"1", "true", "yes", "on"}
+FACE_CROP_MARGIN = float(os.getenv("FACE_CROP_MARGIN", "0.35"))
+FACE_HINT_EXPAND = float(os.getenv("FACE_HINT_EXPAND", "0.6"))
+FACE_QUALITY_ENABLED = os.getenv("FACE_QUALITY_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+FACE_QUALITY_MIN_FACE_PX = int(os.getenv("FACE_QUALITY_MIN_FACE_PX", "80"))
+FACE_QUALITY_MIN_SHARPNESS = float(os.getenv("FACE_QUALITY_MIN_SHARPNESS", "25"))
+FACE_QUALITY_MIN_BRIGHTNESS = float(os.getenv("FACE_QUALITY_MIN_BRIGHTNESS", "45"))
+FACE_QUALITY_MAX_BRIGHTNESS = float(os.getenv("FACE_QUALITY_MAX_BRIGHTNESS", "215"))
+FACE_QUALITY_MAX_YAW = float(os.getenv("FACE_QUALITY_MAX_YAW", "0.3"))
+FACE_DEDUP_MAX_ENTRIES = int(os.getenv("FACE_DEDUP_MAX_ENTRIES", "256"))
+FACE_DEDUP_TTL_SECONDS = float(os.getenv("FACE_DEDUP_TTL_SECONDS", "10"))
+FACE_HOT_TIER_SIZE = int(os.getenv("FACE_HOT_TIER_SIZE", "300"))
+FACE_HOT_TIER_REVALIDATE_SECONDS = float(os.getenv("FACE_HOT_TIER_REVALIDATE_SECONDS", "300"))
+FACE_STREAM_MAX_FRAMES = int(os.getenv("FACE_STREAM_MAX_FRAMES", "8"))
+FACE_STREAM_TIMEOUT_SECONDS = float(os.getenv("FACE_STREAM_TIMEOUT_SECONDS", "15"))
 FACE_RECOGNITION_ENABLED = os.getenv("FACE_RECOGNITION_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}
+FLOW_SAVE_INTERVAL_SECONDS = float(os.getenv("FLOW_SAVE_INTERVAL_SECONDS", "0.25"))
+FLOW_SESSION_STORE = os.getenv("FLOW_SESSION_STORE", "journal").strip().lower()
+FLOW_SESSION_DB = os.getenv("FLOW_SESSION_DB", "")
+FLOW_JOURNAL_COMPACT_RECORDS = int(os.getenv("FLOW_JOURNAL_COMPACT_RECORDS", "2000"))
+FLOW_JOURNAL_COMPACT_BYTES = int(os.getenv("FLOW_JOURNAL_COMPACT_BYTES", str(4 * 1024 * 1024)))
+SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "embedded").strip().lower()
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "redis://localhost:6379/0")
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH") or str(PROJECT_ROOT / "data" / "shared_state.db")
+SHARED_STATE_TIMEOUT_SECONDS = float(os.getenv("SHARED_STATE_TIMEOUT_SECONDS", "5"))
+OTP_SESSION_TTL_SECONDS = float(os.getenv("OTP_SESSION_TTL_SECONDS", "900"))
 GMAIL_USER = os.getenv("GMAIL_USER")
 GMAIL_APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
 GRAPH_CLIENT_ID = os.getenv("GRAPH_CLIENT_ID") or os.getenv("GRAPH_APPLICATION_ID")
@@ -61,8 +127,6 @@ GRAPH_TENANT_ID = os.getenv("GRAPH_TENANT_ID") or os.getenv("AZURE_TENANT_ID")
 GRAPH_APP_OBJECT_ID = os.getenv("GRAPH_APP_OBJECT_ID")
 GRAPH_APP_DISPLAY_NAME = os.getenv("GRAPH_APP_DISPLAY_NAME") or "Clara Bot"
 
-# ---------------- Global Variables ----------------
-otp_sessions = defaultdict(dict)  # Track OTPs temporarily
 # ---------------- Email Configuration ----------------
 
 
@@ -163,6 +227,184 @@ def is_face_recognition_enabled() -> bool:
     return FACE_RECOGNITION_ENABLED
 
 
+def get_face_store_dir() -> Path:
+    """Return the local directory holding the memory-mapped face encoding store."""
+    path = Path(FACE_STORE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def get_face_store_transfer_settings() -> dict:
+    """Return snapshot chunk size (0 = single plain object), zstd level and parallel transfer workers."""
+    return {
+        "chunk_bytes": max(0, FACE_STORE_CHUNK_BYTES),
+        "level": FACE_STORE_ZSTD_LEVEL,
+        "workers": max(1, FACE_STORE_TRANSFER_WORKERS),
+    }
+
+
+def get_face_shard_settings() -> dict:
+    """Return whether the store is sharded by office, this kiosk's site, whether other shards are searched on a miss and how many stay loaded."""
+    return {
+        "enabled": FACE_SHARDING,
+        "site": (FACE_SITE or "").strip(),
+        "fallback": FACE_SHARD_FALLBACK,
+        "max_resident": max(1, FACE_SHARD_MAX_RESIDENT),
+    }
+
+
+def get_face_index_options() -> dict:
+    """Return the gallery index backend (flat, ivf or auto) and its tuning knobs."""
+    return {
+        "index_backend": (FACE_INDEX_BACKEND or "auto").strip().lower(),
+        "ivf_min_size": FACE_INDEX_IVF_MIN_SIZE,
+        "nprobe": FACE_INDEX_NPROBE,
+    }
+
+
+def get_face_template_options() -> dict:
+    """Return the per-employee template cap and the centroid shortlist size."""
+    return {
+        "max_templates": max(1, FACE_MAX_TEMPLATES),
+        "centroid_shortlist": max(1, FACE_CENTROID_SHORTLIST),
+    }
+
+
+def get_face_gallery_dtype() -> str:
+    """Return the gallery storage layout: float32, float16 or int8 (per-dimension scale)."""
+    dtype = (FACE_GALLERY_DTYPE or "float32").strip().lower()
+    return dtype if dtype in ("float32", "float16", "int8") else "float32"
+
+
+def get_face_pool_settings() -> dict:
+    """Return worker count, queue depth and per-job timeout for the face worker pool."""
+    return {
+        "workers": max(0, FACE_POOL_WORKERS),
+        "max_queue": max(0, FACE_POOL_MAX_QUEUE),
+        "timeout": max(0.1, FACE_POOL_TIMEOUT_SECONDS),
+    }
+
+
+def get_face_post_match_settings() -> dict:
+    """Return worker count, queue depth, retry policy and shared status lifetime of the post-match OTP/visitor-log queue (0 workers runs it inline)."""
+    return {
+        "workers": max(0, FACE_POST_MATCH_WORKERS),
+        "max_queue": max(1, FACE_POST_MATCH_MAX_QUEUE),
+        "max_attempts": max(1, FACE_POST_MATCH_MAX_ATTEMPTS),
+        "backoff": max(0.0, FACE_POST_MATCH_BACKOFF_SECONDS),
+        "status_ttl": max(1.0, FACE_POST_MATCH_STATUS_TTL_SECONDS),
+    }
+
+
+def get_face_harvest_settings() -> dict:
+    """Return concurrency, per-host limit, timeout, retry and size limits of the employee photo harvester."""
+    return {
+        "concurrency": max(1, FACE_HARVEST_CONCURRENCY),
+        "per_host": max(1, FACE_HARVEST_PER_HOST),
+        "timeout": max(1.0, FACE_HARVEST_TIMEOUT_SECONDS),
+        "max_attempts": max(1, FACE_HARVEST_MAX_ATTEMPTS),
+        "max_bytes": max(1, FACE_HARVEST_MAX_BYTES),
+    }
+
+
+def get_face_encode_settings() -> dict:
+    """Return download concurrency, encoding processes and checkpoint interval of the batch encoder."""
+    return {
+        "download_workers": max(1, FACE_ENCODE_DOWNLOAD_WORKERS),
+        "encode_workers": max(0, FACE_ENCODE_WORKERS),
+        "checkpoint_every": max(1, FACE_ENCODE_CHECKPOINT_EVERY),
+    }
+
+
+def get_face_backend_settings() -> dict:
+    """Return the face detector/embedder backend (dlib-hog, dlib-cnn or onnx) and its ONNX model options."""
+    return {
+        "backend": (FACE_BACKEND or "dlib-hog").strip().lower(),
+        "onnx_detector_path": FACE_ONNX_DETECTOR_PATH,
+        "onnx_embedder_path": FACE_ONNX_EMBEDDER_PATH,
+        "onnx_match_threshold": FACE_ONNX_MATCH_THRESHOLD,
+        "onnx_threads": max(1, FACE_ONNX_THREADS),
+    }
+
+
+def get_face_pipeline_settings() -> dict:
+    """Return decode/detect sizes (0 = full resolution), crop margin, detector upsampling and ROI hint padding."""
+    return {
+        "decode_max_side": max(0, FACE_DECODE_MAX_SIDE),
+        "detect_max_side": max(0, FACE_DETECT_MAX_SIDE),
+        "upsample": max(0, FACE_DETECT_UPSAMPLE),
+        "fallback": FACE_DETECT_FALLBACK,
+        "crop_margin": max(0.0, FACE_CROP_MARGIN),
+        "hint_expand": max(0.0, FACE_HINT_EXPAND),
+    }
+
+
+def get_face_quality_settings() -> dict:
+    """Return the thresholds of the pre-encoding face quality gate (max_yaw 0 skips the yaw check)."""
+    return {
+        "enabled": FACE_QUALITY_ENABLED,
+        "min_face_px": max(0, FACE_QUALITY_MIN_FACE_PX),
+        "min_sharpness": max(0.0, FACE_QUALITY_MIN_SHARPNESS),
+        "min_brightness": FACE_QUALITY_MIN_BRIGHTNESS,
+        "max_brightness": FACE_QUALITY_MAX_BRIGHTNESS,
+        "max_yaw": max(0.0, FACE_QUALITY_MAX_YAW),
+    }
+
+
+def get_face_dedup_settings() -> dict:
+    """Return size and TTL of the face result cache (size 0 disables it)."""
+    return {
+        "max_entries": max(0, FACE_DEDUP_MAX_ENTRIES),
+        "ttl": FACE_DEDUP_TTL_SECONDS,
+    }
+
+
+def get_face_hot_tier_settings() -> dict:
+    """Return size and margin re-validation period of the recently-matched hot tier (size 0 disables it)."""
+    return {
+        "max_entries": max(0, FACE_HOT_TIER_SIZE),
+        "revalidate_seconds": max(0.0, FACE_HOT_TIER_REVALIDATE_SECONDS),
+    }
+
+
+def get_face_stream_settings() -> dict:
+    """Return the frame and time budget for streamed face recognition."""
+    return {
+        "max_frames": max(1, FACE_STREAM_MAX_FRAMES),
+        "timeout": max(1.0, FACE_STREAM_TIMEOUT_SECONDS),
+    }
+
+
+def get_flow_persistence_settings() -> dict:
+    """Return flow session persistence settings.
+
+    ``store`` is ``journal`` (snapshot plus append-only journal), ``json``
+    (whole-file rewrites), ``sqlite`` (database at ``db_path``, shared by
+    processes; empty means next to the sessions file) or ``shared`` (the
+    shared state backend, see ``get_shared_state_settings``); ``interval`` is the
+    write-behind delay (0 writes on every change); the journal is compacted
+    once it holds ``compact_records`` records or ``compact_bytes`` bytes.
+    """
+    store = FLOW_SESSION_STORE if FLOW_SESSION_STORE in {"journal", "json", "sqlite", "shared"} else "journal"
+    return {
+        "store": store,
+        "db_path": FLOW_SESSION_DB.strip(),
+        "interval": max(0.0, FLOW_SAVE_INTERVAL_SECONDS),
+        "compact_records": max(1, FLOW_JOURNAL_COMPACT_RECORDS),
+        "compact_bytes": max(1, FLOW_JOURNAL_COMPACT_BYTES),
+    }
+
+
+def get_shared_state_settings() -> dict:
+    """Return the shared state backend: ``embedded`` (SQLite at ``path``) or ``redis`` (server at ``url``)."""
+    return {
+        "backend": SHARED_STATE_BACKEND if SHARED_STATE_BACKEND in {"embedded", "redis"} else "embedded",
+        "url": SHARED_STATE_URL,
+        "path": SHARED_STATE_PATH,
+        "timeout": max(0.1, SHARED_STATE_TIMEOUT_SECONDS),
+    }
+
+
 def get_visitor_photo_prefix() -> str:
     """Return an optional root prefix for visitor photo S3 keys."""
     return VISITOR_PHOTO_PREFIX.strip("/")
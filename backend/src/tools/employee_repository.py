@@ -52,6 +52,7 @@ def _map_item(item: dict | None) -> dict | None:
         "email": item.get("email"),
         "phone": item.get("phone") or item.get("mobile"),
         "department": item.get("department"),
+        "office": item.get("office") or item.get("Office"),
         "photo_url": item.get("photo_url"),
         "raw": item,
     }
@@ -256,3 +257,30 @@ def get_employee_by_name(name: str) -> dict | None:
         target,
     )
     return None
+
+
+def get_employee_offices() -> dict[str, str | None] | None:
+    """Map every employee id to its office in one paged scan (None when the scan fails)."""
+    table = _get_table()
+    scan_kwargs = {
+        "ProjectionExpression": "#id, employee_id, office, Office",
+        "ExpressionAttributeNames": {"#id": "id"},
+    }
+    offices: dict[str, str | None] = {}
+    while True:
+        try:
+            response = table.scan(**scan_kwargs)
+        except ClientError as exc:
+            print(f"[employee_repository] DynamoDB office scan failed: {exc}")
+            return None
+
+        for item in response.get("Items", []):
+            employee_id = item.get("employee_id") or item.get("id")
+            if employee_id:
+                offices[str(employee_id).strip()] = item.get("office") or item.get("Office")
+
+        if "LastEvaluatedKey" not in response:
+            break
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    return offices
@@ -1,17 +1,26 @@
 import random
+import uuid
 from datetime import datetime
 from typing import Optional
 
 from livekit.agents import function_tool, RunContext
 
+from shared_state import SharedMap
+
 from .config import (
-    otp_sessions,
+    OTP_SESSION_TTL_SECONDS,
     is_dev_mode_otp,
 )
 from .employee_repository import get_employee_by_email, get_employee_by_id
 from .manager_visit_repository import get_manager_visit
 from .sms_sender import send_sms_via_sns
 
+# Track OTPs temporarily, shared by every process
+otp_sessions = SharedMap("otp", ttl=OTP_SESSION_TTL_SECONDS)
+# Guesses per issued OTP, counted atomically so workers verifying at once share the limit
+otp_attempts = SharedMap("otp_attempts", ttl=OTP_SESSION_TTL_SECONDS)
+MAX_OTP_ATTEMPTS = 3
+
 def _normalize_email(email: str | None) -> str:
     return (email or "").strip().lower()
 
@@ -46,11 +55,11 @@ def _load_employee_record(
     return record
 
 
-def _prepare_session(email_key: str, record: dict) -> None:
+def _prepare_session(email_key: str, record: dict, otp_id: Optional[str] = None) -> None:
     otp_sessions[email_key] = {
         "otp": None,
+        "otp_id": otp_id,
         "verified": False,
-        "attempts": 0,
         "name": record.get("name"),
         "employee_id": record.get("employee_id"),
         "delivery_method": None,
@@ -64,11 +73,14 @@ def _issue_otp(email_key: str, record: dict) -> str:
     generated_otp = str(random.randint(100000, 999999))
     session = otp_sessions[email_key]
     session["otp"] = generated_otp
+    # A new OTP gets a fresh attempts counter
+    session["otp_id"] = uuid.uuid4().hex
     session["verified"] = False
-    session["attempts"] = 0
     session["name"] = record.get("name")
     session["employee_id"] = record.get("employee_id")
     session["delivery_method"] = None
+    # Sessions are shared between processes: changes are written back
+    otp_sessions[email_key] = session
 
     emp_name = record.get("name") or "there"
     phone_number = (record.get("phone") or "").strip()
@@ -124,6 +136,7 @@ def _issue_otp(email_key: str, record: dict) -> str:
         "otp": generated_otp,
         "employee": emp_name,
     }
+    otp_sessions[email_key] = session
     print(
         f"[OTP] {delivery_method.upper()} dispatched",
         {
@@ -169,25 +182,28 @@ def _verify_otp(email_key: str, otp: str, record: dict) -> str:
     if not session:
         return "❌ No OTP session found. Please request OTP first."
 
-    attempts = session.get("attempts", 0)
-    if attempts >= 3:
-        _prepare_session(email_key, record)
-        return "❌ Too many failed OTP attempts. Restart verification."
-
     provided_otp = str(otp or "").strip()
     if not provided_otp:
         return "❌ Please provide the OTP that was sent to your phone via SMS."
 
+    # Claim the attempt before checking the OTP: the limit holds against the
+    # count returned by the increment, however many guesses run at once
+    attempts = otp_attempts.increment(f"{email_key}:{session.get('otp_id') or ''}")
+    if attempts > MAX_OTP_ATTEMPTS:
+        # Drop the OTP but keep its counter, so guesses still in flight are refused too
+        _prepare_session(email_key, record, otp_id=session.get("otp_id"))
+        return "❌ Too many failed OTP attempts. Restart verification."
+
     saved_otp = session.get("otp")
     if saved_otp and provided_otp == saved_otp:
         session["verified"] = True
+        otp_sessions[email_key] = session
         emp_name = record.get("name") or session.get("name") or "Employee"
         emp_id = record.get("employee_id") or session.get("employee_id")
         default_message = f"✅ OTP verified. Welcome {emp_name}!"
         return _manager_visit_message(emp_id, emp_name, default_message)
 
-    session["attempts"] = attempts + 1
-    remaining = max(0, 3 - session["attempts"])
+    remaining = max(0, MAX_OTP_ATTEMPTS - attempts)
     return f"❌ OTP incorrect. Attempts left: {remaining}."
 
 
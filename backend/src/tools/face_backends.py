@@ -0,0 +1,213 @@
+"""
+Face Backends
+
+A backend bundles a face detector with the embedder that turns a face into a
+vector. Deployments pick one with ``FACE_BACKEND``:
+
+- ``dlib-hog`` – dlib HOG detector + dlib ResNet (the original pipeline);
+- ``dlib-cnn`` – dlib MMOD CNN detector + the same ResNet;
+- ``onnx``     – ONNX Runtime on CPU: an UltraFace-style detector and an
+  ArcFace-style embedder (int8-quantised models run as-is; see
+  ``quantize_face_model.py``).
+
+Vectors are only comparable when they come from the same embedder, so every
+backend exposes an ``embedder_id`` that the face store records with each
+snapshot and delta. dlib-hog and dlib-cnn share one. Each backend also
+carries its own match threshold, since the embedding spaces differ.
+"""
+
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from .config import get_face_backend_settings
+
+
+Box = tuple[int, int, int, int]  # (top, right, bottom, left), as face_recognition uses
+
+DLIB_EMBEDDER_ID = "dlib-resnet-128"
+DLIB_MATCH_THRESHOLD = 0.55
+
+
+class DlibBackend:
+    """dlib detector (HOG or CNN) with the 128-d dlib ResNet embedder."""
+
+    embedder_id = DLIB_EMBEDDER_ID
+    embedding_dim = 128
+    match_threshold = DLIB_MATCH_THRESHOLD
+
+    def __init__(self, model: str = "hog"):
+        self.model = model
+        self.name = f"dlib-{model}"
+
+    def warm_up(self) -> None:
+        self.detect(np.zeros((64, 64, 3), dtype=np.uint8), upsample=0)
+
+    def detect(self, frame: np.ndarray, upsample: int = 1) -> list[Box]:
+        import face_recognition
+
+        return face_recognition.face_locations(frame, number_of_times_to_upsample=upsample, model=self.model)
+
+    def landmarks(self, frame: np.ndarray, box: Box) -> dict[str, list] | None:
+        import face_recognition
+
+        found = face_recognition.face_landmarks(frame, [box], model="small")
+        return found[0] if found else None
+
+    def embed(self, frame: np.ndarray, box: Box) -> np.ndarray | None:
+        import face_recognition
+
+        encodings = face_recognition.face_encodings(frame, known_face_locations=[box])
+        return encodings[0] if encodings else None
+
+
+class OnnxBackend:
+    """ONNX Runtime CPU backend: UltraFace-style detector, ArcFace-style embedder.
+
+    The detector takes a normalised RGB NCHW frame and returns ``scores``
+    (N×2) and ``boxes`` (N×4, relative x1,y1,x2,y2). The embedder takes a
+    112×112 RGB NCHW face scaled to [-1, 1]; its output is L2-normalised, so
+    distances live in [0, 2].
+    """
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        detector_path: str,
+        embedder_path: str,
+        match_threshold: float = 1.05,
+        score_threshold: float = 0.7,
+        nms_threshold: float = 0.3,
+        face_scale: float = 1.15,
+        threads: int = 1,
+    ):
+        import onnxruntime
+
+        for path in (detector_path, embedder_path):
+            if not path or not Path(path).exists():
+                raise FileNotFoundError(f"ONNX face model not found: {path!r}")
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = max(1, threads)
+        options.inter_op_num_threads = 1
+        providers = ["CPUExecutionProvider"]
+        self._detector = onnxruntime.InferenceSession(detector_path, options, providers=providers)
+        self._embedder = onnxruntime.InferenceSession(embedder_path, options, providers=providers)
+
+        detector_input = self._detector.get_inputs()[0]
+        self._detector_input = detector_input.name
+        self._detector_size = (int(detector_input.shape[3]), int(detector_input.shape[2]))  # (width, height)
+        embedder_input = self._embedder.get_inputs()[0]
+        self._embedder_input = embedder_input.name
+        self._embedder_size = (int(embedder_input.shape[3]), int(embedder_input.shape[2]))
+        self.embedding_dim = int(self._embedder.get_outputs()[0].shape[-1])
+
+        digest = hashlib.sha256(Path(embedder_path).read_bytes()).hexdigest()[:12]
+        self.embedder_id = f"onnx-{Path(embedder_path).stem}-{digest}"
+        self.match_threshold = match_threshold
+        self.score_threshold = score_threshold
+        self.nms_threshold = nms_threshold
+        self.face_scale = face_scale
+
+    def warm_up(self) -> None:
+        frame = np.zeros((self._detector_size[1], self._detector_size[0], 3), dtype=np.uint8)
+        self.detect(frame)
+        self.embed(frame, (0, frame.shape[1], frame.shape[0], 0))
+
+    def detect(self, frame: np.ndarray, upsample: int = 1) -> list[Box]:
+        height, width = frame.shape[:2]
+        resized = np.asarray(Image.fromarray(frame).resize(self._detector_size, Image.BILINEAR), dtype=np.float32)
+        blob = ((resized - 127.0) / 128.0).transpose(2, 0, 1)[None]
+        scores, boxes = self._detector.run(None, {self._detector_input: blob})
+        scores, boxes = scores[0][:, 1], boxes[0]
+
+        keep = scores >= self.score_threshold
+        scores, boxes = scores[keep], boxes[keep]
+        picked = _nms(boxes, scores, self.nms_threshold)
+        results: list[Box] = []
+        for x1, y1, x2, y2 in boxes[picked]:
+            left, right = int(max(0.0, x1) * width), int(min(1.0, x2) * width)
+            top, bottom = int(max(0.0, y1) * height), int(min(1.0, y2) * height)
+            if right > left and bottom > top:
+                results.append((top, right, bottom, left))
+        return results
+
+    def landmarks(self, frame: np.ndarray, box: Box) -> dict[str, list] | None:
+        # The detector has no landmark head; the quality gate skips yaw
+        return None
+
+    def embed(self, frame: np.ndarray, box: Box) -> np.ndarray | None:
+        top, right, bottom, left = box
+        side = max(bottom - top, right - left) * self.face_scale
+        center_x, center_y = (left + right) / 2, (top + bottom) / 2
+        square = (
+            int(center_x - side / 2),
+            int(center_y - side / 2),
+            int(center_x + side / 2),
+            int(center_y + side / 2),
+        )
+        face = Image.fromarray(frame).crop(square).resize(self._embedder_size, Image.BILINEAR)
+        blob = ((np.asarray(face, dtype=np.float32) - 127.5) / 127.5).transpose(2, 0, 1)[None]
+        vector = self._embedder.run(None, {self._embedder_input: blob})[0][0].astype(np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+
+def _nms(boxes: np.ndarray, scores: np.ndarray, threshold: float) -> list[int]:
+    order = np.argsort(scores)[::-1]
+    areas = np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+    keep: list[int] = []
+    while len(order):
+        best = int(order[0])
+        keep.append(best)
+        rest = order[1:]
+        x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        overlap = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        iou = overlap / np.maximum(areas[best] + areas[rest] - overlap, 1e-9)
+        order = rest[iou <= threshold]
+    return keep
+
+
+def _build_backend(name: str, settings: dict[str, Any]):
+    if name in {"dlib-hog", "dlib-cnn"}:
+        return DlibBackend(name.split("-", 1)[1])
+    if name == "onnx":
+        return OnnxBackend(
+            settings["onnx_detector_path"],
+            settings["onnx_embedder_path"],
+            match_threshold=settings["onnx_match_threshold"],
+            threads=settings["onnx_threads"],
+        )
+    raise ValueError(f"Unknown face backend '{name}' (expected one of {', '.join(FACE_BACKENDS)})")
+
+
+FACE_BACKENDS = ("dlib-hog", "dlib-cnn", "onnx")
+
+_backends: dict[str, Any] = {}
+_backends_lock = threading.Lock()
+
+
+def get_face_backend(name: str | None = None):
+    """Return the (process-wide, lazily loaded) backend ``name`` or the configured one."""
+    settings = get_face_backend_settings()
+    name = (name or settings["backend"]).strip().lower()
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            backend = _build_backend(name, settings)
+            _backends[name] = backend
+            print(f"[FaceBackend] Loaded {backend.name} (embedder {backend.embedder_id}, dim {backend.embedding_dim})")
+    return backend
+
+
+def distance_scale(backend) -> float:
+    """Factor that maps the dlib-tuned distance margins onto ``backend``'s embedding space."""
+    return backend.match_threshold / DLIB_MATCH_THRESHOLD
@@ -0,0 +1,298 @@
+"""
+Face Batch Encoder
+
+Pipelined, resumable, incremental encoding of the employee reference photos
+behind ``encode_faces.py``:
+
+- downloads run on a thread pool (S3 GETs are I/O bound);
+- encoding runs on a process pool, one warm backend per core;
+- a manifest maps every image key to the ETag it was encoded from and the
+  resulting encoding, so images whose ETag is unchanged are skipped;
+- every finished image is appended to a checkpoint log straight away, so an
+  interrupted run resumes where it stopped. The log is folded into the
+  manifest when a run completes.
+
+The manifest belongs to one embedder. After a backend or model change every
+image is re-encoded, and that full pass scales with the process pool.
+Failed downloads and encodes are not recorded and are retried next run;
+images without a detectable face are recorded so they are not retried
+until they change.
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+import numpy as np
+
+from .face_store import _atomic_write
+
+
+ENCODER_DIR = "encoder"
+MANIFEST_NAME = "encode_manifest.json"
+CHECKPOINT_NAME = "encode_checkpoint.jsonl"
+
+
+# ---------------------------------------------------
+# Worker process side
+# ---------------------------------------------------
+_worker_backend = None
+_worker_pipeline: dict[str, Any] | None = None
+
+
+def _init_encoder(backend_name: str | None, pipeline: dict[str, Any]) -> None:
+    global _worker_backend, _worker_pipeline
+    from .face_backends import get_face_backend
+
+    _worker_backend = get_face_backend(backend_name)
+    _worker_backend.warm_up()
+    _worker_pipeline = pipeline
+
+
+def encode_reference_image(image_bytes: bytes) -> list[float] | None:
+    """Encode one reference photo with the worker's backend; None when no face is found."""
+    from .face_pipeline import encode_frame
+
+    if _worker_backend is None:
+        _init_encoder(None, {})
+    pipeline = _worker_pipeline or None
+    encoded = encode_frame(image_bytes, pipeline, quality={"enabled": False}, backend=_worker_backend)
+    if encoded["encoding"] is None:
+        return None
+    return np.asarray(encoded["encoding"], dtype=np.float32).tolist()
+
+
+class _InlineExecutor(Executor):
+    """Runs jobs in the calling thread (encode_workers=0, and tests)."""
+
+    def submit(self, fn, *args, **kwargs):
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            if not isinstance(exc, Exception):
+                raise
+            future.set_exception(exc)
+        return future
+
+
+# ---------------------------------------------------
+# Manifest and checkpoint
+# ---------------------------------------------------
+class EncodeManifest:
+    """ETag → encoding records for one embedder, with an append-only checkpoint log."""
+
+    def __init__(self, state_dir: Path, embedder: str):
+        self.state_dir = Path(state_dir)
+        self.embedder = embedder
+        self.entries: dict[str, dict[str, Any]] = {}
+        self.published: str | None = None
+        # Shard name -> fingerprint of its last published snapshot (sharded stores)
+        self.published_shards: dict[str, str] = {}
+        self._checkpoint = None
+        self._pending = 0
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.state_dir / MANIFEST_NAME
+
+    @property
+    def checkpoint_path(self) -> Path:
+        return self.state_dir / CHECKPOINT_NAME
+
+    def load(self) -> int:
+        """Load the manifest and replay the checkpoint; returns how many checkpoint records were resumed."""
+        self.entries, self.published, self.published_shards = {}, None, {}
+        try:
+            data = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = None
+        if data and data.get("embedder") == self.embedder:
+            self.entries = data.get("entries", {})
+            self.published = data.get("published")
+            self.published_shards = data.get("published_shards", {})
+        elif data:
+            print(f"[FaceEncoder] Embedder changed ({data.get('embedder')} -> {self.embedder}); re-encoding everything")
+
+        resumed = 0
+        try:
+            with self.checkpoint_path.open("r", encoding="utf-8") as handle:
+                for line in handle:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        continue
+                    if record.get("embedder") != self.embedder:
+                        continue
+                    self.entries[record.pop("key")] = record
+                    resumed += 1
+        except OSError:
+            pass
+        return resumed
+
+    def is_current(self, key: str, etag: str | None) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and etag is not None and entry.get("etag") == etag
+
+    def record(self, key: str, etag: str | None, employee_id: str, encoding: list[float] | None, flush_every: int) -> None:
+        entry = {"etag": etag, "employee_id": employee_id, "embedder": self.embedder, "encoding": encoding}
+        self.entries[key] = entry
+        if self._checkpoint is None:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            self._checkpoint = self.checkpoint_path.open("a", encoding="utf-8")
+        self._checkpoint.write(json.dumps({"key": key, **entry}) + "\n")
+        self._pending += 1
+        if self._pending >= max(1, flush_every):
+            self.flush()
+
+    def flush(self) -> None:
+        if self._checkpoint is not None and self._pending:
+            self._checkpoint.flush()
+            os.fsync(self._checkpoint.fileno())
+            self._pending = 0
+
+    def compact(self, keep_keys: Iterable[str] | None = None) -> None:
+        """Fold the checkpoint into the manifest, dropping keys no longer listed."""
+        self.flush()
+        if keep_keys is not None:
+            keep = set(keep_keys)
+            self.entries = {key: entry for key, entry in self.entries.items() if key in keep}
+        manifest = {
+            "embedder": self.embedder,
+            "updated_at": time.time(),
+            "published": self.published,
+            "published_shards": self.published_shards,
+            "entries": self.entries,
+        }
+        _atomic_write(self.manifest_path, json.dumps(manifest).encode("utf-8"))
+        if self._checkpoint is not None:
+            self._checkpoint.close()
+            self._checkpoint = None
+        try:
+            self.checkpoint_path.unlink()
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        self.flush()
+        if self._checkpoint is not None:
+            self._checkpoint.close()
+            self._checkpoint = None
+
+
+# ---------------------------------------------------
+# Pipeline
+# ---------------------------------------------------
+def run_batch_encode(
+    jobs: list[dict[str, Any]],
+    fetch: Callable[[str], bytes],
+    manifest: EncodeManifest,
+    download_workers: int = 16,
+    encode_workers: int = 0,
+    checkpoint_every: int = 25,
+    encode: Callable[[bytes], list[float] | None] = encode_reference_image,
+    backend_name: str | None = None,
+    pipeline: dict[str, Any] | None = None,
+) -> dict[str, int]:
+    """Download and encode every job whose ETag is not already in ``manifest``.
+
+    ``jobs`` are ``{"key", "etag", "employee_id"}`` dicts. At most
+    ``2 * encode_workers + download_workers`` images are in memory at once.
+    Returns counters: skipped, encoded, no_face, failed.
+    """
+    counters = {"skipped": 0, "encoded": 0, "no_face": 0, "failed": 0}
+    todo = []
+    for job in jobs:
+        if manifest.is_current(job["key"], job.get("etag")):
+            counters["skipped"] += 1
+        else:
+            todo.append(job)
+    if not todo:
+        return counters
+
+    if encode_workers > 0:
+        encoders: Executor = ProcessPoolExecutor(
+            max_workers=encode_workers,
+            initializer=_init_encoder,
+            initargs=(backend_name, pipeline or {}),
+        )
+    else:
+        if encode is encode_reference_image:
+            _init_encoder(backend_name, pipeline or {})
+        encoders = _InlineExecutor()
+    window = max(1, download_workers) + 2 * max(1, encode_workers)
+    started = time.perf_counter()
+    finished = 0
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, download_workers), thread_name_prefix="face-encode-fetch") as downloads:
+            queued = iter(todo)
+            in_flight: dict[Future, tuple[str, dict[str, Any]]] = {}
+
+            def refill() -> None:
+                while len(in_flight) < window:
+                    job = next(queued, None)
+                    if job is None:
+                        return
+                    in_flight[downloads.submit(fetch, job["key"])] = ("download", job)
+
+            refill()
+            while in_flight:
+                done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage, job = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as exc:
+                        counters["failed"] += 1
+                        print(f"  ⚠ Failed to {'load' if stage == 'download' else 'encode'} {job['key']}: {exc}")
+                        continue
+
+                    if stage == "download":
+                        in_flight[encoders.submit(encode, result)] = ("encode", job)
+                        continue
+
+                    manifest.record(job["key"], job.get("etag"), job["employee_id"], result, checkpoint_every)
+                    counters["encoded" if result is not None else "no_face"] += 1
+                    finished += 1
+                    if result is None:
+                        print(f"  ⚠ No face found in {job['key']}")
+                    if finished % 100 == 0:
+                        rate = finished / max(time.perf_counter() - started, 1e-9)
+                        print(f"[FaceEncoder] {finished}/{len(todo)} images ({rate:.1f}/s)")
+                refill()
+    finally:
+        manifest.close()
+        encoders.shutdown(wait=True, cancel_futures=True)
+    return counters
+
+
+def select_templates(
+    manifest: EncodeManifest, keys_by_employee: dict[str, list[str]]
+) -> tuple[list[np.ndarray], list[str]]:
+    """Encodings and ids for the snapshot, employees sorted, templates oldest first."""
+    encodings: list[np.ndarray] = []
+    ids: list[str] = []
+    for employee_id in sorted(keys_by_employee):
+        for key in keys_by_employee[employee_id]:
+            entry = manifest.entries.get(key)
+            if entry and entry.get("encoding") is not None:
+                encodings.append(np.asarray(entry["encoding"], dtype=np.float32))
+                ids.append(employee_id)
+    return encodings, ids
+
+
+def snapshot_fingerprint(jobs: list[dict[str, Any]], embedder: str, dtype: str = "float32") -> str:
+    """Identity of the image set a snapshot was built from (keys and ETags) and its storage dtype."""
+    digest = hashlib.sha256(embedder.encode("utf-8"))
+    if dtype != "float32":
+        # float32 fingerprints predate compact storage and stay as they were
+        digest.update(f"\ndtype={dtype}".encode("utf-8"))
+    for job in sorted(jobs, key=lambda item: item["key"]):
+        digest.update(f"\n{job['key']}\t{job.get('etag')}".encode("utf-8"))
+    return digest.hexdigest()
@@ -0,0 +1,464 @@
+"""
+Face Gallery
+
+Holds the known face encodings as one contiguous matrix with precomputed
+squared norms and a parallel employee id array, so a probe encoding is
+matched with a single vectorized distance pass. The matrix is float32, or
+float16/int8 codes (see ``face_quantize``) dequantised inside the kernel.
+
+An employee may own several templates (capped, oldest retired first). A
+per-employee centroid matrix gives a cheap first pass; only the templates of
+the closest employees are then re-ranked exactly. Each centroid keeps the
+radius of its templates, so ``|probe - centroid| - radius`` bounds how close
+any of them can be; every employee whose bound is within the narrowed
+search's worst answer is re-checked exactly, which keeps the runner-up (and
+so the confidence gap) exact even when it fell outside the candidates.
+"""
+
+import threading
+from typing import Any, Sequence
+
+import numpy as np
+
+from .face_index import build_face_index
+from .face_quantize import dequantize, normalize_dtype, quantize, quantized_dot, quantized_sq_norms
+
+
+# Float32 rounding allowance on the centroid bound
+BOUND_SLACK = 1e-4
+
+
+def legacy_employee_ids(encoding_data: dict[str, Any]) -> list:
+    return list(
+        encoding_data.get("employee_ids")
+        or encoding_data.get("ids")
+        or encoding_data.get("names")
+        or []
+    )
+
+
+def decide_match(
+    ranked: list[tuple[str, float]], threshold: float, min_gap: float, confident_margin: float
+) -> str | None:
+    """The accept rule of ``match_face_image`` applied to (employee id, distance) pairs, closest first.
+
+    The best employee is accepted when it is within ``threshold`` and either
+    the runner-up is at least ``min_gap`` further away or the best distance
+    clears the threshold by ``confident_margin``.
+    """
+    if not ranked or ranked[0][1] > threshold:
+        return None
+    gap_confident = len(ranked) < 2 or ranked[1][1] - ranked[0][1] >= min_gap
+    if gap_confident or ranked[0][1] <= threshold - confident_margin:
+        return ranked[0][0]
+    return None
+
+
+class FaceGallery:
+    """Matrix view of the face encoding database with a pluggable index.
+
+    Rows are appended in place (amortised growth) and removed by tombstoning,
+    so registrations update the gallery and its index incrementally. Rows of
+    one employee are its templates, oldest first. ``embedder`` names the
+    backend embedding space every row lives in.
+
+    ``storage_dtype`` picks the row layout (float32, float16 or int8).
+    Encodings already in that layout (int8 with their ``scale``) are adopted
+    as-is; anything else is quantised on the way in.
+
+    The row width is the embedder's: taken from ``encodings`` (an empty
+    ``(0, dim)`` matrix keeps its width), else ``dim``. A gallery that has
+    never held a row takes the width of its first template.
+    """
+
+    def __init__(
+        self,
+        encodings: Sequence | np.ndarray,
+        employee_ids: Sequence[str],
+        index_backend: str | None = None,
+        max_templates: int | None = None,
+        centroid_shortlist: int = 32,
+        embedder: str | None = None,
+        dim: int | None = None,
+        storage_dtype: str | None = None,
+        scale: Sequence[float] | np.ndarray | None = None,
+        **index_options,
+    ):
+        matrix = np.asarray(encodings)
+        if matrix.dtype.name not in ("float16", "int8"):
+            matrix = matrix.astype(np.float32, copy=False)
+        if matrix.size == 0 and (matrix.ndim != 2 or not matrix.shape[1]):
+            matrix = np.empty((0, dim or 0), dtype=matrix.dtype)
+        elif matrix.ndim != 2:
+            matrix = matrix.reshape(len(matrix), -1)
+
+        count = min(len(matrix), len(employee_ids))
+        matrix = matrix[:count]
+        self.storage_dtype = normalize_dtype(storage_dtype or matrix.dtype.name)
+        if matrix.dtype.name == "int8" and scale is None:
+            raise ValueError("int8 encodings need their per-dimension scale")
+        if matrix.dtype.name == self.storage_dtype:
+            codes = matrix
+            self._scale = np.asarray(scale, dtype=np.float32) if self.storage_dtype == "int8" else None
+        else:
+            codes, self._scale = quantize(dequantize(matrix, scale), self.storage_dtype)
+
+        self.embedder = embedder
+        self.dim = matrix.shape[1]
+        self._size = count
+        self._matrix = np.ascontiguousarray(codes)
+        self._sq_norms = quantized_sq_norms(self._matrix, self._scale)
+        self._active = np.ones(count, dtype=bool)
+        self._active_count = count
+        self.ids: list[str] = list(employee_ids)[:count]
+        self._rows_by_id: dict[str, list[int]] = {}
+        for row, employee_id in enumerate(self.ids):
+            self._rows_by_id.setdefault(employee_id, []).append(row)
+
+        self.max_templates = max_templates if max_templates and max_templates > 0 else None
+        self.centroid_shortlist = max(1, centroid_shortlist)
+        if self.max_templates:
+            for rows in self._rows_by_id.values():
+                while len(rows) > self.max_templates:
+                    retired = rows.pop(0)
+                    self._active[retired] = False
+                    self._active_count -= 1
+
+        self._lock = threading.RLock()
+        # Bumped on every add/remove so derived state (hot-tier margins) can tell it is stale
+        self.revision = 0
+        self._build_centroids()
+        self._index_options = (index_backend, index_options)
+        self.index = build_face_index(self, index_backend, **index_options)
+
+    @classmethod
+    def from_encoding_data(
+        cls,
+        encoding_data: dict[str, Any] | None,
+        index_backend: str | None = None,
+        **options,
+    ) -> "FaceGallery":
+        if not encoding_data:
+            return cls([], [], index_backend, **options)
+        options.setdefault("embedder", encoding_data.get("embedder"))
+        options.setdefault("scale", encoding_data.get("scale"))
+        return cls(
+            encoding_data.get("encodings", []),
+            legacy_employee_ids(encoding_data),
+            index_backend,
+            **options,
+        )
+
+    def _build_centroids(self) -> None:
+        self._slot_ids: list[str] = list(self._rows_by_id)
+        self._slots: dict[str, int] = {employee_id: slot for slot, employee_id in enumerate(self._slot_ids)}
+        capacity = max(16, len(self._slot_ids))
+        self._centroids = np.zeros((capacity, self.dim), dtype=np.float32)
+        self._centroid_sq = np.zeros(capacity, dtype=np.float32)
+        self._centroid_live = np.zeros(capacity, dtype=bool)
+        self._radii = np.zeros(capacity, dtype=np.float32)
+        if not self._slot_ids:
+            return
+
+        rows = np.fromiter(
+            (row for employee_id in self._slot_ids for row in self._rows_by_id[employee_id]), dtype=np.int64
+        )
+        counts = np.fromiter((len(self._rows_by_id[employee_id]) for employee_id in self._slot_ids), dtype=np.int64)
+        slots = np.repeat(np.arange(len(self._slot_ids)), counts)
+        vectors = self.vectors(rows)
+        sums = np.zeros((len(self._slot_ids), self.dim), dtype=np.float32)
+        np.add.at(sums, slots, vectors)
+        centroids = sums / counts[:, None]
+        spread = np.linalg.norm(vectors - centroids[slots], axis=1)
+        radii = np.zeros(len(centroids), dtype=np.float32)
+        np.maximum.at(radii, slots, spread)
+        self._centroids[: len(centroids)] = centroids
+        self._radii[: len(centroids)] = radii
+        self._centroid_sq[: len(centroids)] = np.einsum("ij,ij->i", centroids, centroids)
+        self._centroid_live[: len(centroids)] = True
+
+    def _update_centroid(self, employee_id: str) -> None:
+        rows = self._rows_by_id.get(employee_id)
+        slot = self._slots.get(employee_id)
+        if not rows:
+            if slot is not None:
+                self._centroid_live[slot] = False
+            return
+
+        if slot is None:
+            slot = len(self._slot_ids)
+            if slot == len(self._centroids):
+                self._grow_centroids(2 * len(self._centroids))
+            self._slot_ids.append(employee_id)
+            self._slots[employee_id] = slot
+        vectors = self.vectors(rows)
+        centroid = vectors.mean(axis=0)
+        self._centroids[slot] = centroid
+        self._radii[slot] = float(np.linalg.norm(vectors - centroid, axis=1).max())
+        self._centroid_sq[slot] = float(centroid @ centroid)
+        self._centroid_live[slot] = True
+
+    def _grow_centroids(self, capacity: int) -> None:
+        used = len(self._slot_ids)
+        centroids = np.zeros((capacity, self.dim), dtype=np.float32)
+        centroids[:used] = self._centroids[:used]
+        centroid_sq = np.zeros(capacity, dtype=np.float32)
+        centroid_sq[:used] = self._centroid_sq[:used]
+        live = np.zeros(capacity, dtype=bool)
+        live[:used] = self._centroid_live[:used]
+        radii = np.zeros(capacity, dtype=np.float32)
+        radii[:used] = self._radii[:used]
+        self._centroids, self._centroid_sq, self._centroid_live = centroids, centroid_sq, live
+        self._radii = radii
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """Float32 rows; a dequantised copy when the storage is compact."""
+        return self.vectors(slice(0, self._size))
+
+    @property
+    def codes(self) -> np.ndarray:
+        """Rows as stored (float32, float16 or int8 codes)."""
+        return self._matrix[: self._size]
+
+    @property
+    def scale(self) -> np.ndarray | None:
+        """Per-dimension int8 scale, None for float storage."""
+        return self._scale
+
+    @property
+    def storage_bytes(self) -> int:
+        return int(self.codes.nbytes)
+
+    def vectors(self, rows) -> np.ndarray:
+        """Float32 values of the given row(s)."""
+        selected = self._matrix[rows]
+        if self.storage_dtype == "float32":
+            return selected
+        return dequantize(selected, self._scale)
+
+    @property
+    def sq_norms(self) -> np.ndarray:
+        return self._sq_norms[: self._size]
+
+    def __len__(self) -> int:
+        return self._active_count
+
+    def __contains__(self, employee_id: str) -> bool:
+        return bool(self._rows_by_id.get(employee_id))
+
+    @property
+    def employee_count(self) -> int:
+        return len(self._rows_by_id)
+
+    def template_rows(self, employee_id: str) -> list[int]:
+        """Active rows of ``employee_id``, oldest template first."""
+        return list(self._rows_by_id.get(employee_id, []))
+
+    def active_rows(self) -> np.ndarray:
+        return np.flatnonzero(self._active[: self._size])
+
+    def add(self, employee_id: str, encoding: np.ndarray) -> int:
+        """Append one template; past ``max_templates`` the oldest one is retired."""
+        vector = np.asarray(encoding, dtype=np.float32).ravel()
+        with self._lock:
+            if len(vector) != self.dim:
+                self._set_width(len(vector))
+            if self._size == len(self._matrix):
+                self._grow(max(16, 2 * len(self._matrix)))
+            if self._scale is not None:
+                self._widen_scale(vector)
+            row = self._size
+            codes, _ = quantize(vector[None, :], self.storage_dtype, self._scale)
+            self._matrix[row] = codes[0]
+            stored = self.vectors(row)
+            self._sq_norms[row] = float(stored @ stored)
+            self._active[row] = True
+            self._active_count += 1
+            self.ids.append(employee_id)
+            self._size += 1
+            rows = self._rows_by_id.setdefault(employee_id, [])
+            rows.append(row)
+            self.index.add(row)
+            while self.max_templates and len(rows) > self.max_templates:
+                self._retire(rows.pop(0))
+            self._update_centroid(employee_id)
+            self.revision += 1
+        return row
+
+    def _set_width(self, dim: int) -> None:
+        """Adopt the first template's width; rows of another width are refused."""
+        if self._size:
+            raise ValueError(f"{dim}-d encoding does not fit a {self.dim}-d gallery")
+        self.dim = dim
+        self._matrix = np.zeros((0, dim), dtype=self._matrix.dtype)
+        if self._scale is not None:
+            self._scale = np.zeros(dim, dtype=np.float32)
+        self._build_centroids()
+        index_backend, index_options = self._index_options
+        self.index = build_face_index(self, index_backend, **index_options)
+
+    def _widen_scale(self, vector: np.ndarray) -> None:
+        """Re-encode int8 columns whose scale ``vector`` would clip.
+
+        Rare (a new template outside the range seen so far), so the column
+        rewrite and the centroid rebuild are acceptable.
+        """
+        scale = quantize(vector[None, :], "int8", self._scale)[1]
+        widened = np.flatnonzero(scale > self._scale)
+        if not len(widened):
+            return
+        old = np.where(self._scale[widened] > 0, self._scale[widened], 1.0)
+        used = self._matrix[: self._size, widened].astype(np.float32) * (old / scale[widened])
+        self._matrix[: self._size, widened] = np.rint(used).astype(np.int8)
+        self._scale = scale
+        self._sq_norms[: self._size] = quantized_sq_norms(self._matrix[: self._size], self._scale)
+        self._build_centroids()
+
+    def _retire(self, row: int) -> None:
+        self._active[row] = False
+        self._active_count -= 1
+        self.index.remove(row)
+
+    def remove(self, employee_id: str) -> int:
+        """Tombstone every row of ``employee_id``; returns the number removed."""
+        with self._lock:
+            rows = self._rows_by_id.pop(employee_id, [])
+            for row in rows:
+                self._retire(row)
+            self._update_centroid(employee_id)
+            self.revision += 1
+        return len(rows)
+
+    def _grow(self, capacity: int) -> None:
+        matrix = np.zeros((capacity, self.dim), dtype=self._matrix.dtype)
+        matrix[: self._size] = self._matrix[: self._size]
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        sq_norms[: self._size] = self._sq_norms[: self._size]
+        active = np.zeros(capacity, dtype=bool)
+        active[: self._size] = self._active[: self._size]
+        self._matrix, self._sq_norms, self._active = matrix, sq_norms, active
+
+    def distances(self, encoding: np.ndarray, rows: np.ndarray | None = None) -> np.ndarray:
+        """Euclidean distance from ``encoding`` to every (or the given) gallery row."""
+        probe = np.asarray(encoding, dtype=np.float32).ravel()
+        if rows is None:
+            codes, sq_norms = self.codes, self.sq_norms
+        else:
+            codes, sq_norms = self._matrix[rows], self._sq_norms[rows]
+        squared = sq_norms - 2.0 * quantized_dot(codes, probe, self._scale) + float(probe @ probe)
+        np.maximum(squared, 0.0, out=squared)
+        return np.sqrt(squared)
+
+    def separation(self, row: int) -> float:
+        """Exact distance from template ``row`` to the closest template of any other employee."""
+        with self._lock:
+            distances = self.distances(self.vectors(row))
+            distances[~self._active[: self._size]] = np.inf
+            distances[self._rows_by_id.get(self.ids[row], [])] = np.inf
+        return float(distances.min()) if len(distances) else float("inf")
+
+    def nearest(self, encoding: np.ndarray, k: int = 2) -> list[tuple[int, float]]:
+        """Return up to ``k`` (row index, distance) pairs, closest first."""
+        if k <= 0:
+            return []
+
+        probe = np.asarray(encoding, dtype=np.float32).ravel()
+        with self._lock:
+            if len(self) == 0:
+                return []
+            rows = self.index.candidates(probe, k)
+            if rows is None:
+                distances = self.distances(probe)
+                distances[~self._active[: self._size]] = np.inf
+                rows = np.arange(self._size)
+            else:
+                distances = self.distances(probe, rows)
+
+        finite = np.count_nonzero(np.isfinite(distances))
+        k = min(k, finite)
+        if k == 0:
+            return []
+        if k < len(distances):
+            candidates = np.argpartition(distances, k - 1)[:k]
+        else:
+            candidates = np.arange(len(distances))
+        ordered = candidates[np.argsort(distances[candidates])]
+        return [(int(rows[position]), float(distances[position])) for position in ordered]
+
+    def _centroid_distances(self, probe: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Live centroid slots and their distances to ``probe``."""
+        live = np.flatnonzero(self._centroid_live[: len(self._slot_ids)])
+        centroids = self._centroids[live]
+        squared = self._centroid_sq[live] - 2.0 * (centroids @ probe) + float(probe @ probe)
+        return live, np.sqrt(np.maximum(squared, 0.0))
+
+    def _slot_rows(self, slots: np.ndarray) -> np.ndarray:
+        return np.fromiter(
+            (row for slot in slots for row in self._rows_by_id[self._slot_ids[slot]]), dtype=np.int64
+        )
+
+    def _shortlist_rows(self, probe: np.ndarray) -> np.ndarray | None:
+        """Every template of the ``centroid_shortlist`` employees with the closest centroids.
+
+        Only seeds the search: an employee with spread-out templates can sit
+        outside it and still be the runner-up, which ``_bounded_rows`` catches.
+        """
+        if self.employee_count <= self.centroid_shortlist:
+            return None
+        live, distances = self._centroid_distances(probe)
+        return self._slot_rows(live[np.argpartition(distances, self.centroid_shortlist - 1)[: self.centroid_shortlist]])
+
+    def _bounded_rows(self, probe: np.ndarray, worst: float) -> np.ndarray:
+        """Templates of every employee that could be closer than ``worst``.
+
+        No template lies further than its employee's radius from the
+        centroid, so an employee whose centroid is beyond ``worst + radius``
+        cannot beat ``worst`` and is skipped.
+        """
+        live, distances = self._centroid_distances(probe)
+        reachable = distances - self._radii[live] <= worst + BOUND_SLACK
+        return self._slot_rows(live[reachable])
+
+    @staticmethod
+    def _rank(ids: list[str], rows: np.ndarray, distances: np.ndarray, k: int) -> list[tuple[str, float, int]]:
+        results: list[tuple[str, float, int]] = []
+        seen: set[str] = set()
+        for position in np.argsort(distances, kind="stable"):
+            employee_id = ids[rows[position]]
+            if employee_id in seen:
+                continue
+            seen.add(employee_id)
+            results.append((employee_id, float(distances[position]), int(rows[position])))
+            if len(results) == k:
+                break
+        return results
+
+    def nearest_employees(self, encoding: np.ndarray, k: int = 2) -> list[tuple[str, float, int]]:
+        """Return up to ``k`` distinct employees as (employee id, distance, row), closest first.
+
+        Each employee scores by its best template. Candidates come from the
+        index when it narrows the search, otherwise from the centroid shortlist.
+        The ``k``-th distance found there is an upper bound on the true one,
+        so every employee whose centroid bound falls within it is re-ranked
+        over all its templates: the employees and distances returned are the
+        same as a flat search, runner-up included.
+        """
+        if k <= 0:
+            return []
+
+        probe = np.asarray(encoding, dtype=np.float32).ravel()
+        with self._lock:
+            if len(self) == 0:
+                return []
+            rows = self.index.candidates(probe, self.centroid_shortlist)
+            if rows is None:
+                rows = self._shortlist_rows(probe)
+            if rows is None:
+                rows = self.active_rows()
+                return self._rank(self.ids, rows, self.distances(probe, rows), k)
+
+            narrowed = self._rank(self.ids, rows, self.distances(probe, rows), k)
+            worst = narrowed[-1][1] if len(narrowed) == k else float("inf")
+            rows = self._bounded_rows(probe, worst)
+            return self._rank(self.ids, rows, self.distances(probe, rows), k)
@@ -0,0 +1,118 @@
+"""
+Face Gallery Refresher
+
+Keeps the in-memory face gallery warm. A daemon thread polls the ETag of the
+remote store manifest every ``FACE_REFRESH_INTERVAL_SECONDS``; when it changes
+the new snapshot is synced and a fresh gallery is built beside the live one
+and swapped in (see ``reload_face_gallery``). Registrations other nodes
+append to the delta log are replayed on the same tick, so they show up here
+within one interval and no request waits on a cold cache. With a sharded
+store this polls the kiosk's own shard; the other shards held in memory are
+checked on the same tick, each against its own manifest.
+"""
+
+import threading
+import time
+from typing import Any
+
+from .config import FACE_REFRESH_INTERVAL_SECONDS
+from .face_shards import local_store_location
+from .face_store import remote_manifest_etag
+
+
+class FaceGalleryRefresher:
+    """Background ETag poller that rebuilds and swaps the face gallery."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._etag: str | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._stats: dict[str, Any] = {
+            "checks": 0,
+            "reloads": 0,
+            "errors": 0,
+            "last_check_at": None,
+            "last_change_at": None,
+            "last_error": None,
+        }
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="face-gallery-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self) -> None:
+        # The first tick runs immediately so the gallery is warm before the first request
+        while not self._stop.is_set():
+            try:
+                self.check_once()
+            except Exception as exc:
+                self._stats["errors"] += 1
+                self._stats["last_error"] = str(exc)
+                print(f"[FaceRefresher] Refresh failed: {exc}")
+            if self.interval <= 0:
+                break
+            self._stop.wait(self.interval)
+
+    def check_once(self) -> bool:
+        """Run one refresh tick; returns True when the gallery changed."""
+        from .face_recognition import _store_target, refresh_face_gallery
+
+        client, bucket = _store_target()
+        manifest_changed = False
+        if bucket:
+            etag = remote_manifest_etag(client, bucket, local_store_location()[1])
+            manifest_changed = etag is not None and etag != self._etag
+            if manifest_changed:
+                self._etag = etag
+
+        changed = refresh_face_gallery(sync=manifest_changed, remote=bool(bucket))
+        self._stats["checks"] += 1
+        self._stats["last_check_at"] = time.time()
+        if changed:
+            self._stats["reloads"] += 1
+            self._stats["last_change_at"] = self._stats["last_check_at"]
+        return changed
+
+    def metrics(self) -> dict[str, Any]:
+        from .face_recognition import get_face_gallery_status
+
+        return {
+            "interval_seconds": self.interval,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "manifest_etag": self._etag,
+            **self._stats,
+            **get_face_gallery_status(),
+        }
+
+
+_refresher: FaceGalleryRefresher | None = None
+
+
+def get_face_gallery_refresher() -> FaceGalleryRefresher:
+    global _refresher
+    if _refresher is None:
+        _refresher = FaceGalleryRefresher(FACE_REFRESH_INTERVAL_SECONDS)
+    return _refresher
+
+
+def start_face_gallery_refresher() -> FaceGalleryRefresher:
+    refresher = get_face_gallery_refresher()
+    refresher.start()
+    return refresher
+
+
+def stop_face_gallery_refresher() -> None:
+    global _refresher
+    if _refresher is not None:
+        _refresher.stop()
+        _refresher = None
@@ -0,0 +1,226 @@
+"""
+Face Hot Tier
+
+Most verifications at a kiosk come from the same few hundred regulars, so
+the templates of recently and frequently matched employees are searched
+before the full gallery.
+
+A hot match must be as safe as a full search. Hot candidates are only
+compared against each other, so the confidence gap to *everyone else* is
+bounded with the triangle inequality instead. For the best hot template
+``t`` at distance ``d`` from the probe, and ``margin`` the exact distance
+from ``t`` to the closest template of any other employee, every other
+employee is at least ``margin - d`` away. The match is accepted when ``d``
+clears the match threshold and the guaranteed gap ``margin - 2d`` clears
+the confidence gap (or ``d`` is confident on its own and the employee is
+still provably the nearest). Anything else falls through to the full
+search.
+
+Margins are computed lazily with one full-gallery pass per template. They
+are re-validated when the gallery changes (``FaceGallery.revision``) and
+every ``revalidate_seconds`` regardless.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any
+
+import numpy as np
+
+from .config import get_face_hot_tier_settings
+
+
+class FaceHotTier:
+    """Recently/frequently matched employees with cached full-gallery margins."""
+
+    def __init__(self, max_entries: int, revalidate_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.revalidate_seconds = revalidate_seconds
+        # employee id -> match count, least recently matched first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._membership = 0
+        self._gallery_key: tuple[int, int] | None = None
+        self._rows_key: tuple[int, int, int] | None = None
+        self._rows = np.empty(0, dtype=np.int64)
+        self._margins: dict[int, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._counters = {"admitted": 0, "evicted": 0, "revalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, employee_id: str) -> bool:
+        return employee_id in self._entries
+
+    def record(self, employee_id: str) -> None:
+        """Count a confirmed match; admits the employee, evicting a cold one if full."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if employee_id in self._entries:
+                self._entries[employee_id] += 1
+                self._entries.move_to_end(employee_id)
+                return
+
+            self._entries[employee_id] = 1
+            self._membership += 1
+            self._counters["admitted"] += 1
+            if len(self._entries) > self.max_entries:
+                # Among the least recently matched, drop the least frequent; the
+                # survivors age so a former regular cannot stay pinned forever
+                window = max(2, self.max_entries // 8)
+                oldest = [item for _, item in zip(range(window), self._entries.items())]
+                victim = min(oldest, key=lambda item: item[1])[0]
+                del self._entries[victim]
+                for candidate, hits in oldest:
+                    if candidate != victim and hits > 1:
+                        self._entries[candidate] = hits - 1
+                self._counters["evicted"] += 1
+
+    def discard(self, employee_id: str) -> None:
+        with self._lock:
+            if self._entries.pop(employee_id, None) is not None:
+                self._membership += 1
+
+    def _sync(self, gallery) -> None:
+        key = (id(gallery), gallery.revision)
+        if key != self._gallery_key:
+            # A swapped or mutated gallery invalidates every cached margin
+            self._gallery_key = key
+            self._margins.clear()
+
+    def _hot_rows(self, gallery) -> np.ndarray:
+        key = (id(gallery), gallery.revision, self._membership)
+        if key != self._rows_key:
+            rows = [row for employee_id in self._entries for row in gallery.template_rows(employee_id)]
+            self._rows = np.asarray(rows, dtype=np.int64)
+            self._rows_key = key
+        return self._rows
+
+    def _margin(self, gallery, row: int) -> float:
+        now = time.monotonic()
+        cached = self._margins.get(row)
+        if cached is not None and now - cached[0] < self.revalidate_seconds:
+            return cached[1]
+        margin = gallery.separation(row)
+        self._margins[row] = (now, margin)
+        self._counters["revalidations"] += 1
+        return margin
+
+    def match(
+        self,
+        gallery,
+        encoding: np.ndarray,
+        threshold: float,
+        min_gap: float,
+        confident_margin: float,
+    ) -> tuple[dict[str, Any] | None, str]:
+        """Try the hot tier; returns ``(match, reason)``.
+
+        ``match`` is ``{"employeeId", "distance", "gap"}`` (``gap`` is the
+        guaranteed lower bound) or None, in which case ``reason`` says why
+        the search must fall through.
+        """
+        if not self.enabled or not self._entries:
+            return None, "empty"
+
+        probe = np.asarray(encoding, dtype=np.float32).ravel()
+        with self._lock:
+            self._sync(gallery)
+            rows = self._hot_rows(gallery)
+            if not len(rows):
+                return None, "empty"
+            distances = gallery.distances(probe, rows)
+            position = int(np.argmin(distances))
+            row, distance = int(rows[position]), float(distances[position])
+            if distance > threshold:
+                return None, "over_threshold"
+            margin = self._margin(gallery, row)
+
+        gap = margin - 2 * distance
+        if gap >= min_gap or (gap > 0 and distance <= threshold - confident_margin):
+            return {"employeeId": gallery.ids[row], "distance": distance, "gap": gap}, "hit"
+        return None, "margin"
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "revalidate_seconds": self.revalidate_seconds,
+                "cached_margins": len(self._margins),
+                **self._counters,
+            }
+
+
+class FaceHotTierStats:
+    """Hit rate and latency savings of the hot tier, aggregated from match results.
+
+    Matches run in worker processes, so the server aggregates the ``tier``
+    and timings each result carries rather than reading worker state.
+    Savings are estimated as hits times the median full-search time, minus
+    the time spent in every hot lookup (including those that fell through).
+    """
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._full_ms: deque[float] = deque(maxlen=window)
+        self._hot_ms_total = 0.0
+        self._counters = {"lookups": 0, "hits": 0, "fallthroughs": 0, "full_only": 0}
+        self._reasons: dict[str, int] = {}
+
+    def record(self, result: dict[str, Any]) -> None:
+        timings = result.get("timings") or {}
+        if "match_ms" not in timings:
+            return
+        with self._lock:
+            self._counters["lookups"] += 1
+            if "hot_ms" in timings:
+                self._hot_ms_total += timings["hot_ms"]
+            if result.get("tier") == "hot":
+                self._counters["hits"] += 1
+            else:
+                self._counters["fallthroughs" if "hot_ms" in timings else "full_only"] += 1
+                reason = result.get("hot_reason")
+                if reason:
+                    self._reasons[reason] = self._reasons.get(reason, 0) + 1
+            if "full_ms" in timings:
+                self._full_ms.append(timings["full_ms"])
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            tried = self._counters["hits"] + self._counters["fallthroughs"]
+            full_median = float(np.median(self._full_ms)) if self._full_ms else 0.0
+            saved = self._counters["hits"] * full_median - self._hot_ms_total
+            return {
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / tried, 4) if tried else 0.0,
+                "fallthrough_reasons": dict(self._reasons),
+                "hot_ms_avg": round(self._hot_ms_total / tried, 3) if tried else 0.0,
+                "full_ms_median": round(full_median, 3),
+                "estimated_saved_ms": round(saved, 1),
+            }
+
+
+_hot_tier: FaceHotTier | None = None
+_stats: FaceHotTierStats | None = None
+
+
+def get_face_hot_tier() -> FaceHotTier:
+    global _hot_tier
+    if _hot_tier is None:
+        _hot_tier = FaceHotTier(**get_face_hot_tier_settings())
+    return _hot_tier
+
+
+def get_face_hot_tier_stats() -> FaceHotTierStats:
+    global _stats
+    if _stats is None:
+        _stats = FaceHotTierStats()
+    return _stats
@@ -0,0 +1,162 @@
+"""
+Face Index
+
+Candidate-selection backends that sit in front of the exact re-rank in
+``FaceGallery.nearest``. An index only narrows down which gallery rows are
+worth scoring; distances, the threshold and the confidence-gap rule are
+always evaluated exactly on the returned rows.
+"""
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .face_gallery import FaceGallery
+
+
+class FlatIndex:
+    """Exact search: every active row is a candidate."""
+
+    name = "flat"
+
+    def __init__(self, gallery: "FaceGallery"):
+        self.gallery = gallery
+
+    def candidates(self, probe: np.ndarray, k: int) -> np.ndarray | None:
+        return None
+
+    def add(self, row: int) -> None:
+        pass
+
+    def remove(self, row: int) -> None:
+        pass
+
+
+class IVFIndex:
+    """Inverted-file index: k-means coarse quantizer with multi-list probing.
+
+    Rows are bucketed by their nearest centroid. A search probes the
+    ``nprobe`` closest buckets (more if needed to reach ``k`` rows) and the
+    gallery re-ranks those rows exactly.
+    """
+
+    name = "ivf"
+
+    def __init__(
+        self,
+        gallery: "FaceGallery",
+        nlist: int | None = None,
+        nprobe: int = 8,
+        train_iterations: int = 8,
+        seed: int = 0,
+    ):
+        self.gallery = gallery
+        self.nprobe = max(1, nprobe)
+        self._lists: list[list[int]] = []
+        self._list_arrays: list[np.ndarray | None] = []
+        self._row_list: dict[int, int] = {}
+        self.centroids = self._train(nlist, train_iterations, seed)
+        for row in gallery.active_rows():
+            self.add(int(row))
+
+    def _train(self, nlist: int | None, iterations: int, seed: int) -> np.ndarray:
+        rows = self.gallery.active_rows()
+        vectors = self.gallery.vectors(rows)
+        if nlist is None:
+            nlist = int(np.sqrt(max(len(vectors), 1)))
+        nlist = max(1, min(nlist, len(vectors) or 1))
+
+        rng = np.random.default_rng(seed)
+        if len(vectors) == 0:
+            centroids = np.zeros((1, self.gallery.dim), dtype=np.float32)
+        else:
+            sample_size = min(len(vectors), nlist * 64)
+            sample = vectors[rng.choice(len(vectors), size=sample_size, replace=False)]
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = _nearest_centroid(sample, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, sample)
+                counts = np.bincount(assignment, minlength=len(centroids))
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+
+        self._lists = [[] for _ in range(len(centroids))]
+        self._list_arrays = [None] * len(centroids)
+        return np.ascontiguousarray(centroids, dtype=np.float32)
+
+    def candidates(self, probe: np.ndarray, k: int) -> np.ndarray | None:
+        centroid_distances = _squared_distances(self.centroids, probe)
+        order = np.argsort(centroid_distances)
+
+        picked: list[np.ndarray] = []
+        total = 0
+        for probed, list_id in enumerate(order):
+            if probed >= self.nprobe and total >= k:
+                break
+            rows = self._list_array(int(list_id))
+            if len(rows):
+                picked.append(rows)
+                total += len(rows)
+
+        if not picked:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(picked)
+
+    def add(self, row: int) -> None:
+        vector = self.gallery.vectors(row)
+        list_id = int(np.argmin(_squared_distances(self.centroids, vector)))
+        self._lists[list_id].append(row)
+        self._list_arrays[list_id] = None
+        self._row_list[row] = list_id
+
+    def remove(self, row: int) -> None:
+        list_id = self._row_list.pop(row, None)
+        if list_id is None:
+            return
+        self._lists[list_id].remove(row)
+        self._list_arrays[list_id] = None
+
+    def _list_array(self, list_id: int) -> np.ndarray:
+        cached = self._list_arrays[list_id]
+        if cached is None:
+            cached = np.asarray(self._lists[list_id], dtype=np.int64)
+            self._list_arrays[list_id] = cached
+        return cached
+
+
+def _squared_distances(points: np.ndarray, probe: np.ndarray) -> np.ndarray:
+    diff = points - probe
+    return np.einsum("ij,ij->i", diff, diff)
+
+
+def _nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    scores = vectors @ centroids.T
+    scores *= -2.0
+    scores += np.einsum("ij,ij->i", centroids, centroids)
+    return np.argmin(scores, axis=1)
+
+
+INDEX_BACKENDS = {
+    FlatIndex.name: FlatIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def build_face_index(
+    gallery: "FaceGallery",
+    backend: str | None = None,
+    ivf_min_size: int = 20000,
+    nprobe: int = 8,
+):
+    """Create the index for ``gallery``; ``auto`` picks IVF for large galleries."""
+    name = (backend or "auto").strip().lower()
+    if name == "auto":
+        name = IVFIndex.name if len(gallery) >= ivf_min_size else FlatIndex.name
+
+    if name == IVFIndex.name:
+        return IVFIndex(gallery, nprobe=nprobe)
+    if name != FlatIndex.name:
+        print(f"[FaceIndex] Unknown index backend '{backend}', using exact search")
+    return FlatIndex(gallery)
@@ -0,0 +1,299 @@
+"""
+Face Pipeline
+
+Turns an uploaded camera frame into one face encoding with as little pixel
+work as possible, using the configured detector/embedder backend:
+
+1. decode – JPEGs are decoded in draft mode at the smallest DCT scale that
+   still covers ``decode_max_side``;
+2. detect – the detector runs on a copy downscaled to ``detect_max_side`` (kiosk
+   faces fill much of the frame, so they survive the downscale). With a
+   client ROI hint it first searches only an expanded region around the
+   hint, and falls back to the full frame when that finds nothing;
+3. quality – the cheap checks in ``face_quality`` reject unusable faces
+   before any descriptor work;
+4. encode – landmarks and the descriptor are computed on a tight crop of the
+   decoded frame around the largest face, at full decoded resolution.
+
+Every stage is timed so callers can log or report where the time goes.
+"""
+
+import io
+import json
+import math
+import threading
+import time
+from collections import deque
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from .config import get_face_pipeline_settings
+from .face_backends import get_face_backend
+from .face_quality import assess_face_quality
+
+
+def decode_frame(image_bytes: bytes, max_side: int = 0) -> np.ndarray:
+    """Decode to an RGB uint8 array, letting JPEG decode at reduced scale when ``max_side`` allows."""
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        if max_side and image.format == "JPEG":
+            width, height = image.size
+            scale = max_side / max(width, height)
+            if scale < 1:
+                image.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+        return np.array(image.convert("RGB"))
+
+
+def _downscale(frame: np.ndarray, max_side: int) -> tuple[np.ndarray, float]:
+    height, width = frame.shape[:2]
+    scale = max_side / max(height, width) if max_side else 1.0
+    if scale >= 1:
+        return frame, 1.0
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return np.array(Image.fromarray(frame).resize(size, Image.BILINEAR, reducing_gap=2.0)), scale
+
+
+def detect_faces(
+    frame: np.ndarray,
+    detect_max_side: int = 0,
+    upsample: int = 1,
+    backend=None,
+    fallback: bool = True,
+) -> list[tuple[int, int, int, int]]:
+    """Face boxes as ``(top, right, bottom, left)`` in ``frame`` coordinates."""
+    backend = backend or get_face_backend()
+    small, scale = _downscale(frame, detect_max_side)
+    boxes = backend.detect(small, upsample)
+    if not boxes and fallback and scale < 1:
+        # Small or distant faces can vanish in the downscaled copy
+        return backend.detect(frame, upsample)
+
+    height, width = frame.shape[:2]
+    return [
+        (
+            max(0, int(top / scale)),
+            min(width, int(math.ceil(right / scale))),
+            min(height, int(math.ceil(bottom / scale))),
+            max(0, int(left / scale)),
+        )
+        for top, right, bottom, left in boxes
+    ]
+
+
+def parse_face_hint(raw: Any) -> tuple[float, float, float, float] | None:
+    """Validate a client ROI hint: ``{"x", "y", "w", "h"}`` as fractions of the frame.
+
+    Accepts a dict or its JSON text; anything malformed or empty is None.
+    """
+    if isinstance(raw, (str, bytes)):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return None
+    if not isinstance(raw, dict):
+        return None
+    try:
+        x, y, w, h = (float(raw[key]) for key in ("x", "y", "w", "h"))
+    except (KeyError, TypeError, ValueError):
+        return None
+    x, y = min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+    w, h = min(w, 1.0 - x), min(h, 1.0 - y)
+    if not (w > 0 and h > 0) or any(math.isnan(value) for value in (x, y, w, h)):
+        return None
+    return x, y, w, h
+
+
+def face_box_hint(box: tuple[int, int, int, int], frame_shape: tuple[int, ...]) -> dict[str, float]:
+    """A detected box as the normalized hint a client can send back with its next frame."""
+    top, right, bottom, left = box
+    height, width = frame_shape[:2]
+    return {
+        "x": round(left / width, 4),
+        "y": round(top / height, 4),
+        "w": round((right - left) / width, 4),
+        "h": round((bottom - top) / height, 4),
+    }
+
+
+def hint_region(
+    hint: tuple[float, float, float, float], frame_shape: tuple[int, ...], expand: float
+) -> tuple[int, int, int, int]:
+    """Pixel region ``(y0, x1, y1, x0)`` around ``hint`` padded by ``expand`` × its size on every side."""
+    x, y, w, h = hint
+    height, width = frame_shape[:2]
+    y0 = max(0, int((y - h * expand) * height))
+    y1 = min(height, int(math.ceil((y + h * (1 + expand)) * height)))
+    x0 = max(0, int((x - w * expand) * width))
+    x1 = min(width, int(math.ceil((x + w * (1 + expand)) * width)))
+    return y0, x1, y1, x0
+
+
+def detect_faces_hinted(
+    frame: np.ndarray,
+    hint: tuple[float, float, float, float],
+    expand: float,
+    detect_max_side: int = 0,
+    upsample: int = 1,
+    backend=None,
+) -> list[tuple[int, int, int, int]]:
+    """Detect inside the hint region only; boxes come back in ``frame`` coordinates."""
+    y0, x1, y1, x0 = hint_region(hint, frame.shape, expand)
+    if y1 - y0 < 2 or x1 - x0 < 2:
+        return []
+    region = np.ascontiguousarray(frame[y0:y1, x0:x1])
+    boxes = detect_faces(region, detect_max_side, upsample, backend, fallback=False)
+    return [(top + y0, right + x0, bottom + y0, left + x0) for top, right, bottom, left in boxes]
+
+
+def crop_face(
+    frame: np.ndarray, box: tuple[int, int, int, int], margin: float
+) -> tuple[np.ndarray, tuple[int, int, int, int]]:
+    """Crop ``box`` plus ``margin`` (fraction of the box size); returns the crop and the box inside it."""
+    top, right, bottom, left = box
+    height, width = frame.shape[:2]
+    pad_y = int((bottom - top) * margin)
+    pad_x = int((right - left) * margin)
+    y0, y1 = max(0, top - pad_y), min(height, bottom + pad_y)
+    x0, x1 = max(0, left - pad_x), min(width, right + pad_x)
+    crop = np.ascontiguousarray(frame[y0:y1, x0:x1])
+    return crop, (top - y0, right - x0, bottom - y0, left - x0)
+
+
+def encode_frame(
+    image_bytes: bytes,
+    settings: dict[str, Any] | None = None,
+    quality: dict[str, Any] | None = None,
+    backend=None,
+    hint: tuple[float, float, float, float] | None = None,
+) -> dict[str, Any]:
+    """Run decode → detect → quality → crop-encode on one frame.
+
+    Returns ``{"encoding": ndarray | None, "embedder": str, "faces": int,
+    "box": tuple | None, "face_hint": dict | None, "roi": str | None,
+    "quality": dict | None, "timings": {...}}``. With several faces the
+    largest box wins; it is the person standing at the kiosk. When the
+    quality gate rejects the face, ``encoding`` is None and ``quality``
+    carries the reason and hint.
+
+    ``hint`` is a parsed client ROI hint. ``roi`` reports "hit" when the
+    hint region alone found the face, "miss" when the full frame had to be
+    searched too (``hint_detect_ms`` is the time spent in the region).
+    """
+    settings = settings or get_face_pipeline_settings()
+    backend = backend or get_face_backend()
+    timings: dict[str, float] = {}
+
+    started = time.perf_counter()
+    frame = decode_frame(image_bytes, settings["decode_max_side"])
+    timings["decode_ms"] = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    boxes: list[tuple[int, int, int, int]] = []
+    roi = None
+    if hint is not None:
+        boxes = detect_faces_hinted(
+            frame, hint, settings.get("hint_expand", 0.6), settings["detect_max_side"], settings["upsample"], backend
+        )
+        timings["hint_detect_ms"] = (time.perf_counter() - started) * 1000
+        roi = "hit" if boxes else "miss"
+    if not boxes:
+        boxes = detect_faces(
+            frame,
+            settings["detect_max_side"],
+            settings["upsample"],
+            backend,
+            settings["fallback"],
+        )
+    timings["detect_ms"] = (time.perf_counter() - started) * 1000
+
+    result: dict[str, Any] = {
+        "encoding": None,
+        "embedder": backend.embedder_id,
+        "faces": len(boxes),
+        "box": None,
+        "face_hint": None,
+        "roi": roi,
+        "quality": None,
+        "timings": timings,
+    }
+    if not boxes:
+        return result
+
+    box = max(boxes, key=lambda item: (item[2] - item[0]) * (item[1] - item[3]))
+    result["face_hint"] = face_box_hint(box, frame.shape)
+    started = time.perf_counter()
+    result["quality"] = assess_face_quality(frame, box, quality, backend)
+    timings["quality_ms"] = (time.perf_counter() - started) * 1000
+    if not result["quality"]["passed"]:
+        return result
+
+    started = time.perf_counter()
+    crop, crop_box = crop_face(frame, box, settings["crop_margin"])
+    encoding = backend.embed(crop, crop_box)
+    timings["encode_ms"] = (time.perf_counter() - started) * 1000
+
+    if encoding is not None:
+        result["encoding"] = encoding
+        result["box"] = box
+    return result
+
+
+class FaceHintStats:
+    """How often client ROI hints spare the full-frame search, aggregated from match results.
+
+    Matches run in worker processes, so the server reads the ``roi`` outcome
+    and timings each result carries. Savings are estimated as hits times the
+    median full-frame detect time, minus the hinted detect time of every hit
+    and the region time wasted on every miss.
+    """
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._full_ms: deque[float] = deque(maxlen=window)
+        self._hint_ms_total = 0.0
+        self._counters = {"hinted": 0, "hits": 0, "misses": 0, "unhinted": 0, "invalid": 0}
+
+    def record_invalid(self) -> None:
+        with self._lock:
+            self._counters["invalid"] += 1
+
+    def record(self, result: dict[str, Any]) -> None:
+        timings = result.get("timings") or {}
+        if "detect_ms" not in timings:
+            return
+        roi = result.get("roi")
+        with self._lock:
+            if roi is None:
+                self._counters["unhinted"] += 1
+                self._full_ms.append(timings["detect_ms"])
+                return
+            self._counters["hinted"] += 1
+            self._counters["hits" if roi == "hit" else "misses"] += 1
+            hint_ms = timings.get("hint_detect_ms", 0.0)
+            self._hint_ms_total += hint_ms
+            if roi == "miss":
+                self._full_ms.append(timings["detect_ms"] - hint_ms)
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            hinted = self._counters["hinted"]
+            full_median = float(np.median(self._full_ms)) if self._full_ms else 0.0
+            saved = self._counters["hits"] * full_median - self._hint_ms_total
+            return {
+                **self._counters,
+                "hit_rate": round(self._counters["hits"] / hinted, 4) if hinted else 0.0,
+                "hint_detect_ms_avg": round(self._hint_ms_total / hinted, 3) if hinted else 0.0,
+                "full_detect_ms_median": round(full_median, 3),
+                "estimated_saved_ms": round(saved, 1),
+            }
+
+
+_hint_stats: FaceHintStats | None = None
+
+
+def get_face_hint_stats() -> FaceHintStats:
+    global _hint_stats
+    if _hint_stats is None:
+        _hint_stats = FaceHintStats()
+    return _hint_stats
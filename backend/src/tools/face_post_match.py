@@ -0,0 +1,230 @@
+"""
+Face Post-Match Queue
+
+Side effects of a successful face match (OTP generation, the SNS publish
+and the visitor-log write) run here on background threads, so the face
+endpoints answer as soon as the match is known.
+
+A task is an ordered list of named steps that share one ``state`` dict. A
+failing step is retried with exponential backoff; the next step still runs
+once its retries are exhausted (the visitor log records a failed OTP too).
+Steps must be safe to retry: the OTP step keeps its generated code in
+``state`` so a retry re-sends the same code instead of issuing a new one.
+When a task finishes, its ``on_complete`` callback publishes the outcome
+(for face OTPs, through the flow signal channel). Task statuses are also
+written to the shared state, so a status poll answered by another uvicorn
+worker finds them.
+"""
+
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, MutableMapping, Sequence
+
+from .config import get_face_post_match_settings
+
+
+Step = tuple[str, Callable[[dict[str, Any]], None]]
+
+
+class FacePostMatchQueue:
+    """Bounded queue of retrying post-match tasks served by daemon threads."""
+
+    def __init__(
+        self,
+        workers: int,
+        max_queue: int,
+        max_attempts: int = 3,
+        backoff: float = 0.5,
+        shared_statuses: MutableMapping[str, dict[str, Any]] | None = None,
+    ):
+        self.workers = workers
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._statuses: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        # Statuses seen by every process (None: this process only)
+        self._shared_statuses = shared_statuses
+        self._counters = {"submitted": 0, "completed": 0, "failed_steps": 0, "retries": 0, "rejected": 0}
+        self._run_ms: list[float] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads or not self.enabled:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"face-post-match-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Let queued tasks drain (up to ``timeout``), then stop the workers."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(timeout=max(0.0, deadline - time.monotonic()))
+
+    def submit(
+        self,
+        steps: Sequence[Step],
+        on_complete: Callable[[dict[str, Any]], None] | None = None,
+        state: dict[str, Any] | None = None,
+    ) -> str | None:
+        """Queue a task; returns its id, or None when the queue is full or disabled.
+
+        Callers run the steps inline on None, so side effects are never dropped.
+        """
+        if not self.enabled:
+            return None
+        self.start()
+        task_id = uuid.uuid4().hex[:12]
+        task = {
+            "id": task_id,
+            "steps": list(steps),
+            "on_complete": on_complete,
+            "state": {**(state or {}), "taskId": task_id},
+        }
+        try:
+            self._queue.put_nowait(task)
+        except queue.Full:
+            with self._lock:
+                self._counters["rejected"] += 1
+            return None
+        with self._lock:
+            self._counters["submitted"] += 1
+            self._remember(task_id, {"status": "queued"})
+        self._share(task_id, {"status": "queued"})
+        return task_id
+
+    def status(self, task_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            status = self._statuses.get(task_id)
+            if status is not None:
+                return dict(status)
+        if self._shared_statuses is None:
+            return None
+        try:
+            # Queued by another worker process
+            return self._shared_statuses.get(task_id)
+        except Exception as exc:
+            print(f"[FacePostMatch] Could not read status of task {task_id}: {exc}")
+            return None
+
+    def _remember(self, task_id: str, status: dict[str, Any]) -> None:
+        self._statuses[task_id] = status
+        self._statuses.move_to_end(task_id)
+        while len(self._statuses) > 256:
+            self._statuses.popitem(last=False)
+
+    def _share(self, task_id: str, status: dict[str, Any]) -> None:
+        if self._shared_statuses is None:
+            return
+        try:
+            self._shared_statuses[task_id] = status
+        except Exception as exc:
+            print(f"[FacePostMatch] Could not share status of task {task_id}: {exc}")
+
+    def _run(self) -> None:
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            try:
+                self.run_task(task["steps"], task["on_complete"], task["state"], task["id"])
+            except Exception as exc:
+                print(f"[FacePostMatch] Task {task['id']} crashed: {exc}")
+
+    def run_task(
+        self,
+        steps: Sequence[Step],
+        on_complete: Callable[[dict[str, Any]], None] | None = None,
+        state: dict[str, Any] | None = None,
+        task_id: str | None = None,
+    ) -> dict[str, Any]:
+        """Run ``steps`` with retries and return the final state (also used inline)."""
+        state = state if state is not None else {}
+        state.setdefault("errors", {})
+        started = time.perf_counter()
+        if task_id:
+            with self._lock:
+                self._remember(task_id, {"status": "running"})
+            self._share(task_id, {"status": "running"})
+
+        for name, step in steps:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    step(state)
+                    break
+                except Exception as exc:
+                    if attempt == self.max_attempts:
+                        state["errors"][name] = str(exc)
+                        with self._lock:
+                            self._counters["failed_steps"] += 1
+                        print(f"[FacePostMatch] Step {name} failed after {attempt} attempt(s): {exc}")
+                        break
+                    with self._lock:
+                        self._counters["retries"] += 1
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+
+        if on_complete is not None:
+            try:
+                on_complete(state)
+            except Exception as exc:
+                print(f"[FacePostMatch] Completion callback failed: {exc}")
+
+        final = {
+            "status": "failed" if state["errors"] else "done",
+            **{key: value for key, value in state.items() if key != "otp_code"},
+        }
+        with self._lock:
+            self._counters["completed"] += 1
+            self._run_ms.append((time.perf_counter() - started) * 1000)
+            self._run_ms = self._run_ms[-500:]
+            if task_id:
+                self._remember(task_id, final)
+        if task_id:
+            self._share(task_id, final)
+        return state
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            run_ms = sorted(self._run_ms)
+            return {
+                "enabled": self.enabled,
+                "workers": self.workers,
+                "queued": self._queue.qsize(),
+                "max_attempts": self.max_attempts,
+                "run_ms_p50": round(run_ms[len(run_ms) // 2], 1) if run_ms else 0.0,
+                "run_ms_max": round(run_ms[-1], 1) if run_ms else 0.0,
+                **self._counters,
+            }
+
+
+_post_match_queue: FacePostMatchQueue | None = None
+
+
+def get_face_post_match_queue() -> FacePostMatchQueue:
+    global _post_match_queue
+    if _post_match_queue is None:
+        from shared_state import SharedMap
+
+        settings = get_face_post_match_settings()
+        statuses = SharedMap("face_post_match", ttl=settings.pop("status_ttl"))
+        _post_match_queue = FacePostMatchQueue(**settings, shared_statuses=statuses)
+    return _post_match_queue
+
+
+def shutdown_face_post_match_queue() -> None:
+    if _post_match_queue is not None:
+        _post_match_queue.stop()
@@ -0,0 +1,108 @@
+"""
+Face Quality Gate
+
+Cheap checks run on a detected face box before the expensive descriptor is
+computed. A frame that is too small, too dark or bright, blurred or turned
+away is rejected with a machine-readable ``reason`` and a short ``hint`` the
+kiosk can show straight away ("Please move closer to the camera").
+
+Checks run cheapest first and stop at the first failure:
+
+- box size: shorter side of the face box, in decoded-frame pixels;
+- exposure: mean luminance of the face box;
+- sharpness: variance of the Laplacian of the face box, resampled to a fixed
+  width so the score does not depend on how large the face is;
+- yaw: horizontal offset of the nose tip from the eye midpoint divided by the
+  eye distance (0 is frontal, about ±0.5 is a strong profile), from the
+  backend's landmarks (skipped when the backend has none).
+"""
+
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from .config import get_face_quality_settings
+
+
+SHARPNESS_WIDTH = 128
+
+QUALITY_HINTS = {
+    "too_small": "Please move closer to the camera",
+    "too_dark": "It is too dark - please face the light",
+    "too_bright": "There is too much light on your face - please step out of direct light",
+    "blurry": "Please hold still",
+    "off_angle": "Please look straight at the camera",
+}
+
+
+def _rejected(reason: str, metrics: dict[str, float]) -> dict[str, Any]:
+    return {"passed": False, "reason": reason, "hint": QUALITY_HINTS[reason], "metrics": metrics}
+
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian; low values mean a blurred image."""
+    gray = gray.astype(np.float32)
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return 0.0
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:] - 4.0 * gray[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+
+def estimate_yaw(frame: np.ndarray, box: tuple[int, int, int, int], backend=None) -> float | None:
+    """Signed nose offset from the eye midpoint, in eye distances; None without landmarks."""
+    from .face_backends import get_face_backend
+
+    points = (backend or get_face_backend()).landmarks(frame, box)
+    if not points:
+        return None
+    left_eye = np.mean(points["left_eye"], axis=0)
+    right_eye = np.mean(points["right_eye"], axis=0)
+    nose = np.mean(points["nose_tip"], axis=0)
+    eye_distance = float(np.linalg.norm(right_eye - left_eye))
+    if eye_distance == 0:
+        return None
+    return float((nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance)
+
+
+def assess_face_quality(
+    frame: np.ndarray,
+    box: tuple[int, int, int, int],
+    settings: dict[str, Any] | None = None,
+    backend=None,
+) -> dict[str, Any]:
+    """Return ``{"passed", "reason", "hint", "metrics"}`` for the face at ``box``."""
+    settings = settings or get_face_quality_settings()
+    metrics: dict[str, float] = {}
+    if not settings["enabled"]:
+        return {"passed": True, "reason": None, "hint": None, "metrics": metrics}
+
+    top, right, bottom, left = box
+    metrics["face_px"] = float(min(bottom - top, right - left))
+    if metrics["face_px"] < settings["min_face_px"]:
+        return _rejected("too_small", metrics)
+
+    face = Image.fromarray(np.ascontiguousarray(frame[top:bottom, left:right])).convert("L")
+    gray = np.asarray(face, dtype=np.float32)
+    metrics["brightness"] = round(float(gray.mean()), 2)
+    if metrics["brightness"] < settings["min_brightness"]:
+        return _rejected("too_dark", metrics)
+    if metrics["brightness"] > settings["max_brightness"]:
+        return _rejected("too_bright", metrics)
+
+    height = max(1, round(face.height * SHARPNESS_WIDTH / max(face.width, 1)))
+    resized = np.asarray(face.resize((SHARPNESS_WIDTH, height), Image.BILINEAR))
+    metrics["sharpness"] = round(laplacian_variance(resized), 2)
+    if metrics["sharpness"] < settings["min_sharpness"]:
+        return _rejected("blurry", metrics)
+
+    if settings["max_yaw"] > 0:
+        yaw = estimate_yaw(frame, box, backend)
+        if yaw is not None:
+            metrics["yaw"] = round(yaw, 3)
+            if abs(yaw) > settings["max_yaw"]:
+                return _rejected("off_angle", metrics)
+
+    return {"passed": True, "reason": None, "hint": None, "metrics": metrics}
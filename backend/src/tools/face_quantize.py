@@ -0,0 +1,208 @@
+"""
+Face Encoding Quantisation
+
+Compact storage modes for gallery encodings, selected with
+``FACE_GALLERY_DTYPE``:
+
+- ``float32`` – the reference layout, 4 bytes per dimension;
+- ``float16`` – half precision, 2 bytes per dimension, no side data;
+- ``int8``    – 1 byte per dimension plus one float32 scale per dimension
+  (symmetric: ``value ≈ code * scale``).
+
+The same codes are written to the snapshot files (so S3 transfer shrinks
+too) and held by the in-memory gallery. Distances dequantise block by block
+inside the kernel, so no full float32 copy of the gallery is ever built.
+
+``validate_quantization`` measures what a mode costs: on a held-out split
+it compares match decisions and employee rankings with float64 search.
+"""
+
+from typing import Any, Sequence
+
+import numpy as np
+
+
+QUANT_DTYPES = ("float32", "float16", "int8")
+INT8_MAX = 127
+# Rows dequantised per block in the distance kernel (~2 MiB of float32 at 128-d)
+BLOCK_ROWS = 4096
+
+
+def normalize_dtype(name: str | None) -> str:
+    dtype = (name or "float32").strip().lower()
+    if dtype not in QUANT_DTYPES:
+        print(f"[FaceQuantize] Unknown gallery dtype '{name}'; using float32")
+        return "float32"
+    return dtype
+
+
+def fit_scale(matrix: np.ndarray, scale: np.ndarray | None = None) -> np.ndarray:
+    """Per-dimension int8 scale covering ``matrix``, never narrower than ``scale``."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    dim = matrix.shape[-1]
+    peak = np.abs(matrix).max(axis=0) if matrix.size else np.zeros(dim, dtype=np.float32)
+    fitted = (peak / INT8_MAX).astype(np.float32)
+    if scale is not None:
+        fitted = np.maximum(fitted, np.asarray(scale, dtype=np.float32))
+    return fitted
+
+
+def quantize(
+    matrix: Sequence | np.ndarray, dtype: str, scale: np.ndarray | None = None
+) -> tuple[np.ndarray, np.ndarray | None]:
+    """Encode float rows as ``dtype``; returns (codes, scale), scale only for int8.
+
+    An int8 ``scale`` is reused (so re-encoding the same codes is lossless)
+    and only widened for dimensions the new rows would otherwise clip.
+    """
+    floats = np.asarray(matrix, dtype=np.float32)
+    if dtype == "float32":
+        return np.ascontiguousarray(floats), None
+    if dtype == "float16":
+        return np.ascontiguousarray(floats, dtype=np.float16), None
+
+    scale = fit_scale(floats, scale)
+    safe = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(floats / safe), -INT8_MAX, INT8_MAX).astype(np.int8)
+    return np.ascontiguousarray(codes), scale
+
+
+def dequantize(codes: np.ndarray, scale: np.ndarray | None = None) -> np.ndarray:
+    """Float32 values of ``codes`` (any shape; ``scale`` applies to the last axis)."""
+    values = np.asarray(codes).astype(np.float32)
+    if scale is not None:
+        values *= np.asarray(scale, dtype=np.float32)
+    return values
+
+
+def quantized_dot(codes: np.ndarray, probe: np.ndarray, scale: np.ndarray | None = None) -> np.ndarray:
+    """``dequantize(codes, scale) @ probe`` without materialising the float matrix."""
+    if codes.dtype == np.float32:
+        return codes @ probe
+    weighted = probe * scale if scale is not None else probe
+    out = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), BLOCK_ROWS):
+        out[start : start + BLOCK_ROWS] = codes[start : start + BLOCK_ROWS].astype(np.float32) @ weighted
+    return out
+
+
+def quantized_sq_norms(codes: np.ndarray, scale: np.ndarray | None = None) -> np.ndarray:
+    """Squared norms of the dequantised rows, block by block."""
+    out = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), BLOCK_ROWS):
+        block = dequantize(codes[start : start + BLOCK_ROWS], scale)
+        out[start : start + BLOCK_ROWS] = np.einsum("ij,ij->i", block, block)
+    return out
+
+
+def bytes_per_encoding(dtype: str, dim: int) -> int:
+    return dim * np.dtype(dtype).itemsize
+
+
+# ---------------------------------------------------
+# Validation against float64
+# ---------------------------------------------------
+def _rank_employees(distances: np.ndarray, ids: Sequence[str], k: int) -> list[tuple[str, float]]:
+    # Closest few rows first; the full sort only when they hold fewer than k employees
+    shortlist = min(len(distances), 16 * k)
+    closest = np.argpartition(distances, shortlist - 1)[:shortlist] if shortlist < len(distances) else None
+    if closest is not None and len({ids[row] for row in closest}) >= k:
+        order = closest[np.argsort(distances[closest], kind="stable")]
+    else:
+        order = np.argsort(distances, kind="stable")
+    ranked: list[tuple[str, float]] = []
+    seen: set[str] = set()
+    for row in order:
+        if ids[row] in seen:
+            continue
+        seen.add(ids[row])
+        ranked.append((ids[row], float(distances[row])))
+        if len(ranked) == k:
+            break
+    return ranked
+
+
+def holdout_split(
+    employee_ids: Sequence[str], holdout: float = 0.2, seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """Row indices (gallery, probes). Probes whose employee keeps no gallery row test rejection."""
+    rng = np.random.default_rng(seed)
+    count = len(employee_ids)
+    probes = np.sort(rng.choice(count, size=max(1, int(count * holdout)), replace=False)) if count else np.empty(0, int)
+    mask = np.ones(count, dtype=bool)
+    mask[probes] = False
+    return np.flatnonzero(mask), probes
+
+
+def validate_quantization(
+    encodings: Sequence | np.ndarray,
+    employee_ids: Sequence[str],
+    dtype: str,
+    threshold: float,
+    min_gap: float,
+    confident_margin: float,
+    k: int = 5,
+    holdout: float = 0.2,
+    seed: int = 0,
+    probe_noise: float = 0.0,
+    max_probes: int | None = None,
+) -> dict[str, Any]:
+    """Compare ``dtype`` storage with float64 search on a held-out split.
+
+    Returns decision agreement (same accept/reject and employee under the
+    match rule), top-1 agreement, top-``k`` employee overlap and exact
+    order agreement, distance error and storage per encoding.
+    ``probe_noise`` perturbs probes, standing in for a fresh capture;
+    ``max_probes`` samples the held-out rows to bound the float64 work.
+    """
+    from .face_gallery import FaceGallery, decide_match
+
+    reference = np.asarray(encodings, dtype=np.float64)
+    ids = [str(employee_id) for employee_id in employee_ids]
+    gallery_rows, probe_rows = holdout_split(ids, holdout, seed)
+    if max_probes and len(probe_rows) > max_probes:
+        probe_rows = np.random.default_rng(seed).choice(probe_rows, size=max_probes, replace=False)
+    gallery_ids = [ids[row] for row in gallery_rows]
+    base = reference[gallery_rows]
+    probes = reference[probe_rows]
+    if probe_noise:
+        probes = probes + np.random.default_rng(seed + 1).normal(scale=probe_noise, size=probes.shape)
+
+    gallery = FaceGallery(base, gallery_ids, index_backend="flat", storage_dtype=dtype)
+    base_sq = np.einsum("ij,ij->i", base, base)
+    counts = {"decision": 0, "top1": 0, "rank_exact": 0, "accepted": 0, "accept_flips": 0}
+    overlap = 0.0
+    errors: list[float] = []
+    for probe in probes:
+        exact = np.sqrt(np.maximum(base_sq - 2.0 * (base @ probe) + probe @ probe, 0.0))
+        approx = gallery.distances(probe).astype(np.float64)
+        errors.append(float(np.abs(approx - exact).max()) if len(exact) else 0.0)
+
+        want = _rank_employees(exact, gallery_ids, k)
+        got = _rank_employees(approx, gallery_ids, k)
+        want_decision = decide_match(want, threshold, min_gap, confident_margin)
+        got_decision = decide_match(got, threshold, min_gap, confident_margin)
+        counts["decision"] += want_decision == got_decision
+        counts["accepted"] += want_decision is not None
+        counts["accept_flips"] += (want_decision is None) != (got_decision is None)
+        counts["top1"] += bool(want) and bool(got) and want[0][0] == got[0][0]
+        counts["rank_exact"] += [name for name, _ in want] == [name for name, _ in got]
+        if want:
+            overlap += len({name for name, _ in want} & {name for name, _ in got}) / len(want)
+
+    total = max(len(probes), 1)
+    return {
+        "dtype": gallery.storage_dtype,
+        "gallery": len(gallery_rows),
+        "probes": len(probes),
+        "reference_accepts": counts["accepted"],
+        "decision_agreement": counts["decision"] / total,
+        "accept_flips": counts["accept_flips"],
+        "top1_agreement": counts["top1"] / total,
+        f"top{k}_overlap": overlap / total,
+        f"top{k}_exact_order": counts["rank_exact"] / total,
+        "max_distance_error": max(errors, default=0.0),
+        "mean_distance_error": float(np.mean(errors)) if errors else 0.0,
+        "bytes_per_encoding": bytes_per_encoding(gallery.storage_dtype, gallery.dim),
+        "compression_vs_float64": 8 / np.dtype(gallery.storage_dtype).itemsize,
+    }
@@ -1,10 +1,10 @@
-import io
 import pickle
 import random
+import threading
+import time
 from typing import Any
 
 import boto3
-import face_recognition
 import numpy as np
 from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
 from datetime import datetime
@@ -14,16 +14,60 @@ from .config import (
     FACE_S3_BUCKET,
     FACE_IMAGE_BUCKET,
     FACE_ENCODING_S3_KEY,
-    otp_sessions,
+    FACE_DELTA_COMPACT_EVERY,
+    get_face_gallery_dtype,
+    get_face_index_options,
+    get_face_shard_settings,
+    get_face_store_transfer_settings,
+    get_face_template_options,
 )
 from .employee_repository import get_employee_by_id
+from .employee_verification import otp_sessions
+from .face_backends import distance_scale, get_face_backend
+from .face_gallery import FaceGallery, decide_match, legacy_employee_ids
+from .face_hot_tier import get_face_hot_tier
+from .face_post_match import get_face_post_match_queue
+from .face_quantize import dequantize
+from .face_pipeline import encode_frame
+from .face_shards import (
+    employee_shard,
+    get_face_shard_set,
+    local_shard,
+    local_store_location,
+    shard_location,
+    update_shard_index,
+)
+from .face_store import (
+    LEGACY_EMBEDDER,
+    FaceSnapshot,
+    append_delta,
+    delta_embedder,
+    delete_deltas,
+    fold_deltas,
+    latest_delta_seq,
+    load_snapshot,
+    next_snapshot_version,
+    publish_to_s3,
+    read_deltas,
+    read_manifest,
+    sync_from_s3,
+    write_snapshot,
+)
 from .sms_sender import send_sms_via_sns
 from .visitor_log_repository import put_visitor_log
 
 
 _s3_client = None
 _encoding_cache: dict[str, Any] | None = None
-_employee_cache: dict[str, str] = {}
+_gallery_cache: FaceGallery | None = None
+_gallery_generation = 0
+_gallery_version = 0
+_gallery_base_seq = 0
+_applied_seqs: set[int] = set()
+_store_lock = threading.RLock()
+_reload_lock = threading.Lock()
+_employee_cache: dict[str, tuple[float, dict[str, Any]]] = {}
+EMPLOYEE_CACHE_TTL_SECONDS = 600
 
 
 def _get_s3_client():
@@ -65,67 +109,440 @@ def _read_encoding_blob_from_s3() -> bytes | None:
         return None
 
 
-def get_face_encoding_data(force_reload: bool = False) -> dict[str, Any] | None:
-    global _encoding_cache
-    if not force_reload and _encoding_cache is not None:
-        return _encoding_cache
-
+def _migrate_legacy_pickle() -> FaceSnapshot | None:
+    """Convert the old ``encoding.pkl`` blob into the first store snapshot."""
     blob = _read_encoding_blob_from_s3()
-
     if blob is None:
-        _encoding_cache = None
         return None
 
     try:
         data = pickle.loads(blob)
     except Exception as exc:
         print(f"[FaceRecognition] Failed to deserialize face encodings: {exc}")
-        _encoding_cache = None
         return None
 
-    _encoding_cache = data
-    return data
+    encodings = list(data.get("encodings", []))
+    employee_ids = legacy_employee_ids(data)
+    count = min(len(encodings), len(employee_ids))
+    print(f"[FaceRecognition] Migrating {count} legacy pickle encodings to the face store")
+    return _persist_encodings(encodings[:count], employee_ids[:count], embedder=LEGACY_EMBEDDER)
+
+
+def _sync_store(store_dir, client, bucket: str, prefix: str | None = None) -> bool:
+    workers = get_face_store_transfer_settings()["workers"]
+    return sync_from_s3(store_dir, client, bucket, prefix or local_store_location()[1], workers=workers)
 
-def invalidate_face_encoding_cache() -> None:
+
+def _empty_shard_data() -> dict[str, Any]:
+    # A shard nobody has encoded yet: registrations replay onto it as deltas
+    return {
+        "encodings": np.empty((0, get_face_backend().embedding_dim), dtype=np.float32),
+        "scale": None,
+        "employee_ids": [],
+        "version": 0,
+        "applied_seq": 0,
+        "embedder": None,
+    }
+
+
+def _load_snapshot_data(sync: bool = True, location: tuple | None = None) -> dict[str, Any] | None:
+    store_dir, prefix = location or local_store_location()
+    client, bucket = _store_target()
+    if sync and bucket:
+        _sync_store(store_dir, client, bucket, prefix)
+
+    snapshot = load_snapshot(store_dir)
+    if snapshot is None and get_face_shard_settings()["enabled"]:
+        # The legacy pickle only ever held the unsharded gallery
+        return _empty_shard_data()
+    snapshot = snapshot or _migrate_legacy_pickle()
+    return snapshot.as_encoding_data() if snapshot is not None else None
+
+
+def get_face_encoding_data(force_reload: bool = False) -> dict[str, Any] | None:
+    """Return ``{"encodings": <memory-mapped float32 matrix>, "employee_ids": [...]}``."""
     global _encoding_cache
-    _encoding_cache = None
+    if not force_reload and _encoding_cache is not None:
+        return _encoding_cache
 
+    _encoding_cache = _load_snapshot_data()
+    return _encoding_cache
+
+
+def get_face_gallery(force_reload: bool = False) -> FaceGallery | None:
+    """Return the float32 matrix view of the store, with pending deltas replayed."""
+    if not force_reload and _gallery_cache is not None:
+        return _gallery_cache
+    return reload_face_gallery()
 
-def save_face_encoding_data(data: dict[str, Any]) -> bool:
-    if data is None:
-        return False
 
+def _build_gallery(data: dict[str, Any], remote: bool, location: tuple | None = None) -> tuple[FaceGallery, set[int]] | None:
+    """Build a gallery and replay its deltas without touching the live one."""
     try:
-        blob = pickle.dumps(data)
+        gallery = FaceGallery.from_encoding_data(
+            data, storage_dtype=get_face_gallery_dtype(), **get_face_index_options(), **get_face_template_options()
+        )
     except Exception as exc:
-        print(f"[FaceRecognition] Failed to serialize face encodings: {exc}")
-        return False
+        print(f"[FaceRecognition] Failed to build face gallery: {exc}")
+        return None
 
+    applied: set[int] = set()
+    _replay_deltas(gallery, location or local_store_location(), int(data.get("applied_seq", 0)), applied, remote)
+    return gallery, applied
+
+
+def _replay_deltas(gallery: FaceGallery, location: tuple, base_seq: int, applied: set[int], remote: bool) -> int:
+    """Apply the store's delta records newer than ``base_seq`` not yet in ``applied``; returns how many."""
+    store_dir, prefix = location
+    client, bucket = _store_target() if remote else (None, None)
+    count = 0
+    for record in read_deltas(store_dir, base_seq, client, bucket, prefix):
+        if record["seq"] in applied:
+            continue
+        _apply_delta(gallery, record)
+        applied.add(record["seq"])
+        count += 1
+    return count
+
+
+def _load_store_state(location: tuple, sync: bool, remote: bool) -> dict[str, Any] | None:
+    """Gallery and replay position of one (shard) store, built from scratch."""
+    data = _load_snapshot_data(sync=sync, location=location)
+    built = _build_gallery(data, remote, location) if data is not None else None
+    if built is None:
+        return None
+    gallery, applied = built
+    return {
+        "gallery": gallery,
+        "version": int(data.get("version", 0)),
+        "base_seq": int(data.get("applied_seq", 0)),
+        "applied": applied,
+    }
+
+
+def _catch_up_store(state: dict[str, Any], location: tuple, remote: bool) -> int:
+    """Replay new deltas onto a store state from ``_load_store_state``."""
+    return _replay_deltas(state["gallery"], location, state["base_seq"], state["applied"], remote)
+
+
+def reload_face_gallery(sync: bool = True, remote: bool = True) -> FaceGallery | None:
+    """Rebuild the gallery off to the side and swap it in.
+
+    Requests keep matching against the previous gallery until the swap, and
+    keep it if the rebuild fails.
+    """
+    global _encoding_cache, _gallery_cache, _gallery_version, _gallery_base_seq, _applied_seqs
+    with _reload_lock:
+        data = _load_snapshot_data(sync=sync)
+        built = _build_gallery(data, remote) if data is not None else None
+        if built is None:
+            return _gallery_cache
+
+        gallery, applied = built
+        with _store_lock:
+            _encoding_cache = data
+            _gallery_cache = gallery
+            _gallery_version = int(data.get("version", 0))
+            _gallery_base_seq = int(data.get("applied_seq", 0))
+            _applied_seqs = applied
+
+    # Pick up anything appended while the new gallery was being built
+    apply_pending_deltas()
+    _bump_gallery_generation()
+    return gallery
+
+
+def _store_target() -> tuple[Any, str | None]:
     bucket = _encoding_bucket()
-    key = FACE_ENCODING_S3_KEY
-    if not bucket or not key:
-        print("[FaceRecognition] S3 bucket/key not configured; cannot save encodings")
-        return False
+    return (_get_s3_client() if bucket else None), bucket
+
+
+def _apply_delta(gallery: FaceGallery, record: dict[str, Any]) -> None:
+    if record["op"] == "add":
+        if gallery.embedder and delta_embedder(record) != gallery.embedder:
+            # Vectors from another embedding space must never be compared
+            print(
+                f"[FaceRecognition] Skipping delta {record['seq']}: embedder {delta_embedder(record)} "
+                f"does not match gallery {gallery.embedder}"
+            )
+            return
+        gallery.add(record["employee_id"], np.asarray(record["encoding"], dtype=np.float32))
+    elif record["op"] == "remove":
+        gallery.remove(record["employee_id"])
+
+
+def apply_pending_deltas(remote: bool = False) -> int:
+    """Replay delta records not yet applied to the cached gallery; returns how many."""
+    gallery = _gallery_cache
+    if gallery is None:
+        return 0
+
+    with _store_lock:
+        applied = _replay_deltas(gallery, local_store_location(), _gallery_base_seq, _applied_seqs, remote)
+    if applied:
+        print(f"[FaceRecognition] Applied {applied} face registration delta(s)")
+    return applied
+
+
+def refresh_face_gallery(sync: bool = False, remote: bool = False) -> bool:
+    """Bring the cached gallery up to date with the store; True when it changed.
+
+    A compaction built on the snapshot we hold only folds deltas we replay
+    anyway, so it needs no rebuild. Any other new snapshot does: a bulk
+    re-encode, a legacy migration, or a compaction on a newer base, whose
+    deletion of the deltas inside that base would otherwise lose registrations.
+    """
+    store_dir, prefix = local_store_location()
+    client, bucket = _store_target()
+    if sync and bucket:
+        _sync_store(store_dir, client, bucket, prefix)
+
+    # Other offices' shards refresh independently, each on its own manifest ETag
+    shards = get_face_shard_set()
+    shards_changed = shards.refresh(sync=remote, remote=remote) if shards is not None else False
+
+    manifest = read_manifest(store_dir) or {}
+    version = int(manifest.get("version", 0))
+    if _gallery_cache is None or (version != _gallery_version and not _compacts_loaded_base(manifest)):
+        return reload_face_gallery(sync=False, remote=remote) is not None or shards_changed
+
+    if apply_pending_deltas(remote=remote) or shards_changed:
+        _bump_gallery_generation()
+        return True
+    return False
+
+
+def _compacts_loaded_base(manifest: dict[str, Any]) -> bool:
+    """True when ``manifest`` is a compaction of exactly the snapshot the cached gallery was built from."""
+    return (
+        manifest.get("source") == "compaction"
+        and manifest.get("base_version") == _gallery_version
+        and manifest.get("base_applied_seq") == _gallery_base_seq
+    )
+
+
+def get_face_gallery_status() -> dict[str, Any]:
+    gallery = _gallery_cache
+    shards = get_face_shard_set()
+    return {
+        "loaded": gallery is not None,
+        "encodings": len(gallery) if gallery is not None else 0,
+        "embedder": gallery.embedder if gallery is not None else None,
+        "storage_dtype": gallery.storage_dtype if gallery is not None else None,
+        "storage_bytes": gallery.storage_bytes if gallery is not None else 0,
+        "snapshot_version": _gallery_version,
+        "base_seq": _gallery_base_seq,
+        "deltas_applied": len(_applied_seqs),
+        "generation": _gallery_generation,
+        "shard": local_shard(),
+        "shards": shards.metrics() if shards is not None else None,
+    }
+
+
+def get_gallery_generation() -> int:
+    """Counter bumped on every local gallery change; worker processes compare it."""
+    return _gallery_generation
+
+
+def _bump_gallery_generation() -> None:
+    global _gallery_generation
+    _gallery_generation += 1
+
+
+def _persist_encodings(
+    encodings,
+    employee_ids: list[str],
+    applied_seq: int = 0,
+    source: str = "snapshot",
+    embedder: str | None = None,
+    scale: np.ndarray | None = None,
+    location: tuple | None = None,
+    base_version: int | None = None,
+    base_applied_seq: int | None = None,
+) -> FaceSnapshot | None:
+    """Write the next store version locally and publish it to S3.
+
+    ``embedder`` defaults to the embedding space of the configured backend.
+    Rows are stored as ``FACE_GALLERY_DTYPE``. ``location`` is a shard's
+    ``(store_dir, prefix)``; this kiosk's own store by default. A compaction
+    passes the ``base_version`` / ``base_applied_seq`` it folded deltas into.
+    """
+    embedder = embedder or get_face_backend().embedder_id
+    store_dir, prefix = location or local_store_location()
+    client, bucket = _store_target()
+    version = next_snapshot_version(store_dir, client, bucket, prefix)
 
     try:
-        client = _get_s3_client()
-        client.put_object(
-            Bucket=bucket,
-            Key=key,
-            Body=blob,
-            ContentType="application/octet-stream",
+        snapshot = write_snapshot(
+            store_dir,
+            encodings,
+            employee_ids,
+            version=version,
+            applied_seq=applied_seq,
+            source=source,
+            embedder=embedder,
+            dtype=get_face_gallery_dtype(),
+            scale=scale,
+            base_version=base_version,
+            base_applied_seq=base_applied_seq,
         )
-        invalidate_face_encoding_cache()
-        return True
-    except (BotoCoreError, ClientError, NoCredentialsError) as exc:
-        print(f"[FaceRecognition] Failed to upload encodings to S3 ({exc})")
     except Exception as exc:
-        print(f"[FaceRecognition] Unexpected error uploading encodings to S3: {exc}")
+        print(f"[FaceRecognition] Failed to write face store snapshot: {exc}")
+        return None
 
-    return False
+    if not bucket:
+        print("[FaceRecognition] S3 bucket not configured; face store saved locally only")
+        return snapshot
 
+    if not publish_to_s3(store_dir, client, bucket, prefix, **get_face_store_transfer_settings()):
+        return None
+    return snapshot
 
-def _get_employee_name(employee_id: str) -> str | None:
+
+def _encoding_matrix(data: dict[str, Any] | None) -> np.ndarray:
+    encodings = dequantize(np.asarray((data or {}).get("encodings", [])), (data or {}).get("scale"))
+    if encodings.size == 0:
+        return np.empty((0, get_face_backend().embedding_dim), dtype=np.float32)
+    return encodings.reshape(len(encodings), -1)
+
+
+def save_face_encoding_data(data: dict[str, Any]) -> bool:
+    """Replace the whole gallery; every delta recorded so far is superseded."""
+    if data is None:
+        return False
+
+    client, bucket = _store_target()
+    store_dir, prefix = local_store_location()
+    applied_seq = latest_delta_seq(store_dir, client, bucket, prefix)
+    snapshot = _persist_encodings(
+        _encoding_matrix(data), legacy_employee_ids(data), applied_seq=applied_seq, embedder=data.get("embedder")
+    )
+    if snapshot is None:
+        return False
+
+    reload_face_gallery(sync=False)
+    return True
+
+
+def compact_face_store(location: tuple | None = None) -> bool:
+    """Fold the delta log into a new base snapshot.
+
+    Deltas are deleted one compaction late (only those already inside the
+    previous base), so a node still catching up never loses records.
+    ``location`` picks another shard's store; this kiosk's by default.
+    """
+    global _encoding_cache
+    store_dir, prefix = location or local_store_location()
+    client, bucket = _store_target()
+
+    with _store_lock:
+        if bucket:
+            _sync_store(store_dir, client, bucket, prefix)
+        base = load_snapshot(store_dir)
+        base_seq = base.applied_seq if base else 0
+        deltas = read_deltas(store_dir, base_seq, client, bucket, prefix)
+        if not deltas:
+            return True
+
+        embedder = base.as_encoding_data()["embedder"] if base else get_face_backend().embedder_id
+        matrix, employee_ids = fold_deltas(
+            base.float_encodings() if base else np.empty((0, get_face_backend().embedding_dim), dtype=np.float32),
+            base.employee_ids if base else [],
+            deltas,
+            max_templates=get_face_template_options()["max_templates"],
+            embedder=embedder,
+        )
+        snapshot = _persist_encodings(
+            matrix,
+            employee_ids,
+            applied_seq=deltas[-1]["seq"],
+            source="compaction",
+            embedder=embedder,
+            scale=base.scale if base else None,
+            location=(store_dir, prefix),
+            base_version=base.version if base else 0,
+            base_applied_seq=base_seq,
+        )
+        if snapshot is None:
+            return False
+
+        delete_deltas(store_dir, base_seq, client, bucket, prefix)
+        if location is None:
+            _encoding_cache = snapshot.as_encoding_data()
+
+    print(f"[FaceRecognition] Compacted {len(deltas)} delta(s) into snapshot v{snapshot.version}")
+    return True
+
+
+def _employee_face_shard(employee_id: str) -> str | None:
+    """Shard an employee's templates belong to; None when the store is not sharded."""
+    local = local_shard()
+    if local is None:
+        return None
+    record = _get_employee_record(employee_id)
+    if record is None:
+        print(f"[FaceRecognition] No employee record for {employee_id}; using this kiosk's shard {local}")
+        return local
+    return employee_shard(record)
+
+
+def get_employee_face_gallery(employee_id: str) -> FaceGallery | None:
+    """Gallery of the shard holding ``employee_id`` (this kiosk's own when not sharded)."""
+    shard = _employee_face_shard(employee_id)
+    if shard is None or shard == local_shard():
+        return get_face_gallery()
+    return get_face_shard_set().get(shard)
+
+
+def _record_face_delta(
+    op: str, employee_id: str, encoding: np.ndarray | None = None, embedder: str | None = None
+) -> bool:
+    # Registrations go to the employee's own office shard, wherever the kiosk is
+    shard = _employee_face_shard(employee_id)
+    other_shard = shard is not None and shard != local_shard()
+    store_dir, prefix = shard_location(shard) if other_shard else local_store_location()
+    client, bucket = _store_target()
+
+    # Build the gallery first so the new record is replayed on top of it
+    gallery = get_employee_face_gallery(employee_id)
+    if op == "add" and gallery is not None and gallery.embedder and gallery.embedder != embedder:
+        print(f"[FaceRecognition] Refusing {embedder} encoding for a {gallery.embedder} gallery; re-encode the gallery first")
+        return False
+    record = append_delta(store_dir, op, employee_id, encoding, client, bucket, prefix, embedder=embedder)
+    if record is None:
+        return False
+
+    if shard is not None and not get_face_shard_set().listed(shard):
+        # First registration for an office: list it so other kiosks search it
+        update_shard_index({shard: {}}, client, bucket)
+        get_face_shard_set().invalidate_index()
+    if other_shard:
+        get_face_shard_set().refresh(remote=bool(bucket))
+    else:
+        apply_pending_deltas(remote=bool(bucket))
+    _bump_gallery_generation()
+
+    base_seq = int((read_manifest(store_dir) or {}).get("applied_seq", 0))
+    if record["seq"] - base_seq >= FACE_DELTA_COMPACT_EVERY:
+        compact_face_store((store_dir, prefix) if other_shard else None)
+    return True
+
+
+def register_face_encoding(employee_id: str, encoding: np.ndarray, embedder: str | None = None) -> bool:
+    """Append an ``add`` delta (one more template); cost is independent of gallery size.
+
+    ``embedder`` is the embedding space of ``encoding`` (default: the configured backend's).
+    """
+    return _record_face_delta("add", employee_id, encoding, embedder or get_face_backend().embedder_id)
+
+
+def remove_face_encoding(employee_id: str) -> bool:
+    """Append a ``remove`` delta for every encoding of ``employee_id``."""
+    return _record_face_delta("remove", employee_id)
+
+
+def _get_employee_record(employee_id: str) -> dict[str, Any] | None:
+    """Employee record by id, cached briefly so name lookup and OTP dispatch share one fetch."""
     if not employee_id:
         return None
 
@@ -133,100 +550,211 @@ def _get_employee_name(employee_id: str) -> str | None:
     if not key:
         return None
 
-    if key in _employee_cache:
-        return _employee_cache[key]
-
-    name: str | None = None
+    cached = _employee_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < EMPLOYEE_CACHE_TTL_SECONDS:
+        return cached[1]
 
     try:
         record = get_employee_by_id(key)
-        if record:
-            candidate = (record.get("name") or record.get("employee_id") or "").strip()
-            if candidate:
-                name = candidate
     except Exception as exc:
         print(f"[FaceRecognition] DynamoDB lookup failed for {key}: {exc}")
+        return None
+
+    if record:
+        _employee_cache[key] = (time.monotonic(), record)
+    return record
+
 
-    if name:
-        _employee_cache[key] = name
+def _employee_name(record: dict[str, Any] | None) -> str | None:
+    if not record:
+        return None
+    return (record.get("name") or record.get("employee_id") or "").strip() or None
 
-    return name
 
+def _get_employee_name(employee_id: str) -> str | None:
+    return _employee_name(_get_employee_record(employee_id))
 
-def _dispatch_face_verification_otp(employee_id: str, employee_name: str) -> dict[str, Any]:
-    result: dict[str, Any] = {
+
+def _face_otp_task(
+    employee_id: str, employee_name: str, record: dict[str, Any] | None
+) -> tuple[dict[str, Any], list]:
+    """Initial state and retryable steps (send OTP, then log the visit) for one face match."""
+    state: dict[str, Any] = {
+        "employeeId": employee_id,
+        "employeeName": employee_name,
         "otpSent": False,
         "message": None,
         "phone": None,
         "visitorLogId": None,
     }
-
-    record = get_employee_by_id(employee_id)
     if not record:
-        result["message"] = "Employee record not found for OTP dispatch"
-        return result
+        state["message"] = "Employee record not found for OTP dispatch"
+        return state, []
 
     phone_number = (record.get("phone") or "").strip()
     if not phone_number:
-        result["message"] = "Employee phone number not available"
-        return result
-
-    generated_otp = f"{random.randint(100000, 999999)}"
-    otp_sessions[employee_id] = {
-        "otp": generated_otp,
-        "verified": False,
-        "timestamp": datetime.utcnow().isoformat(),
-        "employee_name": employee_name,
-        "phone": phone_number,
-    }
-
-    message = (
-        f"Hello {employee_name}, your Clara verification code is {generated_otp}. "
-        "Use this OTP to complete your sign-in."
-    )
-
-    try:
+        state["message"] = "Employee phone number not available"
+        return state, []
+    state["phone"] = phone_number
+
+    def send_otp(state: dict[str, Any]) -> None:
+        if state["otpSent"]:
+            return
+        if "otp_code" not in state:
+            # Generated once, so a retried publish re-sends the same code
+            state["otp_code"] = f"{random.randint(100000, 999999)}"
+            otp_sessions[employee_id] = {
+                "otp": state["otp_code"],
+                "verified": False,
+                "timestamp": datetime.utcnow().isoformat(),
+                "employee_name": employee_name,
+                "phone": phone_number,
+            }
+        message = (
+            f"Hello {employee_name}, your Clara verification code is {state['otp_code']}. "
+            "Use this OTP to complete your sign-in."
+        )
         send_sms_via_sns(phone_number, message)
-        result["otpSent"] = True
-        result["message"] = "OTP sent via SNS"
-        result["phone"] = phone_number
-    except Exception as exc:
-        result["message"] = f"Failed to send OTP: {exc}"
+        state["otpSent"] = True
+        state["message"] = "OTP sent via SNS"
 
-    try:
-        metadata = {
-            "employee_id": employee_id,
-            "otp_sent": result["otpSent"],
-            "phone": phone_number,
-        }
+    def log_visit(state: dict[str, Any]) -> None:
+        if state["visitorLogId"]:
+            return
         log_entry = put_visitor_log(
             visitor_name=employee_name,
             phone=phone_number,
             purpose="Employee face verification",
             meeting_employee=employee_name,
             photo_captured=False,
-            metadata=metadata,
+            metadata={
+                "employee_id": employee_id,
+                "otp_sent": state["otpSent"],
+                "phone": phone_number,
+            },
         )
-        if log_entry and log_entry.get("visit_id"):
-            result["visitorLogId"] = log_entry["visit_id"]
+        if not log_entry or not log_entry.get("visit_id"):
+            raise RuntimeError("visitor log write was not acknowledged")
+        state["visitorLogId"] = log_entry["visit_id"]
+
+    return state, [("send_otp", send_otp), ("log_visit", log_visit)]
+
+
+def _face_otp_result(state: dict[str, Any]) -> dict[str, Any]:
+    errors = state.get("errors") or {}
+    message = state.get("message")
+    if "send_otp" in errors:
+        message = f"Failed to send OTP: {errors['send_otp']}"
+    return {
+        "otpSent": state.get("otpSent", False),
+        "message": message,
+        "phone": state.get("phone") if state.get("otpSent") else None,
+        "visitorLogId": state.get("visitorLogId"),
+    }
+
+
+def _publish_face_otp_status(state: dict[str, Any]) -> None:
+    """Send a queued dispatch's outcome to the kiosk on its own signal channel.
+
+    The channel has its own slot, so the outcome never replaces a pending
+    flow signal such as ``start_face_capture``.
+    """
+    result = _face_otp_result(state)
+    print(f"[FaceRecognition] OTP task {state.get('taskId')} for {state.get('employeeId')}: {result['message']}")
+    try:
+        from flow_signal import FACE_OTP_CHANNEL, post_signal
+
+        post_signal("face_otp_status", {
+            "taskId": state.get("taskId"),
+            "employeeId": state.get("employeeId"),
+            "status": "failed" if state.get("errors") else "done",
+            **result,
+        }, kiosk_id=state.get("kioskId"), channel=FACE_OTP_CHANNEL)
     except Exception as exc:
-        print(f"[FaceRecognition] Failed to log visitor entry: {exc}")
+        print(f"[FaceRecognition] Could not post OTP status signal: {exc}")
+
+
+def _dispatch_face_verification_otp(
+    employee_id: str, employee_name: str, record: dict[str, Any] | None = None
+) -> dict[str, Any]:
+    """Send the OTP and log the visit before returning (the blocking path)."""
+    if record is None:
+        record = _get_employee_record(employee_id)
+    state, steps = _face_otp_task(employee_id, employee_name, record)
+    if steps:
+        state = get_face_post_match_queue().run_task(steps, state=state)
+    return _face_otp_result(state)
 
-    return result
 
+def _queue_face_verification_otp(
+    employee_id: str, employee_name: str, record: dict[str, Any] | None, kiosk_id: str | None = None
+) -> dict[str, Any]:
+    """Hand OTP dispatch and visitor logging to the post-match queue.
 
-# Pure function (can be used in API + agent)
+    Falls back to the blocking path when the queue is disabled or full, so
+    an OTP is never silently dropped. The outcome is signalled to ``kiosk_id``.
+    """
+    state, steps = _face_otp_task(employee_id, employee_name, record)
+    if not steps:
+        return _face_otp_result(state)
+    state["kioskId"] = kiosk_id
+
+    task_id = get_face_post_match_queue().submit(steps, on_complete=_publish_face_otp_status, state=state)
+    if task_id is None:
+        return _dispatch_face_verification_otp(employee_id, employee_name, record)
+    return {
+        "status": "queued",
+        "taskId": task_id,
+        "otpSent": False,
+        "message": "OTP dispatch queued",
+        "phone": None,
+        "visitorLogId": None,
+    }
+
+
+# Pure functions (can be used in API + agent)
 # ---------------------------------------------------
-def run_face_verify(image_bytes: bytes):
-    """SECURE face verification with strict matching and comprehensive logging"""
-    import time
-    
+def _format_timings(timings: dict[str, float]) -> str:
+    return ", ".join(f"{stage}={value:.1f}" for stage, value in timings.items())
+
+
+def _match_other_shards(
+    shards, names: list[str], encoding: np.ndarray, embedder: str, tolerance: float, min_gap: float, margin: float
+) -> dict[str, Any] | None:
+    """After a local miss, search the other offices' shards in turn; the first confident match wins."""
+    match = None
+    for shard in names:
+        gallery = shards.get(shard)
+        if gallery is None or len(gallery) == 0:
+            continue
+        if gallery.embedder and gallery.embedder != embedder:
+            print(f"Skipping shard {shard}: built with embedder {gallery.embedder}")
+            continue
+        ranked = [(emp_id, distance) for emp_id, distance, _ in gallery.nearest_employees(encoding, k=2)]
+        emp_id = decide_match(ranked, tolerance, min_gap, margin)
+        if emp_id is not None:
+            match = {"employeeId": emp_id, "distance": ranked[0][1], "shard": shard}
+            break
+    shards.record(match["shard"] if match else None)
+    return match
+
+
+def match_face_image(image_bytes: bytes, hint: tuple[float, float, float, float] | None = None) -> dict[str, Any]:
+    """CPU-bound half of verification: decode, encode and match against the gallery.
+
+    Safe to run in a worker process; it has no side effects beyond the local
+    gallery cache. A successful result carries ``employeeId`` and ``distance``.
+    ``hint`` is a parsed client ROI hint; once a face was found, results carry
+    ``roi`` (hint hit/miss) and ``faceBox``, the hint for the client's next frame.
+    With a sharded store the kiosk's own office is searched first and the
+    other shards only when it finds no match (``tier`` "shard", plus ``shard``).
+    """
     verification_id = int(time.time() * 1000)  # Unique ID for this verification
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     print(f"\n=== SECURITY VERIFICATION {verification_id} ===")
     print(f"Time: {timestamp}")
-    print(f"Image size: {len(image_bytes)} bytes")
+    print(f"Image size: {len(image_bytes) if image_bytes else 0} bytes")
     
     try:
         
@@ -234,102 +762,179 @@ def run_face_verify(image_bytes: bytes):
         if not image_bytes or len(image_bytes) == 0:
             return {"status": "error", "message": "No image data provided"}
         
-        # Load image from bytes
-        np_image = face_recognition.load_image_file(
-            io.BytesIO(image_bytes)
-        )
-        
-
-        encoding_data = get_face_encoding_data()
-        if not encoding_data:
+        gallery = get_face_gallery()
+        if gallery is None:
             return {"status": "error", "message": "Face database is unavailable"}
 
-        known_encodings = encoding_data.get("encodings", [])
-        known_ids = (
-            encoding_data.get("employee_ids")
-            or encoding_data.get("ids")
-            or encoding_data.get("names")
-            or []
-        )
-        print(f"Loaded {len(known_encodings)} encodings and {len(known_ids)} IDs")
+        print(f"Loaded {len(gallery)} encodings and IDs")
 
-        if not known_encodings or not known_ids:
+        shards = get_face_shard_set() if get_face_shard_settings()["fallback"] else None
+        other_shards = shards.names() if shards is not None else []
+        if len(gallery) == 0 and not other_shards:
             return {"status": "error", "message": "Face database is empty"}
 
-        # Encode faces
-        encodings = face_recognition.face_encodings(np_image)
-        if not encodings:
-            print("No face detected in the image")
-            return {"status": "error", "message": "No face detected in image"}
+        backend = get_face_backend()
+        if gallery.embedder and gallery.embedder != backend.embedder_id:
+            # Vectors from different embedders are not comparable; refuse rather than guess
+            print(f"Gallery embedder {gallery.embedder} does not match backend {backend.name} ({backend.embedder_id})")
+            return {"status": "error", "message": "Face database was built with a different face backend"}
+
+        # Decode at reduced size, detect on a downscaled copy, encode a full-resolution crop
+        encoded = encode_frame(image_bytes, backend=backend, hint=hint)
+        timings = encoded["timings"]
+        frame_info = {"roi": encoded["roi"], "faceBox": encoded["face_hint"]}
+        quality = encoded["quality"]
+        if quality is not None and not quality["passed"]:
+            # Rejected before any descriptor work; the hint goes straight to the kiosk
+            print(f"Face quality rejected: {quality['reason']} {quality['metrics']} (timings: {_format_timings(timings)})")
+            return {
+                "status": "error",
+                "message": quality["hint"],
+                "reason": quality["reason"],
+                "hint": quality["hint"],
+                "quality": quality["metrics"],
+                "timings": timings,
+                **frame_info,
+            }
+        if encoded["encoding"] is None:
+            print(f"No face detected in the image (timings: {_format_timings(timings)})")
+            return {"status": "error", "message": "No face detected in image", "timings": timings, **frame_info}
         
-        if len(encodings) > 1:
-            print(f"Multiple faces detected ({len(encodings)}), using the first one")
+        if encoded["faces"] > 1:
+            print(f"Multiple faces detected ({encoded['faces']}), using the largest one")
             
-        face_encoding = encodings[0]
+        face_encoding = encoded["encoding"]
         print(f"Face encoding generated successfully")
 
-        # Compare with known encodings using a strict tolerance to avoid false matches
-        print(f"Comparing against {len(known_encodings)} known faces...")
-        tolerance = 0.55
-        matches = face_recognition.compare_faces(known_encodings, face_encoding, tolerance=tolerance)
-        
-        # Also get face distances for additional validation
-        face_distances = face_recognition.face_distance(known_encodings, face_encoding)
-        print(f"Face distances: {face_distances}")
-        
+        tolerance = backend.match_threshold
+        min_confidence_gap = 0.05 * distance_scale(backend)
+        confident_margin = 0.03 * distance_scale(backend)
+
+        # Regulars first: the hot tier only answers when its guaranteed gap to
+        # the rest of the gallery is as good as a full search would demand
+        hot_tier = get_face_hot_tier()
+        started = time.perf_counter()
+        hot_match, hot_reason = hot_tier.match(gallery, face_encoding, tolerance, min_confidence_gap, confident_margin)
+        if hot_reason != "empty":
+            timings["hot_ms"] = (time.perf_counter() - started) * 1000
+        if hot_match is not None:
+            timings["match_ms"] = timings["hot_ms"]
+            hot_tier.record(hot_match["employeeId"])
+            print(f"Stage timings: {_format_timings(timings)}")
+            print(
+                f"✅ Face match accepted from hot tier: {hot_match['employeeId']} with distance "
+                f"{hot_match['distance']} (guaranteed gap {hot_match['gap']:.4f})"
+            )
+            return {
+                "status": "success",
+                "employeeId": hot_match["employeeId"],
+                "distance": hot_match["distance"],
+                "tier": "hot",
+                "timings": timings,
+                **frame_info,
+            }
+        if "hot_ms" in timings:
+            print(f"Hot tier fell through ({hot_reason})")
+
+        # Centroid pre-filter, then exact re-rank; the gap is measured between
+        # the two closest *employees*, not two templates of the same person
+        print(f"Comparing against {len(gallery)} templates of {gallery.employee_count} employees...")
+        started = time.perf_counter()
+        nearest = gallery.nearest_employees(face_encoding, k=2)
+        timings["full_ms"] = (time.perf_counter() - started) * 1000
+        timings["match_ms"] = timings.get("hot_ms", 0.0) + timings["full_ms"]
+        print(f"Stage timings: {_format_timings(timings)}")
+
         # Find the best match (lowest distance)
-        if len(face_distances) > 0:
-            best_match_index = face_distances.argmin()
-            best_distance = face_distances[best_match_index]
+        if nearest:
+            emp_id, best_distance, _ = nearest[0]
             print(f"Best match distance: {best_distance} (threshold: {tolerance})")
-
-            # Security threshold matches the relaxed tolerance for consistent acceptance
-            security_threshold = 0.55
-            min_confidence_gap = 0.05
-
-            if best_distance <= security_threshold and matches[best_match_index]:
-                other_distances = [d for i, d in enumerate(face_distances) if i != best_match_index]
-                confidence_gap = None
-                if other_distances:
-                    second_best = min(other_distances)
-                    confidence_gap = second_best - best_distance
-                    print(f"Confidence gap: {confidence_gap} (preferred: >{min_confidence_gap})")
-
-                # Accept match if either gap is healthy or the best distance is very confident on its own
-                gap_confident = confidence_gap is None or confidence_gap >= min_confidence_gap
-                distance_confident = best_distance <= (security_threshold - 0.03)
-
-                if gap_confident or distance_confident:
-                    emp_id = known_ids[best_match_index]
-                    emp_name = _get_employee_name(emp_id) or "Unknown"
-                    if not gap_confident:
-                        print("⚠️ Gap below preferred minimum but distance is confident; accepting match")
-                    print(f"✅ Face match accepted: {emp_name} ({emp_id}) with distance {best_distance}")
-                    otp_result = _dispatch_face_verification_otp(emp_id, emp_name)
-                    return {
-                        "status": "success",
-                        "employeeId": emp_id,
-                        "name": emp_name,
-                        "otp": otp_result,
-                    }
-                else:
-                    print("Confidence gap insufficient; rejecting match for safety")
+            if len(nearest) > 1:
+                print(f"Confidence gap: {nearest[1][1] - best_distance} (preferred: >{min_confidence_gap})")
+
+            # The same accept rule as every other tier; the dlib-tuned margins
+            # are scaled into the backend's distance range
+            ranked = [(employee_id, distance) for employee_id, distance, _ in nearest]
+            if decide_match(ranked, tolerance, min_confidence_gap, confident_margin) is not None:
+                print(f"✅ Face match accepted: {emp_id} with distance {best_distance}")
+                hot_tier.record(emp_id)
+                return {
+                    "status": "success",
+                    "employeeId": emp_id,
+                    "distance": best_distance,
+                    "tier": "full",
+                    "hot_reason": hot_reason,
+                    "timings": timings,
+                    **frame_info,
+                }
+            if best_distance <= tolerance:
+                print("Confidence gap insufficient; rejecting match for safety")
+
+        if other_shards:
+            # Visitors from other offices; their matches stay out of the local hot tier
+            started = time.perf_counter()
+            shard_match = _match_other_shards(
+                shards, other_shards, face_encoding, backend.embedder_id, tolerance, min_confidence_gap, confident_margin
+            )
+            timings["shards_ms"] = (time.perf_counter() - started) * 1000
+            timings["match_ms"] = timings.get("match_ms", 0.0) + timings["shards_ms"]
+            if shard_match is not None:
+                print(
+                    f"✅ Face match accepted from shard {shard_match['shard']}: {shard_match['employeeId']} "
+                    f"with distance {shard_match['distance']} (shard search {timings['shards_ms']:.1f} ms)"
+                )
+                return {"status": "success", "tier": "shard", **shard_match, "timings": timings, **frame_info}
+            print(f"No match in {len(other_shards)} other shard(s) either")
 
         print("❌ SECURITY: Face verification FAILED - No secure match found")
         print(f"Best distance was: {best_distance if 'best_distance' in locals() else 'N/A'}")
         print("Reason: Face does not meet strict security requirements")
-        return {"status": "error", "message": "Face not recognized - Security verification failed"}
+        return {
+            "status": "error",
+            "message": "Face not recognized - Security verification failed",
+            "tier": "full",
+            "hot_reason": hot_reason,
+            "timings": timings,
+            **frame_info,
+        }
 
     except Exception as e:
         error_msg = f"SECURITY ERROR in verification {verification_id}: {str(e)}"
         print(f"❌ {error_msg}")
-        print(f"=== END VERIFICATION {verification_id} ===\n")
         return {"status": "error", "message": "Verification system error"}
     
     finally:
         print(f"=== END VERIFICATION {verification_id} ===\n")
 
 
+def complete_face_match(match: dict[str, Any], kiosk_id: str | None = None) -> dict[str, Any]:
+    """I/O half of verification: resolve the employee name and queue the OTP.
+
+    Returns as soon as the name is known; the OTP outcome follows as a
+    ``face_otp_status`` signal on the ``face_otp`` channel of ``kiosk_id``
+    (and at ``/face_otp/status/{taskId}``).
+    """
+    if match.get("status") != "success":
+        return match
+
+    emp_id = match["employeeId"]
+    record = _get_employee_record(emp_id)
+    emp_name = _employee_name(record) or "Unknown"
+    print(f"[FaceRecognition] Match resolved to {emp_name} ({emp_id})")
+    otp_result = _queue_face_verification_otp(emp_id, emp_name, record, kiosk_id)
+    return {
+        "status": "success",
+        "employeeId": emp_id,
+        "name": emp_name,
+        "otp": otp_result,
+    }
+
+
+def run_face_verify(image_bytes: bytes):
+    """SECURE face verification with strict matching and comprehensive logging"""
+    return complete_face_match(match_face_image(image_bytes))
+
+
 # ---------------------------------------------------
 # Agent tool wrapper (for LiveKit LLM agent)
 # ---------------------------------------------------
@@ -4,13 +4,11 @@ Face Registration Tool
 This tool allows new employees to register their faces after manual verification
 """
 
-import io
 import os
 from typing import Any
 
 import boto3
 import pandas as pd
-import face_recognition
 import numpy as np
 from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
 from datetime import datetime
@@ -23,8 +21,15 @@ from .config import (
     FACE_IMAGE_PREFIX,
     FACE_IMAGE_EXTENSION,
     FACE_ENCODING_S3_KEY,
+    get_face_pipeline_settings,
+)
+from .face_backends import distance_scale, get_face_backend
+from .face_pipeline import encode_frame
+from .face_recognition import (
+    get_employee_face_gallery,
+    register_face_encoding,
+    remove_face_encoding,
 )
-from .face_recognition import get_face_encoding_data, save_face_encoding_data
 
 
 _s3_client = None
@@ -41,10 +46,11 @@ def _employee_image_bucket() -> str | None:
     return FACE_IMAGE_BUCKET or FACE_S3_BUCKET
 
 
-def _build_employee_image_key(employee_id: str) -> str:
+def _build_employee_image_key(employee_id: str, template: str | None = None) -> str:
+    """``<prefix>/<id>.<ext>`` for the first photo, ``<prefix>/<id>/<template>.<ext>`` for extra templates."""
     prefix = (FACE_IMAGE_PREFIX or "").strip("/")
     ext = (FACE_IMAGE_EXTENSION or "png").lstrip(".")
-    filename = f"{employee_id}.{ext}"
+    filename = f"{employee_id}/{template}.{ext}" if template else f"{employee_id}.{ext}"
     return f"{prefix}/{filename}" if prefix else filename
 
 
@@ -59,12 +65,14 @@ def _guess_content_type(extension: str) -> str:
     return "application/octet-stream"
 
 
-def _upload_employee_image(employee_id: str, image_bytes: bytes) -> tuple[bool, str | None]:
+def _upload_employee_image(
+    employee_id: str, image_bytes: bytes, template: str | None = None
+) -> tuple[bool, str | None]:
     bucket = _employee_image_bucket()
     if not bucket or not image_bytes:
         return False, None
 
-    key = _build_employee_image_key(employee_id)
+    key = _build_employee_image_key(employee_id, template)
     content_type = _guess_content_type((FACE_IMAGE_EXTENSION or "png").lstrip("."))
 
     try:
@@ -97,21 +105,9 @@ async def register_employee_face(ctx: RunContext, employee_id: str, image_bytes:
         if not image_bytes or len(image_bytes) == 0:
             return "❌ No image data provided for face registration"
         
-        # Load existing encodings
-        encoding_data = get_face_encoding_data()
-        if encoding_data:
-            known_encodings = list(encoding_data.get("encodings", []))
-            legacy_ids = (
-                encoding_data.get("employee_ids")
-                or encoding_data.get("ids")
-                or encoding_data.get("names")
-                or []
-            )
-            known_ids = list(legacy_ids)
-        else:
-            known_encodings = []
-            known_ids = []
-        
+        # Load existing encodings (the employee's own office shard when sharded)
+        gallery = get_employee_face_gallery(employee_id)
+
         # Check if employee ID exists in database
         try:
             df = pd.read_csv(EMPLOYEE_CSV, dtype=str).fillna("")
@@ -124,52 +120,54 @@ async def register_employee_face(ctx: RunContext, employee_id: str, image_bytes:
         except Exception as e:
             return f" Error reading employee database: {str(e)}"
         
-        # Check if face is already registered
-        if employee_id in known_ids:
-            return f"⚠️ Face already registered for {employee_name} (ID: {employee_id})"
-        
-        # Process the new face image
+        # Quality-gate and encode the new face; templates keep the full decoded resolution
         try:
-            np_image = face_recognition.load_image_file(io.BytesIO(image_bytes))
-            print(f"Image loaded successfully. Shape: {np_image.shape}")
+            backend = get_face_backend()
+            encoded = encode_frame(image_bytes, {**get_face_pipeline_settings(), "decode_max_side": 0}, backend=backend)
         except Exception as e:
             return f"❌ Error loading image: {str(e)}"
         
-        # Encode the face
-        encodings = face_recognition.face_encodings(np_image)
-        if not encodings:
+        quality = encoded["quality"]
+        if quality is not None and not quality["passed"]:
+            print(f"Registration photo rejected: {quality['reason']} {quality['metrics']}")
+            return f"❌ {quality['hint']} and try again."
+        
+        if encoded["encoding"] is None:
             return "❌ No face detected in the image. Please ensure your face is clearly visible and try again."
         
-        if len(encodings) > 1:
-            print(f"Multiple faces detected ({len(encodings)}), using the first one")
+        if encoded["faces"] > 1:
+            print(f"Multiple faces detected ({encoded['faces']}), using the largest one")
         
-        new_encoding = encodings[0]
+        new_encoding = encoded["encoding"]
         print(f"Face encoding generated successfully for {employee_name}")
-        
-        # Quality check - compare with existing faces to avoid duplicates
-        if known_encodings:
-            distances = face_recognition.face_distance(known_encodings, new_encoding)
-            min_distance = min(distances) if distances else 1.0
-            
+
+        # An already registered employee gets an extra template, but only of the same face
+        existing_rows = gallery.template_rows(employee_id) if gallery is not None else []
+        if existing_rows:
+            own_distance = float(gallery.distances(new_encoding, np.asarray(existing_rows)).min())
+            if own_distance > 0.6 * distance_scale(backend):
+                return (
+                    f"⚠️ Face already registered for {employee_name} (ID: {employee_id}) "
+                    "and the new photo does not match it"
+                )
+            print(f"Adding template {len(existing_rows) + 1} for {employee_id} (distance to own: {own_distance})")
+        
+        # Quality check - compare with other employees' faces to avoid duplicates
+        nearest = gallery.nearest_employees(new_encoding, k=2) if gallery is not None else []
+        others = [entry for entry in nearest if entry[0] != employee_id]
+        if others:
+            closest_id, min_distance, _ = others[0]
+
             # If the face is too similar to an existing one, warn but still register
-            if min_distance < 0.4:
-                closest_id = known_ids[distances.argmin()]
+            if min_distance < 0.4 * distance_scale(backend):
                 print(f"Warning: Face is similar to existing employee {closest_id} (distance: {min_distance})")
-        
-        # Add the new encoding
-        known_encodings.append(new_encoding)
-        known_ids.append(employee_id)
-        
-        # Save updated encodings
-        updated_encoding_data = {
-            "encodings": known_encodings,
-            "employee_ids": known_ids
-        }
 
-        if not save_face_encoding_data(updated_encoding_data):
+        # Add the new encoding to the stored set and the in-memory index
+        if not register_face_encoding(employee_id, new_encoding, encoded["embedder"]):
             return "❌ Error saving face encodings"
 
-        image_uploaded, image_location = _upload_employee_image(employee_id, image_bytes)
+        template = datetime.now().strftime("%Y%m%d%H%M%S") if existing_rows else None
+        image_uploaded, image_location = _upload_employee_image(employee_id, image_bytes, template)
         
         # Log the registration
         log_entry = {
@@ -201,19 +199,12 @@ async def check_face_registration_status(ctx: RunContext, employee_id: str) -> s
     Check if an employee's face is already registered in the system
     """
     try:
-        # Load existing encodings
-        encoding_data = get_face_encoding_data()
-        if not encoding_data:
+        # The gallery includes registrations still sitting in the delta log
+        gallery = get_employee_face_gallery(employee_id)
+        if gallery is None:
             return "❌ Face recognition system not initialized"
 
-        known_ids = (
-            encoding_data.get("employee_ids")
-            or encoding_data.get("ids")
-            or encoding_data.get("names")
-            or []
-        )
-        
-        if employee_id in known_ids:
+        if employee_id in gallery:
             return f" Face is registered for employee ID {employee_id}"
         else:
             return f" No face registered for employee ID {employee_id}"
@@ -228,35 +219,16 @@ async def remove_face_registration(ctx: RunContext, employee_id: str) -> str:
     Remove an employee's face registration (admin function)
     """
     try:
-        # Load existing encodings
-        encoding_data = get_face_encoding_data()
-        if not encoding_data:
+        # The gallery includes registrations still sitting in the delta log
+        gallery = get_employee_face_gallery(employee_id)
+        if gallery is None:
             return f" Face recognition system not initialized"
 
-        known_encodings = list(encoding_data.get("encodings", []))
-        legacy_ids = (
-            encoding_data.get("employee_ids")
-            or encoding_data.get("ids")
-            or encoding_data.get("names")
-            or []
-        )
-        known_ids = list(legacy_ids)
-        
-        if employee_id not in known_ids:
+        if employee_id not in gallery:
             return f"❌ No face registration found for employee ID {employee_id}"
         
-        # Find and remove the employee's face
-        index = known_ids.index(employee_id)
-        removed_encoding = known_encodings.pop(index)
-        removed_id = known_ids.pop(index)
-        
-        # Save updated encodings
-        updated_encoding_data = {
-            "encodings": known_encodings,
-            "employee_ids": known_ids
-        }
-
-        if not save_face_encoding_data(updated_encoding_data):
+        # Remove the employee's face from the stored set and the in-memory index
+        if not remove_face_encoding(employee_id):
             return "❌ Error saving face encodings"
 
         removed = f"s3://{_employee_image_bucket()}/{_build_employee_image_key(employee_id)}" if _employee_image_bucket() else None
@@ -0,0 +1,103 @@
+"""
+Face Result Cache
+
+Short-lived LRU of face match results keyed by the SHA-256 of the uploaded
+bytes, so a frame a kiosk re-posts is answered without another dlib decode,
+detection and encoding pass. Only byte-identical frames hit: a visually
+similar frame may hold a different person, so it always gets a fresh match.
+
+Only deterministic outcomes are cached: a match and "no face detected".
+Entries remember the gallery generation they were computed against and are
+ignored once a registration or reload changes it.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from .config import get_face_dedup_settings
+
+
+NO_FACE_MESSAGE = "No face detected in image"
+
+
+def _cacheable(result: dict[str, Any]) -> bool:
+    return result.get("status") == "success" or result.get("message") == NO_FACE_MESSAGE
+
+
+class FaceResultCache:
+    """Bounded, TTL-expiring LRU of match results with hit/miss counters."""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, int, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            key, (stored_at, _, _) = next(iter(self._entries.items()))
+            if now - stored_at < self.ttl:
+                break
+            del self._entries[key]
+            self._counters["evicted"] += 1
+
+    def get(self, image_bytes: bytes, generation: int) -> dict[str, Any] | None:
+        """Return a cached result for exactly these bytes."""
+        if not self.enabled or not image_bytes:
+            return None
+
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.get(digest)
+            if entry is not None and entry[1] == generation:
+                self._entries.move_to_end(digest)
+                self._counters["hits"] += 1
+                return dict(entry[2])
+
+            self._counters["misses"] += 1
+        return None
+
+    def put(self, image_bytes: bytes, generation: int, result: dict[str, Any]) -> None:
+        if not self.enabled or not image_bytes or not _cacheable(result):
+            return
+
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        with self._lock:
+            self._entries[digest] = (time.monotonic(), generation, dict(result))
+            self._entries.move_to_end(digest)
+            self._counters["stored"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evicted"] += 1
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            hits = self._counters["hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                **self._counters,
+            }
+
+
+_cache: FaceResultCache | None = None
+
+
+def get_face_result_cache() -> FaceResultCache:
+    global _cache
+    if _cache is None:
+        _cache = FaceResultCache(**get_face_dedup_settings())
+    return _cache
@@ -0,0 +1,354 @@
+"""
+Face Gallery Shards
+
+With ``FACE_SHARDING`` on, the face store is split into one shard per
+office. An employee's shard comes from the ``office`` attribute of their
+employee record, the same attribute manager visits carry. Each shard is a
+complete face store (snapshot, delta log, manifest):
+
+    <FACE_STORE_DIR>/shards/<shard>/          local copy
+    <FACE_STORE_S3_PREFIX>/shards/<shard>/    on S3
+    <FACE_STORE_S3_PREFIX>/shards.json        shard index
+
+So every shard is published, synced, compacted and refreshed on its own.
+A kiosk's own shard (``FACE_SITE``) is its primary gallery and is always
+loaded. The other shards are only searched when the local one finds no
+match. They are loaded on first use and at most ``FACE_SHARD_MAX_RESIDENT``
+stay in memory (least recently searched are dropped), so per-kiosk memory
+and search cost follow the size of its office, not of the company.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
+
+from .config import FACE_STORE_S3_PREFIX, get_face_shard_settings, get_face_store_dir
+from .face_store import _CONFLICT_CODES, _atomic_write, _s3_key, read_manifest, remote_manifest_etag
+
+
+SHARD_DIR = "shards"
+SHARD_INDEX_NAME = "shards.json"
+# Employees whose record names no office
+UNASSIGNED_SHARD = "unassigned"
+
+
+def shard_key(office: str | None) -> str:
+    """Stable shard name for an office: lowercase, path-safe."""
+    key = re.sub(r"[^a-z0-9]+", "-", (office or "").strip().lower()).strip("-")
+    return key or UNASSIGNED_SHARD
+
+
+def employee_shard(record: dict[str, Any] | None) -> str:
+    """Shard of an employee record (mapped or raw DynamoDB item)."""
+    record = record or {}
+    raw = record.get("raw") or {}
+    return shard_key(record.get("office") or raw.get("office") or raw.get("Office"))
+
+
+def shard_location(shard: str) -> tuple[Path, str]:
+    """Local directory and S3 prefix of one shard's store."""
+    store_dir = get_face_store_dir() / SHARD_DIR / shard
+    store_dir.mkdir(parents=True, exist_ok=True)
+    return store_dir, _s3_key(FACE_STORE_S3_PREFIX, f"{SHARD_DIR}/{shard}")
+
+
+def local_shard() -> str | None:
+    """This kiosk's shard, or None when the store is not sharded."""
+    settings = get_face_shard_settings()
+    return shard_key(settings["site"]) if settings["enabled"] else None
+
+
+def local_store_location() -> tuple[Path, str]:
+    """Local directory and S3 prefix of the store this kiosk matches against first."""
+    shard = local_shard()
+    return shard_location(shard) if shard else (get_face_store_dir(), FACE_STORE_S3_PREFIX)
+
+
+# ---------------------------------------------------
+# Shard index
+# ---------------------------------------------------
+def _index_path() -> Path:
+    return get_face_store_dir() / SHARD_INDEX_NAME
+
+
+def _fetch_shard_index(client, bucket: str) -> tuple[bytes | None, str | None] | None:
+    """Remote index body and ETag, ``(None, None)`` when it does not exist yet, None when unreachable."""
+    try:
+        response = client.get_object(Bucket=bucket, Key=_s3_key(FACE_STORE_S3_PREFIX, SHARD_INDEX_NAME))
+        return response["Body"].read(), response.get("ETag")
+    except ClientError as exc:
+        code = exc.response.get("Error", {}).get("Code")
+        if code in {"NoSuchKey", "404"}:
+            return None, None
+        print(f"[FaceShards] Failed to fetch shard index ({exc})")
+    except (BotoCoreError, NoCredentialsError) as exc:
+        print(f"[FaceShards] Failed to fetch shard index ({exc})")
+    return None
+
+
+def read_shard_index(client=None, bucket: str | None = None) -> dict[str, dict[str, Any]]:
+    """Shard name → ``{"employees", "encodings", "version", "updated_at"}``.
+
+    With a bucket the remote index is fetched and cached locally; the local
+    copy answers when S3 is unreachable.
+    """
+    if client is not None and bucket:
+        fetched = _fetch_shard_index(client, bucket)
+        if fetched is not None and fetched[0] is not None:
+            try:
+                shards = json.loads(fetched[0]).get("shards", {})
+                _atomic_write(_index_path(), fetched[0])
+                return shards
+            except ValueError as exc:
+                print(f"[FaceShards] Failed to fetch shard index ({exc})")
+
+    try:
+        return json.loads(_index_path().read_text(encoding="utf-8")).get("shards", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _merge_index(shards: dict[str, dict[str, Any]], entries: dict[str, dict[str, Any]]) -> bytes:
+    for shard, entry in entries.items():
+        shards[shard] = {**shards.get(shard, {}), **entry, "updated_at": time.time()}
+    return json.dumps({"shards": shards}, indent=2, sort_keys=True).encode("utf-8")
+
+
+def update_shard_index(
+    entries: dict[str, dict[str, Any]], client=None, bucket: str | None = None, max_attempts: int = 20
+) -> bool:
+    """Merge ``entries`` into the index (read-modify-write) and publish it.
+
+    With S3 the put is conditional on the ETag that was read (create-only
+    when there was no index), so two nodes updating at once cannot drop each
+    other's shards: the loser re-reads and merges again.
+    """
+    if client is None or not bucket:
+        _atomic_write(_index_path(), _merge_index(read_shard_index(), entries))
+        return True
+
+    key = _s3_key(FACE_STORE_S3_PREFIX, SHARD_INDEX_NAME)
+    for _ in range(max_attempts):
+        fetched = _fetch_shard_index(client, bucket)
+        if fetched is None:
+            # S3 unreachable: keep the local copy current for this node
+            _atomic_write(_index_path(), _merge_index(read_shard_index(), entries))
+            return False
+        current, etag = fetched
+        try:
+            shards = json.loads(current).get("shards", {}) if current is not None else {}
+        except ValueError:
+            shards = {}
+        body = _merge_index(shards, entries)
+        condition = {"IfMatch": etag} if current is not None else {"IfNoneMatch": "*"}
+        try:
+            client.put_object(Bucket=bucket, Key=key, Body=body, ContentType="application/json", **condition)
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in _CONFLICT_CODES:
+                continue
+            print(f"[FaceShards] Failed to publish shard index ({exc})")
+            return False
+        except (BotoCoreError, NoCredentialsError) as exc:
+            print(f"[FaceShards] Failed to publish shard index ({exc})")
+            return False
+        _atomic_write(_index_path(), body)
+        return True
+
+    print(f"[FaceShards] Gave up publishing the shard index after {max_attempts} attempts")
+    return False
+
+
+# ---------------------------------------------------
+# Other offices' shards
+# ---------------------------------------------------
+class FaceShardSet:
+    """The shards other than this kiosk's: loaded on a local miss, LRU-bounded."""
+
+    def __init__(self, local: str, max_resident: int):
+        self.local = local
+        self.max_resident = max_resident
+        self._lock = threading.RLock()
+        # shard -> {"gallery", "version", "base_seq", "applied", "etag"}
+        self._resident: OrderedDict[str, dict[str, Any]] = OrderedDict()
+        # shard -> set once its load finishes; the S3 sync runs outside the lock
+        self._loading: dict[str, threading.Event] = {}
+        # One refresh at a time, so two never replay the same deltas into a gallery
+        self._refresh_lock = threading.Lock()
+        self._index: dict[str, dict[str, Any]] | None = None
+        self._hits: dict[str, int] = {}
+        self._counters = {"searches": 0, "hits": 0, "loads": 0, "evictions": 0, "load_failures": 0}
+
+    def _load_index(self) -> dict[str, dict[str, Any]]:
+        if self._index is None:
+            from .face_recognition import _store_target
+
+            self._index = read_shard_index(*_store_target())
+        return self._index
+
+    def listed(self, shard: str) -> bool:
+        """Whether the shard index names ``shard`` (other kiosks only search listed shards)."""
+        with self._lock:
+            return shard in self._load_index()
+
+    def invalidate_index(self) -> None:
+        with self._lock:
+            self._index = None
+
+    def names(self) -> list[str]:
+        """Other shards in search order: most cross-office matches first, then largest."""
+        with self._lock:
+            index = self._load_index()
+            others = [shard for shard in index if shard != self.local]
+            return sorted(
+                others,
+                key=lambda shard: (-self._hits.get(shard, 0), -int(index[shard].get("employees", 0)), shard),
+            )
+
+    def _resident_gallery(self, shard: str):
+        state = self._resident.get(shard)
+        if state is None:
+            return None
+        self._resident.move_to_end(shard)
+        return state["gallery"]
+
+    def get(self, shard: str):
+        """The shard's gallery, loading (and syncing) it on first use.
+
+        The download runs outside the lock, so searches of resident shards
+        go on meanwhile; concurrent callers for the same shard wait for the
+        one load instead of starting their own.
+        """
+        from .face_recognition import _load_store_state, _store_target
+
+        with self._lock:
+            gallery = self._resident_gallery(shard)
+            if gallery is not None:
+                return gallery
+            pending = self._loading.get(shard)
+            loading = pending is None
+            if loading:
+                pending = self._loading[shard] = threading.Event()
+
+        if not loading:
+            pending.wait()
+            with self._lock:
+                return self._resident_gallery(shard)
+
+        state = None
+        try:
+            client, bucket = _store_target()
+            location = shard_location(shard)
+            state = _load_store_state(location, sync=bool(bucket), remote=bool(bucket))
+            if state is not None:
+                state["etag"] = remote_manifest_etag(client, bucket, location[1]) if bucket else None
+        finally:
+            with self._lock:
+                del self._loading[shard]
+                if state is None:
+                    self._counters["load_failures"] += 1
+                else:
+                    self._insert(shard, state)
+            pending.set()
+        return state["gallery"] if state is not None else None
+
+    def _insert(self, shard: str, state: dict[str, Any]) -> None:
+        # Caller holds the lock
+        self._resident[shard] = state
+        self._counters["loads"] += 1
+        while len(self._resident) > max(1, self.max_resident):
+            evicted, _ = self._resident.popitem(last=False)
+            self._counters["evictions"] += 1
+            print(f"[FaceShards] Dropped shard {evicted} from memory")
+
+    def record(self, shard: str | None) -> None:
+        """Count one search of the other shards and, when one matched, which."""
+        with self._lock:
+            self._counters["searches"] += 1
+            if shard is not None:
+                self._counters["hits"] += 1
+                self._hits[shard] = self._hits.get(shard, 0) + 1
+
+    def refresh(self, sync: bool = False, remote: bool = False) -> bool:
+        """Bring resident shards up to date, each on its own manifest; True when one changed.
+
+        ``sync`` re-reads the shard index and downloads shards whose remote
+        manifest ETag moved. The HEADs, downloads and rebuilds run outside
+        the lock on a snapshot of the resident shards; a rebuilt shard is
+        only swapped in if nothing replaced or evicted it meanwhile.
+        """
+        from .face_recognition import _catch_up_store, _load_store_state, _store_target, _sync_store
+
+        client, bucket = _store_target()
+        changed = False
+        with self._refresh_lock:
+            with self._lock:
+                if sync:
+                    self._index = None
+                resident = list(self._resident.items())
+
+            fresh_states: dict[str, dict[str, Any]] = {}
+            etags: dict[str, str] = {}
+            for shard, state in resident:
+                store_dir, prefix = shard_location(shard)
+                etag = state["etag"]
+                if sync and bucket:
+                    remote_etag = remote_manifest_etag(client, bucket, prefix)
+                    if remote_etag is not None and remote_etag != etag:
+                        _sync_store(store_dir, client, bucket, prefix)
+                        etag = etags[shard] = remote_etag
+
+                version = int((read_manifest(store_dir) or {}).get("version", 0))
+                if version != state["version"]:
+                    fresh = _load_store_state((store_dir, prefix), sync=False, remote=remote)
+                    if fresh is not None:
+                        fresh["etag"] = etag
+                        fresh_states[shard] = fresh
+                        continue
+                if _catch_up_store(state, (store_dir, prefix), remote):
+                    changed = True
+
+            with self._lock:
+                for shard, state in resident:
+                    if self._resident.get(shard) is not state:
+                        # Evicted (or reloaded) while we worked; our copy is stale
+                        continue
+                    if shard in fresh_states:
+                        self._resident[shard] = fresh_states[shard]
+                        changed = True
+                    elif shard in etags:
+                        state["etag"] = etags[shard]
+        return changed
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "local": self.local,
+                "max_resident": self.max_resident,
+                "known": len(self._index or {}),
+                "resident": {
+                    shard: {"encodings": len(state["gallery"]), "version": state["version"]}
+                    for shard, state in self._resident.items()
+                },
+                "hits_by_shard": dict(self._hits),
+                **self._counters,
+            }
+
+
+_shard_set: FaceShardSet | None = None
+
+
+def get_face_shard_set() -> FaceShardSet | None:
+    """The other shards of this kiosk, or None when the store is not sharded."""
+    global _shard_set
+    shard = local_shard()
+    if shard is None:
+        return None
+    if _shard_set is None:
+        _shard_set = FaceShardSet(shard, get_face_shard_settings()["max_resident"])
+    return _shard_set
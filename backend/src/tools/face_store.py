@@ -0,0 +1,727 @@
+"""
+Face Encoding Store
+
+Versioned on-disk snapshot of the face gallery:
+
+    manifest.json           {"version", "count", "dim", "dtype", "scale", "checksum", ...}
+    encodings-v<N>.npy      (count, dim) matrix: float32, float16 or int8 codes
+    ids-v<N>.json           employee ids, parallel to the matrix rows
+    deltas/<seq>.json       add/remove records appended after the snapshot
+
+Readers memory-map the matrix (zero-copy, shared page cache across worker
+processes). Writers create the next version's files first and atomically
+replace the manifest last, so a reader never sees a half-written snapshot.
+S3 mirrors the same layout under ``FACE_STORE_S3_PREFIX`` and is the sync
+target between nodes. With chunked transfer the matrix travels as
+``encodings-v<N>.npy.zst``: fixed-size slices of the ``.npy`` file, each
+zstd-compressed on its own, with the chunk index in the remote manifest.
+Readers fetch chunks with parallel ranged GETs and stream-decompress each
+one straight into its slot of the local file, which is then memory-mapped.
+
+Registrations never rewrite the snapshot. Each one appends a delta record
+whose sequence number is claimed with a create-only write (S3 ``If-None-Match``
+or ``O_EXCL`` locally), so concurrent registrations cannot overwrite each
+other. Readers replay deltas newer than the snapshot's ``applied_seq`` and
+compaction periodically folds them into a new snapshot.
+
+Compact dtypes (``FACE_GALLERY_DTYPE``) shrink both the files and S3
+transfer; int8 snapshots carry their per-dimension scale in the manifest.
+Deltas stay float32, since they are few and get folded on compaction.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Sequence
+
+import numpy as np
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
+
+from .face_quantize import dequantize, normalize_dtype, quantize
+
+
+MANIFEST_NAME = "manifest.json"
+DELTA_DIR = "deltas"
+# Snapshots and deltas written before the embedder was recorded came from dlib
+LEGACY_EMBEDDER = "dlib-resnet-128"
+KEEP_VERSIONS = 2
+CHUNKED_SUFFIX = ".zst"
+# Decompressed bytes written per step while a chunk streams in
+STREAM_BLOCK = 1 << 20
+_CONFLICT_CODES = {"PreconditionFailed", "ConditionalRequestConflict", "412", "409"}
+
+
+@dataclass
+class FaceSnapshot:
+    version: int
+    encodings: np.ndarray
+    employee_ids: list[str]
+    manifest: dict[str, Any] = field(default_factory=dict)
+
+    def as_encoding_data(self) -> dict[str, Any]:
+        return {
+            "encodings": self.encodings,
+            "scale": self.scale,
+            "employee_ids": self.employee_ids,
+            "version": self.version,
+            "applied_seq": self.applied_seq,
+            "embedder": self.manifest.get("embedder") or LEGACY_EMBEDDER,
+        }
+
+    @property
+    def applied_seq(self) -> int:
+        return int(self.manifest.get("applied_seq", 0))
+
+    @property
+    def scale(self) -> np.ndarray | None:
+        scale = self.manifest.get("scale")
+        return np.asarray(scale, dtype=np.float32) if scale is not None else None
+
+    def float_encodings(self) -> np.ndarray:
+        """The rows as float32, dequantising compact snapshots."""
+        if self.encodings.dtype == np.float32:
+            return self.encodings
+        return dequantize(self.encodings, self.scale)
+
+
+def _encodings_name(version: int) -> str:
+    return f"encodings-v{version}.npy"
+
+
+def _ids_name(version: int) -> str:
+    return f"ids-v{version}.json"
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_name, path)
+    except Exception:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def _npy_bytes(matrix: np.ndarray) -> bytes:
+    import io
+
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(matrix), allow_pickle=False)
+    return buffer.getvalue()
+
+
+def read_manifest(store_dir: Path) -> dict[str, Any] | None:
+    path = Path(store_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception as exc:
+        print(f"[FaceStore] Failed to read manifest {path}: {exc}")
+        return None
+
+
+def load_snapshot(store_dir: Path, verify: bool = False) -> FaceSnapshot | None:
+    """Memory-map the snapshot named by the local manifest."""
+    store_dir = Path(store_dir)
+    manifest = read_manifest(store_dir)
+    if not manifest:
+        return None
+
+    encodings_path = store_dir / manifest["encodings_file"]
+    ids_path = store_dir / manifest["ids_file"]
+    try:
+        if verify and _sha256(encodings_path.read_bytes()) != manifest.get("checksum"):
+            print(f"[FaceStore] Checksum mismatch for {encodings_path}")
+            return None
+        encodings = np.load(encodings_path, mmap_mode="r", allow_pickle=False)
+        employee_ids = json.loads(ids_path.read_text(encoding="utf-8"))
+    except Exception as exc:
+        print(f"[FaceStore] Failed to load snapshot v{manifest.get('version')}: {exc}")
+        return None
+
+    return FaceSnapshot(int(manifest["version"]), encodings, list(employee_ids), manifest)
+
+
+def _install_files(store_dir: Path, version: int, npy: bytes | None, ids_blob: bytes, manifest: dict[str, Any]) -> None:
+    """Install a version; ``npy=None`` means the encodings file is already in place."""
+    if npy is not None:
+        _atomic_write(store_dir / manifest["encodings_file"], npy)
+    _atomic_write(store_dir / manifest["ids_file"], ids_blob)
+    _atomic_write(store_dir / MANIFEST_NAME, json.dumps(manifest, indent=2).encode("utf-8"))
+    _prune_old_versions(store_dir, version)
+
+
+def _prune_old_versions(store_dir: Path, current: int) -> None:
+    for path in store_dir.glob("*-v*.*"):
+        try:
+            version = int(path.stem.rsplit("-v", 1)[1])
+        except (IndexError, ValueError):
+            continue
+        if version <= current - KEEP_VERSIONS:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def write_snapshot(
+    store_dir: Path,
+    encodings: Sequence | np.ndarray,
+    employee_ids: Sequence[str],
+    version: int | None = None,
+    applied_seq: int = 0,
+    source: str = "snapshot",
+    embedder: str | None = None,
+    dtype: str = "float32",
+    scale: np.ndarray | None = None,
+    base_version: int | None = None,
+    base_applied_seq: int | None = None,
+) -> FaceSnapshot:
+    """Write the next snapshot version locally and return it memory-mapped.
+
+    ``embedder`` names the backend embedding space the vectors live in.
+    ``dtype`` is the stored layout; for int8 the previous snapshot's
+    ``scale`` keeps unchanged rows bit-identical across compactions.
+    A compaction records the snapshot it folded deltas into as
+    ``base_version`` / ``base_applied_seq``.
+    """
+    store_dir = Path(store_dir)
+    matrix = np.asarray(encodings, dtype=np.float32)
+    if matrix.size == 0 and matrix.ndim != 2:
+        # No rows and no width: the first registration sets it
+        matrix = np.empty((0, 0), dtype=np.float32)
+    ids = [str(employee_id) for employee_id in employee_ids]
+    if len(ids) != len(matrix):
+        raise ValueError(f"{len(matrix)} encodings but {len(ids)} employee ids")
+
+    if version is None:
+        current = read_manifest(store_dir) or {}
+        version = int(current.get("version", 0)) + 1
+
+    dtype = normalize_dtype(dtype)
+    codes, scale = quantize(matrix, dtype, scale)
+    npy = _npy_bytes(codes)
+    ids_blob = json.dumps(ids).encode("utf-8")
+    manifest = {
+        "version": version,
+        "count": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]),
+        "dtype": dtype,
+        "scale": [float(value) for value in scale] if scale is not None else None,
+        "checksum": _sha256(npy),
+        "ids_checksum": _sha256(ids_blob),
+        "encodings_file": _encodings_name(version),
+        "ids_file": _ids_name(version),
+        "applied_seq": int(applied_seq),
+        "source": source,
+        "base_version": base_version,
+        "base_applied_seq": base_applied_seq,
+        "embedder": embedder,
+        "created_at": time.time(),
+    }
+    _install_files(store_dir, version, npy, ids_blob, manifest)
+    return load_snapshot(store_dir)
+
+
+# ---------------------------------------------------
+# S3 sync
+# ---------------------------------------------------
+def _s3_key(prefix: str, name: str) -> str:
+    prefix = (prefix or "").strip("/")
+    return f"{prefix}/{name}" if prefix else name
+
+
+# ---------------------------------------------------
+# Delta log
+# ---------------------------------------------------
+def _delta_name(seq: int) -> str:
+    return f"{seq:012d}.json"
+
+
+def _delta_seq(name: str) -> int | None:
+    try:
+        return int(Path(name).stem)
+    except ValueError:
+        return None
+
+
+def _local_delta_seqs(store_dir: Path) -> list[int]:
+    delta_dir = Path(store_dir) / DELTA_DIR
+    if not delta_dir.exists():
+        return []
+    seqs = [_delta_seq(path.name) for path in delta_dir.glob("*.json")]
+    return sorted(seq for seq in seqs if seq is not None)
+
+
+def _remote_delta_keys(client, bucket: str, prefix: str, after_seq: int) -> list[tuple[int, str]]:
+    delta_prefix = _s3_key(prefix, f"{DELTA_DIR}/")
+    kwargs = {"Bucket": bucket, "Prefix": delta_prefix, "StartAfter": delta_prefix + _delta_name(after_seq)}
+    keys: list[tuple[int, str]] = []
+    for page in client.get_paginator("list_objects_v2").paginate(**kwargs):
+        for entry in page.get("Contents", []):
+            seq = _delta_seq(entry["Key"].rsplit("/", 1)[-1])
+            if seq is not None and seq > after_seq:
+                keys.append((seq, entry["Key"]))
+    return sorted(keys)
+
+
+def latest_delta_seq(store_dir: Path, client=None, bucket: str | None = None, prefix: str = "", after_seq: int = 0) -> int:
+    """Highest sequence number present locally or (when configured) in S3."""
+    local = _local_delta_seqs(store_dir)
+    latest = max([after_seq] + local)
+    if client is not None and bucket:
+        try:
+            remote = _remote_delta_keys(client, bucket, prefix, latest)
+        except (BotoCoreError, ClientError, NoCredentialsError) as exc:
+            print(f"[FaceStore] Failed to list remote deltas ({exc})")
+            remote = []
+        if remote:
+            latest = max(latest, remote[-1][0])
+    return latest
+
+
+def _write_local_delta(store_dir: Path, record: dict[str, Any], exclusive: bool) -> bool:
+    path = Path(store_dir) / DELTA_DIR / _delta_name(record["seq"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if not exclusive:
+        _atomic_write(path, json.dumps(record).encode("utf-8"))
+        return True
+    try:
+        with open(path, "x", encoding="utf-8") as handle:
+            json.dump(record, handle)
+    except FileExistsError:
+        return False
+    return True
+
+
+def append_delta(
+    store_dir: Path,
+    op: str,
+    employee_id: str,
+    encoding: np.ndarray | None = None,
+    client=None,
+    bucket: str | None = None,
+    prefix: str = "",
+    max_attempts: int = 50,
+    embedder: str | None = None,
+) -> dict[str, Any] | None:
+    """Claim the next sequence number and record one add/remove.
+
+    With S3 configured the remote object is the authority (create-only put);
+    the local file is a mirror. Without S3 the local ``O_EXCL`` create claims it.
+    """
+    if op not in {"add", "remove"}:
+        raise ValueError(f"Unknown delta op '{op}'")
+
+    remote = client is not None and bool(bucket)
+    seq = latest_delta_seq(store_dir, client, bucket, prefix, after_seq=_manifest_seq(store_dir)) + 1
+    for _ in range(max_attempts):
+        record = {
+            "seq": seq,
+            "op": op,
+            "employee_id": employee_id,
+            "created_at": time.time(),
+        }
+        if encoding is not None:
+            record["encoding"] = [float(value) for value in np.asarray(encoding, dtype=np.float32).ravel()]
+            record["embedder"] = embedder
+
+        if remote:
+            try:
+                client.put_object(
+                    Bucket=bucket,
+                    Key=_s3_key(prefix, f"{DELTA_DIR}/{_delta_name(seq)}"),
+                    Body=json.dumps(record).encode("utf-8"),
+                    ContentType="application/json",
+                    IfNoneMatch="*",
+                )
+            except ClientError as exc:
+                if exc.response.get("Error", {}).get("Code") in _CONFLICT_CODES:
+                    seq += 1
+                    continue
+                print(f"[FaceStore] Failed to append delta {seq} ({exc})")
+                return None
+            except (BotoCoreError, NoCredentialsError) as exc:
+                print(f"[FaceStore] Failed to append delta {seq} ({exc})")
+                return None
+            _write_local_delta(store_dir, record, exclusive=False)
+            return record
+
+        if _write_local_delta(store_dir, record, exclusive=True):
+            return record
+        seq += 1
+
+    print(f"[FaceStore] Gave up claiming a delta sequence after {max_attempts} attempts")
+    return None
+
+
+def _manifest_seq(store_dir: Path) -> int:
+    return int((read_manifest(store_dir) or {}).get("applied_seq", 0))
+
+
+def delta_embedder(record: dict[str, Any]) -> str:
+    """Embedding space of an ``add`` record; records written before backends existed are dlib."""
+    return record.get("embedder") or LEGACY_EMBEDDER
+
+
+def read_deltas(
+    store_dir: Path,
+    after_seq: int,
+    client=None,
+    bucket: str | None = None,
+    prefix: str = "",
+) -> list[dict[str, Any]]:
+    """Delta records with ``seq > after_seq`` in order; remote ones are mirrored locally."""
+    store_dir = Path(store_dir)
+    if client is not None and bucket:
+        local = set(_local_delta_seqs(store_dir))
+        try:
+            for seq, key in _remote_delta_keys(client, bucket, prefix, after_seq):
+                if seq in local:
+                    continue
+                body = client.get_object(Bucket=bucket, Key=key)["Body"].read()
+                _write_local_delta(store_dir, json.loads(body), exclusive=False)
+        except (BotoCoreError, ClientError, NoCredentialsError) as exc:
+            print(f"[FaceStore] Failed to read remote deltas ({exc})")
+
+    records: list[dict[str, Any]] = []
+    for seq in _local_delta_seqs(store_dir):
+        if seq <= after_seq:
+            continue
+        path = store_dir / DELTA_DIR / _delta_name(seq)
+        try:
+            records.append(json.loads(path.read_text(encoding="utf-8")))
+        except Exception as exc:
+            print(f"[FaceStore] Skipping unreadable delta {path.name}: {exc}")
+    return records
+
+
+def fold_deltas(
+    encodings: np.ndarray,
+    employee_ids: Sequence[str],
+    deltas: Sequence[dict[str, Any]],
+    max_templates: int | None = None,
+    embedder: str | None = None,
+) -> tuple[np.ndarray, list[str]]:
+    """Apply delta records to a base matrix, returning the compacted matrix and ids.
+
+    With ``max_templates`` only each employee's newest templates survive,
+    matching what ``FaceGallery.add`` keeps in memory. With ``embedder``,
+    ``add`` records from a different embedding space are dropped.
+    """
+    base = np.asarray(encodings, dtype=np.float32)
+    if embedder:
+        deltas = [record for record in deltas if record["op"] != "add" or delta_embedder(record) == embedder]
+    if base.ndim == 2 and base.size:
+        dim = base.shape[1]
+    else:
+        fallback = base.shape[1] if base.ndim == 2 else 0
+        dim = next((len(record["encoding"]) for record in deltas if record["op"] == "add"), fallback)
+    ids = list(employee_ids)[: len(base)]
+    active = [True] * len(ids)
+    added: list[np.ndarray] = []
+    rows_by_id: dict[str, list[int]] = {}
+    for row, employee_id in enumerate(ids):
+        rows_by_id.setdefault(employee_id, []).append(row)
+
+    for record in deltas:
+        employee_id = record["employee_id"]
+        if record["op"] == "add":
+            added.append(np.asarray(record["encoding"], dtype=np.float32))
+            rows_by_id.setdefault(employee_id, []).append(len(ids))
+            ids.append(employee_id)
+            active.append(True)
+        elif record["op"] == "remove":
+            for row in rows_by_id.pop(employee_id, []):
+                active[row] = False
+
+    if max_templates:
+        for rows in rows_by_id.values():
+            for row in rows[:-max_templates]:
+                active[row] = False
+
+    matrix = np.vstack([base.reshape(len(base), dim)] + [row.reshape(1, dim) for row in added])
+    keep = np.flatnonzero(active)
+    return np.ascontiguousarray(matrix[keep]), [ids[row] for row in keep]
+
+
+def delete_deltas(store_dir: Path, upto_seq: int, client=None, bucket: str | None = None, prefix: str = "") -> int:
+    """Remove delta records with ``seq <= upto_seq`` locally and in S3."""
+    removed = 0
+    for seq in _local_delta_seqs(store_dir):
+        if seq > upto_seq:
+            break
+        try:
+            (Path(store_dir) / DELTA_DIR / _delta_name(seq)).unlink()
+            removed += 1
+        except OSError:
+            pass
+
+    if client is not None and bucket and upto_seq > 0:
+        try:
+            for seq, key in _remote_delta_keys(client, bucket, prefix, 0):
+                if seq > upto_seq:
+                    break
+                client.delete_object(Bucket=bucket, Key=key)
+        except (BotoCoreError, ClientError, NoCredentialsError) as exc:
+            print(f"[FaceStore] Failed to delete remote deltas ({exc})")
+    return removed
+
+
+def fetch_remote_manifest(client, bucket: str, prefix: str) -> dict[str, Any] | None:
+    try:
+        response = client.get_object(Bucket=bucket, Key=_s3_key(prefix, MANIFEST_NAME))
+        return json.loads(response["Body"].read())
+    except ClientError as exc:
+        code = exc.response.get("Error", {}).get("Code")
+        if code not in {"NoSuchKey", "404"}:
+            print(f"[FaceStore] Failed to fetch remote manifest ({exc})")
+    except (BotoCoreError, NoCredentialsError) as exc:
+        print(f"[FaceStore] Failed to fetch remote manifest ({exc})")
+    except Exception as exc:
+        print(f"[FaceStore] Unexpected error fetching remote manifest: {exc}")
+    return None
+
+
+def remote_manifest_etag(client, bucket: str, prefix: str) -> str | None:
+    """ETag of the remote manifest, or None when it is missing or unreachable."""
+    try:
+        response = client.head_object(Bucket=bucket, Key=_s3_key(prefix, MANIFEST_NAME))
+    except ClientError as exc:
+        code = exc.response.get("Error", {}).get("Code")
+        if code not in {"NoSuchKey", "404"}:
+            print(f"[FaceStore] Failed to check remote manifest ({exc})")
+        return None
+    except (BotoCoreError, NoCredentialsError) as exc:
+        print(f"[FaceStore] Failed to check remote manifest ({exc})")
+        return None
+    return response.get("ETag")
+
+
+def next_snapshot_version(store_dir: Path, client=None, bucket: str | None = None, prefix: str = "") -> int:
+    """Next version number, above both the local and the remote manifest."""
+    local = read_manifest(store_dir) or {}
+    remote = fetch_remote_manifest(client, bucket, prefix) if client is not None and bucket else None
+    return max(int(local.get("version", 0)), int((remote or {}).get("version", 0))) + 1
+
+
+# ---------------------------------------------------
+# Chunked, compressed matrix transfer
+# ---------------------------------------------------
+def _compress_chunks(path: Path, out, chunk_bytes: int, level: int, workers: int) -> list[dict[str, Any]]:
+    """Write ``path`` to ``out`` as independently zstd-compressed chunks; returns the chunk index."""
+    import zstandard
+
+    raw_size = path.stat().st_size
+    spans = [(start, min(chunk_bytes, raw_size - start)) for start in range(0, raw_size, chunk_bytes)]
+
+    def compress(span: tuple[int, int]) -> tuple[bytes, str]:
+        with open(path, "rb") as handle:
+            handle.seek(span[0])
+            raw = handle.read(span[1])
+        return zstandard.ZstdCompressor(level=level).compress(raw), _sha256(raw)
+
+    chunks: list[dict[str, Any]] = []
+    offset = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="face-store-zstd") as pool:
+        for (raw_offset, raw_length), (compressed, digest) in zip(spans, pool.map(compress, spans)):
+            out.write(compressed)
+            chunks.append(
+                {
+                    "offset": offset,
+                    "length": len(compressed),
+                    "raw_offset": raw_offset,
+                    "raw_length": raw_length,
+                    "sha256": digest,
+                }
+            )
+            offset += len(compressed)
+    return chunks
+
+
+def _download_chunked(client, bucket: str, key: str, transfer: dict[str, Any], dest: Path, workers: int) -> None:
+    """Fetch every chunk with a ranged GET and decompress it into its slot of ``dest``."""
+    import zstandard
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{dest.name}.", dir=dest.parent)
+
+    def fetch(chunk: dict[str, Any]) -> None:
+        end = chunk["offset"] + chunk["length"] - 1
+        body = client.get_object(Bucket=bucket, Key=key, Range=f"bytes={chunk['offset']}-{end}")["Body"]
+        digest = hashlib.sha256()
+        position = chunk["raw_offset"]
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+                while True:
+                    block = reader.read(STREAM_BLOCK)
+                    if not block:
+                        break
+                    os.pwrite(fd, block, position)
+                    digest.update(block)
+                    position += len(block)
+        except zstandard.ZstdError as exc:
+            raise ValueError(f"chunk at {chunk['raw_offset']} does not decompress: {exc}") from exc
+        if position - chunk["raw_offset"] != chunk["raw_length"] or digest.hexdigest() != chunk["sha256"]:
+            raise ValueError(f"chunk at {chunk['raw_offset']} failed verification")
+
+    try:
+        os.ftruncate(fd, int(transfer["raw_size"]))
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="face-store-fetch") as pool:
+            for _ in pool.map(fetch, transfer["chunks"]):
+                pass
+        os.fsync(fd)
+        os.close(fd)
+        fd = -1
+        os.replace(tmp_name, dest)
+    except BaseException:
+        if fd >= 0:
+            os.close(fd)
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def sync_from_s3(store_dir: Path, client, bucket: str, prefix: str, workers: int = 8) -> bool:
+    """Download the remote snapshot when it is newer than the local one.
+
+    Chunked snapshots are fetched with ``workers`` parallel ranged GETs.
+    Returns True when the local store holds the remote version afterwards.
+    """
+    store_dir = Path(store_dir)
+    remote = fetch_remote_manifest(client, bucket, prefix)
+    if not remote:
+        return False
+
+    local = read_manifest(store_dir) or {}
+    if int(local.get("version", 0)) >= int(remote.get("version", 0)):
+        return True
+
+    transfer = remote.get("transfer")
+    started = time.perf_counter()
+    try:
+        ids_blob = client.get_object(Bucket=bucket, Key=_s3_key(prefix, remote["ids_file"]))["Body"].read()
+        if transfer:
+            key = _s3_key(prefix, transfer["file"])
+            _download_chunked(client, bucket, key, transfer, store_dir / remote["encodings_file"], workers)
+            npy = None
+        else:
+            npy = client.get_object(Bucket=bucket, Key=_s3_key(prefix, remote["encodings_file"]))["Body"].read()
+    except (BotoCoreError, ClientError, NoCredentialsError) as exc:
+        print(f"[FaceStore] Failed to download snapshot v{remote.get('version')} ({exc})")
+        return False
+    except ImportError:
+        print(f"[FaceStore] zstandard is not installed; cannot read chunked snapshot v{remote.get('version')}")
+        return False
+    except ValueError as exc:
+        print(f"[FaceStore] Corrupt chunk in remote snapshot v{remote.get('version')} ({exc}); ignoring")
+        return False
+
+    if (npy is not None and _sha256(npy) != remote.get("checksum")) or _sha256(ids_blob) != remote.get("ids_checksum"):
+        print(f"[FaceStore] Checksum mismatch for remote snapshot v{remote.get('version')}; ignoring")
+        return False
+
+    _install_files(store_dir, int(remote["version"]), npy, ids_blob, remote)
+    how = f"{len(transfer['chunks'])} chunks" if transfer else "single object"
+    print(
+        f"[FaceStore] Synced snapshot v{remote['version']} ({remote.get('count')} encodings) from S3 "
+        f"in {time.perf_counter() - started:.2f}s ({how})"
+    )
+    return True
+
+
+def publish_to_s3(
+    store_dir: Path,
+    client,
+    bucket: str,
+    prefix: str,
+    chunk_bytes: int = 0,
+    level: int = 3,
+    workers: int = 8,
+) -> bool:
+    """Upload the local snapshot; the manifest goes last so readers never see partial data.
+
+    With ``chunk_bytes`` the matrix is uploaded as zstd-compressed chunks and
+    the chunk index is added to the remote manifest; otherwise as plain ``.npy``.
+    """
+    store_dir = Path(store_dir)
+    manifest = read_manifest(store_dir)
+    if not manifest:
+        return False
+
+    remote = {key: value for key, value in manifest.items() if key != "transfer"}
+    try:
+        if chunk_bytes > 0:
+            try:
+                remote["transfer"] = _upload_chunked(store_dir, manifest, client, bucket, prefix, chunk_bytes, level, workers)
+            except ImportError:
+                print("[FaceStore] zstandard is not installed; publishing the plain matrix")
+                chunk_bytes = 0
+        names = [manifest["ids_file"]] if chunk_bytes > 0 else [manifest["encodings_file"], manifest["ids_file"]]
+        for name in names:
+            client.put_object(
+                Bucket=bucket,
+                Key=_s3_key(prefix, name),
+                Body=(store_dir / name).read_bytes(),
+                ContentType="application/octet-stream",
+            )
+        client.put_object(
+            Bucket=bucket,
+            Key=_s3_key(prefix, MANIFEST_NAME),
+            Body=json.dumps(remote, indent=2).encode("utf-8"),
+            ContentType="application/json",
+        )
+    except (BotoCoreError, ClientError, NoCredentialsError) as exc:
+        print(f"[FaceStore] Failed to publish snapshot v{manifest.get('version')} ({exc})")
+        return False
+    except Exception as exc:
+        print(f"[FaceStore] Unexpected error publishing snapshot: {exc}")
+        return False
+
+    print(f"[FaceStore] Published snapshot v{manifest['version']} to s3://{bucket}/{_s3_key(prefix, '')}")
+    return True
+
+
+def _upload_chunked(
+    store_dir: Path, manifest: dict[str, Any], client, bucket: str, prefix: str, chunk_bytes: int, level: int, workers: int
+) -> dict[str, Any]:
+    """Compress the matrix into one chunked object and upload it (multipart for large files)."""
+    path = store_dir / manifest["encodings_file"]
+    name = manifest["encodings_file"] + CHUNKED_SUFFIX
+    with tempfile.TemporaryFile(dir=store_dir) as out:
+        chunks = _compress_chunks(path, out, chunk_bytes, level, workers)
+        compressed_size = out.tell()
+        out.seek(0)
+        client.upload_fileobj(out, bucket, _s3_key(prefix, name), ExtraArgs={"ContentType": "application/zstd"})
+    raw_size = path.stat().st_size
+    print(
+        f"[FaceStore] Compressed {raw_size / 1e6:.1f} MB into {len(chunks)} chunk(s), "
+        f"{compressed_size / 1e6:.1f} MB ({compressed_size / max(raw_size, 1):.0%})"
+    )
+    return {
+        "file": name,
+        "compression": "zstd",
+        "chunk_bytes": chunk_bytes,
+        "raw_size": raw_size,
+        "compressed_size": compressed_size,
+        "chunks": chunks,
+    }
@@ -0,0 +1,240 @@
+"""
+Face Worker Pool
+
+Runs the CPU-bound half of face verification (``match_face_image``) in a
+bounded process pool so the FastAPI event loop keeps serving signal polling
+and token requests while the face backend works. Each worker preloads the
+backend models and the gallery once at start-up. Workers are started from a
+fresh interpreter (forkserver, or spawn where that is unavailable), never
+forked from the server: by then the server runs the gallery refresher,
+post-match and flow writer threads, and a child forked while one of them
+holds a lock would deadlock. A pool whose worker died (``BrokenProcessPool``)
+is replaced on the next job.
+"""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+from .config import get_face_pool_settings
+
+
+class FacePoolBusy(Exception):
+    """Raised when the pool queue is full; callers should answer 503."""
+
+
+class FacePoolTimeout(Exception):
+    """Raised when a job does not finish within the per-job timeout."""
+
+
+# ---------------------------------------------------
+# Worker process side
+# ---------------------------------------------------
+_worker_generation: int | None = None
+
+
+def _init_worker(generation: int) -> None:
+    """Warm the worker; ``generation`` is the server's gallery generation when the pool started."""
+    global _worker_generation
+    from .face_backends import get_face_backend
+    from .face_recognition import get_face_gallery
+
+    # Load the detector and embedder once so the first real job is warm
+    get_face_backend().warm_up()
+    get_face_gallery()
+    # The gallery just loaded is at least this recent, so a job from a later generation refreshes it
+    _worker_generation = generation
+
+
+def _match_in_worker(image_bytes: bytes, generation: int, hint=None) -> tuple[dict[str, Any], float, float]:
+    global _worker_generation
+    from .face_recognition import match_face_image, refresh_face_gallery
+
+    started_at = time.time()
+    if generation != _worker_generation:
+        refresh_face_gallery()
+    _worker_generation = generation
+    result = match_face_image(image_bytes, hint)
+    return result, started_at, time.time()
+
+
+# ---------------------------------------------------
+# Server side
+# ---------------------------------------------------
+def _worker_context():
+    """Start method for workers: never ``fork`` (see the module docstring)."""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class FaceWorkerPool:
+    """Bounded pool with queue-depth backpressure, timeouts and metrics."""
+
+    def __init__(self, workers: int, max_queue: int, timeout: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor: ProcessPoolExecutor | None = None
+        # Broken pools are dropped from the executor's callback thread
+        self._executor_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._busy_seconds = 0.0
+        self._started = time.time()
+        self._wait_ms: deque[float] = deque(maxlen=500)
+        self._run_ms: deque[float] = deque(maxlen=500)
+        self._counters = {"submitted": 0, "completed": 0, "rejected": 0, "timeouts": 0, "failed": 0}
+
+    @property
+    def capacity(self) -> int:
+        return max(1, self.workers) + self.max_queue
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        from .face_recognition import get_gallery_generation
+
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=_worker_context(),
+                    initializer=_init_worker,
+                    initargs=(get_gallery_generation(),),
+                )
+            return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        """Drop a broken executor so the next job starts a fresh one."""
+        with self._executor_lock:
+            if self._executor is executor:
+                print("[FacePool] Worker pool broke, starting a new one on the next job")
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, image_bytes: bytes, hint=None) -> Future:
+        from .face_recognition import get_gallery_generation
+
+        executor = self._get_executor()
+        try:
+            future = executor.submit(_match_in_worker, image_bytes, get_gallery_generation(), hint)
+        except BrokenProcessPool:
+            # A worker died since the last job; nothing was queued on the old pool
+            self._discard_executor(executor)
+            executor = self._get_executor()
+            future = executor.submit(_match_in_worker, image_bytes, get_gallery_generation(), hint)
+        future.add_done_callback(lambda done: self._check_broken(done, executor))
+        return future
+
+    def _check_broken(self, future: Future, executor: ProcessPoolExecutor) -> None:
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            self._discard_executor(executor)
+
+    def _reserve(self) -> None:
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                self._counters["rejected"] += 1
+                raise FacePoolBusy(f"Face verification queue is full ({self._in_flight} jobs)")
+            self._in_flight += 1
+            self._counters["submitted"] += 1
+
+    def _release(self, future: Future, submitted_at: float) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self._counters["failed"] += 1
+                return
+            _, started_at, finished_at = future.result()
+            self._counters["completed"] += 1
+            self._busy_seconds += finished_at - started_at
+            self._wait_ms.append(max(0.0, started_at - submitted_at) * 1000)
+            self._run_ms.append((finished_at - started_at) * 1000)
+
+    async def match(self, image_bytes: bytes, hint=None) -> dict[str, Any]:
+        """Run ``match_face_image`` off the event loop (``hint``: parsed client ROI hint).
+
+        Raises ``FacePoolBusy`` when the queue is full and ``FacePoolTimeout``
+        when the job exceeds the per-job timeout.
+        """
+        self._reserve()
+        submitted_at = time.time()
+        try:
+            if self.workers > 0:
+                future = self._submit(image_bytes, hint)
+            else:
+                future = Future()
+                threading.Thread(
+                    target=self._run_inline, args=(future, image_bytes, hint), daemon=True
+                ).start()
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+                self._counters["failed"] += 1
+            raise
+        future.add_done_callback(lambda done: self._release(done, submitted_at))
+
+        try:
+            result, _, _ = await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._counters["timeouts"] += 1
+            raise FacePoolTimeout(f"Face verification exceeded {self.timeout:.1f}s")
+        return result
+
+    @staticmethod
+    def _run_inline(future: Future, image_bytes: bytes, hint=None) -> None:
+        from .face_recognition import match_face_image
+
+        if not future.set_running_or_notify_cancel():
+            return
+        started_at = time.time()
+        try:
+            result = match_face_image(image_bytes, hint)
+        except Exception as exc:
+            future.set_exception(exc)
+            return
+        future.set_result((result, started_at, time.time()))
+
+    def metrics(self) -> dict[str, Any]:
+        with self._lock:
+            elapsed = max(time.time() - self._started, 1e-6)
+            wait_ms = sorted(self._wait_ms)
+            run_ms = sorted(self._run_ms)
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "timeout_seconds": self.timeout,
+                "in_flight": self._in_flight,
+                "queued": max(0, self._in_flight - max(1, self.workers)),
+                "utilisation": round(self._busy_seconds / (elapsed * max(1, self.workers)), 4),
+                "wait_ms_avg": round(sum(wait_ms) / len(wait_ms), 2) if wait_ms else 0.0,
+                "wait_ms_p95": round(wait_ms[int(0.95 * (len(wait_ms) - 1))], 2) if wait_ms else 0.0,
+                "run_ms_avg": round(sum(run_ms) / len(run_ms), 2) if run_ms else 0.0,
+                **self._counters,
+            }
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_pool: FaceWorkerPool | None = None
+
+
+def get_face_worker_pool() -> FaceWorkerPool:
+    global _pool
+    if _pool is None:
+        _pool = FaceWorkerPool(**get_face_pool_settings())
+    return _pool
+
+
+def shutdown_face_worker_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
@@ -1,9 +1,16 @@
+import argparse
+import asyncio
+import hashlib
+import json
 import pickle
+import random
+import tempfile
+import time
 from pathlib import Path
+from typing import Any, Callable
 from urllib.parse import urlparse
 
-import requests
-
+import aiohttp
 import boto3
 from botocore.exceptions import BotoCoreError, ClientError 
 
@@ -16,6 +23,8 @@ try:
         FACE_IMAGE_PREFIX,
         FACE_IMAGE_EXTENSION,
         FACE_ENCODING_S3_KEY,
+        FACE_HARVEST_STATE_KEY,
+        get_face_harvest_settings,
     )
 except ImportError:
     import importlib.util
@@ -33,6 +42,13 @@ except ImportError:
     FACE_IMAGE_PREFIX = _config.FACE_IMAGE_PREFIX
     FACE_IMAGE_EXTENSION = _config.FACE_IMAGE_EXTENSION
     FACE_ENCODING_S3_KEY = _config.FACE_ENCODING_S3_KEY
+    FACE_HARVEST_STATE_KEY = _config.FACE_HARVEST_STATE_KEY
+    get_face_harvest_settings = _config.get_face_harvest_settings
+
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+SPOOL_MAX_MEMORY = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
 
 
 def _image_bucket() -> str | None:
@@ -117,7 +133,250 @@ def upload_employee_images_pickle(data: dict[str, dict[str, str]]) -> bool:
         return False
 
 
-def main() -> None:
+def _harvest_state_key() -> str:
+    if FACE_HARVEST_STATE_KEY:
+        return FACE_HARVEST_STATE_KEY.strip("/")
+    return "/".join(segment for segment in [_image_prefix(), "_harvest_state.json"] if segment)
+
+
+def _photo_key(prefix: str, employee_id: str, photo_url: str) -> str:
+    return "/".join(segment for segment in [prefix, f"{employee_id}.{_guess_extension(photo_url)}"] if segment)
+
+
+def load_harvest_state(s3_client, bucket: str, key: str) -> dict[str, dict[str, Any]]:
+    """Per-employee validators (ETag, Last-Modified, content hash) from the previous run."""
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") not in {"NoSuchKey", "404"}:
+            print(f"Failed to read harvest state s3://{bucket}/{key}: {exc}")
+        return {}
+    except BotoCoreError as exc:
+        print(f"Failed to read harvest state s3://{bucket}/{key}: {exc}")
+        return {}
+    try:
+        return json.loads(body).get("employees", {})
+    except ValueError:
+        print("Harvest state is corrupt; every photo will be fetched again.")
+        return {}
+
+
+def save_harvest_state(s3_client, bucket: str, key: str, state: dict[str, dict[str, Any]]) -> bool:
+    payload = json.dumps({"updated_at": time.time(), "employees": state}).encode("utf-8")
+    try:
+        s3_client.put_object(Bucket=bucket, Key=key, Body=payload, ContentType="application/json")
+        return True
+    except (BotoCoreError, ClientError) as exc:
+        print(f"Failed to save harvest state to s3://{bucket}/{key}: {exc}")
+        return False
+
+
+class HarvestError(Exception):
+    """A photo could not be fetched (after retries, or for a non-retryable reason)."""
+
+
+def _retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    if retry_after:
+        try:
+            return min(30.0, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+    return 0.5 * 2 ** (attempt - 1) + random.uniform(0, 0.25)
+
+
+async def _download_photo(
+    session: aiohttp.ClientSession,
+    url: str,
+    previous: dict[str, Any] | None,
+    settings: dict[str, Any],
+    stats: dict[str, Any],
+) -> tuple[dict[str, Any] | None, Any]:
+    """Conditional GET streamed into a spooled temp file.
+
+    Returns ``(None, None)`` on 304 Not Modified, otherwise the response
+    validators and the spooled body (rewound).
+    """
+    headers = {}
+    if previous and previous.get("photo_url") == url:
+        if previous.get("etag"):
+            headers["If-None-Match"] = previous["etag"]
+        if previous.get("last_modified"):
+            headers["If-Modified-Since"] = previous["last_modified"]
+
+    for attempt in range(1, settings["max_attempts"] + 1):
+        stats["requests"] += 1
+        try:
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    return None, None
+                if response.status >= 400:
+                    if response.status in RETRYABLE_STATUS and attempt < settings["max_attempts"]:
+                        stats["retries"] += 1
+                        await asyncio.sleep(_retry_delay(attempt, response.headers.get("Retry-After")))
+                        continue
+                    raise HarvestError(f"HTTP {response.status}")
+
+                spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+                digest = hashlib.sha256()
+                size = 0
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > settings["max_bytes"]:
+                        spool.close()
+                        raise HarvestError(f"photo larger than {settings['max_bytes']} bytes")
+                    digest.update(chunk)
+                    spool.write(chunk)
+                spool.seek(0)
+                stats["bytes"] += size
+                return {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "content_type": response.headers.get("Content-Type"),
+                    "sha256": digest.hexdigest(),
+                    "bytes": size,
+                }, spool
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            if attempt == settings["max_attempts"]:
+                raise HarvestError(f"{type(exc).__name__}: {exc}") from exc
+            stats["retries"] += 1
+            await asyncio.sleep(_retry_delay(attempt))
+    raise HarvestError("retries exhausted")
+
+
+async def harvest_photos(
+    employees: dict[str, dict[str, str]],
+    state: dict[str, dict[str, Any]],
+    upload: Callable[[str, Any, str], None] | None = None,
+    settings: dict[str, Any] | None = None,
+    prefix: str = "",
+) -> dict[str, Any]:
+    """Fetch every employee photo concurrently and return the new state and the delta.
+
+    At most ``concurrency`` downloads run at once and at most ``per_host`` of
+    them against any one host, so a slow photo host only holds its own
+    slots. Unchanged photos (304, or identical bytes from hosts without
+    validators) are not uploaded. ``upload(key, fileobj, content_type)`` runs
+    in a thread; without it (dry run) nothing is written.
+
+    Returns ``{"state", "delta", "stats"}``; ``delta`` maps changed
+    employees to ``{"name", "photo_key"}``.
+    """
+    settings = settings or get_face_harvest_settings()
+    stats: dict[str, Any] = {
+        "employees": len(employees),
+        "requests": 0,
+        "retries": 0,
+        "bytes": 0,
+        "new": 0,
+        "updated": 0,
+        "unchanged": 0,
+        "failed": 0,
+        "removed": len(set(state) - set(employees)),
+        "hosts": {},
+    }
+    new_state: dict[str, dict[str, Any]] = {}
+    delta: dict[str, dict[str, str]] = {}
+    global_limit = asyncio.Semaphore(settings["concurrency"])
+    host_limits: dict[str, asyncio.Semaphore] = {}
+
+    async def harvest_one(session: aiohttp.ClientSession, employee_id: str, info: dict[str, str]) -> None:
+        url = info["photo_url"]
+        previous = state.get(employee_id)
+        host = urlparse(url).netloc.lower() or "?"
+        host_stats = stats["hosts"].setdefault(host, {"photos": 0, "failed": 0, "seconds": 0.0})
+        limit = host_limits.setdefault(host, asyncio.Semaphore(settings["per_host"]))
+
+        # Host slot first, so photos queued for a slow host never hold global slots
+        async with limit, global_limit:
+            started = time.perf_counter()
+            try:
+                validators, body = await _download_photo(session, url, previous, settings, stats)
+            except HarvestError as exc:
+                stats["failed"] += 1
+                host_stats["failed"] += 1
+                print(f"Failed to download image for {employee_id}: {exc}")
+                if previous:
+                    new_state[employee_id] = previous
+                return
+            finally:
+                host_stats["photos"] += 1
+                host_stats["seconds"] += time.perf_counter() - started
+
+        if validators is None or (
+            previous and previous.get("photo_url") == url and previous.get("sha256") == validators["sha256"]
+        ):
+            stats["unchanged"] += 1
+            entry = dict(previous, name=info.get("name", ""))
+            if validators is not None:
+                body.close()
+                entry.update(etag=validators["etag"], last_modified=validators["last_modified"])
+            new_state[employee_id] = entry
+            return
+
+        key = _photo_key(prefix, employee_id, url)
+        try:
+            if upload is not None:
+                content_type = _content_type_for_extension(_guess_extension(url))
+                await asyncio.to_thread(upload, key, body, content_type)
+                print(f"Uploaded S3 image for {employee_id} -> {key}")
+        except (BotoCoreError, ClientError) as exc:
+            stats["failed"] += 1
+            print(f"Failed to upload image for {employee_id}: {exc}")
+            if previous:
+                new_state[employee_id] = previous
+            return
+        finally:
+            body.close()
+
+        stats["updated" if previous else "new"] += 1
+        new_state[employee_id] = {
+            "name": info.get("name", ""),
+            "photo_url": url,
+            "photo_key": key,
+            "etag": validators["etag"],
+            "last_modified": validators["last_modified"],
+            "sha256": validators["sha256"],
+            "harvested_at": time.time(),
+        }
+        delta[employee_id] = {"name": info.get("name", ""), "photo_key": key}
+
+    timeout = aiohttp.ClientTimeout(total=settings["timeout"], sock_connect=min(5.0, settings["timeout"]))
+    connector = aiohttp.TCPConnector(limit=settings["concurrency"], limit_per_host=settings["per_host"])
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await asyncio.gather(*(
+            harvest_one(session, employee_id, info)
+            for employee_id, info in employees.items()
+            if info.get("photo_url")
+        ))
+    stats["elapsed_seconds"] = time.perf_counter() - started
+    return {"state": new_state, "delta": delta, "stats": stats}
+
+
+def format_harvest_report(stats: dict[str, Any]) -> str:
+    elapsed = max(stats.get("elapsed_seconds", 0.0), 1e-9)
+    lines = [
+        f"Harvested {stats['employees']} employee(s) in {elapsed:.2f}s "
+        f"({stats['employees'] / elapsed:.1f} photos/s, {stats['bytes'] / elapsed / 1e6:.2f} MB/s)",
+        f"  new {stats['new']}, updated {stats['updated']}, unchanged {stats['unchanged']}, "
+        f"failed {stats['failed']}, removed {stats['removed']}",
+        f"  requests {stats['requests']}, retries {stats['retries']}, {stats['bytes'] / 1e6:.2f} MB downloaded",
+    ]
+    for host, host_stats in sorted(stats["hosts"].items()):
+        average = host_stats["seconds"] / max(host_stats["photos"], 1)
+        lines.append(
+            f"  {host}: {host_stats['photos']} photo(s), {host_stats['failed']} failed, {average * 1000:.0f} ms avg"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Harvest employee photos into S3")
+    parser.add_argument("--dry-run", action="store_true", help="fetch and report, but upload nothing")
+    parser.add_argument("--concurrency", type=int, help="maximum downloads in flight")
+    parser.add_argument("--per-host", type=int, help="maximum downloads in flight per photo host")
+    args = parser.parse_args(argv)
+
     try:
         data = fetch_employee_images()
     except (BotoCoreError, ClientError) as exc:
@@ -136,47 +395,36 @@ def main() -> None:
         print("Missing S3 bucket configuration for employee images.")
         return
 
-    uploaded: dict[str, str] = {}
-    for employee_id, info in data.items():
-        photo_url = info.get("photo_url")
-        if not photo_url:
-            continue
+    settings = get_face_harvest_settings()
+    if args.concurrency:
+        settings["concurrency"] = max(1, args.concurrency)
+    if args.per_host:
+        settings["per_host"] = max(1, args.per_host)
 
-        try:
-            response = requests.get(photo_url, timeout=15)
-            response.raise_for_status()
-        except Exception as exc:
-            print(f"Failed to download image for {employee_id}: {exc}")
-            continue
-
-        ext = _guess_extension(photo_url)
-        key_parts = [segment for segment in [prefix, f"{employee_id}.{ext}"] if segment]
-        new_key = "/".join(key_parts)
-        content_type = _content_type_for_extension(ext)
+    state_key = _harvest_state_key()
+    state = load_harvest_state(s3_client, bucket, state_key)
 
-        try:
-            s3_client.put_object(
-                Bucket=bucket,
-                Key=new_key,
-                Body=response.content,
-                ContentType=content_type,
-            )
-            uploaded[employee_id] = new_key
-            print(f"Uploaded S3 image for {employee_id} -> {new_key}")
-        except (BotoCoreError, ClientError) as exc:
-            print(f"Failed to upload image for {employee_id}: {exc}")
+    def upload(key: str, body, content_type: str) -> None:
+        # upload_fileobj streams from the spooled file (multipart for large photos)
+        s3_client.upload_fileobj(body, bucket, key, ExtraArgs={"ContentType": content_type})
 
-    if not uploaded:
-        print("No images were uploaded; skipping pickle update.")
+    result = asyncio.run(harvest_photos(data, state, None if args.dry_run else upload, settings, prefix))
+    print(format_harvest_report(result["stats"]))
+    if args.dry_run:
+        print("Dry run: nothing was uploaded.")
         return
 
-    pickle_payload = {
-        emp_id: {"name": data[emp_id]["name"], "photo_key": uploaded[emp_id]}
-        for emp_id in uploaded
-    }
+    if result["state"] != state:
+        save_harvest_state(s3_client, bucket, state_key, result["state"])
+
+    # Only employees whose photo actually changed go into the manifest
+    delta = result["delta"]
+    if not delta:
+        print("No employee photos changed; skipping pickle update.")
+        return
 
-    if upload_employee_images_pickle(pickle_payload):
-        print(f"Uploaded {len(pickle_payload)} employee images to configured S3 location.")
+    if upload_employee_images_pickle(delta):
+        print(f"Uploaded {len(delta)} changed employee image(s) to configured S3 location.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test the incremental, resumable batch encoder behind encode_faces.py
+"""
+import sys
+import tempfile
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+from tools.face_batch_encoder import EncodeManifest, run_batch_encode, select_templates
+
+
+def _jobs(count: int, etag: str = "v1"):
+    return [{"key": f"faces/E{index:03d}.jpg", "etag": etag, "employee_id": f"E{index:03d}"} for index in range(count)]
+
+
+def _fetch(key: str) -> bytes:
+    if key.endswith("E007.jpg"):
+        raise OSError("connection reset")
+    return key.encode("utf-8")
+
+
+def _encode(image_bytes: bytes):
+    if image_bytes.endswith(b"E003.jpg"):
+        return None  # no face in this photo
+    return [float(len(image_bytes)), float(image_bytes[-5])]
+
+
+class _Crash(KeyboardInterrupt):
+    pass
+
+
+def test_batch_encoder_incremental_and_resumable():
+    print("🧪 Testing incremental, resumable batch encoding")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state_dir = Path(tmp) / "encoder"
+        jobs = _jobs(20)
+
+        # A run that dies half-way keeps everything it already checkpointed
+        encoded_before_crash = []
+
+        def crashing_encode(image_bytes):
+            if len(encoded_before_crash) == 10:
+                raise _Crash()
+            encoded_before_crash.append(image_bytes)
+            return _encode(image_bytes)
+
+        manifest = EncodeManifest(state_dir, "embedder-a")
+        manifest.load()
+        try:
+            run_batch_encode(jobs, _fetch, manifest, download_workers=4, checkpoint_every=1, encode=crashing_encode)
+            raise AssertionError("the simulated crash should propagate")
+        except _Crash:
+            pass
+
+        resumed = EncodeManifest(state_dir, "embedder-a")
+        count = resumed.load()
+        # Results still in flight when the run died are simply encoded again
+        assert 0 < count <= 10, "checkpointed images are resumed"
+        counters = run_batch_encode(jobs, _fetch, resumed, download_workers=4, encode=_encode)
+        print(f"   Resumed {count} image(s), then: {counters}")
+        assert counters["skipped"] == count
+        assert counters["encoded"] + counters["no_face"] + counters["failed"] == 20 - count
+        assert counters["failed"] == 1, "the failed download is not recorded"
+        resumed.compact([job["key"] for job in jobs])
+        assert not resumed.checkpoint_path.exists()
+
+        # Nothing changed: only the failed image is tried again
+        again = EncodeManifest(state_dir, "embedder-a")
+        again.load()
+        counters = run_batch_encode(jobs, _fetch, again, encode=_encode)
+        assert counters == {"skipped": 19, "encoded": 0, "no_face": 0, "failed": 1}, counters
+
+        # A changed ETag re-encodes just that image
+        changed = [dict(job, etag="v2") if job["employee_id"] == "E005" else job for job in jobs]
+        counters = run_batch_encode(changed, _fetch, again, encode=_encode)
+        assert counters["encoded"] == 1 and counters["skipped"] == 18
+
+        encodings, ids = select_templates(again, {job["employee_id"]: [job["key"]] for job in jobs})
+        assert "E003" not in ids and "E007" not in ids and len(ids) == 18
+        assert len(encodings) == len(ids)
+
+        # A new embedder invalidates everything
+        other = EncodeManifest(state_dir, "embedder-b")
+        other.load()
+        counters = run_batch_encode(jobs, _fetch, other, encode=_encode)
+        assert counters["skipped"] == 0 and counters["encoded"] == 18
+
+    print("\n✅ Batch Encoder Test Complete!")
+
+
+if __name__ == "__main__":
+    test_batch_encoder_incremental_and_resumable()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test the float32 face gallery matching against a brute-force reference
+"""
+import sys
+sys.path.insert(0, 'src')
+
+import numpy as np
+
+from tools.face_gallery import FaceGallery, decide_match
+
+
+def _synthetic_gallery(count: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(scale=0.09, size=(count, 128))
+    ids = [f"E{index:04d}" for index in range(count)]
+    return encodings, ids
+
+
+def test_gallery_nearest_matches_bruteforce():
+    print("🧪 Testing FaceGallery top-2 against brute force")
+    print("=" * 50)
+
+    encodings, ids = _synthetic_gallery(500)
+    gallery = FaceGallery.from_encoding_data({"encodings": list(encodings), "employee_ids": ids})
+    assert gallery.matrix.dtype == np.float32
+    assert gallery.matrix.flags["C_CONTIGUOUS"]
+    assert len(gallery) == 500
+
+    probe = encodings[42] + np.random.default_rng(1).normal(scale=0.01, size=128)
+    reference = np.linalg.norm(encodings - probe, axis=1)
+    expected = np.argsort(reference)[:2]
+
+    nearest = gallery.nearest(probe, k=2)
+    print(f"   Nearest: {nearest}")
+    assert [index for index, _ in nearest] == list(expected)
+    assert abs(nearest[0][1] - reference[expected[0]]) < 1e-4
+    assert gallery.ids[nearest[0][0]] == "E0042"
+
+    print("\n✅ FaceGallery Test Complete!")
+
+
+def test_gallery_edge_cases():
+    empty = FaceGallery.from_encoding_data({"encodings": [], "employee_ids": []})
+    assert len(empty) == 0
+    assert empty.nearest(np.zeros(128)) == []
+
+    encodings, ids = _synthetic_gallery(1)
+    single = FaceGallery.from_encoding_data({"encodings": list(encodings), "ids": ids})
+    assert len(single.nearest(encodings[0], k=2)) == 1
+
+    # The accept rule: within the threshold, then a wide gap or a confident distance
+    assert decide_match([], 0.55, 0.05, 0.03) is None
+    assert decide_match([("E1", 0.40)], 0.55, 0.05, 0.03) == "E1"
+    assert decide_match([("E1", 0.60), ("E2", 0.90)], 0.55, 0.05, 0.03) is None
+    assert decide_match([("E1", 0.54), ("E2", 0.56)], 0.55, 0.05, 0.03) is None
+    assert decide_match([("E1", 0.50), ("E2", 0.51)], 0.55, 0.05, 0.03) == "E1"
+
+
+def test_ivf_index_incremental_updates():
+    print("🧪 Testing IVF index with incremental register/remove")
+    print("=" * 50)
+
+    encodings, ids = _synthetic_gallery(2000)
+    gallery = FaceGallery(encodings, ids, index_backend="ivf", nprobe=4)
+    assert gallery.index.name == "ivf"
+
+    probe = encodings[7] + 0.005
+    assert gallery.ids[gallery.nearest(probe, k=2)[0][0]] == "E0007"
+
+    removed = gallery.remove("E0007")
+    assert removed == 1 and "E0007" not in gallery
+    assert gallery.ids[gallery.nearest(probe, k=1)[0][0]] != "E0007"
+
+    gallery.add("E9999", encodings[7])
+    nearest = gallery.nearest(probe, k=2)
+    print(f"   After re-register: {[(gallery.ids[row], round(dist, 4)) for row, dist in nearest]}")
+    assert gallery.ids[nearest[0][0]] == "E9999"
+    assert len(nearest) == 2
+    assert len(gallery) == 2000
+
+    print("\n✅ IVF Index Test Complete!")
+
+
+def test_ivf_runner_up_is_exact():
+    print("🧪 Testing IVF top-2 employees against brute force")
+    print("=" * 50)
+
+    encodings, ids = _synthetic_gallery(2000)
+    gallery = FaceGallery(encodings, ids, index_backend="ivf", nprobe=1)
+    rng = np.random.default_rng(5)
+    probes = encodings[rng.choice(2000, size=40, replace=False)] + rng.normal(scale=0.05, size=(40, 128))
+
+    missed = 0
+    for probe in probes:
+        reference = np.linalg.norm(encodings - probe, axis=1)
+        order = np.argsort(reference)[:2]
+        # One probed cell rarely holds the true runner-up
+        missed += not set(order) <= set(gallery.index.candidates(probe.astype(np.float32), 1))
+        nearest = gallery.nearest_employees(probe, k=2)
+        assert [employee_id for employee_id, _, _ in nearest] == [ids[row] for row in order]
+        assert np.allclose([dist for _, dist, _ in nearest], reference[order], atol=1e-4)
+    print(f"   Probes whose top-2 left the probed cell: {missed}/40")
+    assert missed > 0
+
+    print("\n✅ IVF Runner-up Test Complete!")
+
+
+def test_multi_template_centroid_shortlist():
+    print("🧪 Testing multi-template gallery with centroid pre-filter")
+    print("=" * 50)
+
+    rng = np.random.default_rng(11)
+    people = rng.normal(scale=0.09, size=(300, 128))
+    ids = [f"E{index:04d}" for index in range(300) for _ in range(3)]
+    encodings = np.repeat(people, 3, axis=0) + rng.normal(scale=0.02, size=(900, 128))
+    gallery = FaceGallery(encodings, ids, index_backend="flat", max_templates=3, centroid_shortlist=16)
+    assert gallery.employee_count == 300 and len(gallery) == 900
+
+    probe = people[123] + rng.normal(scale=0.01, size=128)
+    nearest = gallery.nearest_employees(probe, k=2)
+    print(f"   Nearest employees: {[(employee_id, round(dist, 4)) for employee_id, dist, _ in nearest]}")
+    assert nearest[0][0] == "E0123" and nearest[1][0] != "E0123"
+
+    # The shortlist must agree with an exhaustive per-employee minimum
+    reference = np.linalg.norm(encodings - probe, axis=1).reshape(300, 3).min(axis=1)
+    assert abs(nearest[0][1] - reference[123]) < 1e-4
+    assert abs(nearest[1][1] - np.sort(reference)[1]) < 1e-4
+
+    # A fourth template retires the oldest one and moves the centroid
+    gallery.add("E0123", people[7])
+    assert len(gallery.template_rows("E0123")) == 3 and 369 not in gallery.template_rows("E0123")
+    assert len(gallery) == 900
+    gallery.remove("E0123")
+    assert gallery.employee_count == 299
+    assert all(employee_id != "E0123" for employee_id, _, _ in gallery.nearest_employees(probe, k=2))
+
+    print("\n✅ Multi-template Gallery Test Complete!")
+
+
+def test_runner_up_outside_centroid_shortlist():
+    print("🧪 Testing a runner-up whose centroid misses the shortlist")
+    print("=" * 50)
+
+    rng = np.random.default_rng(13)
+    people = rng.normal(scale=0.09, size=(200, 128))
+    ids = [f"E{index:04d}" for index in range(200) for _ in range(2)]
+    encodings = np.repeat(people, 2, axis=0) + rng.normal(scale=0.02, size=(400, 128))
+    probe = people[50] + rng.normal(scale=0.01, size=128)
+    # E0150 keeps one template right next to E0050 and one far away, dragging its centroid off
+    encodings[300] = probe + rng.normal(scale=0.03, size=128)
+    encodings[301] = probe + 4.0
+    gallery = FaceGallery(encodings, ids, index_backend="flat", max_templates=2, centroid_shortlist=4)
+
+    shortlisted = {gallery.ids[row] for row in gallery._shortlist_rows(probe.astype(np.float32))}
+    assert "E0050" in shortlisted and "E0150" not in shortlisted
+
+    reference = np.linalg.norm(encodings - probe, axis=1).reshape(200, 2).min(axis=1)
+    nearest = gallery.nearest_employees(probe, k=2)
+    print(f"   Nearest employees: {[(employee_id, round(dist, 4)) for employee_id, dist, _ in nearest]}")
+    assert [employee_id for employee_id, _, _ in nearest] == ["E0050", "E0150"]
+    assert abs(nearest[1][1] - reference[150]) < 1e-4
+
+    print("\n✅ Shortlist Runner-up Test Complete!")
+
+
+if __name__ == "__main__":
+    test_gallery_nearest_matches_bruteforce()
+    test_gallery_edge_cases()
+    test_ivf_index_incremental_updates()
+    test_ivf_runner_up_is_exact()
+    test_multi_template_centroid_shortlist()
+    test_runner_up_outside_centroid_shortlist()
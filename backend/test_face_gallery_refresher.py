@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Test the face gallery refresher: off-to-the-side rebuild, atomic swap, generation bumps
+"""
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+import numpy as np
+
+from tools import config
+import tools.face_recognition as face_recognition
+from tools.face_gallery_refresher import FaceGalleryRefresher
+from tools.face_store import append_delta, read_deltas, write_snapshot
+
+
+EMBEDDER = "test-embedder"
+_GLOBALS = ("_encoding_cache", "_gallery_cache", "_gallery_version", "_gallery_base_seq", "_applied_seqs")
+
+
+def _local_store(store_dir: str) -> tuple[dict, dict]:
+    """Point face_recognition at an unsharded local store; returns the values to restore."""
+    saved = (
+        {name: getattr(config, name) for name in ("FACE_STORE_DIR", "FACE_SHARDING")},
+        {name: getattr(face_recognition, name) for name in _GLOBALS + ("FACE_S3_BUCKET", "FACE_IMAGE_BUCKET")},
+    )
+    config.FACE_STORE_DIR, config.FACE_SHARDING = store_dir, False
+    face_recognition.FACE_S3_BUCKET = face_recognition.FACE_IMAGE_BUCKET = None
+    face_recognition._encoding_cache = face_recognition._gallery_cache = None
+    face_recognition._gallery_version = face_recognition._gallery_base_seq = 0
+    face_recognition._applied_seqs = set()
+    return saved
+
+
+def _restore(saved: tuple[dict, dict]) -> None:
+    for module, values in zip((config, face_recognition), saved):
+        for name, value in values.items():
+            setattr(module, name, value)
+
+
+def test_refresh_swaps_gallery_under_concurrent_match():
+    print("🧪 Testing gallery swap while matches run")
+    print("=" * 50)
+
+    rng = np.random.default_rng(9)
+    people = rng.normal(scale=0.09, size=(80, 128)).astype(np.float32)
+    ids = [f"E{index:03d}" for index in range(80)]
+    probe = people[1] + rng.normal(scale=0.005, size=128).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as store:
+        saved = _local_store(store)
+        stop = threading.Event()
+        seen: list[tuple[int, str]] = []
+        errors: list[Exception] = []
+
+        def match_continuously():
+            while not stop.is_set():
+                try:
+                    gallery = face_recognition.get_face_gallery()
+                    size = len(gallery)
+                    nearest = gallery.nearest_employees(probe, k=2)
+                    # Whichever gallery a match picked up, it is complete and unchanged while in use
+                    assert len(gallery) == size
+                    seen.append((size, nearest[0][0]))
+                except Exception as exc:
+                    errors.append(exc)
+                    return
+
+        try:
+            write_snapshot(Path(store), people[:50], ids[:50], embedder=EMBEDDER)
+            refresher = FaceGalleryRefresher(interval=0)
+            assert refresher.check_once()
+            old = face_recognition.get_face_gallery()
+            generation = face_recognition.get_gallery_generation()
+            assert len(old) == 50
+
+            matcher = threading.Thread(target=match_continuously)
+            matcher.start()
+            time.sleep(0.05)
+            # A bulk re-encode elsewhere: a new snapshot is built beside the live one and swapped in
+            write_snapshot(Path(store), people, ids, embedder=EMBEDDER)
+            assert refresher.check_once()
+            time.sleep(0.05)
+            stop.set()
+            matcher.join(5)
+
+            new = face_recognition.get_face_gallery()
+            assert new is not old and len(new) == 80 and len(old) == 50
+            assert face_recognition.get_gallery_generation() == generation + 1
+            assert not errors, errors
+            sizes = {size for size, _ in seen}
+            print(f"   Matches during swap: {len(seen)}, gallery sizes seen: {sorted(sizes)}")
+            assert sizes <= {50, 80} and 80 in sizes
+            assert all(employee_id == "E001" for _, employee_id in seen)
+
+            # Nothing new: no reload and the generation stays put
+            assert not refresher.check_once()
+            assert face_recognition.get_face_gallery() is new
+            assert face_recognition.get_gallery_generation() == generation + 1
+
+            # A registration from another node is replayed into the live gallery on the next tick
+            stranger = rng.normal(scale=0.09, size=128).astype(np.float32)
+            assert append_delta(Path(store), "add", "E900", stranger, embedder=EMBEDDER)
+            assert refresher.check_once()
+            assert face_recognition.get_face_gallery() is new and "E900" in new
+            assert face_recognition.get_gallery_generation() == generation + 2
+
+            # A rebuild that fails keeps serving the previous gallery
+            write_snapshot(Path(store), people[:10], ids[:10], embedder=EMBEDDER)
+            build = face_recognition._build_gallery
+            face_recognition._build_gallery = lambda *args, **kwargs: None
+            try:
+                refresher.check_once()
+            finally:
+                face_recognition._build_gallery = build
+            assert face_recognition.get_face_gallery() is new
+            assert face_recognition.get_gallery_generation() == generation + 2
+
+            metrics = refresher.metrics()
+            print(f"   Refresher: checks={metrics['checks']} reloads={metrics['reloads']}")
+            assert metrics["checks"] == 5 and metrics["generation"] == generation + 2
+        finally:
+            stop.set()
+            _restore(saved)
+
+    print("\n✅ Gallery Swap Test Complete!")
+
+
+def test_refresh_after_compactions_elsewhere():
+    print("🧪 Testing refresh after compactions on another node")
+    print("=" * 50)
+
+    rng = np.random.default_rng(12)
+    people = rng.normal(scale=0.09, size=(13, 128)).astype(np.float32)
+    ids = [f"E{index:03d}" for index in range(13)]
+
+    with tempfile.TemporaryDirectory() as store:
+        saved = _local_store(store)
+        try:
+            write_snapshot(Path(store), people[:10], ids[:10], embedder=EMBEDDER)
+            refresher = FaceGalleryRefresher(interval=0)
+            assert refresher.check_once()
+            behind = face_recognition.get_face_gallery()
+
+            # Two compactions while this node sleeps; the second deletes E010's delta
+            for index in (10, 11):
+                assert append_delta(Path(store), "add", ids[index], people[index], embedder=EMBEDDER)
+                assert face_recognition.compact_face_store()
+            assert [record["employee_id"] for record in read_deltas(Path(store), 0)] == ["E011"]
+
+            # The latest compaction is not built on the snapshot this node holds: reload
+            assert refresher.check_once()
+            caught_up = face_recognition.get_face_gallery()
+            assert caught_up is not behind and "E010" in caught_up and "E011" in caught_up
+            assert face_recognition._gallery_version == 3
+
+            # A compaction of exactly the snapshot this node holds is replayed, not rebuilt
+            assert append_delta(Path(store), "add", ids[12], people[12], embedder=EMBEDDER)
+            assert face_recognition.compact_face_store()
+            assert refresher.check_once()
+            assert face_recognition.get_face_gallery() is caught_up and "E012" in caught_up
+            print(f"   Gallery: {len(caught_up)} templates at v{face_recognition._gallery_version}")
+        finally:
+            _restore(saved)
+
+    print("\n✅ Compaction Refresh Test Complete!")
+
+
+def test_refresher_thread_start_stop():
+    print("🧪 Testing refresher thread lifecycle")
+    print("=" * 50)
+
+    rng = np.random.default_rng(4)
+    with tempfile.TemporaryDirectory() as store:
+        saved = _local_store(store)
+        refresher = FaceGalleryRefresher(interval=0.05)
+        try:
+            write_snapshot(Path(store), rng.normal(scale=0.09, size=(5, 128)), [f"E{i}" for i in range(5)], embedder=EMBEDDER)
+            refresher.start()
+            # The first tick runs at once, so the gallery is warm before any request
+            deadline = time.monotonic() + 5
+            while face_recognition._gallery_cache is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert len(face_recognition._gallery_cache) == 5
+            assert refresher.metrics()["running"]
+            refresher.stop()
+            assert not refresher.metrics()["running"] and refresher.metrics()["checks"] >= 1
+        finally:
+            refresher.stop()
+            _restore(saved)
+
+    print("\n✅ Refresher Lifecycle Test Complete!")
+
+
+if __name__ == "__main__":
+    test_refresh_swaps_gallery_under_concurrent_match()
+    test_refresh_after_compactions_elsewhere()
+    test_refresher_thread_start_stop()
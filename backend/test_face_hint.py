@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test client ROI hints: region-first detection, full-frame fallback and hint stats
+"""
+import io
+import sys
+sys.path.insert(0, 'src')
+
+import numpy as np
+from PIL import Image
+
+from tools.face_pipeline import FaceHintStats, encode_frame, face_box_hint, hint_region, parse_face_hint
+
+
+SETTINGS = {
+    "decode_max_side": 0,
+    "detect_max_side": 0,
+    "upsample": 0,
+    "fallback": True,
+    "crop_margin": 0.2,
+    "hint_expand": 0.6,
+}
+NO_QUALITY = {"enabled": False}
+
+
+class BrightSquareBackend:
+    """Detects the white square of the synthetic frame; records the size of every image it searched."""
+
+    embedder_id = "fake"
+
+    def __init__(self):
+        self.searched: list[tuple[int, int]] = []
+
+    def detect(self, image, upsample):
+        self.searched.append(image.shape[:2])
+        ys, xs = np.nonzero(image[:, :, 0] > 200)
+        if not len(ys):
+            return []
+        return [(int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1, int(xs.min()))]
+
+    def embed(self, crop, box):
+        return np.full(128, 0.1, dtype=np.float32)
+
+
+def _frame(top: int, left: int, size: int = 60) -> bytes:
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    frame[top : top + size, left : left + size] = 255
+    buffer = io.BytesIO()
+    Image.fromarray(frame).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_parse_face_hint():
+    print("🧪 Testing face hint parsing")
+    print("=" * 50)
+
+    assert parse_face_hint('{"x": 0.25, "y": 0.5, "w": 0.2, "h": 0.3}') == (0.25, 0.5, 0.2, 0.3)
+    # Clamped into the frame
+    x, y, w, h = parse_face_hint({"x": 0.9, "y": -0.1, "w": 0.5, "h": 0.4})
+    assert (x, y, h) == (0.9, 0.0, 0.4) and abs(w - 0.1) < 1e-9
+    for raw in (None, "", "not json", "[1, 2]", {"x": 0.1}, {"x": 0.1, "y": 0.1, "w": 0, "h": 0.2},
+                {"x": "a", "y": 0, "w": 1, "h": 1}, {"x": 0.1, "y": 0.1, "w": float("nan"), "h": 0.2}):
+        assert parse_face_hint(raw) is None, raw
+
+    box = (120, 260, 180, 200)
+    hint = face_box_hint(box, (480, 640, 3))
+    assert hint == {"x": 0.3125, "y": 0.25, "w": 0.0938, "h": 0.125}
+    y0, x1, y1, x0 = hint_region(parse_face_hint(hint), (480, 640), 0.5)
+    assert (y0, x0) <= (box[0], box[3]) and (y1, x1) >= (box[2], box[1])
+    assert hint_region((0.0, 0.0, 1.0, 1.0), (480, 640), 0.6) == (0, 640, 480, 0)
+
+    print("\n✅ Face Hint Parsing Test Complete!")
+
+
+def test_hinted_detection():
+    print("🧪 Testing hinted detection")
+    print("=" * 50)
+
+    backend = BrightSquareBackend()
+    plain = encode_frame(_frame(120, 200), SETTINGS, NO_QUALITY, backend)
+    assert plain["roi"] is None and plain["box"] == (120, 260, 180, 200)
+    assert backend.searched == [(480, 640)]
+
+    # Hit: only the region around the hint is searched, the box is in frame coordinates
+    backend.searched.clear()
+    hit = encode_frame(_frame(130, 210), SETTINGS, NO_QUALITY, backend, hint=parse_face_hint(plain["face_hint"]))
+    print(f"   hit: box={hit['box']} searched={backend.searched} timings={hit['timings']}")
+    assert hit["roi"] == "hit" and hit["box"] == (130, 270, 190, 210)
+    assert len(backend.searched) == 1 and backend.searched[0][0] * backend.searched[0][1] < 480 * 640 / 4
+    assert "hint_detect_ms" in hit["timings"] and hit["encoding"] is not None
+
+    # Miss: the person moved away, the full frame is searched too
+    backend.searched.clear()
+    miss = encode_frame(_frame(380, 560), SETTINGS, NO_QUALITY, backend, hint=parse_face_hint(plain["face_hint"]))
+    assert miss["roi"] == "miss" and miss["box"] == (380, 620, 440, 560)
+    assert backend.searched[-1] == (480, 640)
+    assert miss["timings"]["detect_ms"] >= miss["timings"]["hint_detect_ms"]
+
+    print("\n✅ Hinted Detection Test Complete!")
+
+
+def test_hint_stats():
+    stats = FaceHintStats()
+    stats.record({"roi": None, "timings": {"detect_ms": 40.0}})
+    stats.record({"roi": None, "timings": {"detect_ms": 60.0}})
+    stats.record({"roi": "hit", "timings": {"detect_ms": 5.0, "hint_detect_ms": 5.0}})
+    stats.record({"roi": "hit", "timings": {"detect_ms": 5.0, "hint_detect_ms": 5.0}})
+    stats.record({"roi": "miss", "timings": {"detect_ms": 55.0, "hint_detect_ms": 5.0}})
+    stats.record({"status": "error", "message": "No image"})  # never reached detection
+    stats.record_invalid()
+
+    metrics = stats.metrics()
+    print(f"   {metrics}")
+    assert (metrics["hinted"], metrics["hits"], metrics["misses"], metrics["unhinted"], metrics["invalid"]) == (3, 2, 1, 2, 1)
+    assert metrics["hit_rate"] == round(2 / 3, 4)
+    assert metrics["full_detect_ms_median"] == 50.0
+    # Two hits spare 2 x 50 ms; all three hinted searches cost 5 ms
+    assert metrics["estimated_saved_ms"] == 85.0
+
+
+if __name__ == "__main__":
+    test_parse_face_hint()
+    test_hinted_detection()
+    test_hint_stats()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test the recently-matched hot tier against a brute-force full-gallery search
+"""
+import sys
+sys.path.insert(0, 'src')
+
+import numpy as np
+
+import tools.face_recognition as face_recognition
+from tools.face_gallery import FaceGallery
+from tools.face_hot_tier import FaceHotTier, FaceHotTierStats
+
+
+THRESHOLD, MIN_GAP, CONFIDENT = 0.55, 0.05, 0.03
+
+
+def _bruteforce(encodings, ids, probe):
+    distances = np.linalg.norm(np.asarray(encodings) - probe, axis=1)
+    best = {}
+    for employee_id, distance in zip(ids, distances):
+        best[employee_id] = min(distance, best.get(employee_id, np.inf))
+    ranked = sorted(best.items(), key=lambda item: item[1])
+    return ranked[0], (ranked[1][1] - ranked[0][1]) if len(ranked) > 1 else None
+
+
+def test_hot_tier_agrees_with_full_search():
+    print("🧪 Testing hot tier acceptance against brute force")
+    print("=" * 50)
+
+    rng = np.random.default_rng(11)
+    encodings = list(rng.normal(scale=0.09, size=(1000, 128)))
+    ids = [f"E{index:04d}" for index in range(1000)]
+    gallery = FaceGallery(encodings, ids)
+
+    tier = FaceHotTier(max_entries=50)
+    for index in range(50):
+        tier.record(ids[index])
+
+    hits = 0
+    for trial in range(200):
+        index = int(rng.integers(0, 100))
+        probe = encodings[index] + rng.normal(scale=0.012, size=128)
+        match, reason = tier.match(gallery, probe, THRESHOLD, MIN_GAP, CONFIDENT)
+        if index >= 50:
+            assert match is None, "cold employees must fall through"
+            continue
+        (expected, best), gap = _bruteforce(encodings, ids, probe)
+        assert match is not None, reason
+        assert match["employeeId"] == expected
+        assert abs(match["distance"] - best) < 1e-4
+        assert match["gap"] <= gap + 1e-4, "the guaranteed gap is a lower bound"
+        hits += 1
+
+    print(f"   Hot hits: {hits}, metrics: {tier.metrics()}")
+    assert tier.metrics()["revalidations"] <= 50, "margins are cached per template"
+    print("\n✅ Hot Tier Agreement Test Complete!")
+
+
+def test_hot_tier_revalidates_after_registration():
+    print("🧪 Testing hot tier margin re-validation")
+    print("=" * 50)
+
+    rng = np.random.default_rng(5)
+    encodings = list(rng.normal(scale=0.09, size=(200, 128)))
+    ids = [f"E{index:04d}" for index in range(200)]
+    gallery = FaceGallery(encodings, ids)
+    tier = FaceHotTier(max_entries=10)
+    tier.record("E0001")
+
+    probe = encodings[1] + rng.normal(scale=0.012, size=128)
+    match, _ = tier.match(gallery, probe, THRESHOLD, MIN_GAP, CONFIDENT)
+    assert match and match["employeeId"] == "E0001"
+
+    # A look-alike registered right next to E0001 shrinks the margin below the gap
+    gallery.add("E9999", encodings[1] + rng.normal(scale=0.01, size=128))
+    match, reason = tier.match(gallery, probe, THRESHOLD, MIN_GAP, CONFIDENT)
+    assert match is None and reason == "margin", reason
+
+    far = encodings[1] + rng.normal(scale=0.2, size=128)
+    match, reason = tier.match(gallery, far, THRESHOLD, MIN_GAP, CONFIDENT)
+    assert match is None and reason == "over_threshold"
+
+    print("\n✅ Hot Tier Re-validation Test Complete!")
+
+
+def test_hot_tier_eviction_and_stats():
+    tier = FaceHotTier(max_entries=16)
+    for _ in range(4):
+        tier.record("regular")
+    for index in range(18):
+        tier.record(f"visitor{index}")
+    assert "regular" in tier, "frequent employees survive a burst of one-off matches"
+    assert "visitor0" not in tier and len(tier) == 16
+
+    stats = FaceHotTierStats()
+    stats.record({"status": "success", "tier": "hot", "timings": {"hot_ms": 0.2, "match_ms": 0.2}})
+    stats.record({
+        "status": "success",
+        "tier": "full",
+        "hot_reason": "margin",
+        "timings": {"hot_ms": 0.3, "full_ms": 4.0, "match_ms": 4.3},
+    })
+    stats.record({"status": "success", "tier": "full", "timings": {"full_ms": 4.0, "match_ms": 4.0}})
+    metrics = stats.metrics()
+    print(f"   Stats: {metrics}")
+    assert metrics["hit_rate"] == 0.5 and metrics["full_only"] == 1
+    assert metrics["fallthrough_reasons"] == {"margin": 1}
+    assert abs(metrics["estimated_saved_ms"] - 3.5) < 1e-6
+
+
+class _Backend:
+    name = embedder_id = "test-embedder"
+    match_threshold = THRESHOLD
+
+
+def test_full_tier_uses_shared_accept_rule():
+    print("🧪 Testing full-gallery accept rule")
+    print("=" * 50)
+
+    rng = np.random.default_rng(17)
+    encodings = list(rng.normal(scale=0.09, size=(100, 128)))
+    ids = [f"E{index:04d}" for index in range(100)]
+    gallery = FaceGallery(encodings, ids, embedder=_Backend.embedder_id)
+    probe = encodings[3] + rng.normal(scale=0.012, size=128)
+    decisions = []
+
+    def decide(ranked, *args):
+        decisions.append(ranked)
+        return decide_match(ranked, *args)
+
+    decide_match = face_recognition.decide_match
+    saved = {
+        name: getattr(face_recognition, name)
+        for name in ("decide_match", "encode_frame", "get_face_backend", "get_face_gallery", "get_face_hot_tier")
+    }
+    face_recognition.decide_match = decide
+    face_recognition.encode_frame = lambda image_bytes, backend, hint=None: {
+        "timings": {}, "roi": None, "face_hint": None, "quality": None, "encoding": probe, "faces": 1,
+    }
+    face_recognition.get_face_backend = _Backend
+    face_recognition.get_face_gallery = lambda: gallery
+    # An empty hot tier every time, so each frame is decided by the full search
+    face_recognition.get_face_hot_tier = lambda: FaceHotTier(max_entries=0)
+    try:
+        result = face_recognition.match_face_image(b"jpeg")
+        assert result["status"] == "success" and result["tier"] == "full"
+        assert result["employeeId"] == "E0003" and decisions[-1][0][0] == "E0003"
+
+        # A look-alike inside the threshold but too close to call is rejected by the same rule
+        gallery.add("E9999", encodings[3] + rng.normal(scale=0.003, size=128))
+        direction = rng.normal(size=128)
+        far = encodings[3] + 0.535 * direction / np.linalg.norm(direction)
+        face_recognition.encode_frame = lambda image_bytes, backend, hint=None: {
+            "timings": {}, "roi": None, "face_hint": None, "quality": None, "encoding": far, "faces": 1,
+        }
+        result = face_recognition.match_face_image(b"jpeg")
+        ranked = decisions[-1]
+        print(f"   Ranked: {ranked}")
+        assert len(decisions) == 2 and decide_match(ranked, THRESHOLD, MIN_GAP, CONFIDENT) is None
+        assert result["status"] != "success"
+    finally:
+        for name, value in saved.items():
+            setattr(face_recognition, name, value)
+
+    print("\n✅ Full Tier Accept Rule Test Complete!")
+
+
+if __name__ == "__main__":
+    test_hot_tier_agrees_with_full_search()
+    test_hot_tier_revalidates_after_registration()
+    test_hot_tier_eviction_and_stats()
+    test_full_tier_uses_shared_accept_rule()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test the background post-match queue (retries, step isolation, completion)
+"""
+import sys
+import tempfile
+import threading
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+import flow_signal
+from shared_state import EmbeddedStateBackend, SharedMap
+from tools.face_post_match import FacePostMatchQueue
+from tools.face_recognition import _publish_face_otp_status
+
+
+def test_post_match_retries_and_completion():
+    print("🧪 Testing post-match queue retries")
+    print("=" * 50)
+
+    queue = FacePostMatchQueue(workers=1, max_queue=4, max_attempts=3, backoff=0.01)
+    calls = {"send": 0, "log": 0}
+    done = threading.Event()
+    outcome = {}
+
+    def flaky_send(state):
+        calls["send"] += 1
+        state.setdefault("otp_code", "123456")
+        if calls["send"] < 3:
+            raise RuntimeError("SNS throttled")
+        state["otpSent"] = True
+
+    def broken_log(state):
+        calls["log"] += 1
+        raise RuntimeError("DynamoDB unavailable")
+
+    def on_complete(state):
+        outcome.update(state)
+        done.set()
+
+    task_id = queue.submit([("send_otp", flaky_send), ("log_visit", broken_log)], on_complete, {"employeeId": "E001"})
+    assert task_id is not None
+    assert done.wait(5), "task should finish in the background"
+
+    print(f"   Outcome: {outcome}")
+    assert calls == {"send": 3, "log": 3}
+    assert outcome["otpSent"] and outcome["taskId"] == task_id
+    assert "log_visit" in outcome["errors"] and "send_otp" not in outcome["errors"]
+
+    queue.stop()
+    status = queue.status(task_id)
+    assert status["status"] == "failed" and "otp_code" not in status
+    metrics = queue.metrics()
+    print(f"   Metrics: {metrics}")
+    assert metrics["retries"] == 4 and metrics["failed_steps"] == 1 and metrics["completed"] == 1
+
+    print("\n✅ Post-Match Queue Test Complete!")
+
+
+def test_post_match_disabled_and_full():
+    disabled = FacePostMatchQueue(workers=0, max_queue=4)
+    assert disabled.submit([("noop", lambda state: None)]) is None, "disabled queue hands work back"
+    state = disabled.run_task([("mark", lambda state: state.update(ran=True))])
+    assert state["ran"] and state["errors"] == {}
+
+    release = threading.Event()
+    queue = FacePostMatchQueue(workers=1, max_queue=1, backoff=0)
+    blocking = [("wait", lambda state: release.wait(5))]
+    assert queue.submit(blocking) is not None
+    submitted = [queue.submit(blocking) for _ in range(3)]
+    assert None in submitted, "a full queue rejects instead of blocking the request"
+    release.set()
+    queue.stop()
+    assert queue.metrics()["rejected"] >= 1
+
+
+def test_post_match_status_from_another_worker():
+    print("🧪 Testing task status polled through another worker")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "shared_state.db"
+        # Two uvicorn workers, each with its own queue and connection
+        first = FacePostMatchQueue(workers=1, max_queue=4, shared_statuses=SharedMap("face_post_match", ttl=60, backend=EmbeddedStateBackend(path)))
+        second = FacePostMatchQueue(workers=1, max_queue=4, shared_statuses=SharedMap("face_post_match", ttl=60, backend=EmbeddedStateBackend(path)))
+        release = threading.Event()
+        done = threading.Event()
+
+        def send(state):
+            release.wait(5)
+            state["otp_code"] = "123456"
+            state["otpSent"] = True
+
+        task_id = first.submit([("send_otp", send)], lambda state: done.set(), {"employeeId": "E001"})
+        assert second.status(task_id)["status"] in {"queued", "running"}
+        release.set()
+        assert done.wait(5)
+        first.stop()
+        status = second.status(task_id)
+        print(f"   Status seen by the other worker: {status}")
+        assert status["status"] == "done" and status["otpSent"] and "otp_code" not in status
+        assert second.status("unknown") is None
+        second.stop()
+
+    print("\n✅ Shared Task Status Test Complete!")
+
+
+def test_otp_status_keeps_pending_capture_signal():
+    print("🧪 Testing that the OTP outcome leaves a pending capture signal alone")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saved_signals = flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR
+        flow_signal.SIGNAL_FILE = Path(tmp) / "flow_signal.json"
+        flow_signal.KIOSK_SIGNAL_DIR = Path(tmp) / "flow_signals"
+        try:
+            queue = FacePostMatchQueue(workers=1, max_queue=4)
+            done = threading.Event()
+
+            def send(state):
+                state.update(otp_code="123456", otpSent=True, phone="+15550100", message="OTP sent via SNS")
+                # The flow moves on while the SMS is out
+                flow_signal.post_signal("start_face_capture", {"reason": "retry"}, kiosk_id="lobby")
+
+            def publish(state):
+                _publish_face_otp_status(state)
+                done.set()
+
+            queue.submit([("send_otp", send)], publish, {"employeeId": "E001", "kioskId": "lobby"})
+            assert done.wait(5)
+            queue.stop()
+
+            pending = flow_signal.get_signal(clear=False, kiosk_id="lobby")
+            assert pending["name"] == "start_face_capture"
+            otp = flow_signal.get_signal(kiosk_id="lobby", channel=flow_signal.FACE_OTP_CHANNEL)
+            print(f"   OTP signal: {otp}")
+            assert otp["name"] == "face_otp_status" and otp["payload"]["otpSent"] and otp["payload"]["status"] == "done"
+            assert "otp_code" not in otp["payload"]
+            # Reading the OTP channel cleared only that channel
+            assert flow_signal.get_signal(kiosk_id="lobby", channel=flow_signal.FACE_OTP_CHANNEL) is None
+            assert flow_signal.get_signal(kiosk_id="lobby")["name"] == "start_face_capture"
+        finally:
+            flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR = saved_signals
+
+    print("\n✅ OTP Signal Channel Test Complete!")
+
+
+if __name__ == "__main__":
+    test_post_match_retries_and_completion()
+    test_post_match_disabled_and_full()
+    test_post_match_status_from_another_worker()
+    test_otp_status_keeps_pending_capture_signal()
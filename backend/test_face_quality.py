@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test the pre-encoding face quality gate on an employee photo
+"""
+import sys
+sys.path.insert(0, 'src')
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from tools.face_quality import assess_face_quality
+
+
+SETTINGS = {
+    "enabled": True,
+    "min_face_px": 80,
+    "min_sharpness": 25,
+    "min_brightness": 45,
+    "max_brightness": 215,
+    "max_yaw": 0,  # yaw needs the dlib landmark model
+}
+
+
+def test_face_quality_gate():
+    print("🧪 Testing face quality gate")
+    print("=" * 50)
+
+    frame = np.array(Image.open("employee_image/E002.jpg").convert("RGB"))
+    height, width = frame.shape[:2]
+    box = (int(height * 0.2), int(width * 0.7), int(height * 0.6), int(width * 0.3))
+
+    good = assess_face_quality(frame, box, SETTINGS)
+    print(f"   Sharp photo: {good['metrics']}")
+    assert good["passed"] and good["reason"] is None
+
+    cases = {
+        "too_small": (frame, (0, 50, 50, 0)),
+        "too_dark": ((frame * 0.2).astype(np.uint8), box),
+        "too_bright": (np.clip(frame.astype(np.int16) + 160, 0, 255).astype(np.uint8), box),
+        "blurry": (np.array(Image.fromarray(frame).filter(ImageFilter.GaussianBlur(12))), box),
+    }
+    for expected, (image, face_box) in cases.items():
+        result = assess_face_quality(image, face_box, SETTINGS)
+        print(f"   {expected}: {result['hint']} {result['metrics']}")
+        assert not result["passed"] and result["reason"] == expected and result["hint"]
+
+    assert assess_face_quality(frame, (0, 50, 50, 0), {**SETTINGS, "enabled": False})["passed"]
+
+    print("\n✅ Face Quality Test Complete!")
+
+
+if __name__ == "__main__":
+    test_face_quality_gate()
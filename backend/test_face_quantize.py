@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test float16/int8 gallery storage against float32 and float64 search
+"""
+import sys
+import tempfile
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+import numpy as np
+
+from tools.face_gallery import FaceGallery
+from tools.face_quantize import quantize, validate_quantization
+from tools.face_store import load_snapshot, write_snapshot
+
+
+def _encodings(count: int, seed: int = 3):
+    rng = np.random.default_rng(seed)
+    identities = rng.normal(scale=0.09, size=(count // 2, 128))
+    # Two templates per employee, a capture apart
+    encodings = np.repeat(identities, 2, axis=0) + rng.normal(scale=0.02, size=(count, 128))
+    ids = [f"E{index // 2:04d}" for index in range(count)]
+    return encodings, ids
+
+
+def test_quantized_gallery_matches_float32():
+    print("🧪 Testing float16/int8 gallery storage")
+    print("=" * 50)
+
+    encodings, ids = _encodings(2000)
+    reference = FaceGallery(encodings, ids, index_backend="flat")
+    probe = encodings[84] + np.random.default_rng(1).normal(scale=0.01, size=128)
+    expected = reference.nearest_employees(probe, k=3)
+
+    for dtype, itemsize in (("float16", 2), ("int8", 1)):
+        gallery = FaceGallery(encodings, ids, index_backend="flat", storage_dtype=dtype)
+        assert gallery.codes.dtype == np.dtype(dtype)
+        assert gallery.storage_bytes == 2000 * 128 * itemsize
+        found = gallery.nearest_employees(probe, k=3)
+        print(f"   {dtype}: {found[0][:2]} vs float32 {expected[0][:2]}")
+        assert [name for name, _, _ in found] == [name for name, _, _ in expected]
+        assert abs(found[0][1] - expected[0][1]) < 0.01
+
+    # int8 adds re-encode existing columns when a new template is out of range
+    gallery = FaceGallery(encodings, ids, index_backend="flat", storage_dtype="int8")
+    outlier = encodings[0].copy()
+    outlier[5] = 3 * np.abs(encodings[:, 5]).max()
+    row = gallery.add("E_new", outlier)
+    assert abs(gallery.vectors(row)[5] - outlier[5]) < 0.01
+    assert abs(gallery.nearest_employees(encodings[10], k=1)[0][1]) < 0.01
+
+    print("\n✅ Quantized Gallery Test Complete!")
+
+
+def test_quantized_snapshot_roundtrip():
+    encodings, ids = _encodings(200)
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = write_snapshot(Path(tmp), encodings, ids, dtype="int8")
+        assert snapshot.encodings.dtype == np.int8 and snapshot.manifest["dtype"] == "int8"
+        assert (Path(tmp) / snapshot.manifest["encodings_file"]).stat().st_size < 200 * 128 * 2
+
+        # The gallery adopts the stored codes without re-quantising them
+        gallery = FaceGallery.from_encoding_data(load_snapshot(Path(tmp)).as_encoding_data(), storage_dtype="int8")
+        assert np.array_equal(gallery.codes, snapshot.encodings)
+
+        # Re-writing with the previous scale keeps unchanged rows bit-identical
+        again = write_snapshot(Path(tmp), snapshot.float_encodings(), ids, dtype="int8", scale=snapshot.scale)
+        assert np.array_equal(again.encodings, snapshot.encodings)
+
+        _, scale = quantize(encodings, "int8")
+        assert np.abs(snapshot.float_encodings() - encodings).max() <= scale.max() / 2 + 1e-6
+
+
+def test_validation_report():
+    encodings, ids = _encodings(1000)
+    for dtype in ("float32", "float16", "int8"):
+        report = validate_quantization(
+            encodings, ids, dtype, threshold=0.55, min_gap=0.05, confident_margin=0.03, probe_noise=0.02
+        )
+        print(f"   {dtype}: decision={report['decision_agreement']:.3f} top1={report['top1_agreement']:.3f}")
+        assert report["probes"] == 200 and report["reference_accepts"] > 0
+        assert report["decision_agreement"] >= 0.99 and report["top5_overlap"] >= 0.98
+
+
+if __name__ == "__main__":
+    test_quantized_gallery_matches_float32()
+    test_quantized_snapshot_roundtrip()
+    test_validation_report()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Test the repeated-frame face result cache (byte-identical frames only)
+"""
+import io
+import sys
+import time
+sys.path.insert(0, 'src')
+
+from PIL import Image
+
+from tools.face_result_cache import FaceResultCache
+
+
+def _jpeg(path: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.open(path).convert("RGB").save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def test_face_result_cache():
+    print("🧪 Testing face result cache")
+    print("=" * 50)
+
+    frame = _jpeg("employee_image/E001.jpg", 85)
+    recompressed = _jpeg("employee_image/E001.jpg", 60)
+    other = _jpeg("employee_image/E002.jpg", 85)
+    match = {"status": "success", "employeeId": "E001", "distance": 0.31}
+
+    cache = FaceResultCache(max_entries=2, ttl=0.5)
+    cache.put(frame, 1, match)
+    assert cache.get(frame, 1) == match
+    # A look-alike frame may hold someone else, so it never reuses the cached identity
+    assert cache.get(recompressed, 1) is None, "a re-encoded frame must be matched again"
+    assert cache.get(other, 1) is None
+    assert cache.get(frame, 2) is None, "a new gallery generation must miss"
+
+    # Transient failures are never cached
+    cache.put(other, 1, {"status": "error", "message": "Verification system error"})
+    assert cache.get(other, 1) is None
+
+    time.sleep(0.6)
+    assert cache.get(frame, 1) is None, "entries expire after the TTL"
+
+    metrics = cache.metrics()
+    print(f"   Metrics: {metrics}")
+    assert metrics["hits"] == 1 and metrics["misses"] == 5
+
+    print("\n✅ Face Result Cache Test Complete!")
+
+
+if __name__ == "__main__":
+    test_face_result_cache()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Test office-sharded face galleries: local shard first, other shards on a miss
+"""
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+import numpy as np
+
+from tools import config
+from tools.face_shards import (
+    FaceShardSet,
+    employee_shard,
+    read_shard_index,
+    shard_key,
+    shard_location,
+    update_shard_index,
+)
+from tools.face_store import load_snapshot, write_snapshot
+from test_face_store import FakeS3
+
+
+def _sharded(store_dir: str, site: str, max_resident: int = 4) -> dict:
+    """Point the config at a temporary sharded store; returns the values to restore."""
+    saved = {name: getattr(config, name) for name in ("FACE_STORE_DIR", "FACE_SHARDING", "FACE_SITE", "FACE_SHARD_MAX_RESIDENT")}
+    config.FACE_STORE_DIR, config.FACE_SHARDING, config.FACE_SITE = store_dir, True, site
+    config.FACE_SHARD_MAX_RESIDENT = max_resident
+    return saved
+
+
+def _office_encodings(rng, count: int, prefix: str):
+    identities = rng.normal(scale=0.09, size=(count, 128))
+    return identities.astype(np.float32), [f"{prefix}{index:03d}" for index in range(count)]
+
+
+def test_shard_keys_and_index():
+    print("🧪 Testing shard keys and the shard index")
+    print("=" * 50)
+
+    assert shard_key("Chennai") == "chennai"
+    assert shard_key("  New York / HQ ") == "new-york-hq"
+    assert shard_key(None) == shard_key("") == "unassigned"
+    assert employee_shard({"office": "Pune"}) == "pune"
+    assert employee_shard({"office": None, "raw": {"Office": "Chennai"}}) == "chennai"
+    assert employee_shard(None) == "unassigned"
+
+    with tempfile.TemporaryDirectory() as store, tempfile.TemporaryDirectory() as other_node:
+        saved = _sharded(store, "Chennai")
+        s3 = FakeS3()
+        try:
+            store_dir, prefix = shard_location("chennai")
+            assert store_dir == Path(store) / "shards" / "chennai" and prefix == "face_store/shards/chennai"
+
+            assert update_shard_index({"chennai": {"employees": 3}}, s3, "bucket")
+            assert update_shard_index({"pune": {"employees": 5}}, s3, "bucket")
+            assert set(read_shard_index(s3, "bucket")) == {"chennai", "pune"}
+            assert "face_store/shards.json" in s3.objects
+
+            # Another node learns the shards from S3 and keeps a local copy
+            config.FACE_STORE_DIR = other_node
+            assert read_shard_index(s3, "bucket")["pune"]["employees"] == 5
+            assert set(read_shard_index()) == {"chennai", "pune"}
+        finally:
+            for name, value in saved.items():
+                setattr(config, name, value)
+
+    print("\n✅ Shard Key/Index Test Complete!")
+
+
+class RacingS3(FakeS3):
+    """Another node publishes the shard index between our read and our put."""
+
+    def __init__(self):
+        super().__init__()
+        self.races = 1
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if Key.endswith("shards.json") and self.races:
+            self.races -= 1
+            update_shard_index({"delhi": {"employees": 7}}, self, Bucket)
+        return super().put_object(Bucket, Key, Body, **kwargs)
+
+
+def test_shard_index_concurrent_updates():
+    print("🧪 Testing conditional shard index publishing")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as store:
+        saved = _sharded(store, "Chennai")
+        s3 = RacingS3()
+        try:
+            assert update_shard_index({"chennai": {"employees": 3}}, s3, "bucket")
+            # Our first put lost to the other node's index and was merged again, not overwritten
+            shards = read_shard_index(s3, "bucket")
+            print(f"   Index: {sorted(shards)}")
+            assert shards["delhi"]["employees"] == 7 and shards["chennai"]["employees"] == 3
+
+            s3.races = 1
+            assert update_shard_index({"pune": {"employees": 5}}, s3, "bucket")
+            assert set(read_shard_index(s3, "bucket")) == {"chennai", "delhi", "pune"}
+        finally:
+            for name, value in saved.items():
+                setattr(config, name, value)
+
+    print("\n✅ Shard Index Race Test Complete!")
+
+
+def test_local_shard_first_then_other_shards():
+    print("🧪 Testing local-first sharded matching")
+    print("=" * 50)
+
+    import tools.face_recognition as face_recognition
+    import tools.face_shards as face_shards
+
+    rng = np.random.default_rng(5)
+    offices = {"chennai": _office_encodings(rng, 40, "C"), "pune": _office_encodings(rng, 30, "P"), "delhi": _office_encodings(rng, 20, "D")}
+
+    with tempfile.TemporaryDirectory() as store:
+        saved = _sharded(store, "Chennai", max_resident=1)
+        saved_buckets = face_recognition.FACE_S3_BUCKET, face_recognition.FACE_IMAGE_BUCKET
+        face_recognition.FACE_S3_BUCKET = face_recognition.FACE_IMAGE_BUCKET = None
+        face_shards._shard_set = None
+        try:
+            for shard, (encodings, ids) in offices.items():
+                write_snapshot(shard_location(shard)[0], encodings, ids, embedder="test-embedder")
+            update_shard_index({shard: {"employees": len(ids)} for shard, (_, ids) in offices.items()})
+
+            # Only the kiosk's own office is loaded up front
+            gallery = face_recognition.reload_face_gallery(sync=False, remote=False)
+            assert len(gallery) == 40 and "C001" in gallery and "P001" not in gallery
+            shards = face_shards.get_face_shard_set()
+            assert set(shards.names()) == {"pune", "delhi"}
+            assert shards.metrics()["resident"] == {}
+
+            # A Pune employee visiting Chennai: local miss, found in the Pune shard
+            probe = offices["pune"][0][7] + rng.normal(scale=0.005, size=128).astype(np.float32)
+            assert gallery.nearest_employees(probe, k=1)[0][1] > 0.55
+            match = face_recognition._match_other_shards(shards, shards.names(), probe, "test-embedder", 0.55, 0.05, 0.03)
+            print(f"   cross-office match: {match}")
+            assert match["employeeId"] == "P007" and match["shard"] == "pune"
+            # Shards with recent cross-office matches are searched first
+            assert shards.names()[0] == "pune"
+
+            # A stranger is searched everywhere and rejected; at most one other shard stays resident
+            stranger = rng.normal(scale=0.09, size=128).astype(np.float32)
+            assert face_recognition._match_other_shards(shards, shards.names(), stranger, "test-embedder", 0.55, 0.05, 0.03) is None
+            metrics = shards.metrics()
+            print(f"   shard metrics: {metrics}")
+            assert len(metrics["resident"]) == 1 and metrics["evictions"] >= 1
+            assert (metrics["searches"], metrics["hits"]) == (2, 1)
+
+            # Registrations land in the employee's own shard, wherever the kiosk is
+            face_recognition._employee_cache["P900"] = (float("inf"), {"employee_id": "P900", "office": "Pune"})
+            new_face = rng.normal(scale=0.09, size=128).astype(np.float32)
+            assert face_recognition.register_face_encoding("P900", new_face, "test-embedder")
+            assert "P900" not in face_recognition.get_face_gallery()
+            assert "P900" in face_recognition.get_employee_face_gallery("P900")
+            assert load_snapshot(shard_location("pune")[0]) is not None
+            assert (shard_location("pune")[0] / "deltas").exists()
+
+            # A shard snapshot rewritten elsewhere is picked up by the next refresh
+            encodings, ids = offices["pune"]
+            write_snapshot(shard_location("pune")[0], encodings[:10], ids[:10], embedder="test-embedder")
+            assert face_recognition.refresh_face_gallery()
+            assert "P020" not in shards.get("pune")
+        finally:
+            for name, value in saved.items():
+                setattr(config, name, value)
+            face_recognition.FACE_S3_BUCKET, face_recognition.FACE_IMAGE_BUCKET = saved_buckets
+            face_shards._shard_set = None
+            face_recognition._employee_cache.pop("P900", None)
+
+    print("\n✅ Sharded Matching Test Complete!")
+
+
+def test_shard_loads_outside_the_lock():
+    print("🧪 Testing shard loads run outside the shard set lock")
+    print("=" * 50)
+
+    import tools.face_recognition as face_recognition
+
+    release = threading.Event()
+    loads = []
+
+    def slow_load(location, sync, remote):
+        loads.append(location)
+        release.wait(5)
+        return {"gallery": [], "version": 1}
+
+    saved = face_recognition._load_store_state, face_recognition._store_target
+    face_recognition._load_store_state = slow_load
+    face_recognition._store_target = lambda: (None, None)
+    shards = FaceShardSet("chennai", max_resident=2)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as store:
+            saved_config = _sharded(store, "Chennai")
+            try:
+                callers = [threading.Thread(target=lambda: results.append(shards.get("pune"))) for _ in range(3)]
+                for caller in callers:
+                    caller.start()
+                while not loads:
+                    time.sleep(0.01)
+
+                # The download is in flight; the lock is free for everything else
+                acquired = shards._lock.acquire(timeout=1)
+                assert acquired, "get() must not hold the lock while loading"
+                shards._lock.release()
+                assert shards.metrics()["resident"] == {}
+
+                release.set()
+                for caller in callers:
+                    caller.join(5)
+            finally:
+                for name, value in saved_config.items():
+                    setattr(config, name, value)
+    finally:
+        release.set()
+        face_recognition._load_store_state, face_recognition._store_target = saved
+
+    print(f"   Loads: {len(loads)}, callers served: {len(results)}")
+    assert len(loads) == 1 and len(results) == 3 and results[0] is not None
+    assert all(gallery is results[0] for gallery in results)
+    assert shards.metrics()["loads"] == 1
+
+    print("\n✅ Shard Load Lock Test Complete!")
+
+
+def test_shard_refresh_outside_the_lock():
+    print("🧪 Testing shard refresh runs outside the shard set lock")
+    print("=" * 50)
+
+    import tools.face_recognition as face_recognition
+
+    release = threading.Event()
+    loads = []
+
+    def slow_load(location, sync, remote):
+        loads.append(location)
+        release.wait(5)
+        return {"gallery": [f"fresh-{len(loads)}"], "version": 2}
+
+    saved = face_recognition._load_store_state, face_recognition._store_target
+    face_recognition._load_store_state = slow_load
+    face_recognition._store_target = lambda: (None, None)
+    shards = FaceShardSet("chennai", max_resident=4)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as store:
+            saved_config = _sharded(store, "Chennai")
+            try:
+                for shard in ("pune", "delhi"):
+                    write_snapshot(shard_location(shard)[0], np.zeros((1, 128)), [f"{shard}-1"], version=2)
+                    shards._insert(shard, {"gallery": [f"old-{shard}"], "version": 1, "etag": None})
+
+                refresher = threading.Thread(target=lambda: results.append(shards.refresh()))
+                refresher.start()
+                while not loads:
+                    time.sleep(0.01)
+
+                # The rebuild is in flight; searches and loads can take the lock
+                acquired = shards._lock.acquire(timeout=1)
+                assert acquired, "refresh() must not hold the lock while rebuilding"
+                # Meanwhile Pune is evicted and loaded again by a search
+                replacement = {"gallery": ["reloaded-pune"], "version": 2, "etag": None}
+                shards._resident["pune"] = replacement
+                shards._lock.release()
+
+                release.set()
+                refresher.join(5)
+            finally:
+                for name, value in saved_config.items():
+                    setattr(config, name, value)
+    finally:
+        release.set()
+        face_recognition._load_store_state, face_recognition._store_target = saved
+
+    print(f"   Refresh changed: {results}, loads: {len(loads)}")
+    assert results == [True] and len(loads) == 2
+    # The stale rebuild does not replace the newer state; the untouched shard is swapped
+    assert shards._resident["pune"] is replacement
+    assert shards._resident["delhi"]["gallery"][0].startswith("fresh-")
+
+    print("\n✅ Shard Refresh Lock Test Complete!")
+
+
+if __name__ == "__main__":
+    test_shard_keys_and_index()
+    test_shard_index_concurrent_updates()
+    test_shard_loads_outside_the_lock()
+    test_shard_refresh_outside_the_lock()
+    test_local_shard_first_then_other_shards()
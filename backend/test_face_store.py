@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Test the versioned, memory-mapped face encoding store and its S3 sync
+"""
+import sys
+import tempfile
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+from tools.face_store import (
+    append_delta,
+    delete_deltas,
+    fold_deltas,
+    load_snapshot,
+    publish_to_s3,
+    read_deltas,
+    sync_from_s3,
+    write_snapshot,
+)
+
+
+class FakeS3:
+    """In-memory stand-in for the handful of S3 calls the store makes."""
+
+    def __init__(self):
+        self.objects: dict[str, bytes] = {}
+        self.ranged_gets = 0
+
+    @staticmethod
+    def etag(body: bytes) -> str:
+        import hashlib
+        return f'"{hashlib.md5(body).hexdigest()}"'
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if kwargs.get("IfNoneMatch") == "*" and Key in self.objects:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        if "IfMatch" in kwargs and (Key not in self.objects or self.etag(self.objects[Key]) != kwargs["IfMatch"]):
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        self.objects[Key] = bytes(Body)
+        return {"ETag": self.etag(self.objects[Key])}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        import io
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body = self.objects[Key]
+        if Range:
+            self.ranged_gets += 1
+            start, end = (int(value) for value in Range.removeprefix("bytes=").split("-"))
+            body = body[start : end + 1]
+        return {"Body": io.BytesIO(body), "ETag": self.etag(self.objects[Key])}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None):
+        self.objects[Key] = Fileobj.read()
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.objects.pop(Key, None)
+
+    def get_paginator(self, name):
+        fake = self
+
+        class _Paginator:
+            def paginate(self, Bucket, Prefix, StartAfter="", **kwargs):
+                keys = sorted(key for key in fake.objects if key.startswith(Prefix) and key > StartAfter)
+                yield {"Contents": [{"Key": key} for key in keys]}
+
+        return _Paginator()
+
+
+def test_face_store_roundtrip():
+    print("🧪 Testing face store snapshot write/mmap/sync")
+    print("=" * 50)
+
+    rng = np.random.default_rng(3)
+    encodings = rng.normal(scale=0.1, size=(50, 128))
+    ids = [f"E{index:03d}" for index in range(50)]
+
+    with tempfile.TemporaryDirectory() as node_a, tempfile.TemporaryDirectory() as node_b:
+        snapshot = write_snapshot(Path(node_a), encodings, ids)
+        print(f"   Wrote snapshot v{snapshot.version}")
+        assert snapshot.version == 1
+        assert isinstance(snapshot.encodings, np.memmap)
+        assert snapshot.encodings.dtype == np.float32
+        assert snapshot.employee_ids == ids
+        assert load_snapshot(Path(node_a), verify=True) is not None
+
+        second = write_snapshot(Path(node_a), encodings[:10], ids[:10])
+        assert second.version == 2 and len(second.employee_ids) == 10
+
+        s3 = FakeS3()
+        assert sync_from_s3(Path(node_b), s3, "bucket", "face_store") is False
+        assert publish_to_s3(Path(node_a), s3, "bucket", "face_store")
+        assert sync_from_s3(Path(node_b), s3, "bucket", "face_store")
+        synced = load_snapshot(Path(node_b))
+        print(f"   Synced snapshot v{synced.version} with {len(synced.employee_ids)} ids")
+        assert synced.version == 2
+        assert np.allclose(synced.encodings, encodings[:10].astype(np.float32))
+
+        # A corrupted remote matrix must never replace the local snapshot
+        write_snapshot(Path(node_a), encodings, ids)
+        publish_to_s3(Path(node_a), s3, "bucket", "face_store")
+        s3.objects["face_store/encodings-v3.npy"] = b"corrupted"
+        assert sync_from_s3(Path(node_b), s3, "bucket", "face_store") is False
+        assert load_snapshot(Path(node_b)).version == 2
+
+    print("\n✅ Face Store Test Complete!")
+
+
+def test_face_store_chunked_transfer():
+    print("🧪 Testing chunked zstd snapshot transfer")
+    print("=" * 50)
+
+    rng = np.random.default_rng(9)
+    encodings = rng.normal(scale=0.1, size=(3000, 128))
+    ids = [f"E{index:04d}" for index in range(3000)]
+    s3 = FakeS3()
+
+    with tempfile.TemporaryDirectory() as node_a, tempfile.TemporaryDirectory() as node_b:
+        write_snapshot(Path(node_a), encodings, ids, dtype="int8")
+        assert publish_to_s3(Path(node_a), s3, "bucket", "face_store", chunk_bytes=64 * 1024, workers=4)
+        assert "face_store/encodings-v1.npy" not in s3.objects
+        compressed = s3.objects["face_store/encodings-v1.npy.zst"]
+        raw = (Path(node_a) / "encodings-v1.npy").read_bytes()
+        print(f"   {len(raw)} bytes -> {len(compressed)} compressed")
+
+        assert sync_from_s3(Path(node_b), s3, "bucket", "face_store", workers=4)
+        assert s3.ranged_gets == -(-len(raw) // (64 * 1024)), "one ranged GET per chunk"
+        synced = load_snapshot(Path(node_b), verify=True)
+        assert synced is not None and np.array_equal(synced.encodings, load_snapshot(Path(node_a)).encodings)
+
+        # A corrupted chunk fails verification and leaves no partial file behind
+        write_snapshot(Path(node_a), encodings[:100], ids[:100])
+        publish_to_s3(Path(node_a), s3, "bucket", "face_store", chunk_bytes=16 * 1024)
+        broken = bytearray(s3.objects["face_store/encodings-v2.npy.zst"])
+        broken[-8:] = b"\0" * 8
+        s3.objects["face_store/encodings-v2.npy.zst"] = bytes(broken)
+        assert sync_from_s3(Path(node_b), s3, "bucket", "face_store") is False
+        assert load_snapshot(Path(node_b)).version == 1
+        assert not list(Path(node_b).glob(".encodings-v2*"))
+
+    print("\n✅ Chunked Transfer Test Complete!")
+
+
+def test_face_store_delta_log():
+    print("🧪 Testing face registration delta log")
+    print("=" * 50)
+
+    rng = np.random.default_rng(5)
+    encodings = rng.normal(scale=0.1, size=(5, 128)).astype(np.float32)
+    ids = [f"E{index:03d}" for index in range(5)]
+    s3 = FakeS3()
+
+    with tempfile.TemporaryDirectory() as node_a, tempfile.TemporaryDirectory() as node_b:
+        write_snapshot(Path(node_a), encodings, ids)
+        first = append_delta(Path(node_a), "add", "E100", encodings[0] + 1, s3, "bucket", "face_store")
+        # node_b has no local mirror yet; the create-only put forces it past seq 1
+        second = append_delta(Path(node_b), "remove", "E001", None, s3, "bucket", "face_store")
+        print(f"   Claimed seqs {first['seq']} and {second['seq']}")
+        assert (first["seq"], second["seq"]) == (1, 2)
+
+        deltas = read_deltas(Path(node_a), 0, s3, "bucket", "face_store")
+        assert [record["seq"] for record in deltas] == [1, 2]
+        matrix, folded_ids = fold_deltas(encodings, ids, deltas)
+        assert folded_ids == ["E000", "E002", "E003", "E004", "E100"]
+        assert np.allclose(matrix[-1], encodings[0] + 1)
+
+        assert delete_deltas(Path(node_a), 1, s3, "bucket", "face_store") == 1
+        assert [record["seq"] for record in read_deltas(Path(node_a), 0, s3, "bucket", "face_store")] == [2]
+
+        local = append_delta(Path(node_a), "add", "E200", encodings[1])
+        assert local["seq"] == 3
+
+    print("\n✅ Face Store Delta Test Complete!")
+
+
+def test_face_store_follows_backend_width():
+    print("🧪 Testing a 512-d (ArcFace) face store")
+    print("=" * 50)
+
+    import tools.face_recognition as face_recognition
+    from tools.face_gallery import FaceGallery
+    from test_face_gallery_refresher import _local_store, _restore
+
+    class ArcFaceBackend:
+        # What OnnxBackend reports for an ArcFace embedder (onnxruntime is not needed here)
+        name = "onnx"
+        embedder_id = "onnx-arcface-test"
+        embedding_dim = 512
+        match_threshold = 1.05
+
+    rng = np.random.default_rng(21)
+    faces = rng.normal(size=(3, 512)).astype(np.float32)
+    faces /= np.linalg.norm(faces, axis=1, keepdims=True)
+
+    with tempfile.TemporaryDirectory() as store:
+        saved = _local_store(store)
+        saved_backend = face_recognition.get_face_backend
+        face_recognition.get_face_backend = ArcFaceBackend
+        try:
+            # An empty gallery saved before the first registration already has the embedder's width
+            assert face_recognition.save_face_encoding_data({"encodings": [], "employee_ids": []})
+            assert load_snapshot(Path(store)).manifest["dim"] == 512
+
+            for index, face in enumerate(faces):
+                assert append_delta(Path(store), "add", f"E{index}", face, embedder=ArcFaceBackend.embedder_id)
+            assert face_recognition.compact_face_store()
+            snapshot = load_snapshot(Path(store))
+            assert snapshot.manifest["dim"] == 512 and snapshot.float_encodings().shape == (3, 512)
+
+            gallery = face_recognition.reload_face_gallery(sync=False, remote=False)
+            assert gallery.dim == 512 and len(gallery) == 3
+            assert gallery.nearest_employees(faces[1], k=1)[0][0] == "E1"
+        finally:
+            face_recognition.get_face_backend = saved_backend
+            _restore(saved)
+
+    # A gallery with no rows yet takes its width from the first template and refuses others
+    gallery = FaceGallery([], [])
+    gallery.add("E0", faces[0])
+    assert gallery.dim == 512 and gallery.nearest(faces[0], k=1)[0][0] == 0
+    try:
+        gallery.add("E1", np.zeros(128))
+        raise AssertionError("a 128-d template must not enter a 512-d gallery")
+    except ValueError:
+        pass
+
+    print("\n✅ Face Store Width Test Complete!")
+
+
+if __name__ == "__main__":
+    test_face_store_roundtrip()
+    test_face_store_chunked_transfer()
+    test_face_store_delta_log()
+    test_face_store_follows_backend_width()
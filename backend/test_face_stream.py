@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Test the streamed face recognition WebSocket (/flow/face_recognition/ws)
+"""
+import asyncio
+import sys
+import threading
+import time
+sys.path.insert(0, 'src')
+
+from fastapi.testclient import TestClient
+
+import server
+from tools import config
+from tools.face_worker_pool import FacePoolBusy
+
+
+FACE_BOX = {"x": 0.25, "y": 0.2, "w": 0.4, "h": 0.5}
+
+
+class _StreamHarness:
+    """Replaces the matcher and the flow step around the WebSocket handler."""
+
+    def __init__(self, answers, max_frames: int = 8, timeout: float = 5.0):
+        self.answers = list(answers)
+        self.frames: list[bytes] = []
+        self.hints: list = []
+        self.advanced: list[dict] = []
+        self.started = threading.Event()
+        self.gate: threading.Event | None = None
+        self.settings = (max_frames, timeout)
+
+    async def match(self, image_bytes, hint=None):
+        self.frames.append(image_bytes)
+        self.hints.append(hint)
+        self.started.set()
+        if self.gate is not None:
+            await asyncio.to_thread(self.gate.wait, 5)
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def advance(self, face_result, kiosk, allow_retry=True):
+        self.advanced.append(face_result)
+        return {"success": face_result.get("status") == "success", "message": face_result.get("message")}
+
+    def __enter__(self):
+        self.saved = (
+            server._match_face_cached,
+            server.complete_face_match,
+            server._advance_flow_with_face_result,
+            config.FACE_STREAM_MAX_FRAMES,
+            config.FACE_STREAM_TIMEOUT_SECONDS,
+        )
+        server._match_face_cached = self.match
+        server.complete_face_match = lambda match, kiosk: match
+        server._advance_flow_with_face_result = self.advance
+        config.FACE_STREAM_MAX_FRAMES, config.FACE_STREAM_TIMEOUT_SECONDS = self.settings
+        return self
+
+    def __exit__(self, *exc):
+        (
+            server._match_face_cached,
+            server.complete_face_match,
+            server._advance_flow_with_face_result,
+            config.FACE_STREAM_MAX_FRAMES,
+            config.FACE_STREAM_TIMEOUT_SECONDS,
+        ) = self.saved
+        if self.gate is not None:
+            self.gate.set()
+
+
+def test_stream_stops_at_first_match():
+    print("🧪 Testing face stream frame handling")
+    print("=" * 50)
+
+    no_face = {"status": "error", "message": "No face detected in image", "faceBox": FACE_BOX}
+    matched = {"status": "success", "employeeId": "E001", "distance": 0.31}
+    with _StreamHarness([no_face, matched]) as harness:
+        client = TestClient(server.app)
+        with client.websocket_connect("/flow/face_recognition/ws?kiosk_id=lobby") as websocket:
+            websocket.send_bytes(b"frame-1")
+            first = websocket.receive_json()
+            websocket.send_bytes(b"frame-2")
+            second = websocket.receive_json()
+            result = websocket.receive_json()
+
+    print(f"   Result: {result}")
+    assert (first["type"], first["frame"], first["status"]) == ("progress", 1, "error")
+    assert (second["frame"], second["status"]) == (2, "success")
+    assert result["type"] == "result" and result["success"]
+    assert result["frames_evaluated"] == 2 and result["frames_received"] == 2
+    # The face box of one frame is the ROI hint for the next
+    assert harness.hints == [None, (0.25, 0.2, 0.4, 0.5)]
+    assert harness.advanced == [matched]
+
+    print("\n✅ Face Stream Frame Test Complete!")
+
+
+def test_stream_backpressure_keeps_newest_frame():
+    print("🧪 Testing face stream backpressure")
+    print("=" * 50)
+
+    failed = {"status": "error", "message": "Face not recognized"}
+    answers = [failed, FacePoolBusy("queue full"), failed]
+    with _StreamHarness(answers, max_frames=2) as harness:
+        harness.gate = threading.Event()
+        client = TestClient(server.app)
+        with client.websocket_connect("/flow/face_recognition/ws") as websocket:
+            websocket.send_bytes(b"frame-1")
+            assert harness.started.wait(5)
+            # Frames arriving while the pool is busy replace each other; only the newest is kept
+            for index in range(2, 5):
+                websocket.send_bytes(f"frame-{index}".encode())
+            time.sleep(0.3)
+            harness.gate.set()
+            assert websocket.receive_json()["frame"] == 1
+
+            # A full pool drops the frame without using up the budget
+            time.sleep(0.2)
+            websocket.send_bytes(b"frame-5")
+            second = websocket.receive_json()
+            result = websocket.receive_json()
+
+    print(f"   Frames matched: {harness.frames}")
+    assert harness.frames == [b"frame-1", b"frame-4", b"frame-5"]
+    assert second["frame"] == 2 and second["frames_received"] == 5
+    # The budget ran out without a match: the last failure is applied to the flow
+    assert not result["success"] and result["frames_evaluated"] == 2
+    assert harness.advanced == [failed]
+
+    print("\n✅ Face Stream Backpressure Test Complete!")
+
+
+def test_stream_disconnect_and_end():
+    print("🧪 Testing face stream disconnect and end")
+    print("=" * 50)
+
+    with _StreamHarness([]) as harness:
+        client = TestClient(server.app)
+        # An explicit end before any frame leaves the flow untouched
+        with client.websocket_connect("/flow/face_recognition/ws") as websocket:
+            websocket.send_text('{"type": "end"}')
+            result = websocket.receive_json()
+        assert result == {"type": "result", "success": False, "status": "error", "message": "No face frames received"}
+
+        # A kiosk that drops the connection does not leave the handler waiting for the timeout
+        started = time.monotonic()
+        with client.websocket_connect("/flow/face_recognition/ws") as websocket:
+            websocket.send_text("not json")
+        assert time.monotonic() - started < 2.0
+    assert harness.frames == [] and harness.advanced == []
+
+    print("\n✅ Face Stream Disconnect Test Complete!")
+
+
+if __name__ == "__main__":
+    test_stream_stops_at_first_match()
+    test_stream_backpressure_keeps_newest_frame()
+    test_stream_disconnect_and_end()
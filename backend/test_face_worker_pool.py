@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test the face worker pool (gallery generation in workers, broken pool rebuild)
+"""
+import asyncio
+import sys
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+sys.path.insert(0, 'src')
+
+from tools import face_backends, face_recognition, face_worker_pool
+from tools.face_worker_pool import FaceWorkerPool
+
+
+class _WarmBackend:
+    def warm_up(self):
+        pass
+
+
+class _FakeExecutor:
+    """Stands in for ProcessPoolExecutor; ``mode`` picks how the pool behaves."""
+
+    created: list["_FakeExecutor"] = []
+
+    def __init__(self, max_workers, mp_context, initializer, initargs, mode="ok"):
+        self.start_method = mp_context.get_start_method()
+        self.initargs = initargs
+        self.mode = mode
+        self.shut_down = False
+        _FakeExecutor.created.append(self)
+
+    def submit(self, fn, *args):
+        if self.mode == "broken":
+            raise BrokenProcessPool("a worker died earlier")
+        future = Future()
+        if self.mode == "crash":
+            future.set_exception(BrokenProcessPool("worker died mid-job"))
+        else:
+            future.set_result(({"match": True, "generation": args[1]}, 0.0, 0.0))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_worker_starts_at_current_generation():
+    print("🧪 Testing worker gallery generation at start-up")
+    print("=" * 50)
+
+    refreshes = []
+    saved = (
+        face_backends.get_face_backend,
+        face_recognition.get_face_gallery,
+        face_recognition.refresh_face_gallery,
+        face_recognition.match_face_image,
+        face_worker_pool._worker_generation,
+    )
+    face_backends.get_face_backend = lambda: _WarmBackend()
+    face_recognition.get_face_gallery = lambda: None
+    face_recognition.refresh_face_gallery = lambda: refreshes.append(True)
+    face_recognition.match_face_image = lambda image_bytes, hint=None: {"match": True}
+    try:
+        # A worker started at generation 3 loaded that gallery: no refresh for a generation-3 job
+        face_worker_pool._init_worker(3)
+        face_worker_pool._match_in_worker(b"jpeg", 3)
+        assert refreshes == []
+
+        # A registration after the worker started must reach its very first job
+        face_worker_pool._init_worker(3)
+        face_worker_pool._match_in_worker(b"jpeg", 4)
+        assert len(refreshes) == 1
+        face_worker_pool._match_in_worker(b"jpeg", 4)
+        assert len(refreshes) == 1
+        print(f"   Refreshes: {len(refreshes)}")
+    finally:
+        (
+            face_backends.get_face_backend,
+            face_recognition.get_face_gallery,
+            face_recognition.refresh_face_gallery,
+            face_recognition.match_face_image,
+            face_worker_pool._worker_generation,
+        ) = saved
+
+    print("\n✅ Worker Generation Test Complete!")
+
+
+def test_broken_pool_is_rebuilt():
+    print("🧪 Testing worker pool rebuild after BrokenProcessPool")
+    print("=" * 50)
+
+    modes = iter(["crash", "ok", "broken", "ok"])
+    saved = face_worker_pool.ProcessPoolExecutor
+    face_worker_pool.ProcessPoolExecutor = lambda **options: _FakeExecutor(**options, mode=next(modes))
+    _FakeExecutor.created.clear()
+    pool = FaceWorkerPool(workers=2, max_queue=2, timeout=5.0)
+    try:
+        # A worker dies mid-job: that job fails and the dead pool is dropped
+        try:
+            asyncio.run(pool.match(b"jpeg"))
+            raise AssertionError("the crashed job should fail")
+        except BrokenProcessPool:
+            pass
+        assert _FakeExecutor.created[0].shut_down and pool._executor is None
+
+        result = asyncio.run(pool.match(b"jpeg"))
+        assert result["match"] and len(_FakeExecutor.created) == 2
+        assert _FakeExecutor.created[1].initargs == (face_recognition.get_gallery_generation(),)
+        # Workers load the backend and gallery themselves instead of forking the threaded server
+        assert all(executor.start_method in {"forkserver", "spawn"} for executor in _FakeExecutor.created)
+
+        # A pool found broken at submit time is replaced and the job resubmitted
+        pool._executor = None
+        result = asyncio.run(pool.match(b"jpeg"))
+        assert result["match"] and len(_FakeExecutor.created) == 4
+        assert _FakeExecutor.created[2].shut_down and pool._executor is _FakeExecutor.created[3]
+
+        metrics = pool.metrics()
+        print(f"   Metrics: {metrics}")
+        assert metrics["failed"] == 1 and metrics["completed"] == 2 and metrics["in_flight"] == 0
+    finally:
+        pool.shutdown()
+        face_worker_pool.ProcessPoolExecutor = saved
+
+    print("\n✅ Broken Pool Test Complete!")
+
+
+if __name__ == "__main__":
+    test_worker_starts_at_current_generation()
+    test_broken_pool_is_rebuilt()
@@ -5,49 +5,56 @@ Test script for Virtual Receptionist Flow Manager
 import sys
 sys.path.insert(0, 'src')
 
-from flow_manager import flow_manager, FlowState, UserType
-
 def test_flow():
     print("🧪 Testing Virtual Receptionist Flow Manager")
     print("=" * 50)
+    from flow_manager import flow_manager, FlowState, UserType
     
     # Test 1: Initial status
     print("1. Testing initial flow status:")
     status = flow_manager.get_flow_status()
     print(f"   Status: {status}")
+    assert status["status"] == "no_active_session"
     
     # Test 2: Start flow
     print("\n2. Testing flow start:")
     success, message = flow_manager.process_wake_word_detected()
     print(f"   Success: {success}")
     print(f"   Message: {message}")
+    assert success and message
     
     # Test 3: Check session after start
     print("\n3. Testing session after start:")
     session = flow_manager.get_current_session()
-    if session:
-        print(f"   Session ID: {session.session_id}")
-        print(f"   Current State: {session.current_state.value}")
-        print(f"   User Type: {session.user_type.value}")
-    else:
-        print("   No active session found")
+    assert session is not None, "waking up should open a session"
+    print(f"   Session ID: {session.session_id}")
+    print(f"   Current State: {session.current_state.value}")
+    print(f"   User Type: {session.user_type.value}")
+    assert session.current_state == FlowState.LANGUAGE_SELECTION
+    assert session.user_type == UserType.UNKNOWN
     
-    # Test 4: User classification - Employee
+    # Test 4: Language selection, then user classification - Employee
     print("\n4. Testing employee classification:")
+    success, message, next_state = flow_manager.process_user_classification("English")
+    assert success and next_state == FlowState.USER_CLASSIFICATION
     success, message, next_state = flow_manager.process_user_classification("I am an employee")
     print(f"   Success: {success}")
     print(f"   Message: {message}")
     print(f"   Next State: {next_state.value if next_state else 'None'}")
+    assert success and next_state == FlowState.FACE_RECOGNITION
     
     # Test 5: Check session after classification
     print("\n5. Testing session after classification:")
     status = flow_manager.get_flow_status()
     print(f"   Status: {status}")
+    assert status["current_state"] == "face_recognition" and status["user_type"] == "employee"
+    assert not status["is_verified"] and status["session_id"] == session.session_id
     
     # Test 6: End session
     print("\n6. Testing session end:")
     message = flow_manager.end_session()
     print(f"   Message: {message}")
+    assert flow_manager.get_flow_status()["current_state"] == "flow_end"
     
     print("\n✅ Flow Manager Test Complete!")
 
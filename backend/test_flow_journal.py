@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Test the journaled flow session store: replay, torn tails, compaction and flat append cost
+"""
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+import flow_signal
+from tools import config
+from flow_manager import FlowState, VirtualReceptionistFlow
+from flow_persistence import JournaledSessionFile
+
+
+def _open(directory: str):
+    """Open the store in ``directory``; returns it with what it loaded."""
+    store = JournaledSessionFile(Path(directory) / "sessions.json", interval=60)
+    return store, store.load()
+
+
+def test_replay_and_torn_tail():
+    print("🧪 Testing journal replay")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store, _ = _open(tmp)
+        store.mark("a", {"step": 0})
+        store.flush()  # first write lays down the snapshot and an empty journal
+        snapshot = store.path.read_bytes()
+        for step in range(1, 6):
+            store.mark("a", {"step": step})
+            store.mark(f"b{step}", {"step": step})
+            store.flush()
+        store.mark("b1", None)
+        store.set_meta({"active_sessions": {"lobby": "a"}})
+        store.flush()
+        assert store.path.read_bytes() == snapshot  # appends only
+        assert store.metrics()["journal_records"] == 12
+
+        reloaded, data = _open(tmp)
+        assert data["sessions"]["a"] == {"step": 5} and "b1" not in data["sessions"]
+        assert data["active_sessions"] == {"lobby": "a"} and "journal" not in data
+        metrics = reloaded.metrics()
+        print(f"   {metrics}")
+        assert metrics["replayed_records"] == 12 and not metrics["truncated_tail"]
+        # Loading folded the journal into the snapshot
+        assert metrics["compactions"] == 1 and metrics["journal_records"] == 0
+
+        # A crash mid-append leaves a partial last line: earlier flushes survive
+        reloaded.mark("a", {"step": 6})
+        reloaded.flush()
+        reloaded.mark("a", {"step": 7})
+        reloaded.flush()
+        journal = reloaded.journal_path.read_bytes()
+        reloaded.journal_path.write_bytes(journal[:-5])
+        recovered, data = _open(tmp)
+        assert data["sessions"]["a"] == {"step": 6}
+        assert recovered.metrics()["truncated_tail"]
+        for store_ in (store, reloaded, recovered):
+            store_.close()
+
+    print("\n✅ Journal Replay Test Complete!")
+
+
+def test_interrupted_compaction():
+    print("🧪 Testing a compaction interrupted between its renames")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store, _ = _open(tmp)
+        for step in range(3):
+            store.mark("a", {"step": step})
+            store.flush()
+        old_journal = store.journal_path.read_bytes()
+        store.compact()
+        # The snapshot was replaced but the old journal was not
+        store.journal_path.write_bytes(old_journal + b'{"s":"a","r":{"step":-1}}\n')
+        assert _open(tmp)[1]["sessions"]["a"] == {"step": 2}
+        store.close()
+
+    print("\n✅ Interrupted Compaction Test Complete!")
+
+
+def test_compaction_bounds_journal():
+    print("🧪 Testing journal compaction")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JournaledSessionFile(Path(tmp) / "sessions.json", interval=0.01, compact_records=50)
+        store.load()
+        for step in range(400):
+            store.mark(f"s{step % 20}", {"step": step})
+            store.flush()
+        deadline = time.time() + 5
+        while store.metrics()["journal_records"] >= 50 and time.time() < deadline:
+            time.sleep(0.01)
+        metrics = store.metrics()
+        print(f"   {metrics}")
+        assert metrics["compactions"] >= 2 and metrics["journal_records"] < 50
+        store.close()
+        # The last compaction may predate the last appends: the snapshot plus journal hold everything
+        assert "s19" in json.loads(store.path.read_text())["sessions"]
+        sessions = _open(tmp)[1]["sessions"]
+        assert sessions["s19"] == {"step": 399} and sessions["s0"] == {"step": 380}
+
+    print("\n✅ Journal Compaction Test Complete!")
+
+
+def test_flat_transition_cost():
+    print("🧪 Testing transition cost with many retained sessions")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saved_signals = flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR
+        flow_signal.SIGNAL_FILE = Path(tmp) / "flow_signal.json"
+        flow_signal.KIOSK_SIGNAL_DIR = Path(tmp) / "flow_signals"
+        saved = config.FLOW_SAVE_INTERVAL_SECONDS, config.FLOW_SESSION_STORE
+        config.FLOW_SAVE_INTERVAL_SECONDS, config.FLOW_SESSION_STORE = 60, "journal"
+        try:
+            flow = VirtualReceptionistFlow(sessions_file=Path(tmp) / "flow_sessions.json")
+
+            def transition_bytes(kiosk: str) -> int:
+                before = flow.persistence_metrics()["bytes_written"]
+                flow.process_wake_word_detected(kiosk_id=kiosk)
+                return flow.persistence_metrics()["bytes_written"] - before
+
+            # Sessions retained for the cleanup window come from a handful of kiosks
+            kiosks = [f"lobby-{index}" for index in range(4)]
+            for kiosk in kiosks:
+                transition_bytes(kiosk)
+            small = transition_bytes("first")
+            for index in range(3000):
+                flow.create_session(kiosk_id=kiosks[index % 4])
+            flow.flush_sessions()
+            large = transition_bytes("last")
+            print(f"   bytes per transition: {small} with 5 sessions, {large} with 3005")
+            assert large <= small * 1.2
+
+            # Everything comes back after a restart
+            flow.close_sessions()
+            reloaded = VirtualReceptionistFlow(sessions_file=flow.sessions_file)
+            assert len(reloaded.sessions) == len(flow.sessions)
+            assert reloaded.get_current_session("last").current_state == FlowState.LANGUAGE_SELECTION
+            reloaded.close_sessions()
+        finally:
+            config.FLOW_SAVE_INTERVAL_SECONDS, config.FLOW_SESSION_STORE = saved
+            flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR = saved_signals
+
+    print("\n✅ Flat Transition Cost Test Complete!")
+
+
+if __name__ == "__main__":
+    test_replay_and_torn_tail()
+    test_interrupted_compaction()
+    test_compaction_bounds_journal()
+    test_flat_transition_cost()
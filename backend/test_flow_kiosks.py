@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test per-kiosk flow sessions: concurrent kiosks, per-kiosk signals and persistence
+"""
+import json
+import sys
+import tempfile
+import threading
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+import flow_signal
+from flow_manager import FlowState, UserType, VirtualReceptionistFlow
+from flow_signal import DEFAULT_KIOSK_ID, get_signal, kiosk_key
+
+
+def _isolated_signals(directory: str):
+    """Point the signal files at a temporary directory; returns the values to restore."""
+    saved = flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR
+    flow_signal.SIGNAL_FILE = Path(directory) / "flow_signal.json"
+    flow_signal.KIOSK_SIGNAL_DIR = Path(directory) / "flow_signals"
+    return saved
+
+
+def test_kiosk_keys():
+    print("🧪 Testing kiosk keys")
+    print("=" * 50)
+
+    assert kiosk_key("Clara-room") == "clara-room"
+    assert kiosk_key(" Lobby 2 / East ") == "lobby-2-east"
+    assert kiosk_key(None) == kiosk_key("") == kiosk_key("///") == DEFAULT_KIOSK_ID
+    assert len(kiosk_key("x" * 200)) == 64
+
+    print("\n✅ Kiosk Key Test Complete!")
+
+
+def test_concurrent_kiosks():
+    print("🧪 Testing concurrent kiosks")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saved = _isolated_signals(tmp)
+        try:
+            flow = VirtualReceptionistFlow(sessions_file=Path(tmp) / "flow_sessions.json")
+            kiosks = [f"lobby-{index}" for index in range(24)]
+            errors = []
+
+            def run_kiosk(index: int, kiosk: str):
+                try:
+                    ok, _ = flow.process_wake_word_detected(kiosk_id=kiosk)
+                    assert ok
+                    language = "telugu" if index % 2 else "english"
+                    ok, _, state = flow.process_user_classification(language, kiosk_id=kiosk)
+                    assert ok and state == FlowState.USER_CLASSIFICATION
+                    role = "visitor" if index % 3 == 0 else "employee"
+                    ok, _, _ = flow.process_user_classification(role, kiosk_id=kiosk)
+                    assert ok
+                except Exception as exc:  # surfaced by the main thread
+                    errors.append((kiosk, exc))
+
+            threads = [threading.Thread(target=run_kiosk, args=pair) for pair in enumerate(kiosks)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert not errors, errors
+
+            # Every kiosk has its own session, state and language
+            sessions = {flow.get_current_session(kiosk).session_id for kiosk in kiosks}
+            assert len(sessions) == len(kiosks)
+            for index, kiosk in enumerate(kiosks):
+                session = flow.get_current_session(kiosk)
+                assert session.kiosk_id == kiosk
+                assert session.user_data["language"] == ("te" if index % 2 else "en")
+                if index % 3 == 0:
+                    assert session.user_type == UserType.VISITOR
+                    assert session.current_state == FlowState.VISITOR_INFO_COLLECTION
+                else:
+                    assert session.user_type == UserType.EMPLOYEE
+                    assert session.current_state == FlowState.FACE_RECOGNITION
+            assert flow.get_current_session() is None
+            assert flow.get_flow_status()["status"] == "no_active_session"
+            assert [status["kiosk_id"] for status in flow.list_kiosks()] == sorted(kiosks)
+
+            # Each kiosk got its own signal
+            assert get_signal(kiosk_id="lobby-0")["name"] == "start_visitor_info"
+            assert get_signal(kiosk_id="lobby-1")["name"] == "start_face_capture"
+            assert get_signal(kiosk_id="lobby-1") is None
+            assert get_signal() is None
+
+            # Ending one kiosk's session leaves the others untouched
+            flow.end_session(kiosk_id="lobby-1")
+            assert flow.get_current_session("lobby-1").current_state == FlowState.FLOW_END
+            assert flow.get_current_session("lobby-2").current_state == FlowState.FACE_RECOGNITION
+
+            # Active sessions survive a restart
+            reloaded = VirtualReceptionistFlow(sessions_file=flow.sessions_file)
+            assert reloaded.get_current_session("lobby-5").session_id == flow.get_current_session("lobby-5").session_id
+            assert reloaded.get_current_session("lobby-1").current_state == FlowState.FLOW_END
+        finally:
+            flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR = saved
+
+    print("\n✅ Concurrent Kiosk Test Complete!")
+
+
+def test_legacy_sessions_file():
+    print("🧪 Testing a sessions file with a single current session")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sessions_file = Path(tmp) / "flow_sessions.json"
+        flow = VirtualReceptionistFlow(sessions_file=sessions_file)
+        session_id = flow.create_session()
+        flow.flush_sessions()
+        data = json.loads(sessions_file.read_text())
+        # Files written before per-kiosk sessions carry neither field
+        data.pop("active_sessions")
+        for session in data["sessions"].values():
+            session.pop("kiosk_id")
+        sessions_file.write_text(json.dumps(data))
+
+        reloaded = VirtualReceptionistFlow(sessions_file=sessions_file)
+        assert reloaded.current_session_id == session_id
+        assert reloaded.get_current_session().kiosk_id == DEFAULT_KIOSK_ID
+
+    print("\n✅ Legacy Sessions File Test Complete!")
+
+
+if __name__ == "__main__":
+    test_kiosk_keys()
+    test_concurrent_kiosks()
+    test_legacy_sessions_file()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test write-behind flow session persistence: coalescing, flush points and atomic writes
+"""
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+import flow_signal
+from tools import config
+from flow_manager import FlowState, VirtualReceptionistFlow
+import flow_persistence
+from flow_persistence import WriteBehindSessionFile
+
+
+def _flow(directory: str, interval: float) -> VirtualReceptionistFlow:
+    saved = config.FLOW_SAVE_INTERVAL_SECONDS, config.FLOW_SESSION_STORE
+    config.FLOW_SAVE_INTERVAL_SECONDS, config.FLOW_SESSION_STORE = interval, "json"
+    try:
+        return VirtualReceptionistFlow(sessions_file=Path(directory) / "flow_sessions.json")
+    finally:
+        config.FLOW_SAVE_INTERVAL_SECONDS, config.FLOW_SESSION_STORE = saved
+
+
+def test_coalesced_writes():
+    print("🧪 Testing coalesced session writes")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "sessions.json"
+        writer = WriteBehindSessionFile(path, interval=60)
+        for step in range(50):
+            writer.mark(f"s{step % 5}", {"step": step})
+        writer.mark("s4", {"step": 49})  # unchanged, not a change
+        writer.set_meta({"active_sessions": {"lobby": "s4"}})
+        assert not path.exists() and writer.pending
+
+        assert writer.flush()
+        assert not writer.flush()  # nothing pending
+        data = json.loads(path.read_text())
+        assert data["sessions"]["s0"] == {"step": 45} and data["active_sessions"] == {"lobby": "s4"}
+
+        writer.mark("s0", None)
+        writer.close()
+        assert "s0" not in json.loads(path.read_text())["sessions"]
+        metrics = writer.metrics()
+        print(f"   {metrics}")
+        assert (metrics["changes"], metrics["flushes"], metrics["sessions_flushed"]) == (52, 2, 6)
+        assert list(Path(tmp).iterdir()) == [path]  # no temp files left behind
+
+        # Background flusher: one write for a burst of changes
+        burst = WriteBehindSessionFile(Path(tmp) / "burst.json", interval=0.05)
+        for step in range(20):
+            burst.mark("s", {"step": step})
+        deadline = time.time() + 5
+        while burst.pending and time.time() < deadline:
+            time.sleep(0.01)
+        assert json.loads(burst.path.read_text())["sessions"]["s"] == {"step": 19}
+        assert burst.metrics()["flushes"] == 1
+        burst.close()
+
+    print("\n✅ Coalesced Write Test Complete!")
+
+
+def test_flow_flush_points():
+    print("🧪 Testing flow flush points")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saved_signals = flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR
+        flow_signal.SIGNAL_FILE = Path(tmp) / "flow_signal.json"
+        flow_signal.KIOSK_SIGNAL_DIR = Path(tmp) / "flow_signals"
+        try:
+            flow = _flow(tmp, interval=60)
+
+            # A step's changes are on disk when it returns
+            flow.process_wake_word_detected(kiosk_id="lobby")
+            flow.process_user_classification("english", kiosk_id="lobby")
+            flow.process_user_classification("visitor", kiosk_id="lobby")
+            on_disk = json.loads(flow.sessions_file.read_text())
+            session_id = on_disk["active_sessions"]["lobby"]
+            assert on_disk["sessions"][session_id]["current_state"] == FlowState.VISITOR_INFO_COLLECTION.value
+
+            # Saves outside a step wait for the flusher (or an explicit flush)
+            session = flow.get_current_session("lobby")
+            session.user_data["note"] = "pending"
+            flow.save_sessions(session)
+            assert "note" not in json.loads(flow.sessions_file.read_text())["sessions"][session_id]["user_data"]
+            flow.close_sessions()
+            assert json.loads(flow.sessions_file.read_text())["sessions"][session_id]["user_data"]["note"] == "pending"
+
+            metrics = flow.persistence_metrics()
+            print(f"   {metrics}")
+            # One write per step even though steps save two or three times
+            assert metrics["transitions"] == 3 and metrics["flushes"] == 4
+            assert metrics["changes"] > metrics["flushes"]
+            assert metrics["bytes_per_transition"] > 0
+        finally:
+            flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR = saved_signals
+
+    print("\n✅ Flow Flush Point Test Complete!")
+
+
+def test_readers_never_see_partial_files():
+    print("🧪 Testing atomic replacement")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = WriteBehindSessionFile(Path(tmp) / "sessions.json", interval=0)
+        writer.mark("s", {"payload": "x" * 20000})
+        stop = threading.Event()
+        failures = []
+
+        def read_loop():
+            while not stop.is_set():
+                try:
+                    json.loads(writer.path.read_text())
+                except ValueError as exc:
+                    failures.append(exc)
+
+        reader = threading.Thread(target=read_loop)
+        reader.start()
+        for step in range(200):
+            writer.mark("s", {"payload": str(step) * 5000})
+        stop.set()
+        reader.join()
+        writer.close()
+        assert not failures, failures[:3]
+
+    print("\n✅ Atomic Replacement Test Complete!")
+
+
+def test_exit_flush_registration():
+    print("🧪 Testing exit flushes and the lazily created flow manager")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writers = [WriteBehindSessionFile(Path(tmp) / f"sessions{index}.json", interval=60) for index in range(3)]
+        assert all(writer in flow_persistence._open_stores for writer in writers)
+        writers[0].mark("s", {"step": 1})
+        for writer in writers:
+            writer.close()
+        # Closed stores are no longer flushed at exit
+        assert not any(writer in flow_persistence._open_stores for writer in writers)
+        assert json.loads(writers[0].path.read_text())["sessions"]["s"] == {"step": 1}
+
+        # Importing the module opens no sessions file; one exit hook for every store
+        script = (
+            "import atexit, sys; sys.path.insert(0, 'src')\n"
+            "registered = []\n"
+            "atexit.register = lambda func, *a, **k: registered.append(func) or func\n"
+            "import flow_manager, flow_persistence\n"
+            "assert flow_manager._flow_manager is None\n"
+            "for index in range(3):\n"
+            f"    flow_persistence.WriteBehindSessionFile({tmp!r} + f'/s{{index}}.json', interval=60)\n"
+            "ours = [func for func in registered if getattr(func, '__module__', None) == 'flow_persistence']\n"
+            "assert ours == [flow_persistence._close_open_stores], ours\n"
+        )
+        subprocess.run([sys.executable, "-c", script], check=True, timeout=60)
+
+    print("\n✅ Exit Flush Registration Test Complete!")
+
+
+if __name__ == "__main__":
+    test_coalesced_writes()
+    test_flow_flush_points()
+    test_readers_never_see_partial_files()
+    test_exit_flush_registration()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Test the SQLite flow session store: sharing between processes, indexed queries and expiry
+"""
+import json
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+import flow_signal
+from tools import config
+from flow_manager import FlowState, VirtualReceptionistFlow
+from flow_persistence import SqliteSessionStore
+
+
+def _flow(directory: str) -> VirtualReceptionistFlow:
+    saved = config.FLOW_SESSION_STORE, config.FLOW_SESSION_DB
+    config.FLOW_SESSION_STORE, config.FLOW_SESSION_DB = "sqlite", ""
+    try:
+        return VirtualReceptionistFlow(sessions_file=Path(directory) / "flow_sessions.json")
+    finally:
+        config.FLOW_SESSION_STORE, config.FLOW_SESSION_DB = saved
+
+
+def _isolated_signals(directory: str):
+    saved = flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR
+    flow_signal.SIGNAL_FILE = Path(directory) / "flow_signal.json"
+    flow_signal.KIOSK_SIGNAL_DIR = Path(directory) / "flow_signals"
+    return saved
+
+
+def test_flows_share_sessions():
+    print("🧪 Testing two flow managers sharing one database")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saved = _isolated_signals(tmp)
+        try:
+            # Stand-ins for the uvicorn and agent processes
+            server, agent = _flow(tmp), _flow(tmp)
+            assert server.sessions_file.with_suffix(".db").exists()
+
+            agent.process_wake_word_detected(kiosk_id="lobby")
+            agent.process_user_classification("english", kiosk_id="lobby")
+            session = server.get_current_session("lobby")
+            assert session is not None and session.current_state == FlowState.USER_CLASSIFICATION
+
+            server.process_user_classification("employee", kiosk_id="lobby")
+            assert agent.get_current_session("lobby").current_state == FlowState.FACE_RECOGNITION
+
+            # Each process writes only the kiosks it changed
+            server.create_session(kiosk_id="east")
+            agent.create_session(kiosk_id="west")
+            server.flush_sessions()
+            agent.flush_sessions()
+            assert [status["kiosk_id"] for status in server.list_kiosks()] == ["east", "lobby", "west"]
+            assert agent.get_current_session("east").session_id == server.get_current_session("east").session_id
+
+            waiting = agent.sessions_in_state(FlowState.FACE_RECOGNITION)
+            assert [s.session_id for s in waiting] == [session.session_id]
+
+            # Restart
+            reloaded = _flow(tmp)
+            assert reloaded.get_current_session("lobby").current_state == FlowState.FACE_RECOGNITION
+            print(f"   {reloaded.persistence_metrics()}")
+        finally:
+            flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR = saved
+
+    print("\n✅ Shared Session Test Complete!")
+
+
+def test_indexed_expiry():
+    print("🧪 Testing indexed expiry")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        flow = _flow(tmp)
+        other = _flow(tmp)
+        for index in range(200):
+            session = flow.get_session(flow.create_session(kiosk_id=f"kiosk-{index % 10}"))
+            if index < 150:
+                session.last_activity = time.time() - 3 * 3600
+                flow.save_sessions(session)
+        flow.flush_sessions()
+
+        # Any process can expire every process's sessions
+        other.cleanup_old_sessions()
+        assert other.persistence_metrics()["expired"] == 150
+        flow.cleanup_old_sessions()
+        assert len(flow.sessions) == 50
+
+        db = sqlite3.connect(flow.sessions_file.with_suffix(".db"))
+        assert db.execute("SELECT COUNT(*) FROM flow_sessions").fetchone()[0] == 50
+        assert db.execute("SELECT COUNT(*) FROM flow_kiosks").fetchone()[0] == 10
+        plans = {
+            "expiry": "DELETE FROM flow_sessions WHERE last_activity < 0",
+            "state": "SELECT data FROM flow_sessions WHERE current_state = 'idle'",
+            "kiosk": "SELECT session_id FROM flow_sessions WHERE kiosk_id = 'kiosk-1'",
+        }
+        for name, sql in plans.items():
+            plan = " ".join(row[-1] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}"))
+            print(f"   {name}: {plan}")
+            assert "USING INDEX" in plan or "USING COVERING INDEX" in plan, plan
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        db.close()
+
+    print("\n✅ Indexed Expiry Test Complete!")
+
+
+WRITER = """
+import sys
+sys.path.insert(0, "src")
+from flow_persistence import SqliteSessionStore
+store = SqliteSessionStore(sys.argv[1], interval=0)
+active = store.load()["active_sessions"]
+for index in range(50):
+    sid = f"{sys.argv[2]}-{index}"
+    store.mark(sid, {"session_id": sid, "kiosk_id": sys.argv[2], "current_state": "idle", "last_activity": index})
+    # Kiosks other processes activated since loading are left alone
+    store.set_meta({"active_sessions": {**active, sys.argv[2]: sid}})
+store.close()
+"""
+
+
+def test_concurrent_processes():
+    print("🧪 Testing concurrent writer processes")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "flow_sessions.db"
+        SqliteSessionStore(db_path, interval=0).load()  # create the schema first
+        writers = [
+            subprocess.Popen([sys.executable, "-c", WRITER, str(db_path), f"kiosk-{index}"])
+            for index in range(4)
+        ]
+        assert all(writer.wait(timeout=60) == 0 for writer in writers)
+
+        store = SqliteSessionStore(db_path, interval=0)
+        data = store.load()
+        assert len(data["sessions"]) == 200
+        assert data["active_sessions"] == {f"kiosk-{index}": f"kiosk-{index}-49" for index in range(4)}
+
+    print("\n✅ Concurrent Process Test Complete!")
+
+
+def test_import_from_sessions_file():
+    print("🧪 Testing import of an existing sessions file")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        record = {
+            "session_id": "session_1", "current_state": "language_selection", "user_type": "unknown",
+            "start_time": time.time(), "last_activity": time.time(), "verification_attempts": 0,
+            "user_data": {}, "is_verified": False, "verification_method": None,
+        }
+        (Path(tmp) / "flow_sessions.json").write_text(json.dumps({
+            "sessions": {"session_1": record}, "current_session_id": "session_1",
+        }))
+        flow = _flow(tmp)
+        assert flow.current_session_id == "session_1"
+        assert flow.get_current_session().current_state == FlowState.LANGUAGE_SELECTION
+        assert _flow(tmp).get_session("session_1") is not None
+
+    print("\n✅ Sessions File Import Test Complete!")
+
+
+if __name__ == "__main__":
+    test_flows_share_sessions()
+    test_indexed_expiry()
+    test_concurrent_processes()
+    test_import_from_sessions_file()
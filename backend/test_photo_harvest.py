@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test the concurrent employee photo harvester against a local HTTP stand-in
+"""
+import asyncio
+import sys
+sys.path.insert(0, 'src')
+
+from aiohttp import web
+
+from tools.zenith_emp_img import harvest_photos
+
+
+SETTINGS = {"concurrency": 8, "per_host": 2, "timeout": 5.0, "max_attempts": 3, "max_bytes": 1 << 20}
+ACTIVE = web.AppKey("active", dict)
+
+
+def _stand_in() -> web.Application:
+    app = web.Application()
+    app[ACTIVE] = {"now": 0, "peak": 0, "flaky": set()}
+
+    async def photo(request: web.Request) -> web.Response:
+        name = request.match_info["name"]
+        active = request.app[ACTIVE]
+        if name == "missing":
+            return web.Response(status=404)
+        if name == "flaky" and name not in active["flaky"]:
+            active["flaky"].add(name)
+            return web.Response(status=503, headers={"Retry-After": "0"})
+
+        active["now"] += 1
+        active["peak"] = max(active["peak"], active["now"])
+        try:
+            await asyncio.sleep(0.05)
+        finally:
+            active["now"] -= 1
+
+        etag = f'"{name}-v1"'
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=name.encode() * 100, headers={"ETag": etag})
+
+    app.router.add_get("/{name}.jpg", photo)
+    return app
+
+
+async def _run():
+    app = _stand_in()
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    try:
+        employees = {f"E{index}": {"name": f"N{index}", "photo_url": f"{base}/E{index}.jpg"} for index in range(6)}
+        employees["E_flaky"] = {"name": "Flaky", "photo_url": f"{base}/flaky.jpg"}
+        employees["E_missing"] = {"name": "Missing", "photo_url": f"{base}/missing.jpg"}
+
+        uploaded = {}
+
+        def upload(key, body, content_type):
+            uploaded[key] = body.read()
+
+        cold = await harvest_photos(employees, {"E_gone": {"photo_url": "x"}}, upload, SETTINGS, "Employee_Images")
+        warm = await harvest_photos(employees, cold["state"], upload, SETTINGS, "Employee_Images")
+        return app[ACTIVE]["peak"], uploaded, cold, warm
+    finally:
+        await runner.cleanup()
+
+
+def test_photo_harvest():
+    print("🧪 Testing concurrent photo harvest")
+    print("=" * 50)
+
+    peak, uploaded, cold, warm = asyncio.run(_run())
+    employees_with_photos = {f"E{index}" for index in range(6)} | {"E_flaky"}
+    print(f"   Cold stats: { {k: v for k, v in cold['stats'].items() if k != 'hosts'} }")
+
+    assert peak <= SETTINGS["per_host"], "per-host limit must hold"
+    assert cold["stats"]["new"] == 7 and cold["stats"]["failed"] == 1
+    assert cold["stats"]["retries"] >= 1 and cold["stats"]["removed"] == 1
+    assert "Employee_Images/E0.jpg" in uploaded and uploaded["Employee_Images/E0.jpg"] == b"E0" * 100
+    assert set(cold["delta"]) == employees_with_photos
+    assert "E_missing" not in cold["state"] and "E_gone" not in cold["state"]
+
+    # Second run: conditional GETs answer 304, so the delta is empty
+    assert warm["delta"] == {}
+    assert warm["stats"]["unchanged"] == len(employees_with_photos)
+    assert len(uploaded) == len(employees_with_photos)
+
+    print("\n✅ Photo Harvest Test Complete!")
+
+
+if __name__ == "__main__":
+    test_photo_harvest()
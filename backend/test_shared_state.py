@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Test the shared state layer: embedded and Redis-protocol backends, OTP and agent
+state sharing, and flow sessions shared by worker processes
+"""
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+sys.path.insert(0, 'src')
+
+import agent_state
+import flow_signal
+import shared_state
+from tools import config, employee_verification
+from flow_manager import FlowState, VirtualReceptionistFlow
+from flow_persistence import StateBackendSessionStore
+from shared_state import EmbeddedStateBackend, RedisStateBackend, SharedMap, SharedStateError
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    """Answers the commands RedisStateBackend sends, like a Redis server would."""
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def _reply(self, value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, str):
+            return b"+%s\r\n" % value.encode()
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(self._reply(item) for item in value)
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def handle(self):
+        server = self.server
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            server.commands += 1
+            if server.drop_next:
+                server.drop_next = False
+                return  # the client sees a broken connection
+            name, args = args[0].upper().decode(), args[1:]
+            with server.lock:
+                now = time.time()
+                for key in [key for key, (_, expires) in server.data.items() if expires and expires <= now]:
+                    del server.data[key]
+                if name == "GET":
+                    reply = server.data.get(args[0], (None, None))[0]
+                elif name == "MGET":
+                    reply = [server.data.get(key, (None, None))[0] for key in args]
+                elif name == "SET":
+                    expires = now + int(args[3]) / 1000 if len(args) > 3 and args[2].upper() == b"PX" else None
+                    server.data[args[0]] = (args[1], expires)
+                    reply = "OK"
+                elif name == "DEL":
+                    reply = sum(server.data.pop(key, None) is not None for key in args)
+                elif name == "EVAL" and args[0] == shared_state.INCR_SCRIPT.encode():
+                    # The only script the client sends: INCR, then PEXPIRE on the first increment
+                    key, ttl_ms = args[2], int(args[3])
+                    value, expires = server.data.get(key, (b"0", None))
+                    reply = int(value) + 1
+                    if reply == 1 and ttl_ms > 0:
+                        expires = now + ttl_ms / 1000
+                    server.data[key] = (str(reply).encode(), expires)
+                elif name == "SCAN":
+                    # One page; the client only sends prefix patterns
+                    prefix = args[2][:-1].replace(b"\\", b"")
+                    reply = [b"0", [key for key in server.data if key.startswith(prefix)]]
+                elif name in {"AUTH", "SELECT", "PING"}:
+                    reply = "OK"
+                else:
+                    self.wfile.write(b"-ERR unknown command '%s'\r\n" % name.encode())
+                    continue
+            self.wfile.write(self._reply(reply))
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """In-process stand-in for a Redis server."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _RespHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+        self.commands = 0
+        self.drop_next = False
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.server_address[1]}/0"
+
+
+def _check_backend(backend):
+    backend.set("a:1", b"one")
+    backend.set("a:2", b"two", ttl=0.2)
+    backend.set("b:1", b"other")
+    assert backend.get("a:1") == b"one" and backend.get("missing") is None
+    assert sorted(backend.keys("a:")) == ["a:1", "a:2"]
+    assert backend.get_many(["a:1", "missing", "b:1"]) == [b"one", None, b"other"]
+    time.sleep(0.3)
+    assert backend.get("a:2") is None and backend.keys("a:") == ["a:1"]
+    assert backend.delete("a:1", "missing") == 1 and backend.get("a:1") is None
+
+    otp = SharedMap("otp", ttl=60, backend=backend)
+    otp["e@x.com"] = {"otp": "123456", "attempts": 0}
+    session = otp["e@x.com"]
+    session["attempts"] += 1
+    assert otp["e@x.com"]["attempts"] == 0  # copies until written back
+    otp["e@x.com"] = session
+    assert "e@x.com" in otp and otp.get("nobody") is None
+    assert list(otp) == ["e@x.com"] and len(otp) == 1
+    assert otp.to_dict() == {"e@x.com": {"otp": "123456", "attempts": 1}}
+    del otp["e@x.com"]
+    assert "e@x.com" not in otp
+
+    # Concurrent increments are never lost, and a counter expires with its TTL
+    attempts = SharedMap("attempts", ttl=0.5, backend=backend)
+    counts = []
+    threads = [threading.Thread(target=lambda: counts.extend(attempts.increment("e@x.com") for _ in range(20))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(counts) == list(range(1, 101)) and attempts["e@x.com"] == 100
+    time.sleep(0.6)
+    assert "e@x.com" not in attempts and attempts.increment("e@x.com") == 1
+
+
+def test_backends():
+    print("🧪 Testing shared state backends")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _check_backend(EmbeddedStateBackend(Path(tmp) / "shared_state.db"))
+
+    server = RespStandIn()
+    try:
+        backend = RedisStateBackend(server.url)
+        _check_backend(backend)
+
+        # A dropped connection is re-established and the command retried
+        server.drop_next = True
+        backend.set("k", b"v")
+        assert backend.get("k") == b"v"
+
+        # The first increment sets its TTL in the same round trip
+        sent = server.commands
+        assert backend.incr("counter", ttl=30) == 1
+        assert server.commands == sent + 1 and server.data[b"counter"][1] is not None
+        assert backend.incr("counter", ttl=30) == 2 and backend.incr("forever") == 1
+        assert server.data[b"forever"][1] is None
+
+        try:
+            backend.command("FLUSHALL")
+            assert False, "server errors must raise"
+        except SharedStateError as exc:
+            assert "unknown command" in str(exc)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    try:
+        RedisStateBackend(server.url, timeout=0.5).get("k")
+        assert False, "an unreachable server must raise"
+    except SharedStateError:
+        pass
+
+    print("\n✅ Backend Test Complete!")
+
+
+def test_state_shared_between_processes():
+    print("🧪 Testing OTP and agent state across processes")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "shared_state.db"
+        # Another worker issues an OTP and verifies a user
+        script = (
+            "import sys; sys.path.insert(0, 'src')\n"
+            "from shared_state import EmbeddedStateBackend, SharedMap\n"
+            f"backend = EmbeddedStateBackend({str(path)!r})\n"
+            "SharedMap('otp', ttl=60, backend=backend)['e@x.com'] = {'otp': '654321', 'verified': False}\n"
+            "SharedMap('agent_state', backend=backend).update(is_awake=True, is_verified=True, verified_user_name='Rakesh', verified_user_id='E002')\n"
+        )
+        subprocess.run([sys.executable, "-c", script], check=True, timeout=60)
+
+        previous = shared_state.set_shared_state(EmbeddedStateBackend(path))
+        try:
+            assert employee_verification.otp_sessions["e@x.com"]["otp"] == "654321"
+            state = agent_state.get_state()
+            assert state["is_verified"] and state["verified_user_name"] == "Rakesh"
+
+            # Fields are written on their own, so workers don't undo each other's changes
+            agent_state.set_preferred_language("telugu")
+            assert shared_state.get_shared_state().get_json("agent_state:preferred_language") == "te"
+            assert shared_state.get_shared_state().get_json("agent_state:verified_user_id") == "E002"
+            agent_state.clear_verification()
+            assert not agent_state.get_state()["is_verified"]
+        finally:
+            shared_state.set_shared_state(previous)
+
+    print("\n✅ Cross-Process State Test Complete!")
+
+
+def test_otp_attempt_limit_across_workers():
+    print("🧪 Testing the OTP attempt limit under concurrent guesses")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "shared_state.db"
+        previous = shared_state.set_shared_state(EmbeddedStateBackend(path))
+        try:
+            record = {"name": "Rakesh", "employee_id": "E002", "email": "e@x.com"}
+            employee_verification._prepare_session("e@x.com", record)
+            session = employee_verification.otp_sessions["e@x.com"]
+            session.update(otp="123456", otp_id="first")
+            employee_verification.otp_sessions["e@x.com"] = session
+
+            # Guesses arriving at the same time, as from several workers
+            replies = []
+            threads = [
+                threading.Thread(target=lambda otp=f"{index:06d}": replies.append(employee_verification._verify_otp("e@x.com", otp, record)))
+                for index in range(12)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert sum("OTP incorrect" in reply for reply in replies) == employee_verification.MAX_OTP_ATTEMPTS
+            assert sum("Too many" in reply for reply in replies) == 12 - employee_verification.MAX_OTP_ATTEMPTS
+            # The right OTP no longer helps once the attempts are used up
+            assert "Too many" in employee_verification._verify_otp("e@x.com", "123456", record)
+        finally:
+            shared_state.set_shared_state(previous)
+
+    print("\n✅ OTP Attempt Limit Test Complete!")
+
+
+def test_flow_sessions_on_redis():
+    print("🧪 Testing flow sessions shared through a Redis-protocol server")
+    print("=" * 50)
+
+    server = RespStandIn()
+    with tempfile.TemporaryDirectory() as tmp:
+        saved_signals = flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR
+        flow_signal.SIGNAL_FILE = Path(tmp) / "flow_signal.json"
+        flow_signal.KIOSK_SIGNAL_DIR = Path(tmp) / "flow_signals"
+        saved = config.FLOW_SESSION_STORE, shared_state.set_shared_state(RedisStateBackend(server.url))
+        config.FLOW_SESSION_STORE = "shared"
+        try:
+            # Two uvicorn workers, each with its own connection
+            first = VirtualReceptionistFlow(sessions_file=Path(tmp) / "flow_sessions.json")
+            shared_state.set_shared_state(RedisStateBackend(server.url))
+            second = VirtualReceptionistFlow(sessions_file=Path(tmp) / "flow_sessions.json")
+            assert isinstance(first._writer, StateBackendSessionStore)
+
+            first.process_wake_word_detected(kiosk_id="lobby")
+            first.process_user_classification("english", kiosk_id="lobby")
+            second.process_user_classification("visitor", kiosk_id="lobby")
+            session = first.get_current_session("lobby")
+            assert session.current_state == FlowState.VISITOR_INFO_COLLECTION
+
+            second.create_session(kiosk_id="east")
+            second.flush_sessions()
+            assert [status["kiosk_id"] for status in first.list_kiosks()] == ["east", "lobby"]
+            assert [s.session_id for s in second.sessions_in_state(FlowState.VISITOR_INFO_COLLECTION)] == [session.session_id]
+
+            # Expiry from one worker covers the other's sessions
+            stale = second.get_current_session("east")
+            stale.last_activity = time.time() - 3 * 3600
+            second.save_sessions(stale)
+            second.flush_sessions()
+            first.cleanup_old_sessions()
+            assert first.persistence_metrics()["expired"] == 1
+            assert second.get_current_session("east") is None
+            print(f"   {first.persistence_metrics()}")
+        finally:
+            config.FLOW_SESSION_STORE = saved[0]
+            shared_state.set_shared_state(saved[1])
+            flow_signal.SIGNAL_FILE, flow_signal.KIOSK_SIGNAL_DIR = saved_signals
+            server.shutdown()
+            server.server_close()
+
+    print("\n✅ Shared Flow Session Test Complete!")
+
+
+def test_workers_need_a_shared_flow_store():
+    print("🧪 Testing that several workers refuse a per-process flow session store")
+    print("=" * 50)
+
+    from server import _require_shared_flow_store
+
+    saved = config.FLOW_SESSION_STORE
+    try:
+        for store in ("journal", "json"):
+            config.FLOW_SESSION_STORE = store
+            _require_shared_flow_store(1)
+            try:
+                _require_shared_flow_store(4)
+                assert False, f"{store} store must be refused with several workers"
+            except SystemExit as exc:
+                assert "FLOW_SESSION_STORE" in str(exc)
+        for store in ("sqlite", "shared"):
+            config.FLOW_SESSION_STORE = store
+            _require_shared_flow_store(4)
+    finally:
+        config.FLOW_SESSION_STORE = saved
+
+    print("\n✅ Worker Store Check Test Complete!")
+
+
+if __name__ == "__main__":
+    test_backends()
+    test_state_shared_between_processes()
+    test_otp_attempt_limit_across_workers()
+    test_flow_sessions_on_redis()
+    test_workers_need_a_shared_flow_store()
@@ -7,6 +7,7 @@ export async function verifyFace(imageBlob: Blob) {
   try {
     const response = await fetch(`${backendBase}/flow/face_recognition`, {
       method: "POST",
+      headers: { "X-Kiosk-Id": process.env.NEXT_PUBLIC_KIOSK_ID || "Clara-room" },
       body: formData,
     });
 
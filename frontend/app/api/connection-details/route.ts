@@ -34,7 +34,8 @@ export async function POST(req: Request) {
     // Generate participant token with FIXED room name for agent matching
     const participantName = 'user';
     const participantIdentity = `voice_assistant_user_${Math.floor(Math.random() * 10_000)}`;
-    const roomName = 'Clara-room';  // Fixed room name that agent can join
+    // One room per kiosk; the room name is the kiosk id the backend keys flow sessions by
+    const roomName = process.env.NEXT_PUBLIC_KIOSK_ID || 'Clara-room';
 
     const participantToken = await createParticipantToken(
       { identity: participantIdentity, name: participantName },
@@ -10,9 +10,17 @@ interface FaceFlowResponse {
     status?: string;
     name?: string;
     employeeId?: string;
+    faceBox?: FaceBox | null;
   };
   flow_status?: any;
 }
+// Where the last frame's face was, as fractions of the frame
+interface FaceBox {
+  x: number;
+  y: number;
+  w: number;
+  h: number;
+}
 interface FaceResultPayload {
   status?: string;
   name?: string;
@@ -34,6 +42,7 @@ interface VideoCaptureProps {
 export default function VideoCapture({ onVerified }: VideoCaptureProps) {
   const videoRef = useRef<HTMLVideoElement>(null);
   const scanIntervalRef = useRef<NodeJS.Timeout | null>(null);
+  const faceBoxRef = useRef<FaceBox | null>(null);
   const [verification, setVerification] = useState<VerificationState>({
     status: 'idle',
     message: 'Waiting for employee classification...',
@@ -42,6 +51,8 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
   const [scanningEnabled, setScanningEnabled] = useState(false);
   const [mode, setMode] = useState<'idle' | 'employee' | 'visitor'>('idle');
   const backendBase = (typeof window !== 'undefined' ? (process.env.NEXT_PUBLIC_BACKEND_URL || 'http://127.0.0.1:8000') : '');
+  // The backend keeps one flow session per kiosk; the kiosk id is also the LiveKit room name
+  const kioskHeaders = { 'X-Kiosk-Id': process.env.NEXT_PUBLIC_KIOSK_ID || 'Clara-room' };
   
   // Manual verification state
   const [showManualInput, setShowManualInput] = useState(false);
@@ -81,7 +92,7 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
     const checkSignal = async () => {
       try {
         console.log('[VideoCapture] Polling signal endpoint...');
-        const response = await fetch(`${backendBase}/get_signal`);
+        const response = await fetch(`${backendBase}/get_signal`, { headers: kioskHeaders });
         if (response.ok) {
           const signal = await response.json();
           console.log('[VideoCapture] Received signal:', signal);
@@ -96,7 +107,7 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
             });
             // Clear the signal after processing
             console.log('[VideoCapture] Clearing processed start_face_capture signal');
-            await fetch(`${backendBase}/clear_signal`, { method: 'POST' });
+            await fetch(`${backendBase}/clear_signal`, { method: 'POST', headers: kioskHeaders });
             setTimeout(() => {
               scanFace(true);
             }, 500);
@@ -110,7 +121,7 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
               message: 'Please fill visitor details to proceed',
               accessGranted: false
             });
-            await fetch(`${backendBase}/clear_signal`, { method: 'POST' });
+            await fetch(`${backendBase}/clear_signal`, { method: 'POST', headers: kioskHeaders });
           } else if (signal && signal.name === 'start_visitor_photo') {
             console.log('[VideoCapture] Activating visitor photo capture mode');
             setMode('visitor');
@@ -122,7 +133,7 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
             });
             // Clear the signal after processing
             console.log('[VideoCapture] Clearing processed start_visitor_photo signal');
-            await fetch(`${backendBase}/clear_signal`, { method: 'POST' });
+            await fetch(`${backendBase}/clear_signal`, { method: 'POST', headers: kioskHeaders });
             setTimeout(() => {
               captureVisitorPhoto(true, signal.payload?.message);
             }, 500);
@@ -131,6 +142,29 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
       } catch (error) {
         console.log('[VideoCapture] Signal polling error:', error);
       }
+
+      // The background OTP dispatch after a face match reports on its own channel,
+      // so it never replaces a pending capture signal
+      try {
+        const otpResponse = await fetch(`${backendBase}/get_signal?channel=face_otp`, { headers: kioskHeaders });
+        if (otpResponse.ok) {
+          const otpSignal = await otpResponse.json();
+          if (otpSignal && otpSignal.name === 'face_otp_status') {
+            console.log('[VideoCapture] OTP dispatch outcome:', otpSignal.payload);
+            const otpMessage = otpSignal.payload?.otpSent
+              ? `OTP sent${otpSignal.payload?.phone ? ` to ${otpSignal.payload.phone}` : ''}.`
+              : (otpSignal.payload?.message || 'OTP could not be sent.');
+            setVerification(prev => (
+              prev.status === 'verified' && prev.employeeId === otpSignal.payload?.employeeId
+                ? { ...prev, message: `${prev.message} ${otpMessage}` }
+                : prev
+            ));
+            await fetch(`${backendBase}/clear_signal?channel=face_otp`, { method: 'POST', headers: kioskHeaders });
+          }
+        }
+      } catch (error) {
+        console.log('[VideoCapture] OTP signal polling error:', error);
+      }
     };
 
     const interval = setInterval(checkSignal, 2000);
@@ -212,6 +246,7 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
         try {
           const res = await fetch(`${backendBase}/flow/visitor_photo`, {
             method: 'POST',
+            headers: kioskHeaders,
             body: formData,
           });
           let data: FaceFlowResponse | any = {};
@@ -300,12 +335,17 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
         if (!blob) return;
         const formData = new FormData();
         formData.append("image", blob, "frame.jpg");
+        if (!isVisitorMode && faceBoxRef.current) {
+          // Lets the backend search around the last face before the full frame
+          formData.append("face_hint", JSON.stringify(faceBoxRef.current));
+        }
 
         try {
           const endpoint = isVisitorMode ? `${backendBase}/flow/visitor_photo` : `${backendBase}/flow/face_recognition`;
           console.log('[VideoCapture] Submitting frame to endpoint:', endpoint);
           const res = await fetch(endpoint, {
             method: "POST",
+            headers: kioskHeaders,
             body: formData,
           });
           let data: FaceFlowResponse | (any) = {};
@@ -319,6 +359,9 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
             throw new Error(data?.message || res.statusText);
           }
           console.log('[VideoCapture] Scan result:', data);
+          if (!isVisitorMode) {
+            faceBoxRef.current = data.face_result?.faceBox ?? data.faceBox ?? null;
+          }
 
           if (data.success && data.face_result?.status === 'success') {
             const payload: FaceResultPayload = data.face_result || {};
@@ -345,7 +388,7 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
             try {
               await fetch(`${backendBase}/post_signal`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: { 'Content-Type': 'application/json', ...kioskHeaders },
                 body: JSON.stringify({ name: 'stop_face_capture' }),
               });
             } catch (stopErr) {
@@ -540,7 +583,7 @@ export default function VideoCapture({ onVerified }: VideoCaptureProps) {
                     try {
                       const res = await fetch(`${backendBase}/flow/visitor_info`, {
                         method: 'POST',
-                        headers: { 'Content-Type': 'application/json' },
+                        headers: { 'Content-Type': 'application/json', ...kioskHeaders },
                         body: JSON.stringify({ name: vName, phone: vPhone, purpose: vPurpose, host_employee: vHost })
                       });
                       const data = await res.json();